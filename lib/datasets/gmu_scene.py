@@ -289,6 +289,6 @@ class gmu_scene(datasets.imdb):
 
 
 if __name__ == '__main__':
-    d = datasets.gmu_scene('train')
+    d = datasets.gmu_scene.gmu_scene('train')
     res = d.roidb
     from IPython import embed; embed()
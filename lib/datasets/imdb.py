@@ -12,6 +12,9 @@ import numpy as np
 import scipy.sparse
 import datasets
 from fcn.config import cfg
+from utils.model_index import ModelIndex
+from utils.model_geometry import ModelGeometry
+from utils.file_cache import cache_file, is_fresh, save_npy
 
 class imdb(object):
     """Image database."""
@@ -23,6 +26,8 @@ class imdb(object):
         self._image_index = []
         self._roidb = None
         self._roidb_handler = self.default_roidb
+        self._model_index = None
+        self._model_geometry = None
         # Use this dict for storing dataset specific config options
         self.config = {}
 
@@ -69,10 +74,40 @@ class imdb(object):
             os.makedirs(cache_path)
         return cache_path
 
+    @property
+    def model_index(self):
+        # nearest neighbor indexes of the object models for the ADI metric
+        if self._model_index is None:
+            cache_file = None
+            if cfg.TEST.MODEL_INDEX_CACHE:
+                cache_file = osp.join(self.cache_path, self.name + '_model_index.pkl')
+            self._model_index = ModelIndex(cache_file)
+        return self._model_index
+
+    @property
+    def model_geometry(self):
+        # binary cache of the points of the object models
+        if self._model_geometry is None:
+            self._model_geometry = ModelGeometry(osp.join(self.cache_path, 'models'))
+        return self._model_geometry
+
     @property
     def num_images(self):
       return len(self.image_index)
 
+    def _loadtxt(self, filename):
+        """
+        np.loadtxt(filename), cached in binary form under the cache path
+        and parsed again only if the text file is newer than the cache
+        """
+        npy_file = cache_file(osp.join(self.cache_path, 'loadtxt'), filename)
+        if is_fresh(npy_file, filename):
+            return np.load(npy_file)
+
+        data = np.loadtxt(filename)
+        save_npy(npy_file, data)
+        return data
+
     def image_path_at(self, i):
         raise NotImplementedError
 
@@ -173,7 +173,7 @@ class linemod(datasets.imdb):
             point_file = os.path.join(self._linemod_path, 'models', self._classes[i] + '.xyz')
             print point_file
             assert os.path.exists(point_file), 'Path does not exist: {}'.format(point_file)
-            points[i] = np.loadtxt(point_file)
+            points[i] = self.model_geometry.points(point_file)
             if points[i].shape[0] < num:
                 num = points[i].shape[0]
 
@@ -191,7 +191,7 @@ class linemod(datasets.imdb):
                 'Path does not exist: {}'.format(extent_file)
 
         extents = np.zeros((self.num_classes, 3), dtype=np.float32)
-        extents_all = np.loadtxt(extent_file)
+        extents_all = self._loadtxt(extent_file)
         extents[1, :] = extents_all[self._cls_index - 1, :]
 
         return extents
@@ -487,7 +487,7 @@ class linemod(datasets.imdb):
 
                     # compute pose error
                     if cls == 'eggbox' or cls == 'glue':
-                        error = adi(RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
+                        error = self.model_index.adi(cls, RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
                     else:
                         error = add(RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
                     print 'average distance error: {}\n'.format(error)
@@ -511,7 +511,7 @@ class linemod(datasets.imdb):
                         print 'reprojection error new: {}'.format(error_reprojection_new)
 
                         if cls == 'eggbox' or cls == 'glue':
-                            error_new = adi(RT_new[:3, :3], RT_new[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
+                            error_new = self.model_index.adi(cls, RT_new[:3, :3], RT_new[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
                         else:
                             error_new = add(RT_new[:3, :3], RT_new[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
                         print 'average distance error new: {}\n'.format(error_new)
@@ -534,7 +534,7 @@ class linemod(datasets.imdb):
                         print 'reprojection error icp: {}'.format(error_reprojection_icp)
 
                         if cls == 'eggbox' or cls == 'glue':
-                            error_icp = adi(RT_icp[:3, :3], RT_icp[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
+                            error_icp = self.model_index.adi(cls, RT_icp[:3, :3], RT_icp[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
                         else:
                             error_icp = add(RT_icp[:3, :3], RT_icp[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
                         print 'average distance error icp: {}'.format(error_icp)
@@ -615,7 +615,7 @@ class linemod(datasets.imdb):
 
                     # compute pose error
                     if cls == 'eggbox' or cls == 'glue':
-                        error = adi(RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
+                        error = self.model_index.adi(cls, RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
                     else:
                         error = add(RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
                     print 'average distance error: {}\n'.format(error)
@@ -662,13 +662,14 @@ class linemod(datasets.imdb):
                 gt_labels[:, :] = 0
                 gt_labels[I[0], I[1]] = 1
 
-            # predicated labels
-            if not segmentations[im_ind]:
+            # predicated labels, read once from the results store
+            seg = segmentations[im_ind]
+            if not seg:
                 filename = os.path.join(mat_dir, '%04d.mat' % im_ind)
                 results_mat = scipy.io.loadmat(filename)
                 sg_labels = results_mat['labels']
             else:
-                sg_labels = segmentations[im_ind]['labels']
+                sg_labels = seg['labels']
             hist += self.fast_hist(gt_labels.flatten(), sg_labels.flatten(), n_cl)
 
             # evaluate pose
@@ -680,16 +681,16 @@ class linemod(datasets.imdb):
                 meta_data['cls_indexes'][:] = 0
                 meta_data['cls_indexes'][ind] = 1
 
-                if not segmentations[im_ind]:
+                if not seg:
                     rois = results_mat['rois']
                     poses = results_mat['poses']
                     poses_new = results_mat['poses_refined']
                     poses_icp = results_mat['poses_icp']
                 else:
-                    rois = segmentations[im_ind]['rois']
-                    poses = segmentations[im_ind]['poses']
-                    poses_new = segmentations[im_ind]['poses_refined']
-                    poses_icp = segmentations[im_ind]['poses_icp']
+                    rois = seg['rois']
+                    poses = seg['poses']
+                    poses_new = seg['poses_refined']
+                    poses_icp = seg['poses_icp']
 
                 # save matlab result
                 results = {'labels': sg_labels, 'rois': rois, 'poses': poses, 'poses_refined': poses_new, 'poses_icp': poses_icp}
@@ -742,7 +743,7 @@ class linemod(datasets.imdb):
 
                         # compute pose error
                         if cls == 'eggbox' or cls == 'glue':
-                            error = adi(RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
+                            error = self.model_index.adi(cls, RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
                         else:
                             error = add(RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
 
@@ -766,7 +767,7 @@ class linemod(datasets.imdb):
                                 count_correct_pixel_refined += 1
 
                             if cls == 'eggbox' or cls == 'glue':
-                                error_new = adi(RT_new[:3, :3], RT_new[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
+                                error_new = self.model_index.adi(cls, RT_new[:3, :3], RT_new[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
                             else:
                                 error_new = add(RT_new[:3, :3], RT_new[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
 
@@ -789,7 +790,7 @@ class linemod(datasets.imdb):
                                 count_correct_pixel_icp += 1
 
                             if cls == 'eggbox' or cls == 'glue':
-                                error_icp = adi(RT_icp[:3, :3], RT_icp[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
+                                error_icp = self.model_index.adi(cls, RT_icp[:3, :3], RT_icp[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
                             else:
                                 error_icp = add(RT_icp[:3, :3], RT_icp[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
 
@@ -863,6 +864,8 @@ class linemod(datasets.imdb):
                 print 'correct poses after refinement: {}, all poses: {}, accuracy: {}'.format(count_correct_refined, count_all, float(count_correct_refined) / float(count_all))
 
                 print 'correct poses after ICP: {}, all poses: {}, accuracy: {}'.format(count_correct_icp, count_all, float(count_correct_icp) / float(count_all))
+            self.model_index.report()
+            self.model_index.save()
 
 
     def evaluate_detections(self, detections, output_dir):
@@ -943,7 +946,7 @@ class linemod(datasets.imdb):
 
                         # compute pose error
                         if cls == 'eggbox' or cls == 'glue':
-                            error = adi(RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
+                            error = self.model_index.adi(cls, RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
                         else:
                             error = add(RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points)
 
@@ -955,8 +958,10 @@ class linemod(datasets.imdb):
 
             print 'correct poses reprojection: {}, all poses: {}, accuracy: {}'.format(count_correct_pixel, count_all, float(count_correct_pixel) / float(count_all))
             print 'correct poses: {}, all poses: {}, accuracy: {}'.format(count_correct, count_all, float(count_correct) / float(count_all))
+            self.model_index.report()
+            self.model_index.save()
 
 if __name__ == '__main__':
-    d = datasets.linemod('ape', 'train')
+    d = datasets.linemod.linemod('ape', 'train')
     res = d.roidb
     from IPython import embed; embed()
@@ -10,12 +10,48 @@ import cv2
 import PIL
 import sys
 import scipy
+import scipy.io
+import multiprocessing
 from fcn.config import cfg
 from utils.pose_error import *
+from utils.timer import profiler
 from utils.cython_bbox import bbox_overlaps
 from transforms3d.quaternions import quat2mat, mat2quat
 from rpn_layer.generate_anchors import generate_anchors
 
+# the dataset and the results under evaluation, shared with the
+# evaluation processes forked in evaluate_segmentations
+_eval_imdb = None
+_eval_segmentations = None
+
+def _evaluate_images(image_inds):
+    """confusion matrix and ground truth poses of a shard of test images"""
+    imdb = _eval_imdb
+    n_cl = imdb.num_classes
+    hist = np.zeros((n_cl, n_cl))
+    gts = []
+    for im_ind in image_inds:
+        index = imdb.image_index[im_ind]
+
+        # read ground truth labels
+        im = cv2.imread(imdb.label_path_from_index(index), cv2.IMREAD_UNCHANGED)
+        gt_labels = im.astype(np.float32)
+
+        # predicated labels
+        sg_labels = _eval_segmentations[im_ind]['labels']
+        hist += imdb.fast_hist(gt_labels.flatten(), sg_labels.flatten(), n_cl)
+
+        if cfg.TEST.POSE_REG:
+            # load meta data
+            meta_data = scipy.io.loadmat(imdb.metadata_path_from_index(index))
+            poses_gt = meta_data['poses']
+            if len(poses_gt.shape) == 2:
+                poses_gt = np.reshape(poses_gt, (3, 4, 1))
+            gts.append((im_ind, meta_data['cls_indexes'].flatten(), poses_gt))
+
+    return hist, gts
+
+
 class lov(datasets.imdb):
     def __init__(self, image_set, lov_path = None):
         datasets.imdb.__init__(self, 'lov_' + image_set)
@@ -147,7 +183,7 @@ class lov(datasets.imdb):
             point_file = os.path.join(self._lov_path, 'models', self._classes[i], 'points.xyz')
             print point_file
             assert os.path.exists(point_file), 'Path does not exist: {}'.format(point_file)
-            points[i] = np.loadtxt(point_file)
+            points[i] = self.model_geometry.points(point_file)
             if points[i].shape[0] < num:
                 num = points[i].shape[0]
 
@@ -165,7 +201,7 @@ class lov(datasets.imdb):
                 'Path does not exist: {}'.format(extent_file)
 
         extents = np.zeros((self.num_classes, 3), dtype=np.float32)
-        extents[1:, :] = np.loadtxt(extent_file)
+        extents[1:, :] = self._loadtxt(extent_file)
 
         return extents
 
@@ -365,42 +401,8 @@ class lov(datasets.imdb):
         return image.astype(np.uint8)
 
 
-    def save_result(self, im_ind, segmentation, output_dir):
-
-        # make matlab result dir
-        import scipy.io
-        mat_dir = os.path.join(output_dir, 'mat')
-        if not os.path.exists(mat_dir):
-            os.makedirs(mat_dir)
-
-        sg_labels = segmentation['labels']
-        # evaluate pose
-        if cfg.TEST.POSE_REG:
-            rois = segmentation['rois']
-            poses = segmentation['poses']
-            poses_new = segmentation['poses_refined']
-            poses_icp = segmentation['poses_icp']
-            if cfg.TEST.VERTEX_REG_3D:
-                rois_rgb = segmentation['rois_rgb']
-                poses_rgb = segmentation['poses_rgb']
-
-            # save matlab result
-            if cfg.TEST.VERTEX_REG_2D:
-                results = {'labels': sg_labels, 'rois': rois, 'poses': poses, 'poses_refined': poses_new, 'poses_icp': poses_icp}
-            else:
-                results = {'labels': sg_labels, 'rois_rgb': rois_rgb, 'poses_rgb': poses_rgb, 'rois': rois, 'poses': poses, 'poses_refined': poses_new, 'poses_icp': poses_icp}
-            filename = os.path.join(mat_dir, '%06d.mat' % im_ind)
-            print filename
-            scipy.io.savemat(filename, results, do_compression=True)
-
-
     def evaluate_result(self, im_ind, segmentation, gt_labels, meta_data, output_dir):
-
-        # make matlab result dir
-        import scipy.io
-        mat_dir = os.path.join(output_dir, 'mat')
-        if not os.path.exists(mat_dir):
-            os.makedirs(mat_dir)
+        """print the errors of one frame, the results are stored by the test loop"""
 
         # evaluate segmentation
         n_cl = self.num_classes
@@ -425,18 +427,6 @@ class lov(datasets.imdb):
             poses = segmentation['poses']
             poses_new = segmentation['poses_refined']
             poses_icp = segmentation['poses_icp']
-            if cfg.TEST.VERTEX_REG_3D:
-                rois_rgb = segmentation['rois_rgb']
-                poses_rgb = segmentation['poses_rgb']
-
-            # save matlab result
-            if cfg.TEST.VERTEX_REG_2D:
-                results = {'labels': sg_labels, 'rois': rois, 'poses': poses, 'poses_refined': poses_new, 'poses_icp': poses_icp}
-            else:
-                results = {'labels': sg_labels, 'rois_rgb': rois_rgb, 'poses_rgb': poses_rgb, 'rois': rois, 'poses': poses, 'poses_refined': poses_new, 'poses_icp': poses_icp}
-            filename = os.path.join(mat_dir, '%06d.mat' % im_ind)
-            print filename
-            scipy.io.savemat(filename, results, do_compression=True)
 
             poses_gt = meta_data['poses']
             if len(poses_gt.shape) == 2:
@@ -482,7 +472,7 @@ class lov(datasets.imdb):
 
                         # compute pose error
                         if cls == '024_bowl' or cls == '036_wood_block' or cls == '061_foam_brick':
-                            error = adi(RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points[cls_index])
+                            error = self.model_index.adi(cls_index, RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points[cls_index])
                         else:
                             error = add(RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points[cls_index])
                         print 'error: {}'.format(error)
@@ -495,7 +485,7 @@ class lov(datasets.imdb):
                             print 'translation error new: {}'.format(error_translation_new)
 
                             if cls == '024_bowl' or cls == '036_wood_block' or cls == '061_foam_brick':
-                                error_new = adi(RT_new[:3, :3], RT_new[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points[cls_index])
+                                error_new = self.model_index.adi(cls_index, RT_new[:3, :3], RT_new[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points[cls_index])
                             else:
                                 error_new = add(RT_new[:3, :3], RT_new[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points[cls_index])
                             print 'error new: {}'.format(error_new)
@@ -507,7 +497,7 @@ class lov(datasets.imdb):
                             print 'translation error icp: {}'.format(error_translation_icp)
 
                             if cls == '024_bowl' or cls == '036_wood_block' or cls == '061_foam_brick':
-                                error_icp = adi(RT_icp[:3, :3], RT_icp[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points[cls_index])
+                                error_icp = self.model_index.adi(cls_index, RT_icp[:3, :3], RT_icp[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points[cls_index])
                             else:
                                 error_icp = add(RT_icp[:3, :3], RT_icp[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points[cls_index])
                             print 'error icp: {}'.format(error_icp)
@@ -515,6 +505,64 @@ class lov(datasets.imdb):
                         print 'threshold: {}'.format(0.1 * np.linalg.norm(self._extents[cls_index, :]))
         
 
+    def _evaluate_poses(self, segmentations, gts, threshold):
+        """count the correct poses of each class, batched over all the images"""
+        count_all = np.zeros((self.num_classes,), dtype=np.float32)
+        counts = {}
+
+        # pair each ground truth pose with the rois of its class
+        pair_cls = []
+        pair_gt = []
+        pair_est = {'poses': [], 'poses_refined': [], 'poses_icp': []}
+        for im_ind, cls_indexes, poses_gt in gts:
+            # a store decodes the frame on every read
+            seg = segmentations[im_ind]
+            rois = seg['rois']
+            roi_cls = rois[:, 1].astype(np.int32)
+            for j in xrange(poses_gt.shape[2]):
+                if cls_indexes[j] <= 0:
+                    continue
+                cls_index = int(cls_indexes[j])
+                count_all[cls_index] += 1
+
+                inds = np.where(roi_cls == cls_indexes[j])[0]
+                pair_cls += [cls_index] * len(inds)
+                pair_gt += [poses_gt[:, :, j]] * len(inds)
+                for key in pair_est:
+                    if key == 'poses' or cfg.TEST.POSE_REFINE:
+                        pair_est[key].append(seg[key][inds, :7])
+
+        if cfg.TEST.POSE_REFINE:
+            keys = ['poses', 'poses_refined', 'poses_icp']
+        else:
+            keys = ['poses']
+        for key in keys:
+            counts[key] = np.zeros((self.num_classes,), dtype=np.float32)
+        if len(pair_cls) == 0:
+            return count_all, counts['poses'], counts.get('poses_refined'), counts.get('poses_icp')
+
+        pair_cls = np.array(pair_cls, dtype=np.int32)
+        pair_gt = np.array(pair_gt)
+        for key in keys:
+            poses = np.vstack(pair_est[key])
+            R_est = quat2mat_batch(poses[:, :4]).astype(np.float32)
+            t_est = poses[:, 4:7].astype(np.float32)
+            errors = np.zeros((len(pair_cls),), dtype=np.float64)
+
+            # batched per class
+            for cls_index in np.unique(pair_cls):
+                I = np.where(pair_cls == cls_index)[0]
+                cls = self.classes[cls_index]
+                if cls == '024_bowl' or cls == '036_wood_block' or cls == '061_foam_brick':
+                    errors[I] = self.model_index.adi_batch(cls_index, R_est[I], t_est[I], pair_gt[I, :3, :3], pair_gt[I, :, 3], self._points[cls_index])
+                else:
+                    errors[I] = add_batch(R_est[I], t_est[I], pair_gt[I, :3, :3], pair_gt[I, :, 3], self._points[cls_index])
+
+            correct = errors < threshold[pair_cls]
+            counts[key] = np.bincount(pair_cls[correct], minlength=self.num_classes).astype(np.float32)
+
+        return count_all, counts['poses'], counts.get('poses_refined'), counts.get('poses_icp')
+
     def evaluate_segmentations(self, segmentations, output_dir):
         print 'evaluating segmentations'
         # compute histogram
@@ -526,121 +574,43 @@ class lov(datasets.imdb):
         if not os.path.exists(image_dir):
             os.makedirs(image_dir)
 
-        # make matlab result dir
-        import scipy.io
-        mat_dir = os.path.join(output_dir, 'mat')
-        if not os.path.exists(mat_dir):
-            os.makedirs(mat_dir)
-
-        count_all = np.zeros((self.num_classes,), dtype=np.float32)
-        count_correct = np.zeros((self.num_classes,), dtype=np.float32)
-        count_correct_refined = np.zeros((self.num_classes,), dtype=np.float32)
-        count_correct_icp = np.zeros((self.num_classes,), dtype=np.float32)
         threshold = np.zeros((self.num_classes,), dtype=np.float32)
         for i in xrange(self.num_classes):
             threshold[i] = 0.1 * np.linalg.norm(self._extents[i, :])
 
-        # for each image
-        for im_ind, index in enumerate(self.image_index):
-            # read ground truth labels
-            im = cv2.imread(self.label_path_from_index(index), cv2.IMREAD_UNCHANGED)
-            gt_labels = im.astype(np.float32)
-
-            # predicated labels
-            sg_labels = segmentations[im_ind]['labels']
-            hist += self.fast_hist(gt_labels.flatten(), sg_labels.flatten(), n_cl)
-
-            # evaluate pose
-            if cfg.TEST.POSE_REG:
-                # load meta data
-                meta_data = scipy.io.loadmat(self.metadata_path_from_index(index))
-            
-                rois = segmentations[im_ind]['rois']
-                poses = segmentations[im_ind]['poses']
-                poses_new = segmentations[im_ind]['poses_refined']
-                poses_icp = segmentations[im_ind]['poses_icp']
-
-                '''
-                # save matlab result
-                results = {'labels': sg_labels, 'rois': rois, 'poses': poses, 'poses_refined': poses_new, 'poses_icp': poses_icp}
-                filename = os.path.join(mat_dir, '%04d.mat' % im_ind)
-                print filename
-                scipy.io.savemat(filename, results, do_compression=True)
-                '''
-
-                poses_gt = meta_data['poses']
-                if len(poses_gt.shape) == 2:
-                    poses_gt = np.reshape(poses_gt, (3, 4, 1))
-                num = poses_gt.shape[2]
-
-                for j in xrange(num):
-                    if meta_data['cls_indexes'][j] <= 0:
-                        continue
-                    cls = self.classes[int(meta_data['cls_indexes'][j])]
-                    count_all[int(meta_data['cls_indexes'][j])] += 1
-    
-                    for k in xrange(rois.shape[0]):
-                        cls_index = int(rois[k, 1])
-                        if cls_index == meta_data['cls_indexes'][j]:
-
-                            RT = np.zeros((3, 4), dtype=np.float32)
-                            RT[:3, :3] = quat2mat(poses[k, :4])
-                            RT[:, 3] = poses[k, 4:7]
-
-                            if cfg.TEST.POSE_REFINE:
-                                RT_new = np.zeros((3, 4), dtype=np.float32)
-                                RT_new[:3, :3] = quat2mat(poses_new[k, :4])
-                                RT_new[:, 3] = poses_new[k, 4:7]
-
-                                RT_icp = np.zeros((3, 4), dtype=np.float32)
-                                RT_icp[:3, :3] = quat2mat(poses_icp[k, :4])
-                                RT_icp[:, 3] = poses_icp[k, 4:7]
-
-                            error_rotation = re(RT[:3, :3], poses_gt[:3, :3, j])
-                            error_translation = te(RT[:, 3], poses_gt[:, 3, j])
-                            if cls == '024_bowl' or cls == '036_wood_block' or cls == '061_foam_brick':
-                                error = adi(RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points[cls_index])
-                            else:
-                                error = add(RT[:3, :3], RT[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points[cls_index])
-
-                            if error < threshold[cls_index]:
-                                count_correct[cls_index] += 1
-
-                            if cfg.TEST.POSE_REFINE:
-                                error_rotation_new = re(RT_new[:3, :3], poses_gt[:3, :3, j])
-                                error_translation_new = te(RT_new[:, 3], poses_gt[:, 3, j])
-                                if cls == '024_bowl' or cls == '036_wood_block' or cls == '061_foam_brick':
-                                    error_new = adi(RT_new[:3, :3], RT_new[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points[cls_index])
-                                else:
-                                    error_new = add(RT_new[:3, :3], RT_new[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points[cls_index])
-
-                                if error_new < threshold[cls_index]:
-                                    count_correct_refined[cls_index] += 1
-
-                                error_rotation_icp = re(RT_icp[:3, :3], poses_gt[:3, :3, j])
-                                error_translation_icp = te(RT_icp[:, 3], poses_gt[:, 3, j])
-                                if cls == '024_bowl' or cls == '036_wood_block' or cls == '061_foam_brick':
-                                    error_icp = adi(RT_icp[:3, :3], RT_icp[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points[cls_index])
-                                else:
-                                    error_icp = add(RT_icp[:3, :3], RT_icp[:, 3], poses_gt[:3, :3, j], poses_gt[:, 3, j], self._points[cls_index])
-
-                                if error_icp < threshold[cls_index]:
-                                    count_correct_icp[cls_index] += 1
-
-            '''
-            # label image
-            rgba = cv2.imread(self.image_path_from_index(index), cv2.IMREAD_UNCHANGED)
-            image = rgba[:,:,:3]
-            alpha = rgba[:,:,3]
-            I = np.where(alpha == 0)
-            image[I[0], I[1], :] = 255
-            label_image = self.labels_to_image(image, sg_labels)
-
-            # save image
-            filename = os.path.join(image_dir, '%04d.png' % im_ind)
-            print filename
-            cv2.imwrite(filename, label_image)
-            '''
+        # accumulate the confusion matrix and load the ground truth poses,
+        # with the images sharded across cfg.TEST.EVAL_WORKERS processes
+        profiler.tic('evaluate_segmentations')
+        profiler.tic('images')
+        global _eval_imdb, _eval_segmentations
+        _eval_imdb = self
+        _eval_segmentations = segmentations
+        num_images = len(self.image_index)
+        num_workers = min(cfg.TEST.EVAL_WORKERS, num_images)
+        if num_workers > 0:
+            shards = [list(shard) for shard in np.array_split(np.arange(num_images), 4 * num_workers) if len(shard) > 0]
+            pool = multiprocessing.Pool(num_workers)
+            results = pool.map(_evaluate_images, shards)
+            pool.close()
+            pool.join()
+        else:
+            results = [_evaluate_images(range(num_images))]
+        _eval_imdb = None
+        _eval_segmentations = None
+        profiler.toc('images')
+
+        gts = []
+        for shard_hist, shard_gts in results:
+            hist += shard_hist
+            gts += shard_gts
+
+        # evaluate pose
+        if cfg.TEST.POSE_REG:
+            profiler.tic('poses')
+            count_all, count_correct, count_correct_refined, count_correct_icp = \
+                self._evaluate_poses(segmentations, gts, threshold)
+            profiler.toc('poses')
+        profiler.toc('evaluate_segmentations')
 
         # overall accuracy
         acc = np.diag(hist).sum() / hist.sum()
@@ -678,9 +648,11 @@ class lov(datasets.imdb):
                         self.classes[i], count_correct_refined[i], count_all[i], float(count_correct_refined[i]) / float(count_all[i]))
                     print '{} correct poses after ICP: {}, all poses: {}, accuracy: {}'.format( \
                         self.classes[i], count_correct_icp[i], count_all[i], float(count_correct_icp[i]) / float(count_all[i]))
+            self.model_index.report()
+            self.model_index.save()
 
 
 if __name__ == '__main__':
-    d = datasets.lov('train')
+    d = datasets.lov.lov('train')
     res = d.roidb
     from IPython import embed; embed()
@@ -165,7 +165,7 @@ class lov_single(datasets.imdb):
             point_file = os.path.join(self._lov_path, 'models', self._classes[i], 'points.xyz')
             print point_file
             assert os.path.exists(point_file), 'Path does not exist: {}'.format(point_file)
-            points[i] = np.loadtxt(point_file)
+            points[i] = self.model_geometry.points(point_file)
             if points[i].shape[0] < num:
                 num = points[i].shape[0]
 
@@ -183,7 +183,7 @@ class lov_single(datasets.imdb):
                 'Path does not exist: {}'.format(extent_file)
 
         extents = np.zeros((self.num_classes, 3), dtype=np.float32)
-        extents_txt = np.loadtxt(extent_file)
+        extents_txt = self._loadtxt(extent_file)
         extents[1, :] = extents_txt[self._cls_index - 1, :]
 
         extents_all = np.zeros((self._num_classes_all, 3), dtype=np.float32)
@@ -387,35 +387,6 @@ class lov_single(datasets.imdb):
         return image.astype(np.uint8)
 
 
-    def save_result(self, im_ind, segmentation, output_dir):
-
-        # make matlab result dir
-        import scipy.io
-        mat_dir = os.path.join(output_dir, 'mat')
-        if not os.path.exists(mat_dir):
-            os.makedirs(mat_dir)
-
-        sg_labels = segmentation['labels']
-        # evaluate pose
-        if cfg.TEST.POSE_REG:   
-            rois = segmentation['rois']
-            poses = segmentation['poses']
-            poses_new = segmentation['poses_refined']
-            poses_icp = segmentation['poses_icp']
-            if cfg.TEST.VERTEX_REG_3D:
-                rois_rgb = segmentation['rois_rgb']
-                poses_rgb = segmentation['poses_rgb']
-
-            # save matlab result
-            if cfg.TEST.VERTEX_REG_2D:
-                results = {'labels': sg_labels, 'rois': rois, 'poses': poses, 'poses_refined': poses_new, 'poses_icp': poses_icp}
-            else:
-                results = {'labels': sg_labels, 'rois_rgb': rois_rgb, 'poses_rgb': poses_rgb, 'rois': rois, 'poses': poses, 'poses_refined': poses_new, 'poses_icp': poses_icp}
-            filename = os.path.join(mat_dir, '%04d.mat' % im_ind)
-            print filename
-            scipy.io.savemat(filename, results, do_compression=True)
-
-
     def evaluate_result(self, im_ind, segmentation, gt_labels, meta_data, output_dir):
 
         # make matlab result dir
@@ -568,8 +539,9 @@ class lov_single(datasets.imdb):
             im = cv2.imread(self.label_path_from_index(index), cv2.IMREAD_UNCHANGED)
             gt_labels = im.astype(np.float32)
 
-            # predicated labels
-            sg_labels = segmentations[im_ind]['labels']
+            # predicated labels, read once from the results store
+            seg = segmentations[im_ind]
+            sg_labels = seg['labels']
             hist += self.fast_hist(gt_labels.flatten(), sg_labels.flatten(), n_cl)
 
             # evaluate pose
@@ -577,10 +549,10 @@ class lov_single(datasets.imdb):
                 # load meta data
                 meta_data = scipy.io.loadmat(self.metadata_path_from_index(index))
             
-                rois = segmentations[im_ind]['rois']
-                poses = segmentations[im_ind]['poses']
-                poses_new = segmentations[im_ind]['poses_refined']
-                poses_icp = segmentations[im_ind]['poses_icp']
+                rois = seg['rois']
+                poses = seg['poses']
+                poses_new = seg['poses_refined']
+                poses_icp = seg['poses_icp']
 
                 '''
                 # save matlab result
@@ -703,6 +675,6 @@ class lov_single(datasets.imdb):
 
 
 if __name__ == '__main__':
-    d = datasets.lov('train')
+    d = datasets.lov.lov('train')
     res = d.roidb
     from IPython import embed; embed()
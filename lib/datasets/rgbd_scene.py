@@ -281,6 +281,6 @@ class rgbd_scene(datasets.imdb):
 
 
 if __name__ == '__main__':
-    d = datasets.rgbd_scene('train')
+    d = datasets.rgbd_scene.rgbd_scene('train')
     res = d.roidb
     from IPython import embed; embed()
@@ -284,6 +284,6 @@ class shapenet_scene(datasets.imdb):
 
 
 if __name__ == '__main__':
-    d = datasets.shapenet_scene('train')
+    d = datasets.shapenet_scene.shapenet_scene('train')
     res = d.roidb
     from IPython import embed; embed()
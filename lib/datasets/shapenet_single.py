@@ -140,7 +140,7 @@ class shapenet_single(datasets.imdb):
                 'Path does not exist: {}'.format(extent_file)
 
         extents = np.zeros((self.num_classes, 3), dtype=np.float32)
-        extents[1:, :] = np.loadtxt(extent_file)
+        extents[1:, :] = self._loadtxt(extent_file)
 
         return extents
 
@@ -319,6 +319,6 @@ class shapenet_single(datasets.imdb):
 
 
 if __name__ == '__main__':
-    d = datasets.shapenet_single('train')
+    d = datasets.shapenet_single.shapenet_single('train')
     res = d.roidb
     from IPython import embed; embed()
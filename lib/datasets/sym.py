@@ -137,7 +137,7 @@ class sym(datasets.imdb):
             point_file = os.path.join(self._sym_path, 'models', self._classes[i] + '.xyz')
             print point_file
             assert os.path.exists(point_file), 'Path does not exist: {}'.format(point_file)
-            points[i] = np.loadtxt(point_file)
+            points[i] = self.model_geometry.points(point_file)
             if points[i].shape[0] < num:
                 num = points[i].shape[0]
 
@@ -155,7 +155,7 @@ class sym(datasets.imdb):
                 'Path does not exist: {}'.format(extent_file)
 
         extents = np.zeros((self.num_classes, 3), dtype=np.float32)
-        extents[1:, :] = np.loadtxt(extent_file)
+        extents[1:, :] = self._loadtxt(extent_file)
 
         return extents
 
@@ -528,13 +528,14 @@ class sym(datasets.imdb):
                 gt_labels[:, :] = 0
                 gt_labels[I[0], I[1]] = 1
 
-            # predicated labels
-            if not segmentations[im_ind]:
+            # predicated labels, read once from the results store
+            seg = segmentations[im_ind]
+            if not seg:
                 filename = os.path.join(mat_dir, '%04d.mat' % im_ind)
                 results_mat = scipy.io.loadmat(filename)
                 sg_labels = results_mat['labels']
             else:
-                sg_labels = segmentations[im_ind]['labels']
+                sg_labels = seg['labels']
             hist += self.fast_hist(gt_labels.flatten(), sg_labels.flatten(), n_cl)
 
             # evaluate pose
@@ -546,16 +547,16 @@ class sym(datasets.imdb):
                 meta_data['cls_indexes'][:] = 0
                 meta_data['cls_indexes'][ind] = 1
 
-                if not segmentations[im_ind]:
+                if not seg:
                     rois = results_mat['rois']
                     poses = results_mat['poses']
                     poses_new = results_mat['poses_refined']
                     poses_icp = results_mat['poses_icp']
                 else:
-                    rois = segmentations[im_ind]['rois']
-                    poses = segmentations[im_ind]['poses']
-                    poses_new = segmentations[im_ind]['poses_refined']
-                    poses_icp = segmentations[im_ind]['poses_icp']
+                    rois = seg['rois']
+                    poses = seg['poses']
+                    poses_new = seg['poses_refined']
+                    poses_icp = seg['poses_icp']
 
                 # save matlab result
                 results = {'labels': sg_labels, 'rois': rois, 'poses': poses, 'poses_refined': poses_new, 'poses_icp': poses_icp}
@@ -823,6 +824,6 @@ class sym(datasets.imdb):
             print 'correct poses: {}, all poses: {}, accuracy: {}'.format(count_correct, count_all, float(count_correct) / float(count_all))
 
 if __name__ == '__main__':
-    d = datasets.sym('test')
+    d = datasets.sym.sym('test')
     res = d.roidb
     from IPython import embed; embed()
@@ -137,7 +137,7 @@ class ycb(datasets.imdb):
             point_file = os.path.join(self._ycb_path, 'models', self._classes[i], 'points.xyz')
             print point_file
             assert os.path.exists(point_file), 'Path does not exist: {}'.format(point_file)
-            points[i] = np.loadtxt(point_file)
+            points[i] = self.model_geometry.points(point_file)
             if points[i].shape[0] < num:
                 num = points[i].shape[0]
 
@@ -155,7 +155,7 @@ class ycb(datasets.imdb):
                 'Path does not exist: {}'.format(extent_file)
 
         extents = np.zeros((self.num_classes, 3), dtype=np.float32)
-        extents[1:, :] = np.loadtxt(extent_file)
+        extents[1:, :] = self._loadtxt(extent_file)
 
         return extents
 
@@ -566,6 +566,6 @@ class ycb(datasets.imdb):
 
 
 if __name__ == '__main__':
-    d = datasets.ycb('trainval')
+    d = datasets.ycb.ycb('trainval')
     res = d.roidb
     from IPython import embed; embed()
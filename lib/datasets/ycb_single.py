@@ -176,7 +176,7 @@ class ycb_single(datasets.imdb):
             point_file = os.path.join(self._ycb_path, 'models', self._classes[i], 'points.xyz')
             print point_file
             assert os.path.exists(point_file), 'Path does not exist: {}'.format(point_file)
-            points[i] = np.loadtxt(point_file)
+            points[i] = self.model_geometry.points(point_file)
             if points[i].shape[0] < num:
                 num = points[i].shape[0]
 
@@ -194,7 +194,7 @@ class ycb_single(datasets.imdb):
                 'Path does not exist: {}'.format(extent_file)
 
         extents = np.zeros((self.num_classes, 3), dtype=np.float32)
-        extents_txt = np.loadtxt(extent_file)
+        extents_txt = self._loadtxt(extent_file)
         extents[1, :] = extents_txt[self._cls_index - 1, :]
 
         extents_all = np.zeros((self._num_classes_all, 3), dtype=np.float32)
@@ -402,35 +402,6 @@ class ycb_single(datasets.imdb):
         return image.astype(np.uint8)
 
 
-    def save_result(self, im_ind, segmentation, output_dir):
-
-        # make matlab result dir
-        import scipy.io
-        mat_dir = os.path.join(output_dir, 'mat')
-        if not os.path.exists(mat_dir):
-            os.makedirs(mat_dir)
-
-        sg_labels = segmentation['labels']
-        # evaluate pose
-        if cfg.TEST.POSE_REG:   
-            rois = segmentation['rois']
-            poses = segmentation['poses']
-            poses_new = segmentation['poses_refined']
-            poses_icp = segmentation['poses_icp']
-            if cfg.TEST.VERTEX_REG_3D:
-                rois_rgb = segmentation['rois_rgb']
-                poses_rgb = segmentation['poses_rgb']
-
-            # save matlab result
-            if cfg.TEST.VERTEX_REG_2D:
-                results = {'labels': sg_labels, 'rois': rois, 'poses': poses, 'poses_refined': poses_new, 'poses_icp': poses_icp}
-            else:
-                results = {'labels': sg_labels, 'rois_rgb': rois_rgb, 'poses_rgb': poses_rgb, 'rois': rois, 'poses': poses, 'poses_refined': poses_new, 'poses_icp': poses_icp}
-            filename = os.path.join(mat_dir, '%04d.mat' % im_ind)
-            print filename
-            scipy.io.savemat(filename, results, do_compression=True)
-
-
     def evaluate_result(self, im_ind, segmentation, gt_labels, meta_data, output_dir):
 
         # make matlab result dir
@@ -719,6 +690,6 @@ class ycb_single(datasets.imdb):
 
 
 if __name__ == '__main__':
-    d = datasets.ycb('train')
+    d = datasets.ycb.ycb('train')
     res = d.roidb
     from IPython import embed; embed()
@@ -141,7 +141,7 @@ class yumi(datasets.imdb):
             point_file = os.path.join(self._yumi_path, 'models', self._classes[i] + '.xyz')
             print point_file
             assert os.path.exists(point_file), 'Path does not exist: {}'.format(point_file)
-            points[i] = np.loadtxt(point_file)
+            points[i] = self.model_geometry.points(point_file)
             if points[i].shape[0] < num:
                 num = points[i].shape[0]
 
@@ -159,7 +159,7 @@ class yumi(datasets.imdb):
                 'Path does not exist: {}'.format(extent_file)
 
         extents = np.zeros((self.num_classes, 3), dtype=np.float32)
-        extents[1:, :] = np.loadtxt(extent_file)
+        extents[1:, :] = self._loadtxt(extent_file)
 
         return extents
 
@@ -646,6 +646,6 @@ class yumi(datasets.imdb):
 
 
 if __name__ == '__main__':
-    d = datasets.yumi('train')
+    d = datasets.yumi.yumi('train')
     res = d.roidb
     from IPython import embed; embed()
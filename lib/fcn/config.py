@@ -35,6 +35,26 @@ __C.RIG = ''
 __C.CAD = ''
 __C.POSE = ''
 __C.BACKGROUND = ''
+
+# Decode and resize the background images once into a memory-mapped store next to their list
+__C.BACKGROUND_STORE = False
+
+# Number of background images packed into the store, 0 for all of them
+__C.BACKGROUND_STORE_SIZE = 0
+
+# Number of decoded background images kept in memory by each process
+__C.BACKGROUND_CACHE_SIZE = 200
+
+# Normals of the depth images of cfg.INPUT == 'NORMAL', 'cpu' or 'gpu' (needs the CUDA build of gpu_normals)
+__C.NORMAL_BACKEND = 'cpu'
+
+# Radius of the window averaging the surface tangents of the cpu normals, 0 for
+# no averaging. Smoothed normals replace the bilateral filter of the normal image
+__C.NORMAL_SMOOTHING = 0
+
+# Threads of the OpenMP kernel of the cpu normals, 0 for all the cores. The
+# training loader workers use 1, since the OpenMP thread pool does not survive a fork
+__C.NORMAL_THREADS = 0
 __C.USE_GPU_NMS = True
 
 # Anchor scales for RPN
@@ -87,6 +107,22 @@ __C.TRAIN.SYN_TFAR = 2.0
 __C.TRAIN.SYN_SAMPLE_OBJECT = True
 __C.TRAIN.SYN_SAMPLE_POSE = False
 
+# Number of rendering processes and size of their sample ring for SYN_ONLINE
+__C.TRAIN.SYN_WORKERS = 4
+__C.TRAIN.SYN_QUEUE_SIZE = 100
+
+# index file of the packed shards of the training frames (tools/pack_shards.py), '' reads the image files
+__C.TRAIN.SHARDS = ''
+
+# cache the label, vertex targets and poses of the real frames on disk after their first use
+__C.TRAIN.TARGET_CACHE = False
+
+# Number of processes building the training minibatches (0 builds them in the feeder thread)
+__C.TRAIN.LOADER_WORKERS = 4
+
+# Number of minibatches in shared memory between the workers and the feeder thread
+__C.TRAIN.LOADER_QUEUE_SIZE = 8
+
 # domain adaptation
 __C.TRAIN.ADAPT = False
 __C.TRAIN.ADAPT_ROOT = ''
@@ -215,6 +251,44 @@ __C.TEST.POSE_REFINE = False
 __C.TEST.SYNTHETIC = False
 __C.TEST.VOTING_THRESHOLD = -1
 
+# Number of frames fed to the network in one forward pass in single frame testing
+__C.TEST.IMS_PER_BATCH = 1
+
+# Number of processes reading test frames ahead of the network (0 reads in the main process)
+__C.TEST.PREFETCH_WORKERS = 2
+
+# Maximum number of test frames read ahead
+__C.TEST.PREFETCH_SIZE = 8
+
+# Number of processes used to evaluate the test results (0 evaluates in the main process)
+__C.TEST.EVAL_WORKERS = 4
+
+# Save the nearest neighbor indexes of the object models used by the ADI metric in data/cache
+__C.TEST.MODEL_INDEX_CACHE = False
+
+# NMS of the rois from Hough voting: 'python', 'numpy' or 'cython' (nms.cpu_roi_nms)
+__C.TEST.ROI_NMS = 'numpy'
+
+# Solver of the translations of the detections from their boxes: 'nelder-mead' or 'gauss-newton'
+# (faster, compare it on the detections with tools/test_translation.py before using it)
+__C.TEST.TRANSLATION_SOLVER = 'nelder-mead'
+
+# Track the objects across the frames of a video in single frame testing (VERTEX_REG_2D) and
+# in the ros node, the Hough voting runs only when the objects are lost (utils.pose_tracker)
+__C.TEST.TRACKING = False
+
+# Minimum mask overlap (IoU) of a tracked object with its mask in the last frame
+__C.TEST.TRACK_MIN_OVERLAP = 0.7
+
+# Maximum depth residual in meters of a tracked object in its last pose
+__C.TEST.TRACK_MAX_RESIDUAL = 0.02
+
+# Tracked objects with a smaller depth residual in meters keep their last pose without ICP
+__C.TEST.TRACK_ICP_RESIDUAL = 0.005
+
+# Detect the tracked frames too and report the pose errors of the tracked against the detected poses
+__C.TEST.TRACK_AUDIT = False
+
 # Scales to compute real features
 __C.TEST.SCALES_BASE = (0.25, 0.5, 1.0, 2.0, 3.0)
 
@@ -237,6 +311,35 @@ __C.TEST.BBOX_REG = True
 # IoU >= this threshold)
 __C.TEST.NMS = 0.3
 
+#
+# ros node options
+#
+__C.ROS = edict()
+
+# Frames older than this many seconds when they reach the network are dropped (0 keeps all)
+__C.ROS.LATENCY_BUDGET = 0.2
+
+# Record the color and depth images of every n-th frame into RECORD_DIR (0 records nothing)
+__C.ROS.RECORD_EVERY = 0
+__C.ROS.RECORD_DIR = 'images'
+
+# Print and publish the latency histograms of the pipeline stages every n published frames
+__C.ROS.REPORT_EVERY = 100
+
+#
+# preprocessing of the input images (see lib/utils/preprocess.py)
+#
+__C.PREPROCESS = edict()
+
+# Method building the blob images of single frame testing: 'reference', 'fused' or 'uint8'
+__C.PREPROCESS.TEST = 'fused'
+
+# Method building the blob images of the ros node
+__C.PREPROCESS.ROS = 'fused'
+
+# Method building the blob images of the training minibatches
+__C.PREPROCESS.TRAIN = 'fused'
+
 # Pixel mean values (BGR order) as a (1, 1, 3) array
 # These are the values originally used for training VGG16
 __C.PIXEL_MEANS = np.array([[[102.9801, 115.9465, 122.7717]]])
@@ -244,6 +347,9 @@ __C.PIXEL_MEANS = np.array([[[102.9801, 115.9465, 122.7717]]])
 # For reproducibility
 __C.RNG_SEED = 3
 
+# Profile the scopes of the test and training loops (utils.timer.profiler)
+__C.PROFILE = False
+
 # A small number that's used many times
 __C.EPS = 1e-14
 
@@ -0,0 +1,126 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Frozen inference graphs of the single frame networks.
+
+freeze_network prunes a network built for testing to the tensors its
+inference outputs depend on. The dequeued inputs are replaced by
+placeholders named input/<name>, the keep probability by the constant 1.0,
+and the variables by constants, so the graph has no input queue, losses,
+savers or variables. The outputs are named output/<name>.
+
+FrozenNetwork imports such a graph and looks like the network to the test
+code: the inputs are in layers, and get_output returns the outputs.
+"""
+
+import tensorflow as tf
+# the custom ops of the inference graph
+import hough_voting_gpu_layer.hough_voting_gpu_op
+import roi_pooling_layer.roi_pooling_op
+
+INPUT_NAMES = ('data', 'data_p', 'gt_label_2d', 'vertex_targets', 'vertex_weights', \
+               'poses', 'extents', 'meta_data', 'points', 'symmetry')
+
+def output_names(vertex_reg_2d, vertex_reg_3d, pose_reg):
+    """the outputs of a network tested with these options"""
+    names = ['label_2d', 'prob_normalized']
+    if vertex_reg_2d or vertex_reg_3d:
+        names.append('vertex_pred')
+    if vertex_reg_2d:
+        names += ['rois', 'poses_init']
+        if pose_reg:
+            names.append('poses_tanh')
+    return names
+
+
+def freeze_network(sess, net, outputs, fold_constants=True):
+    """Return the frozen GraphDef computing the outputs of net with the variables in sess."""
+    graph = sess.graph
+    with graph.as_default():
+        for name in outputs:
+            tf.identity(net.get_output(name), name='output/' + name)
+    output_nodes = ['output/' + name for name in outputs]
+    graph_def = tf.graph_util.convert_variables_to_constants(sess, graph.as_graph_def(), output_nodes)
+
+    # map the dequeued tensors to placeholders and prune the queue
+    pruned = tf.Graph()
+    with pruned.as_default():
+        input_map = {}
+        for name in INPUT_NAMES:
+            if name in net.layers:
+                tensor = net.layers[name]
+                input_map[tensor.name] = tf.placeholder(tensor.dtype, name='input/' + name)
+        input_map[net.keep_prob_queue.name] = tf.constant(1.0, dtype=tf.float32, name='keep_prob')
+        tf.import_graph_def(graph_def, input_map=input_map, name='')
+    graph_def = tf.graph_util.extract_sub_graph(pruned.as_graph_def(), output_nodes)
+    for node in graph_def.node:
+        node.device = ''
+
+    if fold_constants:
+        try:
+            from tensorflow.tools.graph_transforms import TransformGraph
+        except ImportError:
+            print 'graph transforms are not available, constants are not folded'
+        else:
+            inputs = [node.name for node in graph_def.node if node.op == 'Placeholder']
+            graph_def = TransformGraph(graph_def, inputs, output_nodes, \
+                                       ['fold_constants(ignore_errors=true)', 'sort_by_execution_order'])
+    return graph_def
+
+
+def write_frozen_graph(graph_def, filename):
+    """Serialize the GraphDef to filename."""
+    with tf.gfile.GFile(filename, 'wb') as fid:
+        fid.write(graph_def.SerializeToString())
+    print 'wrote frozen graph with {} nodes to {}'.format(len(graph_def.node), filename)
+
+
+class FrozenNetwork(object):
+    """A frozen inference graph imported into a graph.
+
+    Only the inputs the outputs depend on are kept in the graph, layers holds
+    their placeholders. The keep probability is folded, keep_prob_queue is
+    None.
+    """
+
+    def __init__(self, filename, graph=None):
+        graph_def = tf.GraphDef()
+        with tf.gfile.GFile(filename, 'rb') as fid:
+            graph_def.ParseFromString(fid.read())
+
+        if graph is None:
+            graph = tf.get_default_graph()
+        with graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+
+        self.layers = {}
+        self.outputs = {}
+        for node in graph_def.node:
+            if node.name.startswith('input/'):
+                self.layers[node.name[len('input/'):]] = graph.get_tensor_by_name(node.name + ':0')
+            elif node.name.startswith('output/'):
+                self.outputs[node.name[len('output/'):]] = graph.get_tensor_by_name(node.name + ':0')
+        self.keep_prob_queue = None
+        print 'frozen graph {} with inputs {} and outputs {}'.format(filename, sorted(self.layers.keys()), sorted(self.outputs.keys()))
+
+    def get_output(self, layer):
+        try:
+            return self.outputs[layer]
+        except KeyError:
+            raise KeyError('Output not in the frozen graph: %s' % layer)
+
+
+def feed_inputs(net, inputs):
+    """Return the feed dict of the blobs in inputs {name: blob} for the inputs net has.
+
+    net is a network or a FrozenNetwork, the keep probability is fed as 1.0
+    unless it is folded.
+    """
+    feed_dict = dict((net.layers[name], blob) for name, blob in inputs.iteritems() if name in net.layers)
+    if net.keep_prob_queue is not None:
+        feed_dict[net.keep_prob_queue] = 1.0
+    return feed_dict
@@ -9,13 +9,23 @@
 
 from fcn.config import cfg, get_output_dir
 import argparse
-from utils.timer import Timer
+from utils.timer import Timer, profiler
 from utils.blob import im_list_to_blob, pad_im, unpad_im, add_noise
+from utils.blob_pool import BlobPool
+from utils.frame_reader import FrameReader
 from utils.voxelizer import Voxelizer, set_axes_equal
 from utils.se3 import *
 from utils.pose_error import *
 from utils.bbox_transform import clip_boxes, bbox_transform_inv
 from utils.nms import nms
+from utils.vertex_targets import vote_centers, scale_vertmap
+from utils.background_store import open_background_store, sample_background
+from fcn.frozen_graph import FrozenNetwork, feed_inputs
+from utils.results_store import ResultsStore
+from utils.target_cache import config_key
+from utils.translation import translations_nelder_mead, translations_gauss_newton
+from utils.pose_tracker import PoseTracker, TrackingStats, pose_errors
+from utils.preprocess import frame_blobs
 import numpy as np
 import cv2
 import cPickle
@@ -25,8 +35,6 @@ import tensorflow as tf
 import time
 from transforms3d.quaternions import quat2mat, mat2quat
 import scipy.io
-from scipy.optimize import minimize
-from normals import gpu_normals
 
 # from synthesize import synthesizer
 # from pose_estimation import ransac
@@ -34,6 +42,9 @@ from normals import gpu_normals
 # from pose_refinement import refiner
 # from mpl_toolkits.mplot3d import Axes3D
 
+# constant blobs fed to the network at test time
+_blob_pool = BlobPool()
+
 def _get_image_blob(im, im_depth, meta_data):
     """Converts an image into a network input.
 
@@ -45,88 +56,15 @@ def _get_image_blob(im, im_depth, meta_data):
         im_scale_factors (list): list of image scales (relative to im) used
             in the image pyramid
     """
-    # RGB
-    im_orig = im.astype(np.float32, copy=True)
-    # mask the color image according to depth
-    if cfg.EXP_DIR == 'rgbd_scene':
-        I = np.where(im_depth == 0)
-        im_orig[I[0], I[1], :] = 0
-
-    processed_ims_rescale = []
-    im_scale = cfg.TEST.SCALES_BASE[0]
-    im_rescale = cv2.resize(im_orig / 127.5 - 1, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
-    processed_ims_rescale.append(im_rescale)
-
-    im_orig -= cfg.PIXEL_MEANS
-    processed_ims = []
-    im_scale_factors = []
     assert len(cfg.TEST.SCALES_BASE) == 1
+    im_scale = cfg.TEST.SCALES_BASE[0]
 
-    im = cv2.resize(im_orig, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
-    im_scale_factors.append(im_scale)
-    processed_ims.append(im)
-
-    # depth
-    im_orig = im_depth.astype(np.float32, copy=True)
-    # im_orig = im_orig / im_orig.max() * 255
-    im_orig = np.clip(im_orig / 2000.0, 0, 1) * 255
-    im_orig = np.tile(im_orig[:,:,np.newaxis], (1,1,3))
-    im_orig -= cfg.PIXEL_MEANS
-
-    processed_ims_depth = []
-    im = cv2.resize(im_orig, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
-    processed_ims_depth.append(im)
-
-    if cfg.INPUT == 'NORMAL':
-        # meta data
-        K = meta_data['intrinsic_matrix'].astype(np.float32, copy=True)
-        fx = K[0, 0]
-        fy = K[1, 1]
-        cx = K[0, 2]
-        cy = K[1, 2]
-
-        # normals
-        depth = im_depth.astype(np.float32, copy=True) / float(meta_data['factor_depth'])
-        nmap = gpu_normals.gpu_normals(depth, fx, fy, cx, cy, 20.0, cfg.GPU_ID)
-        im_normal = 127.5 * nmap + 127.5
-        im_normal = im_normal.astype(np.uint8)
-        im_normal = im_normal[:, :, (2, 1, 0)]
-        im_normal = cv2.bilateralFilter(im_normal, 9, 75, 75)
-        im_orig = im_normal.astype(np.float32, copy=True)
-        im_orig -= cfg.PIXEL_MEANS
-
-        processed_ims_normal = []
-        im = cv2.resize(im_orig, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
-        processed_ims_normal.append(im)
-        blob_normal = im_list_to_blob(processed_ims_normal, 3)
-    else:
-        blob_normal = []
-
-    # Create a blob to hold the input images
-    blob = im_list_to_blob(processed_ims, 3)
-    blob_rescale = im_list_to_blob(processed_ims_rescale, 3)
-    blob_depth = im_list_to_blob(processed_ims_depth, 3)
-
-    return blob, blob_rescale, blob_depth, blob_normal, np.array(im_scale_factors)
-
+    blob, blob_depth, blob_normal = frame_blobs(im, im_depth, meta_data, im_scale, cfg.PREPROCESS.TEST)
+    return blob, blob_depth, blob_normal, np.array([im_scale])
 
-def im_segment_single_frame(sess, net, im, im_depth, meta_data, voxelizer, extents, points, symmetry, num_classes):
-    """segment image
-    """
 
-    # compute image blob
-    im_blob, im_rescale_blob, im_depth_blob, im_normal_blob, im_scale_factors = _get_image_blob(im, im_depth, meta_data)
-    im_scale = im_scale_factors[0]
-    # construct the meta data
-    """
-    format of the meta_data
-    intrinsic matrix: meta_data[0 ~ 8]
-    inverse intrinsic matrix: meta_data[9 ~ 17]
-    pose_world2live: meta_data[18 ~ 29]
-    pose_live2world: meta_data[30 ~ 41]
-    voxel step size: meta_data[42, 43, 44]
-    voxel min value: meta_data[45, 46, 47]
-    """
+def _get_meta_data(meta_data, im_scale, voxelizer):
+    """Build the 48-dim meta data vector of one image for the network."""
     K = np.matrix(meta_data['intrinsic_matrix']) * im_scale
     K[2, 2] = 1
     Kinv = np.linalg.pinv(K)
@@ -145,17 +83,41 @@ def im_segment_single_frame(sess, net, im, im_depth, meta_data, voxelizer, exten
         mdata[0] = -1 * mdata[0]
         mdata[9] = -1 * mdata[9]
         mdata[11] = -1 * mdata[11]
+    return mdata
+
+
+def im_segment_single_frame(sess, net, im, im_depth, meta_data, voxelizer, extents, points, symmetry, num_classes):
+    """segment image
+    """
+
+    # a frozen graph has no input queue
+    if isinstance(net, FrozenNetwork):
+        return im_segment_multi_frame(sess, net, [im], [im_depth], [meta_data], voxelizer, extents, points, symmetry, num_classes)[0]
+
+    # compute image blob
+    im_blob, im_depth_blob, im_normal_blob, im_scale_factors = _get_image_blob(im, im_depth, meta_data)
+    im_scale = im_scale_factors[0]
+    # construct the meta data
+    """
+    format of the meta_data
+    intrinsic matrix: meta_data[0 ~ 8]
+    inverse intrinsic matrix: meta_data[9 ~ 17]
+    pose_world2live: meta_data[18 ~ 29]
+    pose_live2world: meta_data[30 ~ 41]
+    voxel step size: meta_data[42, 43, 44]
+    voxel min value: meta_data[45, 46, 47]
+    """
     meta_data_blob = np.zeros((1, 1, 1, 48), dtype=np.float32)
-    meta_data_blob[0,0,0,:] = mdata
+    meta_data_blob[0,0,0,:] = _get_meta_data(meta_data, im_scale, voxelizer)
 
     # use a fake label blob of ones
     height = int(im_depth.shape[0] * im_scale)
     width = int(im_depth.shape[1] * im_scale)
-    label_blob = np.ones((1, height, width), dtype=np.int32)
+    label_blob = _blob_pool.ones((1, height, width), np.int32)
 
-    pose_blob = np.zeros((1, 13), dtype=np.float32)
-    vertex_target_blob = np.zeros((1, height, width, 3*num_classes), dtype=np.float32)
-    vertex_weight_blob = np.zeros((1, height, width, 3*num_classes), dtype=np.float32)
+    pose_blob = _blob_pool.zeros((1, 13))
+    vertex_target_blob = _blob_pool.zeros((1, height, width, 3*num_classes), num_classes=num_classes)
+    vertex_weight_blob = vertex_target_blob
 
     # forward pass
     if cfg.INPUT == 'RGBD':
@@ -239,12 +201,184 @@ def im_segment_single_frame(sess, net, im, im_depth, meta_data, voxelizer, exten
     return labels_2d[0,:,:].astype(np.int32), probs[0,:,:,:], vertex_pred, rois, poses
 
 
+def _get_feed_dict(net, ims, im_depths, meta_datas, voxelizer, extents, points, symmetry, num_classes):
+    """feed dict of the dequeued tensors of the network for a batch of images
+
+    Returns the feed dict and the (height, width) of the images in the blobs.
+    """
+
+    num_images = len(ims)
+    vertex_reg = cfg.TEST.VERTEX_REG_2D or cfg.TEST.VERTEX_REG_3D
+
+    # compute image blobs
+    processed_ims = []
+    processed_ims_p = []
+    sizes = []
+    meta_data_blob = np.zeros((num_images, 1, 1, 48), dtype=np.float32)
+    for i in xrange(num_images):
+        im_blob, im_depth_blob, im_normal_blob, im_scale_factors = _get_image_blob(ims[i], im_depths[i], meta_datas[i])
+        im_scale = im_scale_factors[0]
+        if cfg.INPUT == 'DEPTH':
+            processed_ims.append(im_depth_blob[0])
+        elif cfg.INPUT == 'NORMAL':
+            processed_ims.append(im_normal_blob[0])
+        else:
+            processed_ims.append(im_blob[0])
+        if cfg.INPUT == 'RGBD':
+            processed_ims_p.append(im_depth_blob[0])
+        sizes.append((int(im_depths[i].shape[0] * im_scale), int(im_depths[i].shape[1] * im_scale)))
+        meta_data_blob[i,0,0,:] = _get_meta_data(meta_datas[i], im_scale, voxelizer)
+
+    # images of different sizes are zero padded to the largest one
+    if num_images == 1:
+        data_blob = processed_ims[0][np.newaxis, :, :, :]
+    else:
+        data_blob = im_list_to_blob(processed_ims, 3)
+    height = data_blob.shape[1]
+    width = data_blob.shape[2]
+
+    # use a fake label blob of ones
+    label_blob = _blob_pool.ones((num_images, height, width), np.int32)
+
+    inputs = {'data': data_blob, 'gt_label_2d': label_blob}
+    if cfg.INPUT == 'RGBD':
+        if num_images == 1:
+            inputs['data_p'] = processed_ims_p[0][np.newaxis, :, :, :]
+        else:
+            inputs['data_p'] = im_list_to_blob(processed_ims_p, 3)
+    if vertex_reg:
+        pose_blob = _blob_pool.zeros((1, 13))
+        inputs.update({'meta_data': meta_data_blob, 'extents': extents, 'points': points, \
+                       'symmetry': symmetry, 'poses': pose_blob})
+        # a frozen graph has no loss layers to feed targets to
+        if 'vertex_targets' in net.layers:
+            vertex_target_blob = _blob_pool.zeros((num_images, height, width, 3*num_classes), num_classes=num_classes)
+            inputs['vertex_targets'] = vertex_target_blob
+            inputs['vertex_weights'] = vertex_target_blob
+    return feed_inputs(net, inputs), sizes
+
+
+def _get_detections(outputs, i, num_classes):
+    """rois and poses of image i of a batch from the outputs (rois, poses_init[, poses_tanh]) of the network"""
+    index = np.where(outputs[0][:, 0] == i)[0]
+    if len(index) == 0:
+        # the same dummy detection as hough voting on a single image
+        rois = np.zeros((1, 7), dtype=np.float32)
+        rois[0, 1] = -1
+        poses = np.zeros((1, 7), dtype=np.float32)
+        poses_pred = np.zeros((1, 4 * num_classes), dtype=np.float32)
+    else:
+        rois = outputs[0][index, :]
+        rois[:, 0] = 0
+        poses = outputs[1][index, :]
+        if cfg.TEST.POSE_REG:
+            poses_pred = outputs[2][index, :]
+
+    if cfg.TEST.POSE_REG:
+        # non-maximum suppression
+        keep = nms(rois, 0.5)
+        rois = rois[keep, :]
+        poses = poses[keep, :]
+        poses_pred = poses_pred[keep, :]
+
+        # combine poses
+        for j in xrange(rois.shape[0]):
+            class_id = int(rois[j, 1])
+            if class_id >= 0:
+                poses[j, :4] = poses_pred[j, 4*class_id:4*class_id+4]
+    return rois, poses
+
+
+def im_segment_multi_frame(sess, net, ims, im_depths, meta_datas, voxelizer, extents, points, symmetry, num_classes):
+    """segment a batch of images with a single forward pass
+
+    The blobs are fed to the dequeued tensors of the network directly, so the
+    input queue is bypassed and the whole batch costs one session call. net
+    can be a FrozenNetwork, then only the inputs of its graph are fed.
+    Returns a list with one (labels, probs, vertex_pred, rois, poses) per image.
+    """
+
+    num_images = len(ims)
+    vertex_reg = cfg.TEST.VERTEX_REG_2D or cfg.TEST.VERTEX_REG_3D
+    feed_dict, sizes = _get_feed_dict(net, ims, im_depths, meta_datas, voxelizer, extents, points, symmetry, num_classes)
+
+    # forward pass
+    fetches = [net.get_output('label_2d'), net.get_output('prob_normalized')]
+    if vertex_reg:
+        fetches.append(net.get_output('vertex_pred'))
+    if cfg.TEST.VERTEX_REG_2D:
+        fetches += [net.get_output('rois'), net.get_output('poses_init')]
+        if cfg.TEST.POSE_REG:
+            fetches.append(net.get_output('poses_tanh'))
+    outputs = sess.run(fetches, feed_dict=feed_dict)
+    labels_2d = outputs[0]
+    probs = outputs[1]
+
+    # split the outputs into frames
+    results = []
+    for i in xrange(num_images):
+        h, w = sizes[i]
+        labels = labels_2d[i, :h, :w].astype(np.int32)
+        prob = probs[i, :h, :w, :]
+        if vertex_reg:
+            vertex_pred = outputs[2][i, :h, :w, :]
+        else:
+            vertex_pred = []
+        rois = []
+        poses = []
+
+        if cfg.TEST.VERTEX_REG_2D:
+            rois, poses = _get_detections(outputs[3:], i, num_classes)
+
+        results.append((labels, prob, vertex_pred, rois, poses))
+
+    return results
+
+
+def _fed_tensor(net, name):
+    """the tensor of a network output to feed, the outputs of a frozen graph are identities of it"""
+    tensor = net.get_output(name)
+    if isinstance(net, FrozenNetwork):
+        tensor = tensor.op.inputs[0]
+    return tensor
+
+
+def im_segment_tracking(sess, net, im, im_depth, meta_data, voxelizer, extents, points, symmetry, num_classes):
+    """segment an image without detecting its objects
+
+    Returns (labels, probs, vertex_pred, detect), detect() returns the rois and
+    poses of the image. It runs the Hough voting (and the pose regression) on
+    the outputs of the segmentation fed back to the network, so a frame whose
+    objects are tracked skips them and a detected frame does not run the
+    network twice.
+    """
+
+    feed_dict, sizes = _get_feed_dict(net, [im], [im_depth], [meta_data], voxelizer, extents, points, symmetry, num_classes)
+    names = ['label_2d', 'prob_normalized', 'vertex_pred']
+    if cfg.TEST.POSE_REG:
+        # the features pooled by the pose regression
+        names += ['conv4_3', 'conv5_3']
+    tensors = [_fed_tensor(net, name) for name in names]
+    outputs = sess.run(tensors, feed_dict=feed_dict)
+
+    def detect():
+        detect_feed_dict = dict(feed_dict)
+        detect_feed_dict.update(zip(tensors, outputs))
+        fetches = [net.get_output('rois'), net.get_output('poses_init')]
+        if cfg.TEST.POSE_REG:
+            fetches.append(net.get_output('poses_tanh'))
+        return _get_detections(sess.run(fetches, feed_dict=detect_feed_dict), 0, num_classes)
+
+    h, w = sizes[0]
+    return outputs[0][0, :h, :w].astype(np.int32), outputs[1][0, :h, :w, :], outputs[2][0, :h, :w, :], detect
+
+
 def im_segment(sess, net, im, im_depth, state, weights, points, meta_data, voxelizer, pose_world2live, pose_live2world):
     """segment image
     """
 
     # compute image blob
-    im_blob, im_rescale_blob, im_depth_blob, im_normal_blob, im_scale_factors = _get_image_blob(im, im_depth, meta_data)
+    im_blob, im_depth_blob, im_normal_blob, im_scale_factors = _get_image_blob(im, im_depth, meta_data)
 
     # depth
     depth = im_depth.astype(np.float32, copy=True) / float(meta_data['factor_depth'])
@@ -285,7 +419,7 @@ def im_segment(sess, net, im, im_depth, state, weights, points, meta_data, voxel
     depth_blob[0,:,:,0] = depth
     meta_data_blob[0,0,0,:] = mdata
     # use a fake label blob of 1s
-    label_blob = np.ones((1, height, width, voxelizer.num_classes), dtype=np.float32)
+    label_blob = _blob_pool.ones((1, height, width, voxelizer.num_classes), num_classes=voxelizer.num_classes)
 
     # reshape the blobs
     num_steps = 1
@@ -293,8 +427,11 @@ def im_segment(sess, net, im, im_depth, state, weights, points, meta_data, voxel
     height_blob = im_blob.shape[1]
     width_blob = im_blob.shape[2]
     im_blob = im_blob.reshape((num_steps, ims_per_batch, height_blob, width_blob, -1))
-    im_depth_blob = im_depth_blob.reshape((num_steps, ims_per_batch, height_blob, width_blob, -1))
-    im_normal_blob = im_normal_blob.reshape((num_steps, ims_per_batch, height_blob, width_blob, -1))
+    # the depth and normal blobs are [] unless cfg.INPUT uses them
+    if cfg.INPUT == 'DEPTH' or cfg.INPUT == 'RGBD':
+        im_depth_blob = im_depth_blob.reshape((num_steps, ims_per_batch, height_blob, width_blob, -1))
+    if cfg.INPUT == 'NORMAL':
+        im_normal_blob = im_normal_blob.reshape((num_steps, ims_per_batch, height_blob, width_blob, -1))
 
     label_blob = label_blob.reshape((num_steps, ims_per_batch, height, width, -1))
     depth_blob = depth_blob.reshape((num_steps, ims_per_batch, height, width, -1))
@@ -375,6 +512,61 @@ def vis_segmentations(im, im_depth, labels, labels_gt, colors):
     '''
     plt.show()
 
+def _read_frame(rgb_filename, depth_filename, meta_filename=None):
+    """read a color image, a depth image and the meta data, padded for the network
+    """
+
+    # read color image
+    rgba = pad_im(cv2.imread(rgb_filename, cv2.IMREAD_UNCHANGED), 16)
+    if rgba.shape[2] == 4:
+        im = np.copy(rgba[:,:,:3])
+        alpha = rgba[:,:,3]
+        I = np.where(alpha == 0)
+        im[I[0], I[1], :] = 0
+    else:
+        im = rgba
+
+    # read depth image
+    if os.path.isfile(depth_filename):
+        im_depth = pad_im(cv2.imread(depth_filename, cv2.IMREAD_UNCHANGED), 16)
+    else:
+        im_depth = np.zeros((im.shape[0], im.shape[1]), dtype=np.uint16)
+
+    # load meta data
+    if meta_filename is None:
+        meta_data = None
+    else:
+        meta_data = scipy.io.loadmat(meta_filename)
+
+    return im, im_depth, meta_data
+
+
+def _get_frame_reader(read_frame, indexes):
+    """prefetch the test frames with cfg.TEST.PREFETCH_WORKERS processes
+    """
+    return FrameReader(read_frame, indexes, cfg.TEST.PREFETCH_WORKERS, cfg.TEST.PREFETCH_SIZE, cfg.RNG_SEED)
+
+
+def _results_key():
+    """hash of the config the stored test results depend on
+    """
+    # the keys not changing the results
+    ignored = ('VISUALIZE', 'PREFETCH_WORKERS', 'PREFETCH_SIZE', 'EVAL_WORKERS', 'MODEL_INDEX_CACHE', 'TRACK_AUDIT')
+    test = [(key, cfg.TEST[key]) for key in sorted(cfg.TEST.keys()) if key not in ignored]
+    synthetic = (cfg.TRAIN.SYNROOT, cfg.TRAIN.SYNNUM, cfg.BACKGROUND) if cfg.TEST.SYNTHETIC else None
+    return config_key(test, cfg.INPUT, cfg.NETWORK, cfg.PIXEL_MEANS, cfg.PREPROCESS.TEST, \
+                      cfg.NORMAL_BACKEND, cfg.NORMAL_SMOOTHING, cfg.RNG_SEED, synthetic)
+
+
+def _skip_done_frames(indexes, results):
+    """the frames of indexes without a result in the results store
+    """
+    done = set(results.frames())
+    indexes = [i for i in indexes if i not in done]
+    if len(done) > 0:
+        print 'resuming, {} frames done, {} to go'.format(len(done), len(indexes))
+    return indexes
+
 ##################
 # test video
 ##################
@@ -384,18 +576,16 @@ def test_net(sess, net, imdb, weights_filename, rig_filename, is_kfusion):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    seg_file = os.path.join(output_dir, 'segmentations.pkl')
+    """Test a FCN on an image database."""
+    num_images = len(imdb.image_index)
+
+    # the frames are tracked in sequence, a run is not resumed
+    segmentations = ResultsStore(os.path.join(output_dir, 'segmentations.db'), _results_key())
     print imdb.name
-    if os.path.exists(seg_file):
-        with open(seg_file, 'rb') as fid:
-            segmentations = cPickle.load(fid)
+    if len(segmentations) == num_images:
         imdb.evaluate_segmentations(segmentations, output_dir)
         return
 
-    """Test a FCN on an image database."""
-    num_images = len(imdb.image_index)
-    segmentations = [[] for _ in xrange(num_images)]
-
     # timers
     _t = {'im_segment' : Timer(), 'misc' : Timer()}
 
@@ -420,12 +610,13 @@ def test_net(sess, net, imdb, weights_filename, rig_filename, is_kfusion):
     else:
         perm = xrange(num_images)
 
+    reader = _get_frame_reader(lambda i: _read_frame(imdb.image_path_at(i), imdb.depth_path_at(i), imdb.metadata_path_at(i)), perm)
+
     video_index = ''
     have_prediction = False
-    for i in perm:
-        rgba = pad_im(cv2.imread(imdb.image_path_at(i), cv2.IMREAD_UNCHANGED), 16)
-        height = rgba.shape[0]
-        width = rgba.shape[1]
+    for i, (im, im_depth, meta_data) in reader:
+        height = im.shape[0]
+        width = im.shape[1]
 
         # parse image name
         image_index = imdb.image_index[i]
@@ -445,21 +636,6 @@ def test_net(sess, net, imdb, weights_filename, rig_filename, is_kfusion):
                 points = np.zeros((1, height, width, 3), dtype=np.float32)
                 print 'start video {}'.format(video_index)
 
-        # read color image
-        if rgba.shape[2] == 4:
-            im = np.copy(rgba[:,:,:3])
-            alpha = rgba[:,:,3]
-            I = np.where(alpha == 0)
-            im[I[0], I[1], :] = 0
-        else:
-            im = rgba
-
-        # read depth image
-        im_depth = pad_im(cv2.imread(imdb.depth_path_at(i), cv2.IMREAD_UNCHANGED), 16)
-
-        # load meta data
-        meta_data = scipy.io.loadmat(imdb.metadata_path_at(i))
-
         # backprojection for the first frame
         if not have_prediction:    
             if is_kfusion:
@@ -526,7 +702,7 @@ def test_net(sess, net, imdb, weights_filename, rig_filename, is_kfusion):
             seg = {'labels': labels_kfusion}
         else:
             seg = {'labels': labels}
-        segmentations[i] = seg
+        segmentations.put(i, seg)
 
         _t['misc'].toc()
 
@@ -544,45 +720,15 @@ def test_net(sess, net, imdb, weights_filename, rig_filename, is_kfusion):
         print 'im_segment: {:d}/{:d} {:.3f}s {:.3f}s' \
               .format(i + 1, num_images, _t['im_segment'].diff, _t['misc'].diff)
 
+    reader.report()
+
     if is_kfusion:
         KF.draw(filename, 1)
 
-    seg_file = os.path.join(output_dir, 'segmentations.pkl')
-    with open(seg_file, 'wb') as f:
-        cPickle.dump(segmentations, f, cPickle.HIGHEST_PROTOCOL)
-
     # evaluation
     imdb.evaluate_segmentations(segmentations, output_dir)
 
 
-# compute the voting label image in 2D
-def _vote_centers(im_label, cls_indexes, centers, poses, num_classes, extents):
-    width = im_label.shape[1]
-    height = im_label.shape[0]
-    vertex_targets = np.zeros((height, width, 3), dtype=np.float32)
-
-    center = np.zeros((2, 1), dtype=np.float32)
-    for i in xrange(1, num_classes):
-        y, x = np.where(im_label == i)
-        I = np.where(im_label == i)
-        ind = np.where(cls_indexes == i)[0]
-        if len(x) > 0 and len(ind) > 0:
-            center[0] = centers[ind, 0]
-            center[1] = centers[ind, 1]
-            z = poses[2, 3, ind]
-            R = np.tile(center, (1, len(x))) - np.vstack((x, y))
-            # compute the norm
-            N = np.linalg.norm(R, axis=0) + 1e-10
-            # normalization
-            R = np.divide(R, np.tile(N, (2,1)))
-            # assignment
-            vertex_targets[y, x, 0] = R[0,:]
-            vertex_targets[y, x, 1] = R[1,:]
-            vertex_targets[y, x, 2] = z
-
-    return vertex_targets
-
-
 # extract vertmap for vertex predication
 def _extract_vertmap(im_label, vertex_pred, extents, num_classes):
     height = im_label.shape[0]
@@ -598,35 +744,6 @@ def _extract_vertmap(im_label, vertex_pred, extents, num_classes):
     vertmap[:, :, 2] = np.exp(vertmap[:, :, 2])
     return vertmap
 
-# compute the voting label image in 2D
-def _generate_vertex_targets(im_label, num_classes, vertmap, extents):
-    width = im_label.shape[1]
-    height = im_label.shape[0]
-    vertex_targets = np.zeros((height, width, 3), dtype=np.float32)
-
-    for i in xrange(1, num_classes):
-        y, x = np.where(im_label == i)
-        I = np.where(im_label == i)
-        if len(x) > 0:
-            vertex_targets[y, x, :] = _scale_vertmap(vertmap, I, extents[i, :])
-
-    return vertex_targets
-
-
-def _scale_vertmap(vertmap, index, extents):
-    for i in range(3):
-        vmin = -extents[i] / 2
-        vmax = extents[i] / 2
-        if vmax - vmin > 0:
-            a = 1.0 / (vmax - vmin)
-            b = -1.0 * vmin / (vmax - vmin)
-        else:
-            a = 0
-            b = 0
-        vertmap[index[0], index[1], i] = a * vertmap[index[0], index[1], i] + b
-    return vertmap[index[0], index[1], :]
-
-
 def _unscale_vertmap(vertmap, labels, extents, num_classes):
     for k in range(1, num_classes):
         index = np.where(labels == k)
@@ -1148,6 +1265,183 @@ def _get_bb2D(extent, pose, intrinsic_matrix):
     return bb
 
 
+def _load_backgrounds():
+    """the background images of cfg.BACKGROUND for the synthetic test frames"""
+    backgrounds = None
+    cache_file = cfg.BACKGROUND
+    if os.path.exists(cache_file):
+        with open(cache_file, 'rb') as fid:
+            backgrounds = cPickle.load(fid)
+        print 'backgrounds loaded from {}'.format(cache_file)
+        if cfg.BACKGROUND_STORE:
+            backgrounds = open_background_store(backgrounds, os.path.splitext(cache_file)[0] + '_store.pkl', \
+                cfg.TRAIN.SYN_HEIGHT, cfg.TRAIN.SYN_WIDTH, cfg.INPUT == 'DEPTH' or cfg.INPUT == 'NORMAL', \
+                cfg.BACKGROUND_STORE_SIZE, cfg.BACKGROUND_CACHE_SIZE)
+    return backgrounds
+
+
+def _read_single_frame(imdb, i, backgrounds):
+    """read the color, depth, label and meta data of one test frame
+    """
+
+    if cfg.TEST.SYNTHETIC:
+        # rgba
+        filename = cfg.TRAIN.SYNROOT + '{:06d}-color.png'.format(i)
+        rgba = pad_im(cv2.imread(filename, cv2.IMREAD_UNCHANGED), 16)
+
+        # depth, before the background is added to it
+        filename = cfg.TRAIN.SYNROOT + '{:06d}-depth.png'.format(i)
+        im_depth = pad_im(cv2.imread(filename, cv2.IMREAD_UNCHANGED), 16)
+
+        if rgba.shape[2] == 4:
+            # sample a background image
+            background = sample_background(backgrounds, rgba.shape[0], rgba.shape[1], \
+                                           cfg.INPUT == 'DEPTH' or cfg.INPUT == 'NORMAL')
+
+            # add background
+            im = np.copy(rgba[:,:,:3])
+            alpha = rgba[:,:,3]
+            I = np.where(alpha == 0)
+            if cfg.INPUT == 'DEPTH' or cfg.INPUT == 'NORMAL':
+                im_depth = np.copy(im_depth)
+                im_depth[I[0], I[1]] = background[I[0], I[1]] / 10
+            else:
+                im[I[0], I[1], :] = background[I[0], I[1], :3]
+        else:
+            im = rgba
+
+        # label
+        filename = cfg.TRAIN.SYNROOT + '{:06d}-label.png'.format(i)
+        labels_gt = pad_im(cv2.imread(filename, cv2.IMREAD_UNCHANGED), 16)
+
+        # meta data
+        filename = cfg.TRAIN.SYNROOT + '{:06d}-meta.mat'.format(i)
+        meta_data = scipy.io.loadmat(filename)
+    else:
+        im, im_depth, meta_data = _read_frame(imdb.image_path_at(i), imdb.depth_path_at(i), imdb.metadata_path_at(i))
+
+        # read label image
+        labels_gt = pad_im(cv2.imread(imdb.label_path_at(i), cv2.IMREAD_UNCHANGED), 16)
+    meta_data['cls_indexes'] = meta_data['cls_indexes'].flatten()
+
+    # process annotation if training for two classes
+    if imdb.num_classes == 2 and imdb._cls_index > 0:
+        I = np.where(labels_gt == imdb._cls_index)
+        labels_gt[:, :] = 0
+        labels_gt[I[0], I[1]] = 1
+        ind = np.where(meta_data['cls_indexes'] == imdb._cls_index)[0]
+        meta_data['cls_indexes'] = np.ones((len(ind),), dtype=np.float32)
+        if len(meta_data['poses'].shape) == 2:
+            meta_data['poses'] = np.reshape(meta_data['poses'], (3, 4, 1))
+        meta_data['poses'] = meta_data['poses'][:,:,ind]
+        meta_data['center'] = meta_data['center'][ind,:]
+
+    return im, im_depth, labels_gt, meta_data
+
+def _refine_poses_icp(synthesizer, labels, im_depth, rois, poses, meta_data, im_scale, imdb):
+    """poses_new and poses_icp of the rois refined from poses with ICP
+
+    labels and im_depth are at the scale im_scale of the rois.
+    """
+    fx = meta_data['intrinsic_matrix'][0, 0] * im_scale
+    fy = meta_data['intrinsic_matrix'][1, 1] * im_scale
+    px = meta_data['intrinsic_matrix'][0, 2] * im_scale
+    py = meta_data['intrinsic_matrix'][1, 2] * im_scale
+    factor = meta_data['factor_depth']
+    znear = 0.25
+    zfar = 6.0
+    poses_new = np.zeros((poses.shape[0], 7), dtype=np.float32)
+    poses_icp = np.zeros((poses.shape[0], 7), dtype=np.float32)
+    error_threshold = 0.01
+
+    labels_icp = labels.copy();
+    rois_icp = rois
+    if imdb.num_classes == 2:
+        I = np.where(labels_icp > 0)
+        labels_icp[I[0], I[1]] = imdb._cls_index
+        rois_icp = rois.copy()
+        rois_icp[:, 1] = imdb._cls_index
+
+    parameters = np.zeros((7, ), dtype=np.float32)
+    parameters[0] = fx
+    parameters[1] = fy
+    parameters[2] = px
+    parameters[3] = py
+    parameters[4] = znear
+    parameters[5] = zfar
+    parameters[6] = factor
+
+    height = labels_icp.shape[0]
+    width = labels_icp.shape[1]
+    num_roi = rois_icp.shape[0]
+    channel_roi = rois_icp.shape[1]
+    synthesizer.icp_python(labels_icp, im_depth, parameters, height, width, num_roi, channel_roi, \
+                           rois_icp, poses, poses_new, poses_icp, error_threshold)
+    return poses_new, poses_icp
+
+
+def _video_id(imdb, i):
+    """the video of test frame i, the directory of its image index"""
+    return os.path.dirname(imdb.image_index[i])
+
+
+def _track_frame(tracker, tracking_stats, i, labels, im_depth, meta_data, im_scale, detect, synthesizer, imdb):
+    """rois, poses, poses_new and poses_icp of frame i, tracked from the last frame or detected
+
+    detect() runs the Hough voting of the frame. With a synthesizer the poses
+    are refined with ICP, the tracked objects start from their last poses and
+    keep them if their depth residual is below cfg.TEST.TRACK_ICP_RESIDUAL.
+    """
+    t = time.time()
+    refine = synthesizer is not None and cfg.TEST.POSE_REG
+    depth = cv2.resize(im_depth, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
+    intrinsic_matrix = meta_data['intrinsic_matrix'] * im_scale
+    intrinsic_matrix[2, 2] = 1
+
+    tracker.start(_video_id(imdb, i), i)
+    tracked = tracker.track(labels, depth.astype(np.float32) / float(meta_data['factor_depth']), intrinsic_matrix)
+    icp_skipped = 0
+    if tracked is None:
+        rois, poses = detect()
+        poses_new = []
+        poses_icp = []
+        if refine:
+            poses_new, poses_icp = _refine_poses_icp(synthesizer, labels, depth, rois, poses, meta_data, im_scale, imdb)
+        elif cfg.TEST.POSE_REG:
+            poses_new = np.zeros((poses.shape[0], 7), dtype=np.float32)
+            poses_icp = np.zeros((poses.shape[0], 7), dtype=np.float32)
+    else:
+        rois, poses, residuals = tracked
+        poses_new = []
+        poses_icp = []
+        if refine:
+            # warm start from the last poses
+            poses_new = poses.copy()
+            poses_icp = poses.copy()
+            index = np.where(residuals > cfg.TEST.TRACK_ICP_RESIDUAL)[0]
+            if len(index) > 0:
+                poses_new[index], poses_icp[index] = \
+                    _refine_poses_icp(synthesizer, labels, depth, rois[index], poses[index], meta_data, im_scale, imdb)
+            icp_skipped = rois.shape[0] - len(index)
+        elif cfg.TEST.POSE_REG:
+            poses_new = np.zeros((poses.shape[0], 7), dtype=np.float32)
+            poses_icp = np.zeros((poses.shape[0], 7), dtype=np.float32)
+    poses_final = poses_icp if refine else poses
+    tracker.update(labels, rois, poses_final)
+    seconds = time.time() - t
+
+    # detect the tracked frame too to compare the poses
+    errors_detected = None
+    if tracked is not None and cfg.TEST.TRACK_AUDIT:
+        rois_detected, poses_detected = detect()
+        if refine:
+            _, poses_detected = _refine_poses_icp(synthesizer, labels, depth, rois_detected, poses_detected, meta_data, im_scale, imdb)
+        errors_detected = pose_errors(rois_detected, poses_detected, meta_data)
+
+    tracking_stats.add(i, tracked is not None, seconds, icp_skipped, pose_errors(rois, poses_final, meta_data), errors_detected)
+    print tracking_stats.frame_summary()
+    return rois, poses, poses_new, poses_icp
+
 ###################
 # test single frame
 ###################
@@ -1157,23 +1451,21 @@ def test_net_single_frame(sess, net, imdb, weights_filename, model_filename):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    seg_file = os.path.join(output_dir, 'segmentations.pkl')
-    print imdb.name
-    if os.path.exists(seg_file):
-        with open(seg_file, 'rb') as fid:
-            segmentations = cPickle.load(fid)
-        imdb.evaluate_segmentations(segmentations, output_dir)
-        return
-
     """Test a FCN on an image database."""
     if cfg.TEST.SYNTHETIC:
         num_images = cfg.TRAIN.SYNNUM
     else:
         num_images = len(imdb.image_index)
-    segmentations = [[] for _ in xrange(num_images)]
+
+    # results of the frames done so far, a rerun resumes
+    segmentations = ResultsStore(os.path.join(output_dir, 'segmentations.db'), _results_key())
+    print imdb.name
+    if len(segmentations) == num_images:
+        imdb.evaluate_segmentations(segmentations, output_dir)
+        return
 
     # timers
-    _t = {'im_segment' : Timer(), 'misc' : Timer()}
+    _t = {'forward' : Timer(), 'im_segment' : Timer(), 'misc' : Timer()}
 
     # voxelizer
     voxelizer = Voxelizer(cfg.TEST.GRID_SIZE, imdb.num_classes)
@@ -1192,128 +1484,105 @@ def test_net_single_frame(sess, net, imdb, weights_filename, model_filename):
     else:
         perm = xrange(num_images)
 
+    backgrounds = None
     if cfg.TEST.SYNTHETIC:
         # perm = np.random.permutation(np.arange(cfg.TRAIN.SYNNUM))
         perm = xrange(cfg.TRAIN.SYNNUM)
 
-        cache_file = cfg.BACKGROUND
-        if os.path.exists(cache_file):
-            with open(cache_file, 'rb') as fid:
-                backgrounds = cPickle.load(fid)
-            print 'backgrounds loaded from {}'.format(cache_file)
+        backgrounds = _load_backgrounds()
 
     if (cfg.TEST.VERTEX_REG_2D and cfg.TEST.POSE_REFINE) or (cfg.TEST.VERTEX_REG_3D and cfg.TEST.POSE_REG):
         import libsynthesizer
         synthesizer = libsynthesizer.Synthesizer(cfg.CAD, cfg.POSE)
         synthesizer.setup(cfg.TRAIN.SYN_WIDTH, cfg.TRAIN.SYN_HEIGHT)
 
-    for i in perm:
-
-        if cfg.TEST.SYNTHETIC:
-            # rgba
-            filename = cfg.TRAIN.SYNROOT + '{:06d}-color.png'.format(i)
-            rgba = pad_im(cv2.imread(filename, cv2.IMREAD_UNCHANGED), 16)
-
-            if rgba.shape[2] == 4:
-                # sample a background image
-                ind = np.random.randint(len(backgrounds), size=1)[0]
-                filename = backgrounds[ind]
-                background = cv2.imread(filename, cv2.IMREAD_UNCHANGED)
-                try:
-                    background = cv2.resize(background, (rgba.shape[1], rgba.shape[0]), interpolation=cv2.INTER_LINEAR)
-                except:
-                    if cfg.INPUT == 'DEPTH' or cfg.INPUT == 'NORMAL':
-                        background = np.zeros((rgba.shape[0], rgba.shape[1]), dtype=np.uint16)
-                    else:
-                        background = np.zeros((rgba.shape[0], rgba.shape[1], 3), dtype=np.uint8)
-                    print 'bad background image'
-
-                if cfg.INPUT != 'DEPTH' and cfg.INPUT != 'NORMAL' and len(background.shape) != 3:
-                    background = np.zeros((rgba.shape[0], rgba.shape[1], 3), dtype=np.uint8)
-                    print 'bad background image'
-
-                # add background
-                im = np.copy(rgba[:,:,:3])
-                alpha = rgba[:,:,3]
-                I = np.where(alpha == 0)
-                if cfg.INPUT == 'DEPTH' or cfg.INPUT == 'NORMAL':
-                    im_depth[I[0], I[1]] = background[I[0], I[1]] / 10
-                else:
-                    im[I[0], I[1], :] = background[I[0], I[1], :3]
-            else:
-                im = rgba
-
-            # depth
-            filename = cfg.TRAIN.SYNROOT + '{:06d}-depth.png'.format(i)
-            im_depth = pad_im(cv2.imread(filename, cv2.IMREAD_UNCHANGED), 16)
-
-            # label
-            filename = cfg.TRAIN.SYNROOT + '{:06d}-label.png'.format(i)
-            labels_gt = pad_im(cv2.imread(filename, cv2.IMREAD_UNCHANGED), 16)
-
-            # meta data
-            filename = cfg.TRAIN.SYNROOT + '{:06d}-meta.mat'.format(i)
-            meta_data = scipy.io.loadmat(filename)
+    # track the objects of the frames of a video
+    tracker = None
+    batch_size = cfg.TEST.IMS_PER_BATCH
+    if cfg.TEST.TRACKING:
+        if not cfg.TEST.VERTEX_REG_2D or cfg.TEST.SYNTHETIC or (cfg.TEST.POSE_REG and isinstance(net, FrozenNetwork)):
+            print 'tracking needs VERTEX_REG_2D on videos and the features of the pose regression, it is disabled'
         else:
-            # parse image name
-            image_index = imdb.image_index[i]
-
-            # read color image
-            rgba = pad_im(cv2.imread(imdb.image_path_at(i), cv2.IMREAD_UNCHANGED), 16)
-            if rgba.shape[2] == 4:
-                im = np.copy(rgba[:,:,:3])
-                alpha = rgba[:,:,3]
-                I = np.where(alpha == 0)
-                im[I[0], I[1], :] = 0
+            tracker = PoseTracker(imdb._points_all, cfg.TEST.TRACK_MIN_OVERLAP, cfg.TEST.TRACK_MAX_RESIDUAL, cfg.TEST.TRACK_ICP_RESIDUAL)
+            tracking_stats = TrackingStats()
+            batch_size = 1
+
+    perm = _skip_done_frames(perm, segmentations)
+    reader = _get_frame_reader(lambda i: _read_single_frame(imdb, i, backgrounds), perm)
+
+    if cfg.PROFILE:
+        profiler.enable()
+    profiler.tic('test_net_single_frame')
+
+    # run the network on IMS_PER_BATCH frames at a time
+    perm = list(perm)
+    for k in xrange(0, len(perm), batch_size):
+
+        # read frames
+        batch = perm[k:k+batch_size]
+        profiler.tic('read')
+        frames = [reader.next()[1] for _ in batch]
+        profiler.toc('read')
+
+        _t['forward'].tic()
+        profiler.tic('forward')
+        if cfg.NETWORK == 'FCN8VGG':
+            results = [im_segment_single_frame(sess, net, im, im_depth, meta_data, voxelizer, imdb._extents, imdb._points_all, imdb._symmetry, imdb.num_classes) \
+                       for im, im_depth, labels_gt, meta_data in frames]
+        elif tracker is not None:
+            im, im_depth, labels_gt, meta_data = frames[0]
+            results = [im_segment_tracking(sess, net, im, im_depth, meta_data, voxelizer, imdb._extents, imdb._points_all, imdb._symmetry, imdb.num_classes)]
+        else:
+            ims = [frame[0] for frame in frames]
+            im_depths = [frame[1] for frame in frames]
+            meta_datas = [frame[3] for frame in frames]
+            results = im_segment_multi_frame(sess, net, ims, im_depths, meta_datas, voxelizer, imdb._extents, imdb._points_all, imdb._symmetry, imdb.num_classes)
+        profiler.toc('forward')
+        _t['forward'].toc()
+
+        for i, frame, result in zip(batch, frames, results):
+
+            im, im_depth, labels_gt, meta_data = frame
+            if tracker is not None:
+                # the objects are detected or tracked below
+                labels, probs, vertex_pred, detect = result
             else:
-                im = rgba
+                labels, probs, vertex_pred, rois, poses = result
 
-            # read depth image
-            if os.path.exists(imdb.depth_path_at(i)):
-                im_depth = pad_im(cv2.imread(imdb.depth_path_at(i), cv2.IMREAD_UNCHANGED), 16)
+            if len(labels_gt.shape) == 2:
+                im_label_gt = imdb.labels_to_image(im, labels_gt)
             else:
-                im_depth = np.zeros((rgba.shape[0], rgba.shape[1]), dtype=np.float32)
-
-            # read label image
-            labels_gt = pad_im(cv2.imread(imdb.label_path_at(i), cv2.IMREAD_UNCHANGED), 16)
-
-            # load meta data
-            meta_data = scipy.io.loadmat(imdb.metadata_path_at(i))
-        meta_data['cls_indexes'] = meta_data['cls_indexes'].flatten()
-
-        # process annotation if training for two classes
-        if imdb.num_classes == 2 and imdb._cls_index > 0:
-            I = np.where(labels_gt == imdb._cls_index)
-            labels_gt[:, :] = 0
-            labels_gt[I[0], I[1]] = 1
-            ind = np.where(meta_data['cls_indexes'] == imdb._cls_index)[0]
-            meta_data['cls_indexes'] = np.ones((len(ind),), dtype=np.float32)
-            if len(meta_data['poses'].shape) == 2:
-                meta_data['poses'] = np.reshape(meta_data['poses'], (3, 4, 1))
-            meta_data['poses'] = meta_data['poses'][:,:,ind]
-            meta_data['center'] = meta_data['center'][ind,:]
-
-        if len(labels_gt.shape) == 2:
-            im_label_gt = imdb.labels_to_image(im, labels_gt)
-        else:
-            im_label_gt = np.copy(labels_gt[:,:,:3])
-            im_label_gt[:,:,0] = labels_gt[:,:,2]
-            im_label_gt[:,:,2] = labels_gt[:,:,0]
-
-        _t['im_segment'].tic()
-
-        labels, probs, vertex_pred, rois, poses = im_segment_single_frame(sess, net, im, im_depth, meta_data, voxelizer, imdb._extents, imdb._points_all, imdb._symmetry, imdb.num_classes)
+                im_label_gt = np.copy(labels_gt[:,:,:3])
+                im_label_gt[:,:,0] = labels_gt[:,:,2]
+                im_label_gt[:,:,2] = labels_gt[:,:,0]
 
-        labels = unpad_im(labels, 16)
-        im_scale = cfg.TEST.SCALES_BASE[0]
-        # build the label image
-        im_label = imdb.labels_to_image(im, labels)
+            _t['im_segment'].tic()
+            profiler.tic('im_segment')
+
+            labels = unpad_im(labels, 16)
+            im_scale = cfg.TEST.SCALES_BASE[0]
+            # build the label image
+            im_label = imdb.labels_to_image(im, labels)
+
+            poses_new = []
+            poses_icp = []
+            if cfg.TEST.VERTEX_REG_2D and tracker is not None:
+                profiler.tic('track')
+                rois, poses, poses_new, poses_icp = _track_frame(tracker, tracking_stats, i, labels, im_depth, meta_data, im_scale, \
+                                                                 detect, synthesizer if cfg.TEST.POSE_REFINE else None, imdb)
+                profiler.toc('track')
+            elif cfg.TEST.VERTEX_REG_2D:
+                if cfg.TEST.POSE_REG:
+                    # pose refinement
+                    poses_new = np.zeros((poses.shape[0], 7), dtype=np.float32)
+                    poses_icp = np.zeros((poses.shape[0], 7), dtype=np.float32)
+                    if cfg.TEST.POSE_REFINE:
+                        im_depth = cv2.resize(im_depth, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
+                        profiler.tic('icp')
+                        poses_new, poses_icp = _refine_poses_icp(synthesizer, labels, im_depth, rois, poses, meta_data, im_scale, imdb)
+                        profiler.toc('icp')
 
-        poses_new = []
-        poses_icp = []
-        if cfg.TEST.VERTEX_REG_2D:
-            if cfg.TEST.POSE_REG:
-                # pose refinement
+            elif cfg.TEST.VERTEX_REG_3D:
                 fx = meta_data['intrinsic_matrix'][0, 0] * im_scale
                 fy = meta_data['intrinsic_matrix'][1, 1] * im_scale
                 px = meta_data['intrinsic_matrix'][0, 2] * im_scale
@@ -1321,6 +1590,49 @@ def test_net_single_frame(sess, net, imdb, weights_filename, model_filename):
                 factor = meta_data['factor_depth']
                 znear = 0.25
                 zfar = 6.0
+
+                # pose estimation with color only
+                poses_tmp = np.zeros((3, 4, imdb.num_classes), dtype=np.float32)            
+                SYN.estimate_poses_2d(labels, vertex_pred, imdb._extents, poses_tmp, imdb.num_classes, fx, fy, px, py)
+                num = 0
+                for j in xrange(imdb.num_classes):
+                    if poses_tmp[2, 3, j] > 0:
+                        num += 1
+                rois_rgb = np.zeros((num, 6), dtype=np.float32)
+                poses_rgb = np.zeros((num, 7), dtype=np.float32)
+                count = 0
+                for j in xrange(imdb.num_classes):
+                    if poses_tmp[2, 3, j] > 0:
+                        rois_rgb[count, 1] = j
+                        poses_rgb[count, :4] = mat2quat(poses_tmp[:3, :3, j])
+                        poses_rgb[count, 4:] = poses_tmp[:, 3, j]
+                        rois_rgb[count, 2:] = _get_bb2D(imdb._extents[j, :], poses_rgb[count, :], meta_data['intrinsic_matrix']) * im_scale
+                        count += 1
+                print rois_rgb
+                print poses_rgb
+
+                # pose estimation with depth
+                poses_tmp = np.zeros((3, 4, imdb.num_classes), dtype=np.float32)
+                im_depth = cv2.resize(im_depth, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
+                SYN.estimate_poses_3d(labels, im_depth, vertex_pred, imdb._extents, poses_tmp, imdb.num_classes, fx, fy, px, py, factor)
+                num = 0
+                for j in xrange(imdb.num_classes):
+                    if poses_tmp[2, 3, j] > 0:
+                        num += 1
+                rois = np.zeros((num, 6), dtype=np.float32)
+                poses = np.zeros((num, 7), dtype=np.float32)
+                count = 0
+                for j in xrange(imdb.num_classes):
+                    if poses_tmp[2, 3, j] > 0:
+                        rois[count, 1] = j
+                        poses[count, :4] = mat2quat(poses_tmp[:3, :3, j])
+                        poses[count, 4:] = poses_tmp[:, 3, j]
+                        rois[count, 2:] = _get_bb2D(imdb._extents[j, :], poses[count, :], meta_data['intrinsic_matrix']) * im_scale
+                        count += 1
+                print rois
+                print poses
+
+                # pose refinement
                 poses_new = np.zeros((poses.shape[0], 7), dtype=np.float32)        
                 poses_icp = np.zeros((poses.shape[0], 7), dtype=np.float32)     
                 error_threshold = 0.01
@@ -1333,139 +1645,117 @@ def test_net_single_frame(sess, net, imdb, weights_filename, model_filename):
                         rois_icp = rois.copy()
                         rois_icp[:, 1] = imdb._cls_index
                     im_depth = cv2.resize(im_depth, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
+                    SYN.refine_poses(labels_icp, im_depth, rois_icp, poses, poses_new, poses_icp, fx, fy, px, py, znear, zfar, factor, error_threshold)
 
-                    parameters = np.zeros((7, ), dtype=np.float32)
-                    parameters[0] = fx
-                    parameters[1] = fy
-                    parameters[2] = px
-                    parameters[3] = py
-                    parameters[4] = znear
-                    parameters[5] = zfar
-                    parameters[6] = factor
-
-                    height = labels_icp.shape[0]
-                    width = labels_icp.shape[1]
-                    num_roi = rois_icp.shape[0]
-                    channel_roi = rois_icp.shape[1]
-                    synthesizer.icp_python(labels_icp, im_depth, parameters, height, width, num_roi, channel_roi, \
-                                           rois_icp, poses, poses_new, poses_icp, error_threshold)
-                
-        elif cfg.TEST.VERTEX_REG_3D:
-            fx = meta_data['intrinsic_matrix'][0, 0] * im_scale
-            fy = meta_data['intrinsic_matrix'][1, 1] * im_scale
-            px = meta_data['intrinsic_matrix'][0, 2] * im_scale
-            py = meta_data['intrinsic_matrix'][1, 2] * im_scale
-            factor = meta_data['factor_depth']
-            znear = 0.25
-            zfar = 6.0
-
-            # pose estimation with color only
-            poses_tmp = np.zeros((3, 4, imdb.num_classes), dtype=np.float32)            
-            SYN.estimate_poses_2d(labels, vertex_pred, imdb._extents, poses_tmp, imdb.num_classes, fx, fy, px, py)
-            num = 0
-            for j in xrange(imdb.num_classes):
-                if poses_tmp[2, 3, j] > 0:
-                    num += 1
-            rois_rgb = np.zeros((num, 6), dtype=np.float32)
-            poses_rgb = np.zeros((num, 7), dtype=np.float32)
-            count = 0
-            for j in xrange(imdb.num_classes):
-                if poses_tmp[2, 3, j] > 0:
-                    rois_rgb[count, 1] = j
-                    poses_rgb[count, :4] = mat2quat(poses_tmp[:3, :3, j])
-                    poses_rgb[count, 4:] = poses_tmp[:, 3, j]
-                    rois_rgb[count, 2:] = _get_bb2D(imdb._extents[j, :], poses_rgb[count, :], meta_data['intrinsic_matrix']) * im_scale
-                    count += 1
-            print rois_rgb
-            print poses_rgb
-
-            # pose estimation with depth
-            poses_tmp = np.zeros((3, 4, imdb.num_classes), dtype=np.float32)
-            im_depth = cv2.resize(im_depth, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
-            SYN.estimate_poses_3d(labels, im_depth, vertex_pred, imdb._extents, poses_tmp, imdb.num_classes, fx, fy, px, py, factor)
-            num = 0
-            for j in xrange(imdb.num_classes):
-                if poses_tmp[2, 3, j] > 0:
-                    num += 1
-            rois = np.zeros((num, 6), dtype=np.float32)
-            poses = np.zeros((num, 7), dtype=np.float32)
-            count = 0
-            for j in xrange(imdb.num_classes):
-                if poses_tmp[2, 3, j] > 0:
-                    rois[count, 1] = j
-                    poses[count, :4] = mat2quat(poses_tmp[:3, :3, j])
-                    poses[count, 4:] = poses_tmp[:, 3, j]
-                    rois[count, 2:] = _get_bb2D(imdb._extents[j, :], poses[count, :], meta_data['intrinsic_matrix']) * im_scale
-                    count += 1
-            print rois
-            print poses
-
-            # pose refinement
-            poses_new = np.zeros((poses.shape[0], 7), dtype=np.float32)        
-            poses_icp = np.zeros((poses.shape[0], 7), dtype=np.float32)     
-            error_threshold = 0.01
-            if cfg.TEST.POSE_REFINE:
-                labels_icp = labels.copy();
-                rois_icp = rois
-                if imdb.num_classes == 2:
-                    I = np.where(labels_icp > 0)
-                    labels_icp[I[0], I[1]] = imdb._cls_index
-                    rois_icp = rois.copy()
-                    rois_icp[:, 1] = imdb._cls_index
-                im_depth = cv2.resize(im_depth, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
-                SYN.refine_poses(labels_icp, im_depth, rois_icp, poses, poses_new, poses_icp, fx, fy, px, py, znear, zfar, factor, error_threshold)
-
-        _t['im_segment'].toc()
-
-        _t['misc'].tic()
-        labels_new = cv2.resize(labels, None, None, fx=1.0/im_scale, fy=1.0/im_scale, interpolation=cv2.INTER_NEAREST)
-        if cfg.TEST.VERTEX_REG_2D:
-            seg = {'labels': labels_new, 'rois': rois, 'poses': poses, 'poses_refined': poses_new, 'poses_icp': poses_icp}
-        else:
-            seg = {'labels': labels_new, 'rois_rgb': rois_rgb, 'poses_rgb': poses_rgb, 'rois': rois, 'poses': poses, 'poses_refined': poses_new, 'poses_icp': poses_icp}
-        segmentations[i] = seg
-        _t['misc'].toc()
-
-        print 'im_segment: {:d}/{:d} {:.3f}s {:.3f}s' \
-              .format(i, num_images, _t['im_segment'].diff, _t['misc'].diff)
+            profiler.toc('im_segment')
+            _t['im_segment'].toc()
 
-        imdb.evaluate_result(i, seg, labels_gt, meta_data, output_dir)
-        if cfg.TEST.VISUALIZE:
+            _t['misc'].tic()
+            profiler.tic('misc')
+            labels_new = cv2.resize(labels, None, None, fx=1.0/im_scale, fy=1.0/im_scale, interpolation=cv2.INTER_NEAREST)
             if cfg.TEST.VERTEX_REG_2D:
-                poses_gt = meta_data['poses']
-                if len(poses_gt.shape) == 2:
-                    poses_gt = np.reshape(poses_gt, (3, 4, 1))
-                vertmap = _extract_vertmap(labels, vertex_pred, imdb._extents, imdb.num_classes)
-                if 'vertmap' in meta_data:
+                seg = {'labels': labels_new, 'rois': rois, 'poses': poses, 'poses_refined': poses_new, 'poses_icp': poses_icp}
+            else:
+                seg = {'labels': labels_new, 'rois_rgb': rois_rgb, 'poses_rgb': poses_rgb, 'rois': rois, 'poses': poses, 'poses_refined': poses_new, 'poses_icp': poses_icp}
+            segmentations.put(i, seg)
+            profiler.toc('misc')
+            _t['misc'].toc()
+
+            print 'im_segment: {:d}/{:d} {:.3f}s {:.3f}s {:.3f}s' \
+                  .format(i, num_images, _t['forward'].diff / len(batch), _t['im_segment'].diff, _t['misc'].diff)
+
+            profiler.tic('evaluate')
+            imdb.evaluate_result(i, seg, labels_gt, meta_data, output_dir)
+            profiler.toc('evaluate')
+            if cfg.TEST.VISUALIZE:
+                if cfg.TEST.VERTEX_REG_2D:
+                    poses_gt = meta_data['poses']
+                    if len(poses_gt.shape) == 2:
+                        poses_gt = np.reshape(poses_gt, (3, 4, 1))
+                    vertmap = _extract_vertmap(labels, vertex_pred, imdb._extents, imdb.num_classes)
+                    if 'vertmap' in meta_data:
+                        vertmap_gt = meta_data['vertmap'].copy()
+                    else:
+                        vertmap_gt = np.zeros((1,), dtype=np.float32)
+                    centers_map_gt = vote_centers(labels_gt, meta_data['cls_indexes'].flatten(), meta_data['center'], poses_gt, imdb.num_classes)
+                    vis_segmentations_vertmaps(im, im_depth, im_label, im_label_gt, imdb._class_colors, \
+                        centers_map_gt, vertmap, labels, labels_gt, rois, poses, poses_icp, meta_data['intrinsic_matrix'], \
+                        vertmap_gt, poses_gt, meta_data['cls_indexes'].flatten(), imdb.num_classes, imdb._points_all)
+                elif cfg.TEST.VERTEX_REG_3D:
+                    poses_gt = meta_data['poses']
+                    if len(poses_gt.shape) == 2:
+                        poses_gt = np.reshape(poses_gt, (3, 4, 1))
+                    vertmap = _extract_vertmap(labels, vertex_pred, imdb._extents, imdb.num_classes)
                     vertmap_gt = meta_data['vertmap'].copy()
+                    vertmap_target = scale_vertmap(labels_gt, vertmap_gt, imdb._extents, imdb.num_classes)
+                    vis_segmentations_vertmaps_3d(im, im_depth, im_label, im_label_gt, imdb._class_colors, \
+                        vertmap, vertmap_target, labels, labels_gt, rois_rgb, poses_rgb, rois, poses, poses_icp, meta_data['intrinsic_matrix'], \
+                        meta_data['vertmap'], poses_gt, meta_data['cls_indexes'].flatten(), imdb.num_classes)
                 else:
-                    vertmap_gt = np.zeros((1,), dtype=np.float32)
-                centers_map_gt = _vote_centers(labels_gt, meta_data['cls_indexes'].flatten(), meta_data['center'], poses_gt, imdb.num_classes, imdb._extents)
-                vis_segmentations_vertmaps(im, im_depth, im_label, im_label_gt, imdb._class_colors, \
-                    centers_map_gt, vertmap, labels, labels_gt, rois, poses, poses_icp, meta_data['intrinsic_matrix'], \
-                    vertmap_gt, poses_gt, meta_data['cls_indexes'].flatten(), imdb.num_classes, imdb._points_all)
-            elif cfg.TEST.VERTEX_REG_3D:
-                poses_gt = meta_data['poses']
-                if len(poses_gt.shape) == 2:
-                    poses_gt = np.reshape(poses_gt, (3, 4, 1))
-                vertmap = _extract_vertmap(labels, vertex_pred, imdb._extents, imdb.num_classes)
-                vertmap_gt = meta_data['vertmap'].copy()
-                vertmap_target = _generate_vertex_targets(labels_gt, imdb.num_classes, vertmap_gt, imdb._extents)
-                vis_segmentations_vertmaps_3d(im, im_depth, im_label, im_label_gt, imdb._class_colors, \
-                    vertmap, vertmap_target, labels, labels_gt, rois_rgb, poses_rgb, rois, poses, poses_icp, meta_data['intrinsic_matrix'], \
-                    meta_data['vertmap'], poses_gt, meta_data['cls_indexes'].flatten(), imdb.num_classes)
-            else:
-                vis_segmentations(im, im_depth, im_label, im_label_gt, imdb._class_colors)
+                    vis_segmentations(im, im_depth, im_label, im_label_gt, imdb._class_colors)
 
-    '''
-    seg_file = os.path.join(output_dir, 'segmentations.pkl')
-    with open(seg_file, 'wb') as f:
-        cPickle.dump(segmentations, f, cPickle.HIGHEST_PROTOCOL)
+    profiler.toc('test_net_single_frame')
+    if tracker is not None:
+        tracking_stats.report()
+    reader.close()
+    reader.report()
+    _blob_pool.report()
+    profiler.report()
+    profiler.save(output_dir)
 
+    '''
     # evaluation
     imdb.evaluate_segmentations(segmentations, output_dir)
     '''
 
+def _read_detection_frame(imdb, i, backgrounds):
+    """read the color image, depth image and meta data of one detection test frame
+    """
+
+    if cfg.TEST.SYNTHETIC:
+        # rgba
+        filename = cfg.TRAIN.SYNROOT + '{:06d}-color.png'.format(i)
+        rgba = pad_im(cv2.imread(filename, cv2.IMREAD_UNCHANGED), 16)
+
+        # sample a background image
+        background_color = sample_background(backgrounds, rgba.shape[0], rgba.shape[1])
+
+        # add background
+        im = np.copy(rgba[:,:,:3])
+        alpha = rgba[:,:,3]
+        I = np.where(alpha == 0)
+        print im.shape, background_color.shape
+        im[I[0], I[1], :] = background_color[I[0], I[1], :]
+
+        # depth
+        filename = cfg.TRAIN.SYNROOT + '{:06d}-depth.png'.format(i)
+        im_depth = pad_im(cv2.imread(filename, cv2.IMREAD_UNCHANGED), 16)
+
+        # meta data
+        filename = cfg.TRAIN.SYNROOT + '{:06d}-meta.mat'.format(i)
+        meta_data = scipy.io.loadmat(filename)
+    else:
+        print imdb.metadata_path_at(i)
+        im, im_depth, meta_data = _read_frame(imdb.image_path_at(i), imdb.depth_path_at(i), imdb.metadata_path_at(i))
+    meta_data['cls_indexes'] = meta_data['cls_indexes'].flatten()
+
+    # process annotation if training for two classes
+    if imdb.num_classes == 2:
+        ind = np.where(meta_data['cls_indexes'] == imdb._cls_index)[0]
+        if len(ind) > 0:
+            meta_data['cls_indexes'] = np.ones((1,), dtype=np.float32)
+            if len(meta_data['poses'].shape) == 3:
+                meta_data['poses'] = np.reshape(meta_data['poses'][:,:,ind], (3, 4, 1))
+            else:
+                meta_data['poses'] = np.reshape(meta_data['poses'], (3, 4, 1))
+            meta_data['center'] = meta_data['center'][ind,:]
+        else:
+            meta_data['cls_indexes'] = np.ones((0,), dtype=np.float32)
+            meta_data['poses'] = np.zeros((3, 4, 0), dtype=np.float32)
+            meta_data['center'] = np.zeros((0, 2), dtype=np.float32)
+
+    return im, im_depth, meta_data
+
 ########################
 # test detection network
 ########################
@@ -1475,20 +1765,18 @@ def test_net_detection(sess, net, imdb, weights_filename):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    det_file = os.path.join(output_dir, 'detections.pkl')
-    print imdb.name
-    if os.path.exists(det_file):
-        with open(det_file, 'rb') as fid:
-            detections = cPickle.load(fid)
-        imdb.evaluate_detections(detections, output_dir)
-        return
-
     """Test a FCN on an image database."""
     if cfg.TEST.SYNTHETIC:
         num_images = cfg.TRAIN.SYNNUM
     else:
         num_images = len(imdb.image_index)
-    detections = [[] for _ in xrange(num_images)]
+
+    # results of the frames done so far, a rerun resumes
+    detections = ResultsStore(os.path.join(output_dir, 'detections.db'), _results_key())
+    print imdb.name
+    if len(detections) == num_images:
+        imdb.evaluate_detections(detections, output_dir)
+        return
 
     # timers
     _t = {'im_detect' : Timer(), 'misc' : Timer()}
@@ -1499,86 +1787,16 @@ def test_net_detection(sess, net, imdb, weights_filename):
     else:
         perm = xrange(num_images)
 
+    backgrounds = None
     if cfg.TEST.SYNTHETIC:
         perm = np.random.permutation(np.arange(cfg.TRAIN.SYNNUM))
 
-        cache_file = cfg.BACKGROUND
-        if os.path.exists(cache_file):
-            with open(cache_file, 'rb') as fid:
-                backgrounds = cPickle.load(fid)
-            print 'backgrounds loaded from {}'.format(cache_file)
-
-    for i in perm:
-
-        if cfg.TEST.SYNTHETIC:
-            # rgba
-            filename = cfg.TRAIN.SYNROOT + '{:06d}-color.png'.format(i)
-            rgba = pad_im(cv2.imread(filename, cv2.IMREAD_UNCHANGED), 16)
-
-            # sample a background image
-            ind = np.random.randint(len(backgrounds), size=1)[0]
-            filename_color = backgrounds[ind]
-            background_color = cv2.imread(filename_color, cv2.IMREAD_UNCHANGED)
-            try:
-                background_color = cv2.resize(background_color, (rgba.shape[1], rgba.shape[0]), interpolation=cv2.INTER_LINEAR)
-            except:
-                background_color = np.zeros((rgba.shape[0], rgba.shape[1], 3), dtype=np.uint8)
-                print 'bad background image'
-
-            if len(background_color.shape) != 3:
-                background_color = np.zeros((rgba.shape[0], rgba.shape[1], 3), dtype=np.uint8)
-                print 'bad background image'
-
-            # add background
-            im = np.copy(rgba[:,:,:3])
-            alpha = rgba[:,:,3]
-            I = np.where(alpha == 0)
-            print im.shape, background_color.shape
-            im[I[0], I[1], :] = background_color[I[0], I[1], :]
+        backgrounds = _load_backgrounds()
 
-            # depth
-            filename = cfg.TRAIN.SYNROOT + '{:06d}-depth.png'.format(i)
-            im_depth = pad_im(cv2.imread(filename, cv2.IMREAD_UNCHANGED), 16)
+    perm = _skip_done_frames(perm, detections)
+    reader = _get_frame_reader(lambda i: _read_detection_frame(imdb, i, backgrounds), perm)
 
-            # meta data
-            filename = cfg.TRAIN.SYNROOT + '{:06d}-meta.mat'.format(i)
-            meta_data = scipy.io.loadmat(filename)
-        else:
-            # parse image name
-            image_index = imdb.image_index[i]
-
-            # read color image
-            rgba = pad_im(cv2.imread(imdb.image_path_at(i), cv2.IMREAD_UNCHANGED), 16)
-            if rgba.shape[2] == 4:
-                im = np.copy(rgba[:,:,:3])
-                alpha = rgba[:,:,3]
-                I = np.where(alpha == 0)
-                im[I[0], I[1], :] = 0
-            else:
-                im = rgba
-
-            # read depth image
-            im_depth = pad_im(cv2.imread(imdb.depth_path_at(i), cv2.IMREAD_UNCHANGED), 16)
-
-            # load meta data
-            print imdb.metadata_path_at(i)
-            meta_data = scipy.io.loadmat(imdb.metadata_path_at(i))
-        meta_data['cls_indexes'] = meta_data['cls_indexes'].flatten()
-
-        # process annotation if training for two classes
-        if imdb.num_classes == 2:
-            ind = np.where(meta_data['cls_indexes'] == imdb._cls_index)[0]
-            if len(ind) > 0:
-                meta_data['cls_indexes'] = np.ones((1,), dtype=np.float32)
-                if len(meta_data['poses'].shape) == 3:
-                    meta_data['poses'] = np.reshape(meta_data['poses'][:,:,ind], (3, 4, 1))
-                else:
-                    meta_data['poses'] = np.reshape(meta_data['poses'], (3, 4, 1))
-                meta_data['center'] = meta_data['center'][ind,:]
-            else:
-                meta_data['cls_indexes'] = np.ones((0,), dtype=np.float32)
-                meta_data['poses'] = np.zeros((3, 4, 0), dtype=np.float32)
-                meta_data['center'] = np.zeros((0, 2), dtype=np.float32)
+    for i, (im, im_depth, meta_data) in reader:
 
         _t['im_detect'].tic()
         boxes, scores, rois, rpn_scores, poses = im_detect_single_frame(sess, net, im, im_depth, meta_data, imdb._points_all, imdb._symmetry, imdb.num_classes)
@@ -1616,7 +1834,7 @@ def test_net_detection(sess, net, imdb, weights_filename):
         all_poses = compute_translations(all_dets, all_poses, imdb._points_all, meta_data['intrinsic_matrix'])
 
         det = {'rois': all_dets, 'poses': all_poses}
-        detections[i] = det
+        detections.put(i, det)
         _t['misc'].toc()
 
         print 'im_detect: {:d}/{:d} {:.3f}s {:.3f}s' \
@@ -1628,67 +1846,22 @@ def test_net_detection(sess, net, imdb, weights_filename):
             vis_detections(im, im_depth, all_dets, all_poses, meta_data['cls_indexes'], meta_data['intrinsic_matrix'], \
                            meta_data['poses'], imdb._points_all, imdb._class_colors, imdb.num_classes)
 
-    det_file = os.path.join(output_dir, 'detections.pkl')
-    with open(det_file, 'wb') as f:
-        cPickle.dump(detections, f, cPickle.HIGHEST_PROTOCOL)
+    reader.report()
+    _blob_pool.report()
 
     # evaluation
     imdb.evaluate_detections(detections, output_dir)
 
 # dets (cls, x1, y1, x2, y2, score)
 def compute_translations(dets, poses, points, intrinsic_matrix):
-
-    fx = intrinsic_matrix[0, 0]
-    fy = intrinsic_matrix[1, 1]
-    cx = intrinsic_matrix[0, 2]
-    cy = intrinsic_matrix[1, 2]
-    num = dets.shape[0]
-    # for each object
-    for i in xrange(num):
-        cls = int(dets[i, 0])
-        # object center
-        x = (dets[i, 1] + dets[i, 3]) / 2
-        y = (dets[i, 2] + dets[i, 4]) / 2
-        width = dets[i, 3] - dets[i, 1]
-        height = dets[i, 4] - dets[i, 2]
-        # backprojection
-        rx = (x - cx) / fx;
-        ry = (y - cy) / fy;
-        x0 = 0.5
-        d = minimize(distance_objective, x0, method='nelder-mead', args=(rx, ry, poses[i,:4], cls, points, intrinsic_matrix, width, height))
-        poses[i, 4] = rx * d.x
-        poses[i, 5] = ry * d.x
-        poses[i, 6] = d.x
-
-    return poses
-
-
-def distance_objective(x, rx, ry, quaternion, cls, points, intrinsic_matrix, width, height):
-
-    x3d = np.ones((4, points.shape[1]), dtype=np.float32)
-    x3d[0, :] = points[cls,:,0]
-    x3d[1, :] = points[cls,:,1]
-    x3d[2, :] = points[cls,:,2]
-
-    # projection
-    RT = np.zeros((3, 4), dtype=np.float32)
-    RT[:3, :3] = quat2mat(quaternion)
-    RT[0, 3] = rx * x
-    RT[1, 3] = ry * x
-    RT[2, 3] = x
-    x2d = np.matmul(intrinsic_matrix, np.matmul(RT, x3d))
-    x2d[0, :] = np.divide(x2d[0, :], x2d[2, :])
-    x2d[1, :] = np.divide(x2d[1, :], x2d[2, :])
-
-    # bounding box
-    x1 = np.min(x2d[0, :])
-    x2 = np.max(x2d[0, :])
-    y1 = np.min(x2d[1, :])
-    y2 = np.max(x2d[1, :])
-    w = x2 - x1
-    h = y2 - y1
-
-    return (w - width) * (w - width) + (h - height) * (h - height)
+    """set the translations of the poses from the boxes with the solver of cfg.TEST.TRANSLATION_SOLVER
+    """
+    if cfg.TEST.TRANSLATION_SOLVER == 'nelder-mead':
+        return translations_nelder_mead(dets, poses, points, intrinsic_matrix)
+    elif cfg.TEST.TRANSLATION_SOLVER == 'gauss-newton':
+        return translations_gauss_newton(dets, poses, points, intrinsic_matrix)
+    else:
+        raise ValueError('unknown translation solver {}'.format(cfg.TEST.TRANSLATION_SOLVER))
 
 
 def im_detect_single_frame(sess, net, im, im_depth, meta_data, points, symmetry, num_classes):
@@ -1696,7 +1869,7 @@ def im_detect_single_frame(sess, net, im, im_depth, meta_data, points, symmetry,
     """
 
     # compute image blob
-    im_blob, im_rescale_blob, im_depth_blob, im_normal_blob, im_scale_factors = _get_image_blob(im, im_depth, meta_data)
+    im_blob, im_depth_blob, im_normal_blob, im_scale_factors = _get_image_blob(im, im_depth, meta_data)
     im_scale = im_scale_factors[0]
     im_info = np.array([im_blob.shape[1], im_blob.shape[2], im_scale], dtype=np.float32)
 
@@ -1712,8 +1885,8 @@ def im_detect_single_frame(sess, net, im, im_depth, meta_data, points, symmetry,
         data_blob = im_normal_blob
 
     # use a fake gt boxes of zeros
-    gt_boxes = np.zeros((1, 5), dtype=np.float32)
-    pose_blob = np.zeros((1, 13), dtype=np.float32)
+    gt_boxes = _blob_pool.zeros((1, 5))
+    pose_blob = _blob_pool.zeros((1, 13))
 
     if cfg.INPUT == 'RGBD':
         feed_dict = {net.data: data_blob, net.data_p: data_p_blob, net.im_info: im_info, net.gt_boxes: gt_boxes, \
@@ -1837,7 +2010,8 @@ def test_net_images(sess, net, imdb, weights_filename, rgb_filenames, depth_file
         os.makedirs(output_dir)
 
     num_images = len(rgb_filenames)
-    segmentations = [[] for _ in xrange(num_images)]
+    # not segmentations.db, the frames of a dataset are skipped by their results there
+    segmentations = ResultsStore(os.path.join(output_dir, 'images.db'), _results_key())
 
     # timers
     _t = {'im_segment' : Timer(), 'misc' : Timer()}
@@ -1864,24 +2038,11 @@ def test_net_images(sess, net, imdb, weights_filename, rgb_filenames, depth_file
         synthesizer = libsynthesizer.Synthesizer(cfg.CAD, cfg.POSE)
         synthesizer.setup(cfg.TRAIN.SYN_WIDTH, cfg.TRAIN.SYN_HEIGHT)
 
-    for i in perm:
+    reader = _get_frame_reader(lambda i: _read_frame(rgb_filenames[i], depth_filenames[i])[:2], perm)
 
-        # read color image
-        rgba = pad_im(cv2.imread(rgb_filenames[i], cv2.IMREAD_UNCHANGED), 16)
-        print rgb_filenames[i]
-        if rgba.shape[2] == 4:
-            im = np.copy(rgba[:,:,:3])
-            alpha = rgba[:,:,3]
-            I = np.where(alpha == 0)
-            im[I[0], I[1], :] = 0
-        else:
-            im = rgba
+    for i, (im, im_depth) in reader:
 
-        # read depth image
-        if os.path.isfile(depth_filenames[i]):
-            im_depth = pad_im(cv2.imread(depth_filenames[i], cv2.IMREAD_UNCHANGED), 16)
-        else:
-            im_depth = np.zeros((im.shape[0], im.shape[1]), dtype=np.uint16)
+        print rgb_filenames[i]
 
         _t['im_segment'].tic()
 
@@ -1938,19 +2099,20 @@ def test_net_images(sess, net, imdb, weights_filename, rgb_filenames, depth_file
         _t['misc'].tic()
         labels_new = cv2.resize(labels, None, None, fx=1.0/im_scale, fy=1.0/im_scale, interpolation=cv2.INTER_NEAREST)
         seg = {'labels': labels_new, 'rois': rois, 'poses': poses, 'poses_refined': poses_new, 'poses_icp': poses_icp}
-        segmentations[i] = seg
+        segmentations.put(i, seg)
         _t['misc'].toc()
 
         print 'im_segment: {:d}/{:d} {:.3f}s {:.3f}s' \
               .format(i, num_images, _t['im_segment'].diff, _t['misc'].diff)
 
-        imdb.save_result(i, seg, output_dir)
-
         if cfg.TEST.VISUALIZE:
             vertmap = _extract_vertmap(labels, vertex_pred, imdb._extents, imdb.num_classes)
             vis_segmentations_vertmaps_detection(im, im_depth, im_label, imdb._class_colors, vertmap, 
                 labels, rois, poses, poses_icp, meta_data['intrinsic_matrix'], imdb.num_classes, imdb._classes, imdb._points_all)
 
+    reader.report()
+    _blob_pool.report()
+
 
 def _render_synthetic_image(SYN, num_classes, backgrounds, intrinsic_matrix):
     """Builds an input blob from the images in the roidb at the specified
@@ -11,7 +11,9 @@ from fcn.config import cfg
 from gt_data_layer.layer import GtDataLayer
 from gt_single_data_layer.layer import GtSingleDataLayer
 from gt_synthesize_layer.layer import GtSynthesizeLayer
-from utils.timer import Timer
+from utils.timer import Timer, profiler
+from utils.data_loader import DataLoader
+from networks.weight_loader import restore_checkpoint
 import numpy as np
 import os
 import tensorflow as tf
@@ -54,41 +56,11 @@ class SolverWrapper(object):
 
         self.saver.save(sess, filename, write_meta_graph=False)
         print 'Wrote snapshot to: {:s}'.format(filename)
+        profiler.save(self.output_dir)
 
     def restore(self, session, save_file):
-        reader = tf.train.NewCheckpointReader(save_file)
-        saved_shapes = reader.get_variable_to_shape_map()
-        var_names = sorted([(var.name, var.name.split(':')[0]) for var in tf.global_variables()
-                if var.name.split(':')[0] in saved_shapes])
-
-        var_name_to_var = {var.name : var for var in tf.global_variables()}
-        restore_vars = []
-        restored_var_names = set()
-        print('Restoring:')
-        with tf.variable_scope(tf.get_variable_scope(), reuse=True):
-            for var_name, saved_var_name in var_names:
-                if 'global_step' in var_name:
-                    continue
-                if 'Variable' in var_name:
-                    continue
-                curr_var = var_name_to_var[var_name]
-                var_shape = curr_var.get_shape().as_list()
-                if var_shape == saved_shapes[saved_var_name]:
-                    restore_vars.append(curr_var)
-                    print(str(saved_var_name))
-                    restored_var_names.add(saved_var_name)
-                else:
-                    print('Shape mismatch for var', saved_var_name, 'expected', var_shape, 'got', saved_shapes[saved_var_name])
-        ignored_var_names = sorted(list(set(saved_shapes.keys()) - restored_var_names))
-        if len(ignored_var_names) == 0:
-            print('Restored all variables')
-        else:
-            print('Did not restore:' + '\n\t'.join(ignored_var_names))
-
-        if len(restore_vars) > 0:
-            saver = tf.train.Saver(restore_vars)
-            saver.restore(session, save_file)
-        print('Restored %s' % save_file)
+        # variables with the same name and shape, assigned in one session run
+        restore_checkpoint(session, save_file)
 
 
     def train_model(self, sess, train_op, loss, learning_rate, max_iters, data_layer):
@@ -380,60 +352,99 @@ def get_training_roidb(imdb):
     return imdb.roidb
 
 
+def _init_loader_worker(data_layer, worker_id):
+    # the OpenMP thread pool started by the first minibatch of the parent does not survive the fork
+    cfg.NORMAL_THREADS = 1
+    # each worker samples its own permutation of the training images
+    data_layer._shuffle_roidb_inds()
+    if isinstance(data_layer, GtSynthesizeLayer):
+        data_layer._shuffle_syn_inds()
+        data_layer._shuffle_adapt_inds()
+
+
 def load_and_enqueue(sess, net, data_layer, coord):
 
+    # the GPU normals cannot be used in forked workers, the workers compute the
+    # cpu normals in one thread (see _init_loader_worker)
+    num_workers = cfg.TRAIN.LOADER_WORKERS
+    if (cfg.INPUT == 'NORMAL' and cfg.NORMAL_BACKEND == 'gpu') or cfg.TRAIN.VISUALIZE:
+        num_workers = 0
+    if cfg.PROFILE:
+        profiler.enable()
+    loader = DataLoader(data_layer, num_workers, cfg.TRAIN.LOADER_QUEUE_SIZE, cfg.RNG_SEED, _init_loader_worker)
+
     iter = 0
-    while not coord.should_stop():
-        blobs = data_layer.forward(iter)
-        iter += 1
-
-        if cfg.INPUT == 'RGBD':
-            data_blob = blobs['data_image_color']
-            data_p_blob = blobs['data_image_depth']
-        elif cfg.INPUT == 'COLOR':
-            data_blob = blobs['data_image_color']
-        elif cfg.INPUT == 'DEPTH':
-            data_blob = blobs['data_image_depth']
-        elif cfg.INPUT == 'NORMAL':
-            data_blob = blobs['data_image_normal']
+    queue_size = 0
+    try:
+        while not coord.should_stop():
+            profiler.tic('load_and_enqueue')
+            profiler.tic('load')
+            blobs = loader.next()
+            profiler.toc('load')
+            iter += 1
 
-        if cfg.TRAIN.SINGLE_FRAME:
-            if cfg.TRAIN.SEGMENTATION:
-                if cfg.INPUT == 'RGBD':
-                    if cfg.TRAIN.VERTEX_REG_2D or cfg.TRAIN.VERTEX_REG_3D:
-                        feed_dict={net.data: data_blob, net.data_p: data_p_blob, net.gt_label_2d: blobs['data_label'], net.keep_prob: 0.5, \
-                                   net.vertex_targets: blobs['data_vertex_targets'], net.vertex_weights: blobs['data_vertex_weights'], \
-                                   net.poses: blobs['data_pose'], net.extents: blobs['data_extents'], net.meta_data: blobs['data_meta_data']}
+            if cfg.INPUT == 'RGBD':
+                data_blob = blobs['data_image_color']
+                data_p_blob = blobs['data_image_depth']
+            elif cfg.INPUT == 'COLOR':
+                data_blob = blobs['data_image_color']
+            elif cfg.INPUT == 'DEPTH':
+                data_blob = blobs['data_image_depth']
+            elif cfg.INPUT == 'NORMAL':
+                data_blob = blobs['data_image_normal']
+
+            if cfg.TRAIN.SINGLE_FRAME:
+                if cfg.TRAIN.SEGMENTATION:
+                    if cfg.INPUT == 'RGBD':
+                        if cfg.TRAIN.VERTEX_REG_2D or cfg.TRAIN.VERTEX_REG_3D:
+                            feed_dict={net.data: data_blob, net.data_p: data_p_blob, net.gt_label_2d: blobs['data_label'], net.keep_prob: 0.5, \
+                                       net.vertex_targets: blobs['data_vertex_targets'], net.vertex_weights: blobs['data_vertex_weights'], \
+                                       net.poses: blobs['data_pose'], net.extents: blobs['data_extents'], net.meta_data: blobs['data_meta_data']}
+                        else:
+                            feed_dict={net.data: data_blob, net.data_p: data_p_blob, net.gt_label_2d: blobs['data_label'], net.keep_prob: 0.5}
                     else:
-                        feed_dict={net.data: data_blob, net.data_p: data_p_blob, net.gt_label_2d: blobs['data_label'], net.keep_prob: 0.5}
+                        if cfg.TRAIN.VERTEX_REG_2D or cfg.TRAIN.VERTEX_REG_3D:
+                            feed_dict={net.data: data_blob, net.gt_label_2d: blobs['data_label'], net.keep_prob: 0.5, \
+                                       net.vertex_targets: blobs['data_vertex_targets'], net.vertex_weights: blobs['data_vertex_weights'], \
+                                       net.poses: blobs['data_pose'], net.extents: blobs['data_extents'], net.meta_data: blobs['data_meta_data'], \
+                                       net.points: blobs['data_points'], net.symmetry: blobs['data_symmetry']}
+                        else:
+                            feed_dict={net.data: data_blob, net.gt_label_2d: blobs['data_label'], net.keep_prob: 0.5}
                 else:
-                    if cfg.TRAIN.VERTEX_REG_2D or cfg.TRAIN.VERTEX_REG_3D:
-                        feed_dict={net.data: data_blob, net.gt_label_2d: blobs['data_label'], net.keep_prob: 0.5, \
-                                   net.vertex_targets: blobs['data_vertex_targets'], net.vertex_weights: blobs['data_vertex_weights'], \
-                                   net.poses: blobs['data_pose'], net.extents: blobs['data_extents'], net.meta_data: blobs['data_meta_data'], \
-                                   net.points: blobs['data_points'], net.symmetry: blobs['data_symmetry']}
+                    if cfg.INPUT == 'RGBD':
+                        feed_dict={net.data: data_blob, net.data_p: data_p_blob, net.im_info: blobs['data_im_info'], \
+                                   net.gt_boxes: blobs['data_gt_boxes'], net.poses: blobs['data_pose'], \
+                                   net.points: blobs['data_points'], net.symmetry: blobs['data_symmetry'], net.keep_prob: 0.5}
                     else:
-                        feed_dict={net.data: data_blob, net.gt_label_2d: blobs['data_label'], net.keep_prob: 0.5}
+                        feed_dict={net.data: data_blob, net.im_info: blobs['data_im_info'], \
+                                   net.gt_boxes: blobs['data_gt_boxes'], net.poses: blobs['data_pose'], \
+                                   net.points: blobs['data_points'], net.symmetry: blobs['data_symmetry'], net.keep_prob: 0.5}
             else:
                 if cfg.INPUT == 'RGBD':
-                    feed_dict={net.data: data_blob, net.data_p: data_p_blob, net.im_info: blobs['data_im_info'], \
-                               net.gt_boxes: blobs['data_gt_boxes'], net.poses: blobs['data_pose'], \
-                               net.points: blobs['data_points'], net.symmetry: blobs['data_symmetry'], net.keep_prob: 0.5}
+                    feed_dict={net.data: data_blob, net.data_p: data_p_blob, net.gt_label_2d: blobs['data_label'], \
+                               net.depth: blobs['data_depth'], net.meta_data: blobs['data_meta_data'], \
+                               net.state: blobs['data_state'], net.weights: blobs['data_weights'], net.points: blobs['data_points'], net.keep_prob: 0.5}
                 else:
-                    feed_dict={net.data: data_blob, net.im_info: blobs['data_im_info'], \
-                               net.gt_boxes: blobs['data_gt_boxes'], net.poses: blobs['data_pose'], \
-                               net.points: blobs['data_points'], net.symmetry: blobs['data_symmetry'], net.keep_prob: 0.5}
-        else:
-            if cfg.INPUT == 'RGBD':
-                feed_dict={net.data: data_blob, net.data_p: data_p_blob, net.gt_label_2d: blobs['data_label'], \
-                           net.depth: blobs['data_depth'], net.meta_data: blobs['data_meta_data'], \
-                           net.state: blobs['data_state'], net.weights: blobs['data_weights'], net.points: blobs['data_points'], net.keep_prob: 0.5}
-            else:
-                feed_dict={net.data: data_blob, net.gt_label_2d: blobs['data_label'], \
-                           net.depth: blobs['data_depth'], net.meta_data: blobs['data_meta_data'], \
-                           net.state: blobs['data_state'], net.weights: blobs['data_weights'], net.points: blobs['data_points'], net.keep_prob: 0.5}
-
-        sess.run(net.enqueue_op, feed_dict=feed_dict)
+                    feed_dict={net.data: data_blob, net.gt_label_2d: blobs['data_label'], \
+                               net.depth: blobs['data_depth'], net.meta_data: blobs['data_meta_data'], \
+                               net.state: blobs['data_state'], net.weights: blobs['data_weights'], net.points: blobs['data_points'], net.keep_prob: 0.5}
+
+            profiler.tic('enqueue')
+            sess.run(net.enqueue_op, feed_dict=feed_dict)
+            profiler.toc('enqueue')
+            profiler.toc('load_and_enqueue')
+
+            # occupancy of the network queue, empty when the training step waits for data
+            if hasattr(net, 'queue_size') and iter % cfg.TRAIN.DISPLAY == 0:
+                queue_size += sess.run(net.queue_size)
+            if iter % (10 * cfg.TRAIN.DISPLAY) == 0:
+                loader.report()
+                profiler.report()
+                if hasattr(net, 'queue_size'):
+                    print 'network queue: {:.2f} minibatches on average'.format(queue_size / 10.0)
+                queue_size = 0
+    finally:
+        loader.close()
 
 
 def loss_cross_entropy(scores, labels):
@@ -15,7 +15,8 @@ from fcn.config import cfg
 from utils.blob import im_list_to_blob, pad_im, chromatic_transform
 from utils.se3 import *
 import scipy.io
-from normals import gpu_normals
+from normals.normal_image import normal_image
+from utils.preprocess import color_blob, depth_blob
 from transforms3d.quaternions import mat2quat, quat2mat
 
 
@@ -105,37 +106,20 @@ def _get_image_blob(roidb, scale_ind):
             im_rescale = cv2.resize(im_orig, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
             processed_ims_rescale.append(im_rescale)
 
-        im_orig = im.astype(np.float32, copy=True)
-        im_orig -= cfg.PIXEL_MEANS
+        # im is already flipped
         im_scale = cfg.TRAIN.SCALES_BASE[scale_ind]
-        im = cv2.resize(im_orig, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
+        im = color_blob(im, im_scale, False, cfg.PREPROCESS.TRAIN)
         im_scales.append(im_scale)
         processed_ims.append(im)
 
-        # depth
-        im_depth = im_depth_raw.astype(np.float32, copy=True) / float(im_depth_raw.max()) * 255
-        im_depth = np.tile(im_depth[:,:,np.newaxis], (1,1,3))
-
-        if roidb[i]['flipped']:
-            im_depth = im_depth[:, ::-1]
-
-        im_orig = im_depth.astype(np.float32, copy=True)
-        im_orig -= cfg.PIXEL_MEANS
-        im_depth = cv2.resize(im_orig, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
+        # depth scaled by the maximum of the image
+        im_depth = depth_blob(im_depth_raw, im_scale, roidb[i]['flipped'], None, cfg.PREPROCESS.TRAIN)
         processed_ims_depth.append(im_depth)
 
         # normals
         depth = im_depth_raw.astype(np.float32, copy=True) / float(meta_data['factor_depth'])
-        nmap = gpu_normals.gpu_normals(depth, fx, fy, cx, cy, 20.0, cfg.GPU_ID)
-        im_normal = 127.5 * nmap + 127.5
-        im_normal = im_normal.astype(np.uint8)
-        im_normal = im_normal[:, :, (2, 1, 0)]
-        if roidb[i]['flipped']:
-            im_normal = im_normal[:, ::-1, :]
-
-        im_orig = im_normal.astype(np.float32, copy=True)
-        im_orig -= cfg.PIXEL_MEANS
-        im_normal = cv2.resize(im_orig, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
+        im_normal = normal_image(depth, fx, fy, cx, cy, bilateral=False)
+        im_normal = color_blob(im_normal, im_scale, roidb[i]['flipped'], cfg.PREPROCESS.TRAIN)
         processed_ims_normal.append(im_normal)
 
     # Create a blob to hold the input images
@@ -10,6 +10,8 @@
 
 from fcn.config import cfg
 from gt_synthesize_layer.minibatch import get_minibatch
+from utils.target_cache import TargetCache, config_key
+from utils.background_store import open_background_store
 import numpy as np
 import cv2
 from utils.blob import pad_im
@@ -35,7 +37,9 @@ class GtSynthesizeLayer(object):
         self._shuffle_adapt_inds()
         self._build_background_images()
         self._build_background_depth_images()
+        self._open_background_stores()
         self._read_camera_parameters()
+        self._build_target_cache()
 
     def _shuffle_roidb_inds(self):
         """Randomly permute the training roidb."""
@@ -110,7 +114,8 @@ class GtSynthesizeLayer(object):
             backgrounds = self._backgrounds_depth
         else:
             backgrounds = self._backgrounds
-        return get_minibatch(minibatch_db, self._extents, self._points, self._symmetry, self._num_classes, backgrounds, self._intrinsic_matrix, self._data_queue, db_inds_syn, is_syn, db_inds_adapt, is_adapt, is_symmetric)
+        return get_minibatch(minibatch_db, self._extents, self._points, self._symmetry, self._num_classes, backgrounds, self._intrinsic_matrix, self._data_queue, db_inds_syn, is_syn, db_inds_adapt, is_adapt, is_symmetric, \
+                             db_inds, self._target_cache)
             
     def forward(self, iter):
         """Get blobs and copy them into this layer's top blob vector."""
@@ -118,6 +123,15 @@ class GtSynthesizeLayer(object):
 
         return blobs
 
+    def _build_target_cache(self):
+        """cache of the targets of the real frames, keyed by the config they depend on"""
+        if not cfg.TRAIN.TARGET_CACHE:
+            self._target_cache = None
+            return
+        key = config_key(len(self._roidb), self._num_classes, self._extents, cfg.INPUT, cfg.TRAIN.SEGMENTATION, \
+                         cfg.TRAIN.VERTEX_REG_2D, cfg.TRAIN.VERTEX_REG_3D, cfg.TRAIN.VERTEX_W_INSIDE)
+        self._target_cache = TargetCache(os.path.join(self._cache_path, self._name + '_targets'), key)
+
     def _read_camera_parameters(self):
         meta_data = scipy.io.loadmat(self._roidb[0]['meta_data'])
         self._intrinsic_matrix = meta_data['intrinsic_matrix'].astype(np.float32, copy=True)
@@ -175,6 +189,22 @@ class GtSynthesizeLayer(object):
             cPickle.dump(backgrounds, fid, cPickle.HIGHEST_PROTOCOL)
         print 'wrote backgrounds to {}'.format(cache_file)
 
+    def _open_background_stores(self):
+        """replace the lists of background files by stores of the decoded images"""
+        if not cfg.BACKGROUND_STORE:
+            return
+        # size of the synthetic images after padding
+        height = int(np.ceil(cfg.TRAIN.SYN_HEIGHT / 16.0) * 16)
+        width = int(np.ceil(cfg.TRAIN.SYN_WIDTH / 16.0) * 16)
+        if cfg.INPUT == 'DEPTH' or cfg.INPUT == 'NORMAL':
+            store_file = os.path.join(self._cache_path, 'backgrounds_depth_{}x{}.pkl'.format(height, width))
+            self._backgrounds_depth = open_background_store(self._backgrounds_depth, store_file, height, width, True, \
+                cfg.BACKGROUND_STORE_SIZE, cfg.BACKGROUND_CACHE_SIZE)
+        else:
+            store_file = os.path.join(self._cache_path, 'backgrounds_{}x{}.pkl'.format(height, width))
+            self._backgrounds = open_background_store(self._backgrounds, store_file, height, width, False, \
+                cfg.BACKGROUND_STORE_SIZE, cfg.BACKGROUND_CACHE_SIZE)
+
     def _write_background_images(self):
 
         cache_file = os.path.join(self._cache_path, self._name + '_backgrounds.pkl')
@@ -12,26 +12,39 @@ import os
 import numpy as np
 import numpy.random as npr
 import cv2
-import math
 from fcn.config import cfg
 from utils.blob import im_list_to_blob, pad_im, chromatic_transform, add_noise
 from utils.se3 import *
 import scipy.io
-from normals import gpu_normals
+from normals.normal_image import normal_image
+from utils.preprocess import color_blob, depth_blob
 from transforms3d.quaternions import mat2quat, quat2mat
-from utils.timer import Timer
+from utils.timer import Timer, profiler
+from utils.frame_shard import ShardReader
+from utils.vertex_targets import generate_vertex_targets
+from utils.background_store import sample_background
+
+# reader of the packed frames in cfg.TRAIN.SHARDS, opened on first use
+_shard_reader = None
 
 def get_minibatch(roidb, extents, points, symmetry, num_classes, backgrounds, intrinsic_matrix, \
-    data_queue, db_inds_syn, is_syn, db_inds_adapt, is_adapt, is_symmetric):
+    data_queue, db_inds_syn, is_syn, db_inds_adapt, is_adapt, is_symmetric, db_inds=None, target_cache=None):
     """Given a roidb, construct a minibatch sampled from it."""
 
+    profiler.tic('get_minibatch')
+
     # Get the input image blob, formatted for tensorflow
     random_scale_ind = npr.randint(0, high=len(cfg.TRAIN.SCALES_BASE))
+    profiler.tic('image_blob')
     im_blob, im_depth_blob, im_normal_blob, im_scales, data_out, height, width = _get_image_blob(roidb, random_scale_ind, num_classes, backgrounds, intrinsic_matrix, data_queue, db_inds_syn, is_syn, db_inds_adapt, is_adapt)
+    profiler.toc('image_blob')
 
     # build the label blob
+    profiler.tic('label_blob')
     depth_blob, label_blob, meta_data_blob, vertex_target_blob, vertex_weight_blob, pose_blob, gt_boxes \
-        = _get_label_blob(roidb, intrinsic_matrix, data_out, num_classes, db_inds_syn, im_scales, extents, is_syn, db_inds_adapt, is_adapt, height, width)
+        = _get_label_blob(roidb, intrinsic_matrix, data_out, num_classes, db_inds_syn, im_scales, extents, is_syn, db_inds_adapt, is_adapt, height, width, \
+                          db_inds, target_cache)
+    profiler.toc('label_blob')
 
     if not cfg.TRAIN.SEGMENTATION:
         im_info = np.array([im_blob.shape[1], im_blob.shape[2], im_scales[0]], dtype=np.float32)
@@ -77,6 +90,7 @@ def get_minibatch(roidb, extents, points, symmetry, num_classes, backgrounds, in
              'data_gt_boxes': gt_boxes,
              'data_im_info': im_info}
 
+    profiler.toc('get_minibatch')
     return blobs
 
 def _get_image_blob(roidb, scale_ind, num_classes, backgrounds, intrinsic_matrix, data_queue, db_inds_syn, is_syn, db_inds_adapt, is_adapt):
@@ -118,31 +132,17 @@ def _get_image_blob(roidb, scale_ind, num_classes, backgrounds, intrinsic_matrix
                         im_depth_raw = pad_im(data['depth'], 16)
                     rgba = pad_im(data['image'], 16)
                 else:
+                    entry = _syn_entry(db_inds_syn[i])
                     if cfg.INPUT == 'DEPTH' or cfg.INPUT == 'RGBD' or cfg.INPUT == 'NORMAL':
                         # depth raw
-                        filename = cfg.TRAIN.SYNROOT + '{:06d}-depth.png'.format(db_inds_syn[i])
-                        im_depth_raw = pad_im(cv2.imread(filename, cv2.IMREAD_UNCHANGED), 16)
+                        im_depth_raw = pad_im(_imread(entry, 'depth'), 16)
 
                     # rgba
-                    filename = cfg.TRAIN.SYNROOT + '{:06d}-color.png'.format(db_inds_syn[i])
-                    rgba = pad_im(cv2.imread(filename, cv2.IMREAD_UNCHANGED), 16)
+                    rgba = pad_im(_imread(entry, 'image'), 16)
 
                 # sample a background image
-                ind = np.random.randint(len(backgrounds), size=1)[0]
-                filename = backgrounds[ind]
-                background = cv2.imread(filename, cv2.IMREAD_UNCHANGED)
-                try:
-                    background = cv2.resize(background, (rgba.shape[1], rgba.shape[0]), interpolation=cv2.INTER_LINEAR)
-                except:
-                    if cfg.INPUT == 'DEPTH' or cfg.INPUT == 'NORMAL':
-                        background = np.zeros((rgba.shape[0], rgba.shape[1]), dtype=np.uint16)
-                    else:
-                        background = np.zeros((rgba.shape[0], rgba.shape[1], 3), dtype=np.uint8)
-                    print 'bad background image'
-
-                if cfg.INPUT != 'DEPTH' and cfg.INPUT != 'NORMAL' and len(background.shape) != 3:
-                    background = np.zeros((rgba.shape[0], rgba.shape[1], 3), dtype=np.uint8)
-                    print 'bad background image'
+                background = sample_background(backgrounds, rgba.shape[0], rgba.shape[1], \
+                                               cfg.INPUT == 'DEPTH' or cfg.INPUT == 'NORMAL')
 
                 # add background
                 im = np.copy(rgba[:,:,:3])
@@ -155,10 +155,10 @@ def _get_image_blob(roidb, scale_ind, num_classes, backgrounds, intrinsic_matrix
             else:
                 if cfg.INPUT == 'DEPTH' or cfg.INPUT == 'RGBD' or cfg.INPUT == 'NORMAL':
                     # depth raw
-                    im_depth_raw = pad_im(cv2.imread(roidb[i]['depth'], cv2.IMREAD_UNCHANGED), 16)
+                    im_depth_raw = pad_im(_imread(roidb[i], 'depth'), 16)
 
                 # rgba
-                rgba = pad_im(cv2.imread(roidb[i]['image'], cv2.IMREAD_UNCHANGED), 16)
+                rgba = pad_im(_imread(roidb[i], 'image'), 16)
                 if rgba.shape[2] == 4:
                     im = np.copy(rgba[:,:,:3])
                     alpha = rgba[:,:,3]
@@ -174,23 +174,20 @@ def _get_image_blob(roidb, scale_ind, num_classes, backgrounds, intrinsic_matrix
         if cfg.TRAIN.ADD_NOISE:
             im = add_noise(im)
 
-        if roidb[i]['flipped']:
-            im = im[:, ::-1, :]
-
-        im_orig = im.astype(np.float32, copy=True)
-        im_orig -= cfg.PIXEL_MEANS
         im_scale = cfg.TRAIN.SCALES_BASE[scale_ind]
-        im = cv2.resize(im_orig, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
+        im = color_blob(im, im_scale, roidb[i]['flipped'], cfg.PREPROCESS.TRAIN)
         im_scales.append(im_scale)
         processed_ims.append(im)
 
-        # depth
-        if cfg.INPUT == 'DEPTH' or cfg.INPUT == 'RGBD':
+        # depth scaled by the maximum of the image
+        if (cfg.INPUT == 'DEPTH' or cfg.INPUT == 'RGBD') and not cfg.TRAIN.ADD_NOISE:
+            im_depth = depth_blob(im_depth_raw, im_scale, roidb[i]['flipped'], None, cfg.PREPROCESS.TRAIN)
+            processed_ims_depth.append(im_depth)
+        elif cfg.INPUT == 'DEPTH' or cfg.INPUT == 'RGBD':
+            # the noise is added to the depth repeated over the channels
             im_depth = im_depth_raw.astype(np.float32, copy=True) / float(im_depth_raw.max()) * 255
             im_depth = np.tile(im_depth[:,:,np.newaxis], (1,1,3))
-
-            if cfg.TRAIN.ADD_NOISE:
-                im_depth = add_noise(im_depth)
+            im_depth = add_noise(im_depth)
 
             if roidb[i]['flipped']:
                 im_depth = im_depth[:, ::-1]
@@ -207,17 +204,8 @@ def _get_image_blob(roidb, scale_ind, num_classes, backgrounds, intrinsic_matrix
             fy = intrinsic_matrix[1, 1] * im_scale
             cx = intrinsic_matrix[0, 2] * im_scale
             cy = intrinsic_matrix[1, 2] * im_scale
-            nmap = gpu_normals.gpu_normals(depth, fx, fy, cx, cy, 20.0, cfg.GPU_ID)
-            im_normal = 127.5 * nmap + 127.5
-            im_normal = im_normal.astype(np.uint8)
-            im_normal = im_normal[:, :, (2, 1, 0)]
-            im_normal = cv2.bilateralFilter(im_normal, 9, 75, 75)
-            if roidb[i]['flipped']:
-                im_normal = im_normal[:, ::-1, :]
-
-            im_orig = im_normal.astype(np.float32, copy=True)
-            im_orig -= cfg.PIXEL_MEANS
-            im_normal = cv2.resize(im_orig, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
+            im_normal = normal_image(depth, fx, fy, cx, cy)
+            im_normal = color_blob(im_normal, im_scale, roidb[i]['flipped'], cfg.PREPROCESS.TRAIN)
             processed_ims_normal.append(im_normal)
 
     # Create a blob to hold the input images
@@ -239,6 +227,52 @@ def _get_image_blob(roidb, scale_ind, num_classes, backgrounds, intrinsic_matrix
     return blob, blob_depth, blob_normal, im_scales, data_out, height, width
 
 
+def _get_shard_reader():
+    global _shard_reader
+    if _shard_reader is None and cfg.TRAIN.SHARDS:
+        _shard_reader = ShardReader(cfg.TRAIN.SHARDS)
+    return _shard_reader
+
+
+def _syn_entry(index):
+    """
+    the files of a synthetic image in cfg.TRAIN.SYNROOT as a roidb entry,
+    its frame is read from the packed shards if it is in there
+    """
+    prefix = cfg.TRAIN.SYNROOT + '{:06d}-'.format(index)
+    return {'image': prefix + 'color.png', 'depth': prefix + 'depth.png', \
+            'label': prefix + 'label.png', 'meta_data': prefix + 'meta.mat'}
+
+
+def _imread(entry, name):
+    """
+    read the 'image', 'depth' or 'label' image of a roidb entry,
+    from the packed shards if the frame is in there
+    """
+    reader = _get_shard_reader()
+    if reader is not None and entry['image'] in reader:
+        arrays, _ = reader.read(entry['image'], (name,))
+        return arrays.get(name)
+    if name == 'depth' and not os.path.exists(entry['depth']):
+        return None
+    return cv2.imread(entry[name], cv2.IMREAD_UNCHANGED)
+
+
+def _loadmat(entry):
+    """
+    read the meta data of a roidb entry, from the packed shards if the
+    frame is in there with all the fields needed
+    """
+    reader = _get_shard_reader()
+    if reader is not None and entry['image'] in reader:
+        arrays, meta_data = reader.read(entry['image'], ('vertmap',))
+        if 'vertmap' in arrays:
+            meta_data['vertmap'] = arrays['vertmap']
+        if not cfg.TRAIN.VERTEX_REG_3D or 'vertmap' in meta_data:
+            return meta_data
+    return scipy.io.loadmat(entry['meta_data'])
+
+
 def _process_label_image(label_image, class_colors, class_weights):
     """
     change label image to label index
@@ -267,8 +301,38 @@ def _process_label_image(label_image, class_colors, class_weights):
     return label_index, labels
 
 
+def _load_cached_targets(record, i, vertex_target_blob, vertex_weight_blob):
+    """ fill the targets of image i from a record of the target cache """
+    if len(vertex_target_blob) > 0:
+        index = record['vertex_index']
+        targets = vertex_target_blob[i].reshape(-1)
+        weights = vertex_weight_blob[i].reshape(-1)
+        for j in xrange(3):
+            targets[index + j] = record['vertex_targets'][:, j]
+            weights[index + j] = cfg.TRAIN.VERTEX_W_INSIDE
+    poses = record['poses'].copy()
+    poses[:, 0] = i
+    return record['label'].astype(np.int32), poses, record['gt_boxes']
+
+
+def _cached_targets_record(i, label, meta_data, vertex_target_blob, vertex_weight_blob, poses, gt_boxes):
+    """ the record of image i for the target cache """
+    record = {'label': label,
+              'poses': poses,
+              'gt_boxes': gt_boxes,
+              'intrinsic_matrix': meta_data['intrinsic_matrix'],
+              'factor_depth': np.array(meta_data['factor_depth'])}
+    if len(vertex_target_blob) > 0:
+        # the weights are set on the three channels of the class of a pixel
+        index = np.flatnonzero(vertex_weight_blob[i])[::3]
+        targets = vertex_target_blob[i].reshape(-1)
+        record['vertex_index'] = index.astype(np.int32)
+        record['vertex_targets'] = np.stack([targets[index + j] for j in xrange(3)], axis=1)
+    return record
+
+
 def _get_label_blob(roidb, intrinsic_matrix, data_out, num_classes, db_inds_syn, im_scales, extents, \
-    is_syn, db_inds_adapt, is_adapt, blob_height, blob_width):
+    is_syn, db_inds_adapt, is_adapt, blob_height, blob_width, db_inds=None, target_cache=None):
     """ build the label blob """
 
     num_images = len(roidb)
@@ -300,7 +364,27 @@ def _get_label_blob(roidb, intrinsic_matrix, data_out, num_classes, db_inds_syn,
     for i in xrange(num_images):
         im_scale = im_scales[i]
 
-        if is_adapt:
+        # targets of a real frame from the cache
+        record = None
+        if target_cache is not None and not is_syn and not is_adapt:
+            record = target_cache.load(db_inds[i], im_scale, roidb[i])
+
+        if record is not None:
+            profiler.tic('cached_targets')
+            meta_data = {'intrinsic_matrix': record['intrinsic_matrix'], 'factor_depth': record['factor_depth']}
+            im_depth = _imread(roidb[i], 'depth')
+            if im_depth is not None:
+                im_depth = pad_im(im_depth, 16)
+            else:
+                im_depth = np.zeros((blob_height, blob_width), dtype=np.float32)
+            im_labels, poses, gt_box = _load_cached_targets(record, i, vertex_target_blob, vertex_weight_blob)
+            processed_label.append(im_labels)
+            if len(poses) > 0:
+                pose_blob = np.concatenate((pose_blob, poses), axis=0)
+            if not cfg.TRAIN.SEGMENTATION:
+                gt_boxes = np.concatenate((gt_boxes, gt_box), axis=0)
+            profiler.toc('cached_targets')
+        elif is_adapt:
             filename = cfg.TRAIN.ADAPT_ROOT + '{:06d}-depth.png'.format(db_inds_adapt[i])
             im_depth = pad_im(cv2.imread(filename, cv2.IMREAD_UNCHANGED), 16)
             meta_data = dict({'intrinsic_matrix': intrinsic_matrix, 'factor_depth': 1000.0})
@@ -312,29 +396,29 @@ def _get_label_blob(roidb, intrinsic_matrix, data_out, num_classes, db_inds_syn,
                     im_depth = pad_im(data_out[i]['depth'], 16)
                     im = pad_im(data_out[i]['label'], 16)
                 else:
-                    filename = cfg.TRAIN.SYNROOT + '{:06d}-meta.mat'.format(db_inds_syn[i])
-                    meta_data = scipy.io.loadmat(filename)
+                    entry = _syn_entry(db_inds_syn[i])
+                    meta_data = _loadmat(entry)
                     meta_data['cls_indexes'] = meta_data['cls_indexes'].flatten()
 
-                    filename = cfg.TRAIN.SYNROOT + '{:06d}-depth.png'.format(db_inds_syn[i])
-                    im_depth = pad_im(cv2.imread(filename, cv2.IMREAD_UNCHANGED), 16)
+                    im_depth = pad_im(_imread(entry, 'depth'), 16)
 
                     # read label image
-                    filename = cfg.TRAIN.SYNROOT + '{:06d}-label.png'.format(db_inds_syn[i])
-                    im = pad_im(cv2.imread(filename, cv2.IMREAD_UNCHANGED), 16)
+                    im = pad_im(_imread(entry, 'label'), 16)
             else:
-                meta_data = scipy.io.loadmat(roidb[i]['meta_data'])
+                meta_data = _loadmat(roidb[i])
                 meta_data['cls_indexes'] = meta_data['cls_indexes'].flatten()
-                if os.path.exists(roidb[i]['depth']):
-                    im_depth = pad_im(cv2.imread(roidb[i]['depth'], cv2.IMREAD_UNCHANGED), 16)
+                im_depth = _imread(roidb[i], 'depth')
+                if im_depth is not None:
+                    im_depth = pad_im(im_depth, 16)
                 else:
                     im_depth = np.zeros((blob_height, blob_width), dtype=np.float32)
 
                 # read label image
-                im = pad_im(cv2.imread(roidb[i]['label'], cv2.IMREAD_UNCHANGED), 16)
+                im = pad_im(_imread(roidb[i], 'label'), 16)
 
             height = im_depth.shape[0]
             width = im_depth.shape[1]
+            num_poses = len(pose_blob)
 
             # mask the label image according to depth
             if cfg.INPUT == 'DEPTH':
@@ -424,17 +508,16 @@ def _get_label_blob(roidb, intrinsic_matrix, data_out, num_classes, db_inds_syn,
                 # check if mutiple same instances
                 cls_indexes = meta_data['cls_indexes']
                 if len(np.unique(cls_indexes)) < len(cls_indexes):
-                    is_multi_instances = 1
                     # read mask image
                     mask = pad_im(cv2.imread(roidb[i]['mask'], cv2.IMREAD_UNCHANGED), 16)
                 else:
-                    is_multi_instances = 0
-                    mask = []
+                    mask = None
 
-                vertex_target_blob[i,:,:,:], vertex_weight_blob[i,:,:,:] = \
-                    _generate_vertex_targets(im, meta_data['cls_indexes'], im_scale * center, poses, num_classes, vertmap, extents, \
-                                             mask, is_multi_instances, cls_indexes_old, \
-                                             vertex_target_blob[i,:,:,:], vertex_weight_blob[i,:,:,:])
+                profiler.tic('vertex_targets')
+                generate_vertex_targets(im, meta_data['cls_indexes'], im_scale * center, poses, num_classes, vertmap, extents, \
+                                        mask, cls_indexes_old, vertex_target_blob[i,:,:,:], vertex_weight_blob[i,:,:,:], \
+                                        cfg.TRAIN.VERTEX_REG_2D, cfg.TRAIN.VERTEX_REG_3D, cfg.TRAIN.VERTEX_W_INSIDE)
+                profiler.toc('vertex_targets')
 
                 num = poses.shape[2]
                 qt = np.zeros((num, 13), dtype=np.float32)
@@ -450,6 +533,16 @@ def _get_label_blob(roidb, intrinsic_matrix, data_out, num_classes, db_inds_syn,
 
                 pose_blob = np.concatenate((pose_blob, qt), axis=0)
 
+            if target_cache is not None and not is_syn:
+                if cfg.TRAIN.SEGMENTATION:
+                    gt_box = np.zeros((0, 5), dtype=np.float32)
+                if len(pose_blob) > 0:
+                    poses = pose_blob[num_poses:]
+                else:
+                    poses = np.zeros((0, 13), dtype=np.float32)
+                target_cache.save(db_inds[i], im_scale, roidb[i], \
+                    _cached_targets_record(i, im, meta_data, vertex_target_blob, vertex_weight_blob, poses, gt_box))
+
             # voxelization
             # points = voxelizer.backproject_camera(im_depth, meta_data)
             # voxelizer.voxelized = False
@@ -539,83 +632,6 @@ def _flip_poses(poses, K, width):
     return poses_new
 
 
-# compute the voting label image in 2D
-def _generate_vertex_targets(im_label, cls_indexes, center, poses, num_classes, vertmap, extents, \
-    mask, is_multi_instances, cls_indexes_old, vertex_targets, vertex_weights):
-
-    width = im_label.shape[1]
-    height = im_label.shape[0]
-
-    if is_multi_instances:
-        c = np.zeros((2, 1), dtype=np.float32)
-        for i in xrange(len(cls_indexes)):
-            cls = int(cls_indexes[i])
-            y, x = np.where((mask == cls_indexes_old[i]+1) & (im_label == cls))
-            I = np.where((mask == cls_indexes_old[i]+1) & (im_label == cls))
-            if len(x) > 0:
-                if cfg.TRAIN.VERTEX_REG_2D:
-                    c[0] = center[i, 0]
-                    c[1] = center[i, 1]
-                    z = poses[2, 3, i]
-                    R = np.tile(c, (1, len(x))) - np.vstack((x, y))
-                    # compute the norm
-                    N = np.linalg.norm(R, axis=0) + 1e-10
-                    # normalization
-                    R = np.divide(R, np.tile(N, (2,1)))
-                    # assignment
-                    vertex_targets[y, x, 3*cls+0] = R[0,:]
-                    vertex_targets[y, x, 3*cls+1] = R[1,:]
-                    vertex_targets[y, x, 3*cls+2] = math.log(z)
-                if cfg.TRAIN.VERTEX_REG_3D:
-                    vertex_targets[y, x, 3*cls:3*cls+3] = _scale_vertmap(vertmap, I, extents[cls, :])
-
-                vertex_weights[y, x, 3*cls+0] = cfg.TRAIN.VERTEX_W_INSIDE
-                vertex_weights[y, x, 3*cls+1] = cfg.TRAIN.VERTEX_W_INSIDE
-                vertex_weights[y, x, 3*cls+2] = cfg.TRAIN.VERTEX_W_INSIDE
-    else:
-        c = np.zeros((2, 1), dtype=np.float32)
-        for i in xrange(1, num_classes):
-            y, x = np.where(im_label == i)
-            I = np.where(im_label == i)
-            ind = np.where(cls_indexes == i)[0]
-            if len(x) > 0 and len(ind) > 0:
-                if cfg.TRAIN.VERTEX_REG_2D:
-                    c[0] = center[ind, 0]
-                    c[1] = center[ind, 1]
-                    z = poses[2, 3, ind]
-                    R = np.tile(c, (1, len(x))) - np.vstack((x, y))
-                    # compute the norm
-                    N = np.linalg.norm(R, axis=0) + 1e-10
-                    # normalization
-                    R = np.divide(R, np.tile(N, (2,1)))
-                    # assignment
-                    vertex_targets[y, x, 3*i+0] = R[0,:]
-                    vertex_targets[y, x, 3*i+1] = R[1,:]
-                    vertex_targets[y, x, 3*i+2] = math.log(z)
-                if cfg.TRAIN.VERTEX_REG_3D:
-                    vertex_targets[y, x, 3*i:3*i+3] = _scale_vertmap(vertmap, I, extents[i, :])
-
-                vertex_weights[y, x, 3*i+0] = cfg.TRAIN.VERTEX_W_INSIDE
-                vertex_weights[y, x, 3*i+1] = cfg.TRAIN.VERTEX_W_INSIDE
-                vertex_weights[y, x, 3*i+2] = cfg.TRAIN.VERTEX_W_INSIDE
-
-    return vertex_targets, vertex_weights
-
-
-def _scale_vertmap(vertmap, index, extents):
-    for i in range(3):
-        vmin = -extents[i] / 2
-        vmax = extents[i] / 2
-        if vmax - vmin > 0:
-            a = 1.0 / (vmax - vmin)
-            b = -1.0 * vmin / (vmax - vmin)
-        else:
-            a = 0
-            b = 0
-        vertmap[index[0], index[1], i] = a * vertmap[index[0], index[1], i] + b
-    return vertmap[index[0], index[1], :]
-
-
 def _unscale_vertmap(vertmap, labels, extents, num_classes):
     for k in range(1, num_classes):
         index = np.where(labels == k)
@@ -0,0 +1,241 @@
+// Hough voting of object centers on the CPU
+
+#include <stdlib.h>
+#include <math.h>
+#include <algorithm>
+#include <atomic>
+#include <thread>
+#include "hough_voting_cpu.h"
+
+HoughVotingOptions HoughVotingOptions::from_environment()
+{
+  HoughVotingOptions options;
+  const char* value = getenv("HOUGH_VOTING_THREADS");
+  if (value != NULL && atoi(value) >= 0)
+    options.num_threads = atoi(value);
+  value = getenv("HOUGH_VOTING_STRIDE");
+  if (value != NULL && atoi(value) >= 1)
+    options.stride = atoi(value);
+  value = getenv("HOUGH_VOTING_MAX_RAY");
+  if (value != NULL && atoi(value) >= 0)
+    options.max_ray_length = atoi(value);
+  return options;
+}
+
+// vote along the center directions of the pixels of class c
+static void vote_class(const std::vector<int>& pixels, const float* vertmap, int* votes,
+  int height, int width, int num_classes, int c, int stride, int max_ray_length)
+{
+  for (size_t i = 0; i < pixels.size(); i += stride)
+  {
+    int x = pixels[i] % width;
+    int y = pixels[i] / width;
+
+    // read the predict center direction
+    int offset = VERTEX_CHANNELS * c + VERTEX_CHANNELS * num_classes * pixels[i];
+    float u = vertmap[offset];
+    float v = vertmap[offset + 1];
+    float norm = sqrt(u * u + v * v);
+    u /= norm;
+    v /= norm;
+
+    // voting
+    float delta = 1.0 / fabs(u);
+    float cx = x;
+    float cy = y;
+    int steps = 0;
+    while (max_ray_length <= 0 || steps++ < max_ray_length)
+    {
+      cx += delta * u;
+      cy += delta * v;
+      int center_x = int(cx);
+      int center_y = int(cy);
+      if (center_x >= 0 && center_x < width && center_y >= 0 && center_y < height)
+        votes[center_y * width + center_x] += 1;
+      else
+        break;
+    }
+  }
+}
+
+// maximum of the votes in row-major order, ties go to the smallest x and then
+// the smallest y as in a column-first scan
+static int find_maximum(const int* votes, int height, int width, int& max_x, int& max_y)
+{
+  int max_vote = 0;
+  for (int y = 0; y < height; y++)
+  {
+    const int* row = votes + y * width;
+    for (int x = 0; x < width; x++)
+    {
+      if (row[x] > max_vote || (row[x] == max_vote && max_vote > 0 && x < max_x))
+      {
+        max_vote = row[x];
+        max_x = x;
+        max_y = y;
+      }
+    }
+  }
+  return max_vote;
+}
+
+// box size and distance from the inlier pixels of the center
+static bool compute_width_height(const std::vector<int>& pixels, const float* vertmap, const float* extents,
+  int width, int num_classes, int c, float center_x, float center_y, float fx, float fy, float px, float py,
+  float inlierThreshold, int& bb_width, int& bb_height, float& bb_distance)
+{
+  float d = 0;
+  int count = 0;
+  std::vector<float> dx;
+  std::vector<float> dy;
+  for (size_t i = 0; i < pixels.size(); i++)
+  {
+    float x = pixels[i] % width;
+    float y = pixels[i] / width;
+
+    // read out object coordinate
+    int offset = VERTEX_CHANNELS * c + VERTEX_CHANNELS * num_classes * pixels[i];
+    float u = vertmap[offset];
+    float v = vertmap[offset + 1];
+    float distance = exp(vertmap[offset + 2]);
+    float norm = sqrt(u * u + v * v);
+    u /= norm;
+    v /= norm;
+
+    // inlier check, the cosine of the direction to the center
+    float ex = center_x - x;
+    float ey = center_y - y;
+    float dot = u * ex + v * ey;
+    if (dot / (sqrt((double)u * u + (double)v * v) * sqrt((double)ex * ex + (double)ey * ey)) > inlierThreshold)
+    {
+      dx.push_back(fabs(x - center_x));
+      dy.push_back(fabs(y - center_y));
+      d += distance;
+      count++;
+    }
+  }
+  if (count == 0)
+    return false;
+  bb_distance = d / count;
+
+  // project the corners of the 3D box at the distance on the optical axis
+  float xHalf = extents[c * 3] * 0.5;
+  float yHalf = extents[c * 3 + 1] * 0.5;
+  float zHalf = extents[c * 3 + 2] * 0.5;
+  int minX = 1e8;
+  int maxX = -1e8;
+  int minY = 1e8;
+  int maxY = -1e8;
+  for (int i = 0; i < 8; i++)
+  {
+    double X = (i & 1) ? -xHalf : xHalf;
+    double Y = (i & 2) ? -yHalf : yHalf;
+    double Z = (i & 4) ? -zHalf : zHalf;
+    double iz = 1. / (Z + (double)bb_distance);
+    float u = X * iz * (double)fx + (double)px;
+    float v = Y * iz * (double)fy + (double)py;
+    minX = std::min((float) minX, u);
+    minY = std::min((float) minY, v);
+    maxX = std::max((float) maxX, u);
+    maxY = std::max((float) maxY, v);
+  }
+  float limit = std::max(maxX - minX + 1, maxY - minY + 1);
+
+  // 95th percentile of the offsets inside the projected box
+  dx.erase(std::remove_if(dx.begin(), dx.end(), [limit](float e) { return e > limit; }), dx.end());
+  dy.erase(std::remove_if(dy.begin(), dy.end(), [limit](float e) { return e > limit; }), dy.end());
+  bb_width = 0;
+  bb_height = 0;
+  if (dx.size() > 0)
+  {
+    std::vector<float>::iterator it = dx.begin() + int(dx.size() * 0.95);
+    std::nth_element(dx.begin(), it, dx.end());
+    bb_width = 2 * (*it);
+  }
+  if (dy.size() > 0)
+  {
+    std::vector<float>::iterator it = dy.begin() + int(dy.size() * 0.95);
+    std::nth_element(dy.begin(), it, dy.end());
+    bb_height = 2 * (*it);
+  }
+  return true;
+}
+
+void hough_voting_cpu(const int* labelmap, const float* vertmap, const float* extents,
+  int height, int width, int num_classes, float fx, float fy, float px, float py,
+  const HoughVotingOptions& options, HoughVotingArena& arena, std::vector<HoughVotingCenter>& centers)
+{
+  float inlierThreshold = 0.9;
+  int votingThreshold = 50;
+  int stride = std::max(options.stride, 1);
+
+  // pixels of each class
+  arena.pixels.resize(num_classes);
+  for (int c = 0; c < num_classes; c++)
+    arena.pixels[c].clear();
+  for (int i = 0; i < height * width; i++)
+  {
+    int c = labelmap[i];
+    if (c > 0 && c < num_classes)
+      arena.pixels[c].push_back(i);
+  }
+
+  std::vector<int> classes;
+  for (int c = 1; c < num_classes; c++)
+  {
+    if (arena.pixels[c].size() > 0)
+      classes.push_back(c);
+  }
+  if (classes.size() == 0)
+    return;
+
+  int num_threads = options.num_threads;
+  if (num_threads <= 0)
+    num_threads = std::max(int(std::thread::hardware_concurrency()), 1);
+  num_threads = std::min(num_threads, int(classes.size()));
+  arena.planes.resize(std::max(int(arena.planes.size()), num_threads));
+  for (int t = 0; t < num_threads; t++)
+    arena.planes[t].resize(height * width);
+
+  // each thread takes the next class and votes in its own plane
+  std::vector<HoughVotingCenter> results(classes.size());
+  std::vector<char> found(classes.size(), 0);
+  std::atomic<int> next(0);
+  auto worker = [&](int t)
+  {
+    int* votes = arena.planes[t].data();
+    for (int k = next++; k < int(classes.size()); k = next++)
+    {
+      int c = classes[k];
+      const std::vector<int>& pixels = arena.pixels[c];
+      std::fill(votes, votes + height * width, 0);
+      vote_class(pixels, vertmap, votes, height, width, num_classes, c, stride, options.max_ray_length);
+
+      HoughVotingCenter& center = results[k];
+      center.cls = c;
+      center.votes = find_maximum(votes, height, width, center.x, center.y) * stride;
+      if (center.votes < votingThreshold)
+        continue;
+
+      found[k] = compute_width_height(pixels, vertmap, extents, width, num_classes, c, center.x, center.y,
+        fx, fy, px, py, inlierThreshold, center.bb_width, center.bb_height, center.bb_distance);
+    }
+  };
+
+  if (num_threads == 1)
+    worker(0);
+  else
+  {
+    std::vector<std::thread> threads;
+    for (int t = 0; t < num_threads; t++)
+      threads.push_back(std::thread(worker, t));
+    for (int t = 0; t < num_threads; t++)
+      threads[t].join();
+  }
+
+  for (size_t k = 0; k < classes.size(); k++)
+  {
+    if (found[k])
+      centers.push_back(results[k]);
+  }
+}
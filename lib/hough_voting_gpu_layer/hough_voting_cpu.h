@@ -0,0 +1,62 @@
+// Hough voting of object centers on the CPU
+//
+// Each labeled pixel votes along the ray of its predicted center direction,
+// the center of a class is the maximum of its votes. The classes of an image
+// are voted in parallel, each thread with its own accumulator plane, and the
+// planes and pixel lists are kept in an arena reused across calls.
+
+#pragma once
+
+#include <vector>
+
+#ifndef VERTEX_CHANNELS
+#define VERTEX_CHANNELS 3
+#endif
+
+// options of the voting, the defaults give the same centers as the single
+// threaded dense kernel
+struct HoughVotingOptions
+{
+  // number of threads, 0 for the number of cores
+  int num_threads;
+  // vote with every stride-th pixel of a class, the votes are scaled by the stride
+  int stride;
+  // maximum number of steps along a voting ray, 0 for no limit
+  int max_ray_length;
+
+  HoughVotingOptions() : num_threads(0), stride(1), max_ray_length(0) {}
+
+  // options from HOUGH_VOTING_THREADS, HOUGH_VOTING_STRIDE and HOUGH_VOTING_MAX_RAY
+  static HoughVotingOptions from_environment();
+};
+
+// object center of a class with the size and distance of its box
+struct HoughVotingCenter
+{
+  int cls;
+  int x;
+  int y;
+  int votes;
+  int bb_width;
+  int bb_height;
+  float bb_distance;
+};
+
+// memory of the voting reused across calls
+class HoughVotingArena
+{
+ public:
+  // pixels of each class in row-major order
+  std::vector<std::vector<int> > pixels;
+  // accumulator plane of each thread
+  std::vector<std::vector<int> > planes;
+};
+
+// vote the centers of the classes in one image
+// labelmap: height x width class labels
+// vertmap: height x width x (3 * num_classes) center directions and log distances
+// extents: num_classes x 3 object extents
+// centers: appended with the centers of at least 50 votes, in class order
+void hough_voting_cpu(const int* labelmap, const float* vertmap, const float* extents,
+  int height, int width, int num_classes, float fx, float fy, float px, float py,
+  const HoughVotingOptions& options, HoughVotingArena& arena, std::vector<HoughVotingCenter>& centers);
@@ -27,10 +27,13 @@ limitations under the License.
 #include "tensorflow/core/framework/op.h"
 #include "tensorflow/core/framework/op_kernel.h"
 #include "tensorflow/core/framework/tensor_shape.h"
+#include "tensorflow/core/platform/mutex.h"
 
 #define VERTEX_CHANNELS 3
 #define MAX_ROI 128
 
+#include "hough_voting_cpu.h"
+
 using namespace tensorflow;
 typedef Eigen::ThreadPoolDevice CPUDevice;
 
@@ -68,19 +71,13 @@ void getBb3Ds(const float* extents, std::vector<std::vector<cv::Point3f>>& bb3Ds
 inline std::vector<cv::Point3f> getBB3D(const cv::Vec<float, 3>& extent);
 inline cv::Rect getBB2D(int imageWidth, int imageHeight, const std::vector<cv::Point3f>& bb3D, const cv::Mat& camMat, const cv::Mat& rvec, const cv::Mat& tvec);
 inline float getIoU(const cv::Rect& bb1, const cv::Rect bb2);
-inline float angle_distance(cv::Point2f x, cv::Point2f n, cv::Point2f p);
 
-void hough_voting(const int* labelmap, const float* vertmap, std::vector<std::vector<cv::Point3f>> bb3Ds,
-  int batch, int height, int width, int num_classes, int is_train,
+void append_rois(const std::vector<HoughVotingCenter>& centers, int batch, int is_train,
   float fx, float fy, float px, float py, std::vector<cv::Vec<float, 14> >& outputs);
 
 void compute_target_weight(int height, int width, float* target, float* weight, std::vector<std::vector<cv::Point3f>> bb3Ds, 
   const float* poses_gt, int num_gt, int num_classes, float fx, float fy, float px, float py, std::vector<cv::Vec<float, 14> > outputs);
 
-inline void compute_width_height(const int* labelmap, const float* vertmap, cv::Point2f center, 
-  std::vector<std::vector<cv::Point3f>> bb3Ds, cv::Mat camMat, float inlierThreshold, 
-  int height, int width, int channel, int num_classes, int & bb_width, int & bb_height, float & bb_distance);
-
 // cuda functions
 void HoughVotingLaucher(OpKernelContext* context,
     const int* labelmap, const float* vertmap, const float* extents, const float* meta_data, const float* gt,
@@ -147,6 +144,7 @@ class HoughvotinggpuOp : public OpKernel {
     OP_REQUIRES_OK(context,
                    context->GetAttr("skip_pixels", &skip_pixels_));
 
+    options_ = HoughVotingOptions::from_environment();
   }
 
   // bottom_label: (batch_size, height, width)
@@ -208,7 +206,13 @@ class HoughvotinggpuOp : public OpKernel {
       fy = meta_data(index_meta_data + 4);
       px = meta_data(index_meta_data + 2);
       py = meta_data(index_meta_data + 5);
-      hough_voting(labelmap, vertmap, bb3Ds, n, height, width, num_classes, is_train_, fx, fy, px, py, outputs);
+      std::vector<HoughVotingCenter> centers;
+      {
+        // the voting memory is shared by the calls of the kernel
+        mutex_lock lock(mu_);
+        hough_voting_cpu(labelmap, vertmap, extents, height, width, num_classes, fx, fy, px, py, options_, arena_, centers);
+      }
+      append_rois(centers, n, is_train_, fx, fy, px, py, outputs);
       index_meta_data += num_meta_data;
     }
 
@@ -292,6 +296,9 @@ class HoughvotinggpuOp : public OpKernel {
   float threshold_vote_;
   float threshold_percentage_;
   int skip_pixels_;
+  HoughVotingOptions options_;
+  mutex mu_;
+  HoughVotingArena arena_ GUARDED_BY(mu_);
 };
 
 REGISTER_KERNEL_BUILDER(Name("Houghvotinggpu").Device(DEVICE_CPU).TypeConstraint<float>("T"), HoughvotinggpuOp<CPUDevice, float>);
@@ -483,278 +490,109 @@ class HoughvotinggpuGradOp : public OpKernel {
 // REGISTER_KERNEL_BUILDER(Name("HoughvotinggpuGrad").Device(DEVICE_CPU).TypeConstraint<float>("T"), HoughvotinggpuGradOp<CPUDevice, float>);
 REGISTER_KERNEL_BUILDER(Name("HoughvotinggpuGrad").Device(DEVICE_GPU).TypeConstraint<float>("T"), HoughvotinggpuGradOp<Eigen::GpuDevice, float>);
 
-void hough_voting(const int* labelmap, const float* vertmap, std::vector<std::vector<cv::Point3f>> bb3Ds, 
-  int batch, int height, int width, int num_classes, int is_train,
+// rois and poses of the voted centers
+void append_rois(const std::vector<HoughVotingCenter>& centers, int batch, int is_train,
   float fx, float fy, float px, float py, std::vector<cv::Vec<float, 14> >& outputs)
 {
-  float inlierThreshold = 0.9;
-  int votingThreshold = 50;
-
-  // camera matrix
-  cv::Mat_<float> camMat = cv::Mat_<float>::zeros(3, 3);
-  camMat(0, 0) = fx;
-  camMat(1, 1) = fy;
-  camMat(2, 2) = 1.f;
-  camMat(0, 2) = px;
-  camMat(1, 2) = py;
-
-  // initialize hough space
-  int* hough_space = (int*)malloc(sizeof(int) * height * width * num_classes);
-  memset(hough_space, 0, height * width * num_classes);
-
-  int* flags = (int*)malloc(sizeof(int) * num_classes);
-  memset(flags, 0, num_classes);
-
-  // for each pixel
-  for (int x = 0; x < width; x++)
-  {
-    for (int y = 0; y < height; y++)
-    {
-      int c = labelmap[y * width + x];
-      if (c > 0)
-      {
-        flags[c] = 1;
-        // read the predict center direction
-        int offset = VERTEX_CHANNELS * c + VERTEX_CHANNELS * num_classes * (y * width + x);
-        float u = vertmap[offset];
-        float v = vertmap[offset + 1];
-        float norm = sqrt(u * u + v * v);
-        u /= norm;
-        v /= norm;
-
-        // voting
-	float delta = 1.0 / fabs(u);
-        float cx = x;
-        float cy = y;
-        while(1)
-        {
-          cx += delta * u;
-          cy += delta * v;
-          int center_x = int(cx);
-          int center_y = int(cy);
-          if (center_x >= 0 && center_x < width && center_y >= 0 && center_y < height)
-          {
-            offset = c + num_classes * (center_y * width + center_x);
-            hough_space[offset] += 1;
-          }
-          else
-            break;
-        }
-      }
-    }
-  }
-
-  // find the maximum in hough space
-  for (int c = 1; c < num_classes; c++)
+  for (size_t k = 0; k < centers.size(); k++)
   {
-    if (flags[c])
+    const HoughVotingCenter& center = centers[k];
+
+    // construct output
+    cv::Vec<float, 14> roi;
+    roi(0) = batch;
+    roi(1) = center.cls;
+
+    // bounding box
+    float scale = 0.05;
+    roi(2) = center.x - center.bb_width * (0.5 + scale);
+    roi(3) = center.y - center.bb_height * (0.5 + scale);
+    roi(4) = center.x + center.bb_width * (0.5 + scale);
+    roi(5) = center.y + center.bb_height * (0.5 + scale);
+
+    // score
+    roi(6) = center.votes;
+
+    // pose
+    float rx = (center.x - px) / fx;
+    float ry = (center.y - py) / fy;
+    roi(7) = 1;
+    roi(8) = 0;
+    roi(9) = 0;
+    roi(10) = 0;
+    roi(11) = rx * center.bb_distance;
+    roi(12) = ry * center.bb_distance;
+    roi(13) = center.bb_distance;
+
+    outputs.push_back(roi);
+
+    if (is_train)
     {
-      int max_vote = 0;
-      int max_x, max_y;
-      for (int x = 0; x < width; x++)
-      {
-        for (int y = 0; y < height; y++)
-        {
-          int offset = c + num_classes * (y * width + x);
-          if (hough_space[offset] > max_vote)
-          {
-            max_vote = hough_space[offset];
-            max_x = x;
-            max_y = y;
-          }
-        }
-      }
-      if (max_vote < votingThreshold)
-        continue;
+      // add jittering rois
+      float x1 = roi(2);
+      float y1 = roi(3);
+      float x2 = roi(4);
+      float y2 = roi(5);
+      float ww = x2 - x1;
+      float hh = y2 - y1;
+
+      // (-1, -1)
+      roi(2) = x1 - 0.05 * ww;
+      roi(3) = y1 - 0.05 * hh;
+      roi(4) = roi(2) + ww;
+      roi(5) = roi(3) + hh;
+      outputs.push_back(roi);
 
-      // center
-      cv::Point2f center(max_x, max_y);
-      int bb_width, bb_height;
-      float bb_distance;
-      compute_width_height(labelmap, vertmap, center, bb3Ds, camMat, inlierThreshold, height, width, c, num_classes, bb_width, bb_height, bb_distance);
+      // (+1, -1)
+      roi(2) = x1 + 0.05 * ww;
+      roi(3) = y1 - 0.05 * hh;
+      roi(4) = roi(2) + ww;
+      roi(5) = roi(3) + hh;
+      outputs.push_back(roi);
 
-      // construct output
-      cv::Vec<float, 14> roi;
-      roi(0) = batch;
-      roi(1) = c;
-
-      // bounding box
-      float scale = 0.05;
-      roi(2) = center.x - bb_width * (0.5 + scale);
-      roi(3) = center.y - bb_height * (0.5 + scale);
-      roi(4) = center.x + bb_width * (0.5 + scale);
-      roi(5) = center.y + bb_height * (0.5 + scale);
-
-      // score
-      roi(6) = max_vote;
-
-      // pose
-      float rx = (center.x - px) / fx;
-      float ry = (center.y - py) / fy;
-      roi(7) = 1;
-      roi(8) = 0;
-      roi(9) = 0;
-      roi(10) = 0;
-      roi(11) = rx * bb_distance;
-      roi(12) = ry * bb_distance;
-      roi(13) = bb_distance;
+      // (-1, +1)
+      roi(2) = x1 - 0.05 * ww;
+      roi(3) = y1 + 0.05 * hh;
+      roi(4) = roi(2) + ww;
+      roi(5) = roi(3) + hh;
+      outputs.push_back(roi);
 
+      // (+1, +1)
+      roi(2) = x1 + 0.05 * ww;
+      roi(3) = y1 + 0.05 * hh;
+      roi(4) = roi(2) + ww;
+      roi(5) = roi(3) + hh;
       outputs.push_back(roi);
 
-      if (is_train)
-      {
-        // add jittering rois
-        float x1 = roi(2);
-        float y1 = roi(3);
-        float x2 = roi(4);
-        float y2 = roi(5);
-        float ww = x2 - x1;
-        float hh = y2 - y1;
-
-        // (-1, -1)
-        roi(2) = x1 - 0.05 * ww;
-        roi(3) = y1 - 0.05 * hh;
-        roi(4) = roi(2) + ww;
-        roi(5) = roi(3) + hh;
-        outputs.push_back(roi);
-
-        // (+1, -1)
-        roi(2) = x1 + 0.05 * ww;
-        roi(3) = y1 - 0.05 * hh;
-        roi(4) = roi(2) + ww;
-        roi(5) = roi(3) + hh;
-        outputs.push_back(roi);
-
-        // (-1, +1)
-        roi(2) = x1 - 0.05 * ww;
-        roi(3) = y1 + 0.05 * hh;
-        roi(4) = roi(2) + ww;
-        roi(5) = roi(3) + hh;
-        outputs.push_back(roi);
-
-        // (+1, +1)
-        roi(2) = x1 + 0.05 * ww;
-        roi(3) = y1 + 0.05 * hh;
-        roi(4) = roi(2) + ww;
-        roi(5) = roi(3) + hh;
-        outputs.push_back(roi);
-
-        // (0, -1)
-        roi(2) = x1;
-        roi(3) = y1 - 0.05 * hh;
-        roi(4) = roi(2) + ww;
-        roi(5) = roi(3) + hh;
-        outputs.push_back(roi);
-
-        // (-1, 0)
-        roi(2) = x1 - 0.05 * ww;
-        roi(3) = y1;
-        roi(4) = roi(2) + ww;
-        roi(5) = roi(3) + hh;
-        outputs.push_back(roi);
-
-        // (0, +1)
-        roi(2) = x1;
-        roi(3) = y1 + 0.05 * hh;
-        roi(4) = roi(2) + ww;
-        roi(5) = roi(3) + hh;
-        outputs.push_back(roi);
-
-        // (+1, 0)
-        roi(2) = x1 + 0.05 * ww;
-        roi(3) = y1;
-        roi(4) = roi(2) + ww;
-        roi(5) = roi(3) + hh;
-        outputs.push_back(roi);
-      }
-    }
-  }
-}
+      // (0, -1)
+      roi(2) = x1;
+      roi(3) = y1 - 0.05 * hh;
+      roi(4) = roi(2) + ww;
+      roi(5) = roi(3) + hh;
+      outputs.push_back(roi);
 
-inline float angle_distance(cv::Point2f x, cv::Point2f n, cv::Point2f p)
-{
-  return n.dot(x - p) / (cv::norm(n) * cv::norm(x - p));
-}
+      // (-1, 0)
+      roi(2) = x1 - 0.05 * ww;
+      roi(3) = y1;
+      roi(4) = roi(2) + ww;
+      roi(5) = roi(3) + hh;
+      outputs.push_back(roi);
 
-inline void compute_width_height(const int* labelmap, const float* vertmap, cv::Point2f center, 
-  std::vector<std::vector<cv::Point3f>> bb3Ds, cv::Mat camMat, float inlierThreshold, 
-  int height, int width, int channel, int num_classes, int & bb_width, int & bb_height, float & bb_distance)
-{
-  float d = 0;
-  int count = 0;
+      // (0, +1)
+      roi(2) = x1;
+      roi(3) = y1 + 0.05 * hh;
+      roi(4) = roi(2) + ww;
+      roi(5) = roi(3) + hh;
+      outputs.push_back(roi);
 
-  // for each pixel
-  std::vector<float> dx;
-  std::vector<float> dy;
-  for (int x = 0; x < width; x++)
-  {
-    for (int y = 0; y < height; y++)
-    {
-      if (labelmap[y * width + x] == channel)
-      {
-        cv::Point2f point(x, y);
-  
-        // read out object coordinate
-        int offset = VERTEX_CHANNELS * channel + VERTEX_CHANNELS * num_classes * (y * width + x);
-        float u = vertmap[offset];
-        float v = vertmap[offset + 1];
-        float distance = exp(vertmap[offset + 2]);
-        float norm = sqrt(u * u + v * v);
-        u /= norm;
-        v /= norm;
-        cv::Point2f direction(u, v);
-
-        // inlier check
-        if(angle_distance(center, direction, point) > inlierThreshold)
-        {
-          dx.push_back(fabs(point.x - center.x));
-          dy.push_back(fabs(point.y - center.y));
-          d += distance;
-          count++;
-        }
-      }
+      // (+1, 0)
+      roi(2) = x1 + 0.05 * ww;
+      roi(3) = y1;
+      roi(4) = roi(2) + ww;
+      roi(5) = roi(3) + hh;
+      outputs.push_back(roi);
     }
   }
-  bb_distance = d / count;
-
-  // estimate a projection
-  cv::Mat tvec(3, 1, CV_64F);
-  cv::Mat rvec(3, 1, CV_64F);
-  for(int i = 0; i < 3; i++)
-  {
-    tvec.at<double>(i, 0) = 0;
-    rvec.at<double>(i, 0) = 0;
-  }
-  tvec.at<double>(2, 0) = bb_distance;
-  std::vector<cv::Point2f> bb2D;
-  cv::projectPoints(bb3Ds[channel-1], rvec, tvec, camMat, cv::Mat(), bb2D);
-    
-  // get min-max of projected vertices
-  int minX = 1e8;
-  int maxX = -1e8;
-  int minY = 1e8;
-  int maxY = -1e8;
-  for(int i = 0; i < bb2D.size(); i++)
-  {
-    minX = std::min((float) minX, bb2D[i].x);
-    minY = std::min((float) minY, bb2D[i].y);
-    maxX = std::max((float) maxX, bb2D[i].x);
-    maxY = std::max((float) maxY, bb2D[i].y);
-  }
-  cv::Rect bb = cv::Rect(0, 0, (maxX - minX + 1), (maxY - minY + 1));
-
-  std::vector<float>::iterator it;
-  it = std::remove_if(dx.begin(), dx.end(), std::bind2nd(std::greater<float>(), std::max(bb.width, bb.height) ));
-  dx.erase(it, dx.end()); 
-
-  it = std::remove_if(dy.begin(), dy.end(), std::bind2nd(std::greater<float>(), std::max(bb.width, bb.height) ));
-  dy.erase(it, dy.end()); 
-
-  std::sort(dx.begin(), dx.end());
-  std::sort(dy.begin(), dy.end());
-
-  bb_width = 2 * dx[int(dx.size() * 0.95)];
-  bb_height = 2 * dy[int(dy.size() * 0.95)];
 }
 
 
@@ -0,0 +1,345 @@
+// Equivalence test and benchmark of the CPU hough voting
+//
+// Runs the single threaded dense kernel the op used before and
+// hough_voting_cpu on synthetic label and vertex maps, checks that the
+// centers agree and reports the time of each kernel and of the voting
+// options. No TensorFlow or OpenCV is needed:
+//
+//   g++ -std=c++11 -O2 -o test_hough_voting_cpu test_hough_voting_cpu.cc hough_voting_cpu.cc -lpthread
+//   ./test_hough_voting_cpu [num_images] [num_objects]
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
+#include <chrono>
+#include <random>
+#include <algorithm>
+#include "hough_voting_cpu.h"
+
+// the dense kernel, the accumulator is cleared with calloc and the box
+// corners are projected as cv::projectPoints does without rotation
+void hough_voting_dense(const int* labelmap, const float* vertmap, const float* extents,
+  int height, int width, int num_classes, float fx, float fy, float px, float py,
+  std::vector<HoughVotingCenter>& centers)
+{
+  float inlierThreshold = 0.9;
+  int votingThreshold = 50;
+
+  int* hough_space = (int*)calloc(height * width * num_classes, sizeof(int));
+  int* flags = (int*)calloc(num_classes, sizeof(int));
+
+  // for each pixel
+  for (int x = 0; x < width; x++)
+  {
+    for (int y = 0; y < height; y++)
+    {
+      int c = labelmap[y * width + x];
+      if (c > 0)
+      {
+        flags[c] = 1;
+        // read the predict center direction
+        int offset = VERTEX_CHANNELS * c + VERTEX_CHANNELS * num_classes * (y * width + x);
+        float u = vertmap[offset];
+        float v = vertmap[offset + 1];
+        float norm = sqrt(u * u + v * v);
+        u /= norm;
+        v /= norm;
+
+        // voting
+        float delta = 1.0 / fabs(u);
+        float cx = x;
+        float cy = y;
+        while(1)
+        {
+          cx += delta * u;
+          cy += delta * v;
+          int center_x = int(cx);
+          int center_y = int(cy);
+          if (center_x >= 0 && center_x < width && center_y >= 0 && center_y < height)
+          {
+            offset = c + num_classes * (center_y * width + center_x);
+            hough_space[offset] += 1;
+          }
+          else
+            break;
+        }
+      }
+    }
+  }
+
+  // find the maximum in hough space
+  for (int c = 1; c < num_classes; c++)
+  {
+    if (flags[c])
+    {
+      int max_vote = 0;
+      int max_x, max_y;
+      for (int x = 0; x < width; x++)
+      {
+        for (int y = 0; y < height; y++)
+        {
+          int offset = c + num_classes * (y * width + x);
+          if (hough_space[offset] > max_vote)
+          {
+            max_vote = hough_space[offset];
+            max_x = x;
+            max_y = y;
+          }
+        }
+      }
+      if (max_vote < votingThreshold)
+        continue;
+
+      // width and height from the inliers
+      float d = 0;
+      int count = 0;
+      std::vector<float> dx;
+      std::vector<float> dy;
+      for (int x = 0; x < width; x++)
+      {
+        for (int y = 0; y < height; y++)
+        {
+          if (labelmap[y * width + x] == c)
+          {
+            int offset = VERTEX_CHANNELS * c + VERTEX_CHANNELS * num_classes * (y * width + x);
+            float u = vertmap[offset];
+            float v = vertmap[offset + 1];
+            float distance = exp(vertmap[offset + 2]);
+            float norm = sqrt(u * u + v * v);
+            u /= norm;
+            v /= norm;
+
+            float ex = float(max_x) - float(x);
+            float ey = float(max_y) - float(y);
+            float dot = u * ex + v * ey;
+            if (dot / (sqrt((double)u * u + (double)v * v) * sqrt((double)ex * ex + (double)ey * ey)) > inlierThreshold)
+            {
+              dx.push_back(fabs(float(x) - float(max_x)));
+              dy.push_back(fabs(float(y) - float(max_y)));
+              d += distance;
+              count++;
+            }
+          }
+        }
+      }
+      float bb_distance = d / count;
+
+      int minX = 1e8;
+      int maxX = -1e8;
+      int minY = 1e8;
+      int maxY = -1e8;
+      float xHalf = extents[c * 3] * 0.5;
+      float yHalf = extents[c * 3 + 1] * 0.5;
+      float zHalf = extents[c * 3 + 2] * 0.5;
+      for (int i = 0; i < 8; i++)
+      {
+        double X = (i & 1) ? -xHalf : xHalf;
+        double Y = (i & 2) ? -yHalf : yHalf;
+        double Z = (i & 4) ? -zHalf : zHalf;
+        double iz = 1. / (Z + (double)bb_distance);
+        float u = X * iz * (double)fx + (double)px;
+        float v = Y * iz * (double)fy + (double)py;
+        minX = std::min((float) minX, u);
+        minY = std::min((float) minY, v);
+        maxX = std::max((float) maxX, u);
+        maxY = std::max((float) maxY, v);
+      }
+      int limit = std::max(maxX - minX + 1, maxY - minY + 1);
+
+      std::vector<float>::iterator it;
+      it = std::remove_if(dx.begin(), dx.end(), [limit](float e) { return e > (float) limit; });
+      dx.erase(it, dx.end());
+      it = std::remove_if(dy.begin(), dy.end(), [limit](float e) { return e > (float) limit; });
+      dy.erase(it, dy.end());
+      std::sort(dx.begin(), dx.end());
+      std::sort(dy.begin(), dy.end());
+
+      HoughVotingCenter center;
+      center.cls = c;
+      center.x = max_x;
+      center.y = max_y;
+      center.votes = max_vote;
+      center.bb_width = 2 * dx[int(dx.size() * 0.95)];
+      center.bb_height = 2 * dy[int(dy.size() * 0.95)];
+      center.bb_distance = bb_distance;
+      centers.push_back(center);
+    }
+  }
+
+  free(hough_space);
+  free(flags);
+}
+
+// a synthetic image with num_objects elliptic objects of distinct classes,
+// noisy center directions and log distances, and some label noise
+void make_image(std::mt19937& rng, int height, int width, int num_classes, int num_objects,
+  std::vector<int>& labelmap, std::vector<float>& vertmap)
+{
+  std::uniform_real_distribution<float> uniform(0, 1);
+  std::normal_distribution<float> normal(0, 1);
+
+  labelmap.assign(height * width, 0);
+  vertmap.resize(height * width * VERTEX_CHANNELS * num_classes);
+  for (size_t i = 0; i < vertmap.size(); i++)
+    vertmap[i] = 0.1 * normal(rng);
+
+  std::vector<int> classes;
+  for (int c = 1; c < num_classes; c++)
+    classes.push_back(c);
+  std::shuffle(classes.begin(), classes.end(), rng);
+
+  for (int k = 0; k < num_objects && k < int(classes.size()); k++)
+  {
+    int c = classes[k];
+    float cx = 40 + uniform(rng) * (width - 80);
+    float cy = 40 + uniform(rng) * (height - 80);
+    float a = 20 + uniform(rng) * 60;
+    float b = 20 + uniform(rng) * 60;
+    float z = 0.5 + uniform(rng);
+    for (int y = std::max(int(cy - b), 0); y < std::min(int(cy + b) + 1, height); y++)
+    {
+      for (int x = std::max(int(cx - a), 0); x < std::min(int(cx + a) + 1, width); x++)
+      {
+        float ex = (x - cx) / a;
+        float ey = (y - cy) / b;
+        if (ex * ex + ey * ey > 1)
+          continue;
+        labelmap[y * width + x] = c;
+        float angle = atan2(cy - y, cx - x) + 0.1 * normal(rng);
+        int offset = VERTEX_CHANNELS * c + VERTEX_CHANNELS * num_classes * (y * width + x);
+        vertmap[offset] = cos(angle);
+        vertmap[offset + 1] = sin(angle);
+        vertmap[offset + 2] = log(z) + 0.01 * normal(rng);
+      }
+    }
+  }
+
+  // label noise
+  for (int i = 0; i < height * width / 200; i++)
+  {
+    int index = int(uniform(rng) * height * width) % (height * width);
+    labelmap[index] = 1 + int(uniform(rng) * (num_classes - 1)) % (num_classes - 1);
+  }
+}
+
+double elapsed_ms(std::chrono::steady_clock::time_point start)
+{
+  return std::chrono::duration<double, std::milli>(std::chrono::steady_clock::now() - start).count();
+}
+
+// number of centers that differ, the box sizes may differ by a pixel and the
+// distances by the rounding of the sum of the inlier distances
+int compare_centers(const std::vector<HoughVotingCenter>& a, const std::vector<HoughVotingCenter>& b)
+{
+  if (a.size() != b.size())
+    return std::max(a.size(), b.size());
+  int num = 0;
+  for (size_t i = 0; i < a.size(); i++)
+  {
+    if (a[i].cls != b[i].cls || a[i].x != b[i].x || a[i].y != b[i].y || a[i].votes != b[i].votes
+      || abs(a[i].bb_width - b[i].bb_width) > 1 || abs(a[i].bb_height - b[i].bb_height) > 1
+      || fabs(a[i].bb_distance - b[i].bb_distance) > 1e-5 * fabs(a[i].bb_distance))
+      num++;
+  }
+  return num;
+}
+
+// mean center displacement in pixels and number of missed centers
+void center_error(const std::vector<HoughVotingCenter>& reference, const std::vector<HoughVotingCenter>& centers,
+  double& displacement, int& missed)
+{
+  for (size_t i = 0; i < reference.size(); i++)
+  {
+    bool found = false;
+    for (size_t j = 0; j < centers.size(); j++)
+    {
+      if (centers[j].cls == reference[i].cls)
+      {
+        displacement += sqrt(double(centers[j].x - reference[i].x) * (centers[j].x - reference[i].x)
+          + double(centers[j].y - reference[i].y) * (centers[j].y - reference[i].y));
+        found = true;
+      }
+    }
+    if (!found)
+      missed++;
+  }
+}
+
+int main(int argc, char** argv)
+{
+  int num_images = argc > 1 ? atoi(argv[1]) : 20;
+  int num_objects = argc > 2 ? atoi(argv[2]) : 8;
+  int height = 480;
+  int width = 640;
+  int num_classes = 22;
+  float fx = 1066.778, fy = 1067.487, px = 312.9869, py = 241.3109;
+
+  std::mt19937 rng(3);
+  std::uniform_real_distribution<float> uniform(0, 1);
+  std::vector<float> extents(num_classes * 3, 0);
+  for (int i = 3; i < num_classes * 3; i++)
+    extents[i] = 0.05 + 0.25 * uniform(rng);
+
+  // the kernels to compare
+  const char* names[] = {"dense", "1 thread", "threads", "stride 2", "stride 4", "max ray 200"};
+  int num_kernels = 6;
+  HoughVotingOptions options[6];
+  options[1].num_threads = 1;
+  options[3].stride = 2;
+  options[4].stride = 4;
+  options[5].max_ray_length = 200;
+
+  std::vector<double> times(num_kernels, 0);
+  std::vector<double> displacements(num_kernels, 0);
+  std::vector<int> missed(num_kernels, 0);
+  int num_centers = 0;
+  int num_different = 0;
+  HoughVotingArena arena;
+  std::vector<int> labelmap;
+  std::vector<float> vertmap;
+  for (int n = 0; n < num_images; n++)
+  {
+    make_image(rng, height, width, num_classes, num_objects, labelmap, vertmap);
+
+    std::vector<HoughVotingCenter> reference;
+    std::chrono::steady_clock::time_point start = std::chrono::steady_clock::now();
+    hough_voting_dense(labelmap.data(), vertmap.data(), extents.data(), height, width, num_classes, fx, fy, px, py, reference);
+    times[0] += elapsed_ms(start);
+    num_centers += reference.size();
+
+    for (int k = 1; k < num_kernels; k++)
+    {
+      std::vector<HoughVotingCenter> centers;
+      start = std::chrono::steady_clock::now();
+      hough_voting_cpu(labelmap.data(), vertmap.data(), extents.data(), height, width, num_classes, fx, fy, px, py,
+        options[k], arena, centers);
+      times[k] += elapsed_ms(start);
+
+      // the options that do not change the votes give the same centers
+      if (options[k].stride == 1 && options[k].max_ray_length == 0)
+        num_different += compare_centers(reference, centers);
+      else
+        center_error(reference, centers, displacements[k], missed[k]);
+    }
+  }
+
+  printf("%d images of %dx%d, %d centers\n", num_images, width, height, num_centers);
+  for (int k = 0; k < num_kernels; k++)
+  {
+    printf("%-12s %8.2fms per image", names[k], times[k] / num_images);
+    if (k > 0)
+      printf("  speedup %5.1fx", times[0] / times[k]);
+    if (options[k].stride > 1 || options[k].max_ray_length > 0)
+      printf("  mean center displacement %.2fpx, %d centers missed",
+        displacements[k] / std::max(num_centers - missed[k], 1), missed[k]);
+    printf("\n");
+  }
+
+  if (num_different > 0)
+  {
+    printf("FAILED: %d centers differ from the dense kernel\n", num_different);
+    return 1;
+  }
+  printf("PASSED: the centers agree with the dense kernel\n");
+  return 0;
+}
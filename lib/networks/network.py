@@ -34,6 +34,7 @@ from rpn_layer.proposal_layer import proposal_layer
 from rpn_layer.proposal_top_layer import proposal_top_layer
 from rpn_layer.anchor_target_layer import anchor_target_layer
 from rpn_layer.proposal_target_layer import proposal_target_layer
+from weight_loader import load_weights
 
 DEFAULT_PADDING = 'SAME'
 
@@ -73,38 +74,10 @@ class Network(object):
         data_path: The path to the numpy-serialized network weights
         session: The current TensorFlow session
         ignore_missing: If true, serialized weights for missing layers are ignored.
+        The weights of op_name are also assigned to the dual layers op_name_p
+        and op_name_d, all in one session run.
         '''
-        data_dict = np.load(data_path).item()
-        for op_name in data_dict:
-            print op_name
-            with tf.variable_scope(op_name, reuse=True):
-                for param_name, data in data_dict[op_name].iteritems():
-                    try:
-                        var = tf.get_variable(param_name)
-                        session.run(var.assign(data))
-                        print op_name + ' ' + param_name + ' assigned'
-                    except ValueError:
-                        if not ignore_missing:
-                            raise
-            # try to assign dual weights
-            with tf.variable_scope(op_name+'_p', reuse=True):
-                for param_name, data in data_dict[op_name].iteritems():
-                    try:
-                        var = tf.get_variable(param_name)
-                        session.run(var.assign(data))
-                        print op_name + '_p ' + param_name + ' assigned'
-                    except ValueError:
-                        if not ignore_missing:
-                            raise
-
-            with tf.variable_scope(op_name+'_d', reuse=True):
-                for param_name, data in data_dict[op_name].iteritems():
-                    try:
-                        var = tf.get_variable(param_name)
-                        session.run(var.assign(data))
-                    except ValueError:
-                        if not ignore_missing:
-                            raise
+        return load_weights(data_path, session, ignore_missing)
 
     def feed(self, *args):
         assert len(args)!=0
@@ -0,0 +1,156 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Assign pretrained weights and checkpoint tensors with a single session run.
+
+Calling session.run(var.assign(data)) per tensor adds a constant and an
+assign op to the graph for every tensor and pays one session call each. The
+loader here creates one placeholder and one assign op per variable, on first
+use only, and feeds all the tensors of a load to one session.run.
+
+Pretrained weights are a dict {op_name: {param_name: array}} in a .npy file,
+a .npz file with keys 'op_name/param_name', or a directory holding
+op_name/param_name.npy files. The last ones are memory-mapped, so only the
+tensors matching a variable are read.
+"""
+
+import os
+import time
+import numpy as np
+import tensorflow as tf
+
+# placeholder and assign op of each variable, keyed by graph and variable name
+_assign_ops = {}
+
+def _assign_op(var):
+    key = (id(var.graph), var.name)
+    if key not in _assign_ops:
+        with var.graph.as_default(), tf.name_scope('weight_loader'):
+            placeholder = tf.placeholder(var.dtype.base_dtype, shape=var.get_shape(), name=var.op.name.replace('/', '_'))
+            _assign_ops[key] = (placeholder, var.assign(placeholder))
+    return _assign_ops[key]
+
+
+def assign_variables(session, pairs):
+    """Assign the arrays to the variables of the (variable, array) pairs in one session run."""
+    ops = []
+    feed_dict = {}
+    for var, data in pairs:
+        placeholder, op = _assign_op(var)
+        ops.append(op)
+        feed_dict[placeholder] = np.asarray(data, dtype=var.dtype.base_dtype.as_numpy_dtype)
+    if len(ops) > 0:
+        session.run(ops, feed_dict=feed_dict)
+
+
+def _read_weights(data_path):
+    """Return a dict {op_name: {param_name: array or callable returning it}} of the weights in data_path."""
+    weights = {}
+    if os.path.isdir(data_path):
+        for op_name in sorted(os.listdir(data_path)):
+            op_dir = os.path.join(data_path, op_name)
+            if not os.path.isdir(op_dir):
+                continue
+            weights[op_name] = {}
+            for filename in sorted(os.listdir(op_dir)):
+                if filename.endswith('.npy'):
+                    weights[op_name][filename[:-4]] = \
+                        (lambda filename=os.path.join(op_dir, filename): np.load(filename, mmap_mode='r'))
+    elif data_path.endswith('.npz'):
+        data = np.load(data_path)
+        for key in data.files:
+            op_name, param_name = key.rsplit('/', 1)
+            weights.setdefault(op_name, {})[param_name] = (lambda key=key: data[key])
+    else:
+        weights = np.load(data_path).item()
+    return weights
+
+
+def load_weights(data_path, session, ignore_missing=False, scope_suffixes=('', '_p', '_d')):
+    """Load pretrained weights into the variables op_name + suffix/param_name.
+
+    Each tensor is assigned to the variables of every scope suffix that exist
+    with the same shape. Without ignore_missing a tensor matching no variable
+    raises a ValueError. Returns the names assigned, missing and mismatched.
+    """
+    t = time.time()
+    weights = _read_weights(data_path)
+    variables = dict((var.op.name, var) for var in tf.global_variables())
+
+    pairs = []
+    assigned = []
+    missing = []
+    mismatched = []
+    for op_name in sorted(weights):
+        for param_name, data in sorted(weights[op_name].iteritems()):
+            if callable(data):
+                data = data()
+            found = False
+            for suffix in scope_suffixes:
+                name = op_name + suffix + '/' + param_name
+                var = variables.get(name)
+                if var is None:
+                    continue
+                found = True
+                if var.get_shape().as_list() != list(data.shape):
+                    mismatched.append((name, var.get_shape().as_list(), list(data.shape)))
+                    continue
+                pairs.append((var, data))
+                assigned.append(name)
+            if not found:
+                missing.append(op_name + '/' + param_name)
+
+    if len(missing) > 0 and not ignore_missing:
+        raise ValueError('no variables for the weights {} in {}'.format(', '.join(missing), data_path))
+    assign_variables(session, pairs)
+
+    print 'loaded {} tensors from {} in {:.3f}s'.format(len(assigned), data_path, time.time() - t)
+    for name in assigned:
+        print name + ' assigned'
+    if len(missing) > 0:
+        print 'no variables for: ' + ', '.join(missing)
+    for name, var_shape, data_shape in mismatched:
+        print 'shape mismatch for {}: expected {}, got {}'.format(name, var_shape, data_shape)
+    return {'assigned': assigned, 'missing': missing, 'mismatched': mismatched}
+
+
+def restore_checkpoint(session, save_file):
+    """Restore the variables of the checkpoint with the same name and shape.
+
+    The global step and unnamed variables are not restored. Returns the names
+    restored, not in the graph and mismatched.
+    """
+    t = time.time()
+    reader = tf.train.NewCheckpointReader(save_file)
+    saved_shapes = reader.get_variable_to_shape_map()
+
+    pairs = []
+    restored = []
+    mismatched = []
+    print('Restoring:')
+    for var in sorted(tf.global_variables(), key=lambda var: var.name):
+        name = var.op.name
+        if name not in saved_shapes or 'global_step' in name or 'Variable' in name:
+            continue
+        var_shape = var.get_shape().as_list()
+        if var_shape == saved_shapes[name]:
+            pairs.append((var, reader.get_tensor(name)))
+            restored.append(name)
+            print(str(name))
+        else:
+            mismatched.append((name, var_shape, saved_shapes[name]))
+            print('Shape mismatch for var', name, 'expected', var_shape, 'got', saved_shapes[name])
+
+    ignored = sorted(list(set(saved_shapes.keys()) - set(restored)))
+    if len(ignored) == 0:
+        print('Restored all variables')
+    else:
+        print('Did not restore:' + '\n\t'.join(ignored))
+
+    assign_variables(session, pairs)
+    print('Restored %s, %d tensors in %.3fs' % (save_file, len(restored), time.time() - t))
+    return {'restored': restored, 'ignored': ignored, 'mismatched': mismatched}
@@ -0,0 +1,103 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Surface normals of depth images on the CPU.
+
+cpu_normals follows the convention of gpu_normals: the normal of a pixel is
+the normalized cross product of the differences of its vertex to the vertices
+of the next row and the next column, NaN where one of the three depths is 0 or
+beyond the cutoff and on the last row and column. With smoothing the
+differences are averaged over a window with integral images before the cross
+product, at a cost that does not depend on the window size. The OpenMP kernel
+of cpu_normals_kernel.pyx is used if it is built, otherwise the normals are
+computed with numpy.
+"""
+
+import numpy as np
+try:
+    from normals.cpu_normals_kernel import cpu_normals_kernel
+except ImportError:
+    cpu_normals_kernel = None
+
+def vertex_map(depth, fx, fy, cx, cy, depthCutoff):
+    """height x width x 3 camera coordinates of the pixels, NaN where the depth is 0 or beyond depthCutoff"""
+    depth = np.asarray(depth, dtype=np.float32)
+    height, width = depth.shape
+    fx_inv = np.float32(1) / np.float32(fx)
+    fy_inv = np.float32(1) / np.float32(fy)
+
+    # the rows are scaled by fx and the columns by fy as in gpu_normals
+    u = np.arange(height, dtype=np.float32)[:, np.newaxis]
+    v = np.arange(width, dtype=np.float32)[np.newaxis, :]
+    vmap = np.empty((height, width, 3), dtype=np.float32)
+    vmap[:, :, 0] = depth * (u - np.float32(cx)) * fx_inv
+    vmap[:, :, 1] = depth * (v - np.float32(cy)) * fy_inv
+    vmap[:, :, 2] = depth
+    with np.errstate(invalid='ignore'):
+        valid = (depth != 0) & (depth < np.float32(depthCutoff))
+    vmap[~valid] = np.nan
+    return vmap
+
+
+def _box_mean(x, radius):
+    """mean of the non-NaN vectors of x in the (2 radius + 1)^2 window of each pixel"""
+    height, width = x.shape[:2]
+    valid = ~np.isnan(x[:, :, 0])
+
+    # integral images with a leading row and column of zeros
+    S = np.zeros((height + 1, width + 1, 4), dtype=np.float64)
+    S[1:, 1:, :3] = np.where(valid[:, :, np.newaxis], x, 0)
+    S[1:, 1:, 3] = valid
+    np.cumsum(S, axis=1, out=S)
+    np.cumsum(S, axis=0, out=S)
+
+    y0 = np.clip(np.arange(height) - radius, 0, height)
+    y1 = np.clip(np.arange(height) + radius + 1, 0, height)
+    x0 = np.clip(np.arange(width) - radius, 0, width)
+    x1 = np.clip(np.arange(width) + radius + 1, 0, width)
+    R = S[y1] - S[y0]
+    sums = R[:, x1] - R[:, x0]
+    return (sums[:, :, :3] / np.maximum(sums[:, :, 3:], 1)).astype(np.float32)
+
+
+def cpu_normals(depth, fx, fy, cx, cy, depthCutoff, smoothing=0, num_threads=0):
+    """height x width x 3 normals of a depth image, smoothing is the radius of the tangent averaging window
+
+    num_threads is the number of threads of the kernel, 0 for all the cores.
+    With 1 the kernel does not use OpenMP, as required in forked processes.
+    """
+    if cpu_normals_kernel is not None:
+        return cpu_normals_kernel(np.ascontiguousarray(depth, dtype=np.float32), fx, fy, cx, cy, depthCutoff, \
+                                  smoothing, num_threads)
+
+    vmap = vertex_map(depth, fx, fy, cx, cy, depthCutoff)
+    v00 = vmap[:-1, :-1]
+    v01 = vmap[1:, :-1]
+    v10 = vmap[:-1, 1:]
+    valid = ~(np.isnan(v00[:, :, 0]) | np.isnan(v01[:, :, 0]) | np.isnan(v10[:, :, 0]))
+
+    # tangents along the rows and the columns
+    a = v01 - v00
+    b = v10 - v00
+    if smoothing > 0:
+        a = _box_mean(a, smoothing)
+        b = _box_mean(b, smoothing)
+
+    r = np.empty(a.shape, dtype=np.float32)
+    r[:, :, 0] = a[:, :, 1] * b[:, :, 2] - a[:, :, 2] * b[:, :, 1]
+    r[:, :, 1] = a[:, :, 2] * b[:, :, 0] - a[:, :, 0] * b[:, :, 2]
+    r[:, :, 2] = a[:, :, 0] * b[:, :, 1] - a[:, :, 1] * b[:, :, 0]
+    with np.errstate(invalid='ignore'):
+        n = r[:, :, 0] * r[:, :, 0] + r[:, :, 1] * r[:, :, 1] + r[:, :, 2] * r[:, :, 2]
+        n = np.where(n > 0, np.sqrt(n), np.float32(1))
+    r /= n[:, :, np.newaxis]
+
+    height, width = vmap.shape[:2]
+    nmap = np.empty((height, width, 3), dtype=np.float32)
+    nmap.fill(np.nan)
+    nmap[:-1, :-1][valid] = r[valid]
+    return nmap
@@ -0,0 +1,166 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+# cython: boundscheck=False, wraparound=False, cdivision=True, legacy_implicit_noexcept=True
+
+import numpy as np
+cimport numpy as np
+cimport openmp
+from cython.parallel import prange
+from libc.math cimport sqrt
+
+cdef inline bint valid_depth(float z, float depthCutoff) nogil:
+    return z != 0 and z < depthCutoff
+
+cdef inline void store_normal(float a0, float a1, float a2, float b0, float b1, float b2, np.float32_t* r) nogil:
+    # normalized cross product of the tangents
+    cdef float r0 = a1 * b2 - a2 * b1
+    cdef float r1 = a2 * b0 - a0 * b2
+    cdef float r2 = a0 * b1 - a1 * b0
+    cdef float n = r0 * r0 + r1 * r1 + r2 * r2
+    if n > 0:
+        n = <float>sqrt(n)
+        r0 = r0 / n
+        r1 = r1 / n
+        r2 = r2 / n
+    r[0] = r0
+    r[1] = r1
+    r[2] = r2
+
+cdef void normal_row(np.float32_t[:, ::1] depth, int u, float fx_inv, float fy_inv, float cx, float cy,
+                     float depthCutoff, np.float32_t[:, :, ::1] nmap) nogil:
+    cdef int v
+    cdef float z00, z01, z10
+    for v in range(depth.shape[1] - 1):
+        z00 = depth[u, v]
+        z01 = depth[u + 1, v]
+        z10 = depth[u, v + 1]
+        if not (valid_depth(z00, depthCutoff) and valid_depth(z01, depthCutoff) and valid_depth(z10, depthCutoff)):
+            continue
+        # tangents along the row and the column, the rows are scaled by fx
+        # and the columns by fy as in gpu_normals
+        store_normal(z01 * (u + 1 - cx) * fx_inv - z00 * (u - cx) * fx_inv,
+                     z01 * (v - cy) * fy_inv - z00 * (v - cy) * fy_inv,
+                     z01 - z00,
+                     z10 * (u - cx) * fx_inv - z00 * (u - cx) * fx_inv,
+                     z10 * (v + 1 - cy) * fy_inv - z00 * (v - cy) * fy_inv,
+                     z10 - z00,
+                     &nmap[u, v, 0])
+
+cdef void tangent_row(np.float32_t[:, ::1] depth, int u, float fx_inv, float fy_inv, float cx, float cy,
+                      float depthCutoff, double[:, :, ::1] S) nogil:
+    # row u + 1 of the tangent sums and counts of the columns up to each pixel
+    cdef int v, k
+    cdef float z00, z01, z10
+    cdef double s[8]
+    for k in range(8):
+        s[k] = 0
+    for v in range(depth.shape[1] - 1):
+        z00 = depth[u, v]
+        z01 = depth[u + 1, v]
+        z10 = depth[u, v + 1]
+        if valid_depth(z00, depthCutoff) and valid_depth(z01, depthCutoff):
+            s[0] += <float>(z01 * (u + 1 - cx) * fx_inv - z00 * (u - cx) * fx_inv)
+            s[1] += <float>(z01 * (v - cy) * fy_inv - z00 * (v - cy) * fy_inv)
+            s[2] += <float>(z01 - z00)
+            s[3] += 1
+        if valid_depth(z00, depthCutoff) and valid_depth(z10, depthCutoff):
+            s[4] += <float>(z10 * (u - cx) * fx_inv - z00 * (u - cx) * fx_inv)
+            s[5] += <float>(z10 * (v + 1 - cy) * fy_inv - z00 * (v - cy) * fy_inv)
+            s[6] += <float>(z10 - z00)
+            s[7] += 1
+        for k in range(8):
+            S[u + 1, v + 1, k] = s[k]
+
+cdef void integrate_columns(double[:, :, ::1] S, int v0, int v1) nogil:
+    # sums of the rows up to each pixel in the columns v0 to v1
+    cdef int u, v, k
+    for u in range(1, S.shape[0]):
+        for v in range(v0, v1):
+            for k in range(8):
+                S[u, v, k] += S[u - 1, v, k]
+
+cdef void smoothed_row(np.float32_t[:, ::1] depth, int u, int radius, float depthCutoff,
+                       double[:, :, ::1] S, np.float32_t[:, :, ::1] nmap) nogil:
+    cdef int height = S.shape[0] - 1
+    cdef int width = S.shape[1] - 1
+    cdef int y0 = max(u - radius, 0)
+    cdef int y1 = min(u + radius + 1, height)
+    cdef int v, k, x0, x1
+    cdef double s[8]
+    for v in range(width):
+        if not (valid_depth(depth[u, v], depthCutoff) and valid_depth(depth[u + 1, v], depthCutoff) and valid_depth(depth[u, v + 1], depthCutoff)):
+            continue
+        x0 = max(v - radius, 0)
+        x1 = min(v + radius + 1, width)
+        for k in range(8):
+            s[k] = (S[y1, x1, k] - S[y0, x1, k]) - (S[y1, x0, k] - S[y0, x0, k])
+        # mean tangents in the window
+        store_normal(<float>(s[0] / max(s[3], 1)), <float>(s[1] / max(s[3], 1)), <float>(s[2] / max(s[3], 1)),
+                     <float>(s[4] / max(s[7], 1)), <float>(s[5] / max(s[7], 1)), <float>(s[6] / max(s[7], 1)),
+                     &nmap[u, v, 0])
+
+cdef serial_normals(np.float32_t[:, ::1] depth, float fx_inv, float fy_inv, float cx, float cy,
+                    float depthCutoff, int smoothing, nmap_array):
+    cdef int height = depth.shape[0]
+    cdef int width = depth.shape[1]
+    cdef int u, b
+    cdef int block = 64
+    cdef np.float32_t[:, :, ::1] nmap = nmap_array
+    cdef double[:, :, ::1] S
+
+    if smoothing <= 0:
+        for u in range(height - 1):
+            normal_row(depth, u, fx_inv, fy_inv, cx, cy, depthCutoff, nmap)
+        return nmap_array
+
+    S = np.zeros((height, width, 8), dtype=np.float64)
+    for u in range(height - 1):
+        tangent_row(depth, u, fx_inv, fy_inv, cx, cy, depthCutoff, S)
+    for b in range(0, width, block):
+        integrate_columns(S, b, min(b + block, width))
+    for u in range(height - 1):
+        smoothed_row(depth, u, smoothing, depthCutoff, S, nmap)
+    return nmap_array
+
+def cpu_normals_kernel(np.float32_t[:, ::1] depth, np.float32_t fx, np.float32_t fy, np.float32_t cx, np.float32_t cy,
+                       np.float32_t depthCutoff, int smoothing=0, int num_threads=0):
+    cdef int height = depth.shape[0]
+    cdef int width = depth.shape[1]
+    cdef float fx_inv = 1.0 / fx
+    cdef float fy_inv = 1.0 / fy
+
+    nmap_array = np.empty((height, width, 3), dtype=np.float32)
+    nmap_array.fill(np.nan)
+    cdef np.float32_t[:, :, ::1] nmap = nmap_array
+    if height < 2 or width < 2:
+        return nmap_array
+
+    cdef int u, b
+    cdef int block = 64
+    cdef double[:, :, ::1] S
+    if num_threads == 1:
+        # no OpenMP region, the thread pool of a parent process is unusable in a forked child
+        return serial_normals(depth, fx_inv, fy_inv, cx, cy, depthCutoff, smoothing, nmap_array)
+    if num_threads <= 0:
+        num_threads = openmp.omp_get_max_threads()
+
+    if smoothing <= 0:
+        for u in prange(height - 1, nogil=True, num_threads=num_threads, schedule='static'):
+            normal_row(depth, u, fx_inv, fy_inv, cx, cy, depthCutoff, nmap)
+        return nmap_array
+
+    # integral images of the tangents along the rows and the columns and of their counts
+    S = np.zeros((height, width, 8), dtype=np.float64)
+    for u in prange(height - 1, nogil=True, num_threads=num_threads, schedule='static'):
+        tangent_row(depth, u, fx_inv, fy_inv, cx, cy, depthCutoff, S)
+    for b in prange(0, width, block, nogil=True, num_threads=num_threads, schedule='static'):
+        integrate_columns(S, b, min(b + block, width))
+
+    for u in prange(height - 1, nogil=True, num_threads=num_threads, schedule='static'):
+        smoothed_row(depth, u, smoothing, depthCutoff, S, nmap)
+    return nmap_array
@@ -0,0 +1,36 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Normal images of depth images, the input of the networks with cfg.INPUT == 'NORMAL'."""
+
+import numpy as np
+import cv2
+from fcn.config import cfg
+from normals.cpu_normals import cpu_normals
+
+def compute_normals(depth, fx, fy, cx, cy, depthCutoff=20.0):
+    """height x width x 3 normals of a depth image in meters, computed by cfg.NORMAL_BACKEND"""
+    if cfg.NORMAL_BACKEND == 'gpu':
+        # imported here so the cpu normals do not need CUDA
+        from normals import gpu_normals
+        return gpu_normals.gpu_normals(depth, fx, fy, cx, cy, depthCutoff, cfg.GPU_ID)
+    return cpu_normals(depth, fx, fy, cx, cy, depthCutoff, cfg.NORMAL_SMOOTHING, cfg.NORMAL_THREADS)
+
+
+def normal_image(depth, fx, fy, cx, cy, bilateral=True):
+    """BGR uint8 image of the normals of a depth image in meters.
+
+    The image is smoothed with a bilateral filter if bilateral is set, unless
+    the cpu normals are already smoothed with cfg.NORMAL_SMOOTHING.
+    """
+    nmap = compute_normals(depth, fx, fy, cx, cy)
+    im_normal = 127.5 * nmap + 127.5
+    im_normal = im_normal.astype(np.uint8)
+    im_normal = im_normal[:, :, (2, 1, 0)]
+    if bilateral and (cfg.NORMAL_BACKEND == 'gpu' or cfg.NORMAL_SMOOTHING <= 0):
+        im_normal = cv2.bilateralFilter(im_normal, 9, 75, 75)
+    return im_normal
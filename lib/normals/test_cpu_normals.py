@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Check the cpu normals against a per pixel port of compute_normals.cu and time them.
+
+The depth image is a synthetic 480 x 640 scene of a tilted plane, a sphere and
+a box with holes, far pixels and noise. The numpy normals and the kernel of
+cpu_normals_kernel.pyx (if built) must agree with the reference, gpu_normals
+is compared too if it is built. The smoothed normals of the kernel must
+agree with those of numpy.
+"""
+
+import os.path as osp
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, osp.join(osp.dirname(osp.abspath(__file__)), '..'))
+from normals import cpu_normals
+
+fx = np.float32(1066.778)
+fy = np.float32(1067.487)
+cx = np.float32(312.9869)
+cy = np.float32(241.3109)
+depthCutoff = np.float32(20.0)
+
+def synthetic_depth(height, width, noise):
+    """depth in meters of a tilted plane with a sphere and a box in front of it"""
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    depth = 1.5 + 0.001 * x + 0.0005 * y
+
+    # sphere
+    r2 = (x - 200) ** 2 + (y - 240) ** 2
+    inside = r2 < 100 ** 2
+    depth[inside] = 1.0 - 0.2 * np.sqrt(1 - r2[inside] / 100.0 ** 2)
+
+    # box
+    depth[100:300, 400:550] = 1.2
+
+    rng = np.random.RandomState(3)
+    depth += noise * rng.randn(height, width).astype(np.float32)
+
+    # holes and far pixels
+    depth[rng.rand(height, width) < 0.01] = 0
+    depth[400:420, 500:600] = 30.0
+    return depth.astype(np.float32)
+
+
+def reference_normals(depth):
+    """per pixel port of computeVmapKernel and computeNmapKernel"""
+    height, width = depth.shape
+    fx_inv = np.float32(1) / fx
+    fy_inv = np.float32(1) / fy
+
+    vmap = np.empty((height, width, 3), dtype=np.float32)
+    vmap.fill(np.nan)
+    for u in xrange(height):
+        for v in xrange(width):
+            z = depth[u, v]
+            if z != 0 and z < depthCutoff:
+                vmap[u, v, 0] = z * (np.float32(u) - cx) * fx_inv
+                vmap[u, v, 1] = z * (np.float32(v) - cy) * fy_inv
+                vmap[u, v, 2] = z
+
+    nmap = np.empty((height, width, 3), dtype=np.float32)
+    nmap.fill(np.nan)
+    for u in xrange(height - 1):
+        for v in xrange(width - 1):
+            v00 = vmap[u, v]
+            v01 = vmap[u + 1, v]
+            v10 = vmap[u, v + 1]
+            if np.isnan(v00[0]) or np.isnan(v01[0]) or np.isnan(v10[0]):
+                continue
+            a = v01 - v00
+            b = v10 - v00
+            r = np.array([a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0]], dtype=np.float32)
+            n = r[0] * r[0] + r[1] * r[1] + r[2] * r[2]
+            if n > 0:
+                r /= np.sqrt(n)
+            nmap[u, v] = r
+    return nmap
+
+
+def compare(name, nmap, reference, tolerance):
+    """check the NaN pixels and the largest difference to the reference"""
+    same_nan = np.array_equal(np.isnan(nmap), np.isnan(reference))
+    valid = ~np.isnan(reference)
+    difference = np.abs(nmap[valid] - reference[valid]).max()
+    passed = same_nan and difference <= tolerance
+    print '{:<24s} same NaN pixels {}, largest difference {:.2e}: {}'.format( \
+        name, same_nan, difference, 'PASSED' if passed else 'FAILED')
+    return passed
+
+
+def timed(function, repeats=10):
+    """result and average time in ms of a function"""
+    result = function()
+    t = time.time()
+    for _ in xrange(repeats):
+        function()
+    return result, 1000 * (time.time() - t) / repeats
+
+
+def angular_error(nmap, truth):
+    """mean angle in degrees between the normals and the true normals"""
+    valid = ~np.isnan(nmap[:, :, 0]) & ~np.isnan(truth[:, :, 0])
+    cosine = np.clip(np.abs((nmap[valid] * truth[valid]).sum(axis=1)), 0, 1)
+    return np.degrees(np.arccos(cosine)).mean()
+
+
+if __name__ == '__main__':
+
+    height = 480
+    width = 640
+    depth = synthetic_depth(height, width, 0.0005)
+
+    t = time.time()
+    reference = reference_normals(depth)
+    print 'reference normals of {}x{} in {:.1f}s'.format(width, height, time.time() - t)
+
+    kernel = cpu_normals.cpu_normals_kernel
+    passed = True
+    cpu_normals.cpu_normals_kernel = None
+    nmap, t_numpy = timed(lambda: cpu_normals.cpu_normals(depth, fx, fy, cx, cy, depthCutoff))
+    passed &= compare('numpy', nmap, reference, 1e-6)
+    cpu_normals.cpu_normals_kernel = kernel
+
+    timings = [('numpy', t_numpy)]
+    if kernel is not None:
+        nmap, t_kernel = timed(lambda: kernel(depth, fx, fy, cx, cy, depthCutoff, 0, 1))
+        passed &= compare('kernel', nmap, reference, 1e-6)
+        timings.append(('kernel 1 thread', t_kernel))
+        nmap, t_kernel = timed(lambda: kernel(depth, fx, fy, cx, cy, depthCutoff))
+        passed &= compare('kernel threads', nmap, reference, 1e-6)
+        timings.append(('kernel threads', t_kernel))
+    else:
+        print 'cpu_normals_kernel is not built'
+
+    try:
+        from normals import gpu_normals
+        nmap, t_gpu = timed(lambda: gpu_normals.gpu_normals(depth, fx, fy, cx, cy, depthCutoff, 0))
+        passed &= compare('gpu_normals', nmap, reference, 1e-4)
+        timings.append(('gpu_normals', t_gpu))
+    except ImportError:
+        print 'gpu_normals is not built'
+
+    # smoothing of the normals of the noisy depth
+    truth = cpu_normals.cpu_normals(synthetic_depth(height, width, 0), fx, fy, cx, cy, depthCutoff)
+    print 'mean angular error to the normals without noise:'
+    print '{:<24s} {:.2f} degrees'.format('no smoothing', angular_error(reference, truth))
+    for radius in [2, 5]:
+        name = 'smoothing {}'.format(radius)
+        cpu_normals.cpu_normals_kernel = None
+        nmap, t_smooth = timed(lambda: cpu_normals.cpu_normals(depth, fx, fy, cx, cy, depthCutoff, radius))
+        cpu_normals.cpu_normals_kernel = kernel
+        timings.append(('numpy ' + name, t_smooth))
+        print '{:<24s} {:.2f} degrees'.format(name, angular_error(nmap, truth))
+        if kernel is not None:
+            nmap_kernel, t_smooth = timed(lambda: kernel(depth, fx, fy, cx, cy, depthCutoff, radius))
+            passed &= compare('kernel ' + name, nmap_kernel, nmap, 1e-5)
+            timings.append(('kernel ' + name, t_smooth))
+            nmap_kernel, t_smooth = timed(lambda: kernel(depth, fx, fy, cx, cy, depthCutoff, radius, 1))
+            passed &= compare('kernel 1 thread ' + name, nmap_kernel, nmap, 1e-5)
+            timings.append(('kernel 1 thread ' + name, t_smooth))
+
+    try:
+        import cv2
+        im_normal = (127.5 * reference + 127.5).astype(np.uint8)
+        _, t_bilateral = timed(lambda: cv2.bilateralFilter(im_normal, 9, 75, 75))
+        timings.append(('bilateral filter', t_bilateral))
+    except ImportError:
+        pass
+
+    for name, t in timings:
+        print '{:<24s} {:8.2f}ms'.format(name, t)
+    if not passed:
+        sys.exit(1)
@@ -122,6 +122,13 @@ ext_modules = [
                                      "'-fPIC'"]},
         include_dirs = [numpy_include, CUDA['include'], '/usr/local/include/eigen3']
     ),
+    Extension(
+        "normals.cpu_normals_kernel",
+        ["normals/cpu_normals_kernel.pyx"],
+        extra_compile_args={'gcc': ["-Wno-cpp", "-Wno-unused-function", "-fopenmp"]},
+        extra_link_args=['-fopenmp'],
+        include_dirs = [numpy_include]
+    ),
     Extension(
         "utils.cython_bbox",
         ["utils/bbox.pyx"],
@@ -134,6 +141,12 @@ ext_modules = [
         extra_compile_args={'gcc': ["-Wno-cpp", "-Wno-unused-function"]},
         include_dirs = [numpy_include]
     ),
+    Extension(
+        "nms.cpu_roi_nms",
+        ["nms/cpu_roi_nms.pyx"],
+        extra_compile_args={'gcc': ["-Wno-cpp", "-Wno-unused-function"]},
+        include_dirs = [numpy_include]
+    ),
     Extension('nms.gpu_nms',
         ['nms/nms_kernel.cu', 'nms/gpu_nms.pyx'],
         library_dirs=[CUDA['lib64']],
@@ -0,0 +1,298 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Offline generation of a synthetic dataset in resumable shards.
+
+The index range of the images is split into shards, rendered by worker
+processes with a synthesizer each. The samples are the ones of the render
+farm used for SYN_ONLINE training, so offline and online samples match.
+Each shard saves its progress in a checkpoint, a restarted generation
+continues every shard from its last checkpoint.
+
+The images go either into the <index>-color.png, -depth.png, -label.png and
+-meta.mat files of cfg.TRAIN.SYNROOT, or into shards of packed frames (see
+utils/frame_shard.py). Packed frames are indexed by the path of their color
+image in the output directory, so training with TRAIN.SHARDS set to the
+index reads them instead of the files.
+"""
+
+import os
+import time
+import cPickle
+import multiprocessing
+import traceback
+import Queue
+import numpy as np
+import cv2
+import scipy.io
+from fcn.config import cfg
+from utils.frame_shard import META_KEYS, write_frame, write_index
+from synthesize.render_farm import render_sample, render_one_sample
+
+# distance of the random seeds of consecutive shards
+_SEED_STRIDE = 1000003
+
+def shard_ranges(num_images, num_shards):
+    """split the image indexes 0..num_images-1 into num_shards ranges [start, end)"""
+    bounds = np.linspace(0, num_images, num_shards + 1).astype(int)
+    return [(int(bounds[k]), int(bounds[k + 1])) for k in xrange(num_shards)]
+
+
+class DatasetGenerator(object):
+    """Render num_images synthetic images into root in num_shards resumable shards.
+
+    If index_file is given, the frames are packed into the shards
+    <index_file prefix>_<shard>.bin and index_file is written once every
+    shard is complete. A checkpoint is saved every checkpoint_every
+    accepted images of a shard. The synthesizer is seeded from seed, the
+    shard and the next image, so shards and resumed shards render their
+    own samples.
+    """
+
+    def __init__(self, root, num_images, num_shards, intrinsic_matrix, extents, points, \
+                 index_file=None, compress=False, checkpoint_every=100, seed=0):
+        self.root = root
+        self.seed = seed
+        self.ranges = shard_ranges(num_images, num_shards)
+        self.intrinsic_matrix = intrinsic_matrix
+        self.extents = extents
+        self.points = points
+        self.index_file = index_file
+        self.compress = compress
+        self.checkpoint_every = checkpoint_every
+
+        if index_file is None:
+            self._checkpoint_dir = os.path.join(root, 'checkpoints')
+        else:
+            self._prefix = os.path.splitext(index_file)[0]
+            self._checkpoint_dir = self._prefix + '_checkpoints'
+        for directory in [root, self._checkpoint_dir]:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+
+    def _checkpoint_file(self, shard):
+        return os.path.join(self._checkpoint_dir, 'shard_{:04d}.pkl'.format(shard))
+
+    def _shard_file(self, shard):
+        return '{}_{:04d}.bin'.format(self._prefix, shard)
+
+    def load_checkpoint(self, shard):
+        """the progress of a shard, a new one if the shard has not started"""
+        filename = self._checkpoint_file(shard)
+        if os.path.exists(filename):
+            with open(filename, 'rb') as fid:
+                return cPickle.load(fid)
+        return self._new_state(shard)
+
+    def _new_state(self, shard):
+        start, end = self.ranges[shard]
+        # offset and frames of the packed shard
+        return {'start': start, 'end': end, 'next': start, 'accepted': 0, 'rejected': 0, 'time': 0.0, \
+                'offset': 0, 'frames': {}}
+
+    def _save_checkpoint(self, shard, state):
+        # a crash while saving leaves the previous checkpoint
+        filename = self._checkpoint_file(shard)
+        with open(filename + '.tmp', 'wb') as fid:
+            cPickle.dump(state, fid, cPickle.HIGHEST_PROTOCOL)
+        os.rename(filename + '.tmp', filename)
+
+    def pending(self):
+        """the shards not complete yet"""
+        shards = []
+        for shard in xrange(len(self.ranges)):
+            state = self.load_checkpoint(shard)
+            if state['next'] < state['end']:
+                shards.append(shard)
+        return shards
+
+    def render(self, synthesizer):
+        """render a sample, None if rejected"""
+        if cfg.TRAIN.SYN_CLASS_INDEX >= 0:
+            return render_one_sample(synthesizer, self.intrinsic_matrix, self.extents, self.points)
+        return render_sample(synthesizer, self.intrinsic_matrix, self.points)
+
+    def _write_files(self, i, data):
+        filename = os.path.join(self.root, '{:06d}-color.png'.format(i))
+        cv2.imwrite(filename, data['image'])
+
+        filename = os.path.join(self.root, '{:06d}-depth.png'.format(i))
+        cv2.imwrite(filename, data['depth'])
+
+        filename = os.path.join(self.root, '{:06d}-label.png'.format(i))
+        cv2.imwrite(filename, data['label'])
+
+        filename = os.path.join(self.root, '{:06d}-meta.mat'.format(i))
+        scipy.io.savemat(filename, data['meta_data'], do_compression=True)
+
+    def _packed_meta_data(self, meta_data):
+        # the shapes of the fields read by loadmat
+        meta = {}
+        for key in META_KEYS:
+            if key in meta_data:
+                value = np.asarray(meta_data[key])
+                meta[key] = value if value.ndim >= 2 else np.atleast_2d(value)
+        return meta
+
+    def generate_shard(self, shard, synthesizer, worker_id=0):
+        """render the remaining images of a shard, return the statistics of this run"""
+        state = self.load_checkpoint(shard)
+        fid = None
+        if self.index_file is not None:
+            filename = self._shard_file(shard)
+            if os.path.exists(filename) and state['next'] > state['start']:
+                # drop the frames written after the checkpoint
+                fid = open(filename, 'r+b')
+                fid.truncate(state['offset'])
+                fid.seek(state['offset'])
+            else:
+                if state['next'] > state['start']:
+                    print 'shard file {} is missing, generating shard {:d} again'.format(filename, shard)
+                # the frames of the checkpoint are gone with the file
+                state = self._new_state(shard)
+                fid = open(filename, 'wb')
+        synthesizer.init_rand((self.seed + shard * _SEED_STRIDE + state['next']) % 2**32)
+
+        stats = {'images': 0, 'rejected': 0, 'time': 0.0}
+        start = time.time()
+        saved = start
+        while state['next'] < state['end']:
+            data = self.render(synthesizer)
+            if data is None:
+                state['rejected'] += 1
+                stats['rejected'] += 1
+                continue
+
+            i = state['next']
+            if fid is None:
+                self._write_files(i, data)
+            else:
+                arrays = {'image': data['image'], 'depth': data['depth'], 'label': data['label']}
+                records, state['offset'] = write_frame(fid, state['offset'], arrays, self.compress)
+                path = os.path.join(self.root, '{:06d}-color.png'.format(i))
+                state['frames'][path] = {'arrays': records, 'meta_data': self._packed_meta_data(data['meta_data'])}
+            state['next'] += 1
+            state['accepted'] += 1
+            stats['images'] += 1
+
+            if stats['images'] % self.checkpoint_every == 0 or state['next'] == state['end']:
+                if fid is not None:
+                    fid.flush()
+                    os.fsync(fid.fileno())
+                now = time.time()
+                state['time'] += now - saved
+                saved = now
+                self._save_checkpoint(shard, state)
+                elapsed = now - start
+                print 'worker {:d}, shard {:d}: {:d}/{:d} images, {:.2f} images/s, rejection rate {:.2f}' \
+                      .format(worker_id, shard, state['next'] - state['start'], state['end'] - state['start'], \
+                              stats['images'] / max(elapsed, 1e-6), \
+                              stats['rejected'] / float(max(stats['images'] + stats['rejected'], 1)))
+        if fid is not None:
+            fid.close()
+        stats['time'] = time.time() - start
+        return stats
+
+    def write_index(self):
+        """write the index of the packed shards, False if a shard is not complete"""
+        shards = []
+        frames = {}
+        for shard in xrange(len(self.ranges)):
+            state = self.load_checkpoint(shard)
+            if state['next'] < state['end']:
+                print 'shard {:d} is not complete, no index written'.format(shard)
+                return False
+            shards.append(os.path.basename(self._shard_file(shard)))
+            for path, frame in state['frames'].iteritems():
+                frame = dict(frame)
+                frame['shard'] = shard
+                frames[path] = frame
+        write_index(self.index_file, shards, frames)
+        return True
+
+    def run(self, num_workers):
+        """generate the pending shards in num_workers processes, True if all the shards are complete"""
+        shards = self.pending()
+        print '{:d} of {:d} shards to generate in {:d} workers'.format(len(shards), len(self.ranges), num_workers)
+        if len(shards) == 0:
+            return True if self.index_file is None else self.write_index()
+
+        shard_queue = multiprocessing.Queue()
+        result_queue = multiprocessing.Queue()
+        for shard in shards:
+            shard_queue.put(shard)
+        num_workers = min(num_workers, len(shards))
+        workers = []
+        for worker_id in xrange(num_workers):
+            shard_queue.put(None)
+            worker = multiprocessing.Process(target=_generate_worker, args=(worker_id, self, shard_queue, result_queue))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        # images, rejected, time and failed shards of each worker
+        totals = np.zeros((num_workers, 4), dtype=np.float64)
+        current = [None] * num_workers
+        running = set(xrange(num_workers))
+        while len(running) > 0:
+            try:
+                worker_id, shard, stats = result_queue.get(timeout=1.0)
+            except Queue.Empty:
+                # a worker killed by a crash of the renderer or out of memory does not report
+                for worker_id in list(running):
+                    if not workers[worker_id].is_alive():
+                        running.remove(worker_id)
+                        if current[worker_id] is not None:
+                            print 'worker {:d} died on shard {:d} with exit code {}' \
+                                  .format(worker_id, current[worker_id], workers[worker_id].exitcode)
+                            totals[worker_id, 3] += 1
+                continue
+            if shard is None:
+                running.discard(worker_id)
+            elif stats is None:
+                current[worker_id] = shard
+            elif isinstance(stats, dict):
+                current[worker_id] = None
+                totals[worker_id, :3] += [stats['images'], stats['rejected'], stats['time']]
+            else:
+                current[worker_id] = None
+                print 'worker {:d} failed on shard {:d}:\n{}'.format(worker_id, shard, stats)
+                totals[worker_id, 3] += 1
+        for worker in workers:
+            worker.join()
+
+        for worker_id in xrange(num_workers):
+            images, rejected, seconds, failed = totals[worker_id]
+            print 'worker {:d}: {:d} images, {:.2f} images/s, {:d} rejected (rate {:.2f}), {:d} failed shards' \
+                  .format(worker_id, int(images), images / max(seconds, 1e-6), int(rejected), \
+                          rejected / max(images + rejected, 1), int(failed))
+        images, rejected = totals[:, 0].sum(), totals[:, 1].sum()
+        print 'total: {:d} images, {:.2f} images/s, rejection rate {:.2f}' \
+              .format(int(images), images / max(totals[:, 2].max(), 1e-6), rejected / max(images + rejected, 1))
+
+        if len(self.pending()) > 0:
+            return False
+        return True if self.index_file is None else self.write_index()
+
+
+def _generate_worker(worker_id, generator, shard_queue, result_queue):
+    import libsynthesizer
+
+    synthesizer = libsynthesizer.Synthesizer(cfg.CAD, cfg.POSE)
+    synthesizer.setup(cfg.TRAIN.SYN_WIDTH, cfg.TRAIN.SYN_HEIGHT)
+    while True:
+        shard = shard_queue.get()
+        if shard is None:
+            break
+        # the shard of a worker that dies without reporting is counted as failed
+        result_queue.put((worker_id, shard, None))
+        try:
+            stats = generator.generate_shard(shard, synthesizer, worker_id)
+        except Exception:
+            stats = traceback.format_exc()
+        result_queue.put((worker_id, shard, stats))
+    result_queue.put((worker_id, None, None))
@@ -0,0 +1,320 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Online rendering of synthetic training images in worker processes."""
+
+import time
+import multiprocessing
+import traceback
+import numpy as np
+from fcn.config import cfg
+from transforms3d.quaternions import quat2mat
+
+def render_one_sample(synthesizer, intrinsic_matrix, extents, points):
+    """render an image of the object cfg.TRAIN.SYN_CLASS_INDEX, None if rejected"""
+
+    which_class = cfg.TRAIN.SYN_CLASS_INDEX
+    height = cfg.TRAIN.SYN_HEIGHT
+    width = cfg.TRAIN.SYN_WIDTH
+    fx = intrinsic_matrix[0, 0]
+    fy = intrinsic_matrix[1, 1]
+    px = intrinsic_matrix[0, 2]
+    py = intrinsic_matrix[1, 2]
+    zfar = 6.0
+    znear = 0.25;
+    factor_depth = 1000.0
+
+    # render a synthetic image
+    im_syn = np.zeros((height, width, 4), dtype=np.float32)
+    depth_syn = np.zeros((height, width, 3), dtype=np.float32)
+    vertmap_syn = np.zeros((height, width, 3), dtype=np.float32)
+    poses = np.zeros((1, 7), dtype=np.float32)
+    centers = np.zeros((1, 2), dtype=np.float32)
+    synthesizer.render_one_python(int(which_class), int(width), int(height), fx, fy, px, py, znear, zfar, \
+        im_syn, depth_syn, vertmap_syn, poses, centers, extents)
+
+    # convert images
+    im_syn = np.clip(255 * im_syn, 0, 255)
+    im_syn = im_syn.astype(np.uint8)
+    depth_syn = depth_syn[:, :, 0]
+
+    # convert depth
+    im_depth_raw = factor_depth * 2 * zfar * znear / (zfar + znear - (zfar - znear) * (2 * depth_syn - 1))
+    I = np.where(depth_syn == 1)
+    im_depth_raw[I[0], I[1]] = 0
+
+    # compute labels from vertmap
+    label = np.round(vertmap_syn[:, :, 0]) + 1
+    label[np.isnan(label)] = 0
+
+    I = np.where(label != which_class + 1)
+    label[I[0], I[1]] = 0
+
+    I = np.where(label == which_class + 1)
+    if len(I[0]) < 800:
+        return None
+
+    # convert pose
+    qt = np.zeros((3, 4, 1), dtype=np.float32)
+    qt[:, :3, 0] = quat2mat(poses[0, :4])
+    qt[:, 3, 0] = poses[0, 4:]
+
+    # process the vertmap
+    vertmap_syn[:, :, 0] = vertmap_syn[:, :, 0] - np.round(vertmap_syn[:, :, 0])
+    vertmap_syn[np.isnan(vertmap_syn)] = 0
+
+    # compute box
+    x3d = np.ones((4, points.shape[1]), dtype=np.float32)
+    cls = 1
+    x3d[0, :] = points[cls,:,0]
+    x3d[1, :] = points[cls,:,1]
+    x3d[2, :] = points[cls,:,2]
+    RT = qt[:, :, 0]
+    x2d = np.matmul(intrinsic_matrix, np.matmul(RT, x3d))
+    x2d[0, :] = np.divide(x2d[0, :], x2d[2, :])
+    x2d[1, :] = np.divide(x2d[1, :], x2d[2, :])
+    box = np.zeros((1, 4), dtype=np.float32)
+    box[0, 0] = np.min(x2d[0, :])
+    box[0, 1] = np.min(x2d[1, :])
+    box[0, 2] = np.max(x2d[0, :])
+    box[0, 3] = np.max(x2d[1, :])
+
+    # metadata
+    metadata = {'poses': qt, 'center': centers, 'box': box, \
+                'cls_indexes': np.array([which_class + 1]), 'intrinsic_matrix': intrinsic_matrix, 'factor_depth': factor_depth}
+
+    # construct data
+    data = {'image': im_syn, 'depth': im_depth_raw.astype(np.uint16), 'label': label.astype(np.uint8), 'meta_data': metadata}
+    return data
+
+
+def render_sample(synthesizer, intrinsic_matrix, points):
+    """render an image of sampled objects, None if rejected"""
+
+    height = cfg.TRAIN.SYN_HEIGHT
+    width = cfg.TRAIN.SYN_WIDTH
+    fx = intrinsic_matrix[0, 0]
+    fy = intrinsic_matrix[1, 1]
+    px = intrinsic_matrix[0, 2]
+    py = intrinsic_matrix[1, 2]
+    zfar = 6.0
+    znear = 0.25;
+    tnear = cfg.TRAIN.SYN_TNEAR
+    tfar = cfg.TRAIN.SYN_TFAR
+    factor_depth = 1000.0
+    num_classes = points.shape[0]
+
+    parameters = np.zeros((8, ), dtype=np.float32)
+    parameters[0] = fx
+    parameters[1] = fy
+    parameters[2] = px
+    parameters[3] = py
+    parameters[4] = znear
+    parameters[5] = zfar
+    parameters[6] = tnear
+    parameters[7] = tfar
+
+    # render a synthetic image
+    im_syn = np.zeros((height, width, 4), dtype=np.float32)
+    depth_syn = np.zeros((height, width, 3), dtype=np.float32)
+    vertmap_syn = np.zeros((height, width, 3), dtype=np.float32)
+    class_indexes = -1 * np.ones((num_classes, ), dtype=np.float32)
+    poses = np.zeros((num_classes, 7), dtype=np.float32)
+    centers = np.zeros((num_classes, 2), dtype=np.float32)
+    is_sampling = cfg.TRAIN.SYN_SAMPLE_OBJECT
+    is_sampling_pose = cfg.TRAIN.SYN_SAMPLE_POSE
+    synthesizer.render_python(int(width), int(height), parameters, \
+                               im_syn, depth_syn, vertmap_syn, class_indexes, poses, centers, is_sampling, is_sampling_pose)
+
+    # convert images
+    im_syn = np.clip(255 * im_syn, 0, 255)
+    im_syn = im_syn.astype(np.uint8)
+    depth_syn = depth_syn[:, :, 0]
+
+    # convert depth
+    im_depth_raw = factor_depth * 2 * zfar * znear / (zfar + znear - (zfar - znear) * (2 * depth_syn - 1))
+    I = np.where(depth_syn == 1)
+    im_depth_raw[I[0], I[1]] = 0
+
+    # compute labels from vertmap
+    label = np.round(vertmap_syn[:, :, 0]) + 1
+    label[np.isnan(label)] = 0
+
+    # convert pose
+    index = np.where(class_indexes >= 0)[0]
+    num = len(index)
+    qt = np.zeros((3, 4, num), dtype=np.float32)
+    for j in xrange(num):
+        ind = index[j]
+        qt[:, :3, j] = quat2mat(poses[ind, :4])
+        qt[:, 3, j] = poses[ind, 4:]
+
+    for j in xrange(num):
+        cls = class_indexes[index[j]] + 1
+        I = np.where(label == cls)
+        if len(I[0]) < 800:
+            return None
+
+    # process the vertmap
+    vertmap_syn[:, :, 0] = vertmap_syn[:, :, 0] - np.round(vertmap_syn[:, :, 0])
+    vertmap_syn[np.isnan(vertmap_syn)] = 0
+
+    # compute box
+    box = np.zeros((num, 4), dtype=np.float32)
+    for j in xrange(num):
+        cls = int(class_indexes[index[j]]) + 1
+        x3d = np.ones((4, points.shape[1]), dtype=np.float32)
+        x3d[0, :] = points[cls,:,0]
+        x3d[1, :] = points[cls,:,1]
+        x3d[2, :] = points[cls,:,2]
+        RT = qt[:, :, j]
+        x2d = np.matmul(intrinsic_matrix, np.matmul(RT, x3d))
+        x2d[0, :] = np.divide(x2d[0, :], x2d[2, :])
+        x2d[1, :] = np.divide(x2d[1, :], x2d[2, :])
+
+        box[j, 0] = np.min(x2d[0, :])
+        box[j, 1] = np.min(x2d[1, :])
+        box[j, 2] = np.max(x2d[0, :])
+        box[j, 3] = np.max(x2d[1, :])
+
+    # metadata
+    metadata = {'poses': qt, 'center': centers[class_indexes[index].astype(int), :], 'box': box, \
+                'cls_indexes': class_indexes[index] + 1, 'intrinsic_matrix': intrinsic_matrix, 'factor_depth': factor_depth}
+
+    # construct data
+    data = {'image': im_syn, 'depth': im_depth_raw.astype(np.uint16), 'label': label.astype(np.uint8), 'meta_data': metadata}
+    return data
+
+
+def _render_worker(worker_id, seed, intrinsic_matrix, extents, points, ring, free_queue, ready_queue, counters):
+    import libsynthesizer
+
+    np.random.seed(seed)
+    synthesizer = libsynthesizer.Synthesizer(cfg.CAD, cfg.POSE)
+    synthesizer.setup(cfg.TRAIN.SYN_WIDTH, cfg.TRAIN.SYN_HEIGHT)
+    # the objects and poses are sampled by the synthesizer
+    synthesizer.init_rand(seed)
+    images, depths, labels = ring
+
+    while True:
+        start = time.time()
+        try:
+            if cfg.TRAIN.SYN_CLASS_INDEX >= 0:
+                data = render_one_sample(synthesizer, intrinsic_matrix, extents, points)
+            else:
+                data = render_sample(synthesizer, intrinsic_matrix, points)
+        except Exception:
+            ready_queue.put((None, worker_id, traceback.format_exc()))
+            break
+        # rendered, rejected, render time
+        counters[3 * worker_id] += 1
+        counters[3 * worker_id + 2] += time.time() - start
+        if data is None:
+            counters[3 * worker_id + 1] += 1
+            continue
+
+        slot = free_queue.get()
+        if slot is None:
+            break
+        images[slot] = data['image']
+        depths[slot] = data['depth']
+        labels[slot] = data['label']
+        ready_queue.put((slot, worker_id, data['meta_data']))
+
+
+class RenderFarm(object):
+    """Renders synthetic training images in num_workers processes.
+
+    Every worker has its own synthesizer and writes the images of the
+    accepted samples into a ring of queue_size slots in shared memory.
+    get() returns the next sample as the dict the rendering thread used to
+    put in the data queue, so the farm replaces that queue. The farm must
+    be created before any process that calls get() is forked.
+    """
+
+    def __init__(self, intrinsic_matrix, extents, points, num_workers=4, queue_size=100, seed=0, report_interval=1000):
+        height = cfg.TRAIN.SYN_HEIGHT
+        width = cfg.TRAIN.SYN_WIDTH
+        self._num_workers = num_workers
+        self._report_interval = report_interval
+        self._count = 0
+        self._start = time.time()
+        self._t_wait = 0.
+
+        # ring of rendered images in shared memory
+        self._images = np.frombuffer(multiprocessing.RawArray('B', queue_size * height * width * 4), \
+                                     dtype=np.uint8).reshape((queue_size, height, width, 4))
+        self._depths = np.frombuffer(multiprocessing.RawArray('H', queue_size * height * width), \
+                                     dtype=np.uint16).reshape((queue_size, height, width))
+        self._labels = np.frombuffer(multiprocessing.RawArray('B', queue_size * height * width), \
+                                     dtype=np.uint8).reshape((queue_size, height, width))
+        self._counters = multiprocessing.RawArray('d', 3 * num_workers)
+        self._free_queue = multiprocessing.Queue()
+        self._ready_queue = multiprocessing.Queue()
+        for slot in xrange(queue_size):
+            self._free_queue.put(slot)
+
+        self._workers = []
+        for i in xrange(num_workers):
+            worker = multiprocessing.Process(target=_render_worker, \
+                args=(i, seed + i, intrinsic_matrix, extents, points, (self._images, self._depths, self._labels), \
+                      self._free_queue, self._ready_queue, self._counters))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        print 'render farm: {:d} workers, {:d} slots'.format(num_workers, queue_size)
+
+    def get(self):
+        """Return the next rendered sample."""
+        start = time.time()
+        slot, worker_id, meta_data = self._ready_queue.get()
+        self._t_wait += time.time() - start
+        if slot is None:
+            raise RuntimeError('render worker {} failed:\n{}'.format(worker_id, meta_data))
+
+        data = {'image': self._images[slot].copy(),
+                'depth': self._depths[slot].copy(),
+                'label': self._labels[slot].copy(),
+                'meta_data': meta_data}
+        self._free_queue.put(slot)
+
+        self._count += 1
+        if self._report_interval > 0 and self._count % self._report_interval == 0:
+            self.report()
+        return data
+
+    def close(self):
+        """Stop the render processes."""
+        for worker in self._workers:
+            self._free_queue.put(None)
+        for worker in self._workers:
+            worker.join(1.0)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = []
+
+    def stats(self):
+        """Return the rendering statistics of all the workers."""
+        counters = np.array(self._counters[:], dtype=np.float64).reshape((self._num_workers, 3))
+        rendered = counters[:, 0]
+        rejected = counters[:, 1]
+        elapsed = max(time.time() - self._start, 1e-6)
+        return {'rendered': rendered,
+                'rejected': rejected,
+                'rejection_rate': rejected.sum() / max(rendered.sum(), 1),
+                'throughput': (rendered - rejected) / elapsed,
+                'render_time': counters[:, 2] / np.maximum(rendered, 1),
+                'received': self._count,
+                'wait': self._t_wait / max(self._count, 1)}
+
+    def report(self):
+        stats = self.stats()
+        print 'render farm: {:d} samples received, rejection rate {:.2f}, {:.2f} samples/s, wait {:.3f}s/sample' \
+              .format(stats['received'], stats['rejection_rate'], stats['throughput'].sum(), stats['wait'])
+        for i in xrange(self._num_workers):
+            print '  worker {:d}: {:d} rendered, {:d} rejected, {:.2f} samples/s, {:.3f}s/render' \
+                  .format(i, int(stats['rendered'][i]), int(stats['rejected'][i]), stats['throughput'][i], stats['render_time'][i])
@@ -0,0 +1,165 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Decoded background images at the resolution of the synthetic images.
+
+The background images are decoded and resized once into a flat file of
+uint8 color (or uint16 depth) images, and memory-mapped when sampled. Images
+that fail to decode or have the wrong number of channels are dropped at build
+time. The most recently used images are kept in memory.
+"""
+
+import os
+import cPickle
+import collections
+import numpy as np
+import cv2
+
+def _decode_background(filename, height, width, depth):
+    """the background image resized to height x width, None if it is not usable"""
+    im = cv2.imread(filename, cv2.IMREAD_UNCHANGED)
+    if im is None or im.size == 0:
+        return None
+    if depth:
+        if len(im.shape) != 2:
+            return None
+        im = im.astype(np.uint16)
+    else:
+        if len(im.shape) != 3 or im.shape[2] < 3:
+            return None
+        im = im[:, :, :3].astype(np.uint8)
+    return cv2.resize(im, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def build_background_store(filenames, store_file, height, width, depth=False, max_images=0):
+    """Decode the background images into store_file, return the number kept.
+
+    With max_images > 0 a random subset of that many images is packed.
+    """
+    sources = list(filenames)
+    if max_images > 0 and len(filenames) > max_images:
+        filenames = [filenames[i] for i in np.random.permutation(len(filenames))[:max_images]]
+
+    prefix = os.path.splitext(store_file)[0]
+    kept = []
+    with open(prefix + '.bin', 'wb') as fid:
+        for i, filename in enumerate(filenames):
+            im = _decode_background(filename, height, width, depth)
+            if im is None:
+                print 'bad background image {}'.format(filename)
+                continue
+            fid.write(np.ascontiguousarray(im).tostring())
+            kept.append(filename)
+            if (i + 1) % 1000 == 0:
+                print '{}/{} background images packed'.format(i + 1, len(filenames))
+
+    if depth:
+        shape = (height, width)
+        dtype = np.dtype(np.uint16).str
+    else:
+        shape = (height, width, 3)
+        dtype = np.dtype(np.uint8).str
+    index = {'filenames': kept, 'shape': shape, 'dtype': dtype, 'sources': sources, 'max_images': max_images}
+    with open(store_file, 'wb') as fid:
+        cPickle.dump(index, fid, cPickle.HIGHEST_PROTOCOL)
+    print 'wrote {} of {} background images to {}'.format(len(kept), len(filenames), store_file)
+    return len(kept)
+
+
+class BackgroundStore(object):
+    """Random access to the background images packed by build_background_store.
+
+    The images are memory-mapped on first use in each process, so a store
+    created before forking can be used by the worker processes. Up to
+    cache_size images are kept in memory, least recently used first out.
+    """
+
+    def __init__(self, store_file, cache_size=200):
+        with open(store_file, 'rb') as fid:
+            index = cPickle.load(fid)
+        self._filenames = index['filenames']
+        self._sources = index['sources']
+        self._max_images = index['max_images']
+        self._shape = index['shape']
+        self._dtype = np.dtype(index['dtype'])
+        self._data_file = os.path.splitext(store_file)[0] + '.bin'
+        self._cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._data = None
+        self._pid = None
+        print '{} background images of size {} loaded from {}'.format(len(self._filenames), self._shape, store_file)
+
+    def __len__(self):
+        return len(self._filenames)
+
+    @property
+    def shape(self):
+        return self._shape
+
+    def is_packed_from(self, filenames, height, width, max_images=0):
+        """Return True if the store holds the images of filenames at height x width."""
+        return tuple(self._shape[:2]) == (height, width) and self._max_images == max_images \
+            and self._sources == list(filenames)
+
+    def _map(self):
+        # memory maps and caches are not shared with forked processes
+        if self._pid != os.getpid():
+            self._data = np.memmap(self._data_file, dtype=self._dtype, mode='r', shape=(len(self._filenames),) + tuple(self._shape))
+            self._cache = collections.OrderedDict()
+            self._pid = os.getpid()
+        return self._data
+
+    def get(self, i):
+        """Return background image i, read-only."""
+        data = self._map()
+        im = self._cache.pop(i, None)
+        if im is None:
+            im = np.array(data[i])
+            im.flags.writeable = False
+            if len(self._cache) >= self._cache_size > 0:
+                self._cache.popitem(last=False)
+        if self._cache_size > 0:
+            self._cache[i] = im
+        return im
+
+    def sample(self, height, width):
+        """Return a random background image at height x width."""
+        im = self.get(np.random.randint(len(self._filenames)))
+        if im.shape[0] != height or im.shape[1] != width:
+            im = cv2.resize(im, (width, height), interpolation=cv2.INTER_LINEAR)
+        return im
+
+
+def open_background_store(filenames, store_file, height, width, depth=False, max_images=0, cache_size=200):
+    """Open the store of the background images, built first if missing or packed from other images."""
+    if os.path.exists(store_file):
+        store = BackgroundStore(store_file, cache_size)
+        if store.is_packed_from(filenames, height, width, max_images):
+            return store
+        print 'background images in {} are out of date'.format(store_file)
+    build_background_store(filenames, store_file, height, width, depth, max_images)
+    return BackgroundStore(store_file, cache_size)
+
+
+def sample_background(backgrounds, height, width, depth=False):
+    """Return a random background image at height x width.
+
+    backgrounds is a BackgroundStore or a list of image files, in which case
+    the image is decoded here and a bad image gives a black background.
+    """
+    if isinstance(backgrounds, BackgroundStore):
+        return backgrounds.sample(height, width)
+
+    ind = np.random.randint(len(backgrounds), size=1)[0]
+    background = _decode_background(backgrounds[ind], height, width, depth)
+    if background is None:
+        if depth:
+            background = np.zeros((height, width), dtype=np.uint16)
+        else:
+            background = np.zeros((height, width, 3), dtype=np.uint8)
+        print 'bad background image'
+    return background
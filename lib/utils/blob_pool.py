@@ -0,0 +1,63 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""A pool of preallocated blobs reused across frames at test time."""
+
+import numpy as np
+
+class BlobPool(object):
+    """Hands out constant blobs keyed by (shape, dtype, num_classes).
+
+    The fake label, vertex target and vertex weight blobs fed at test time
+    are never read by inference, so one buffer per key is allocated and
+    returned on every later request. Callers must not write into the blobs.
+    """
+
+    def __init__(self):
+        self._blobs = {}
+        self._requests = 0
+        self._allocations = 0
+        self._bytes = 0
+
+    def get(self, shape, dtype, num_classes=0, value=0):
+        """Return a blob of the given shape and dtype filled with value."""
+        shape = tuple(int(s) for s in shape)
+        key = (shape, np.dtype(dtype).str, num_classes, value)
+        self._requests += 1
+
+        blob = self._blobs.get(key)
+        if blob is None:
+            blob = np.empty(shape, dtype=dtype)
+            blob.fill(value)
+            self._blobs[key] = blob
+            self._allocations += 1
+            self._bytes += blob.nbytes
+        return blob
+
+    def zeros(self, shape, dtype=np.float32, num_classes=0):
+        return self.get(shape, dtype, num_classes, 0)
+
+    def ones(self, shape, dtype=np.float32, num_classes=0):
+        return self.get(shape, dtype, num_classes, 1)
+
+    def clear(self):
+        """Release all the blobs in the pool."""
+        self._blobs = {}
+        self._bytes = 0
+
+    def stats(self):
+        """Return the allocation statistics of the pool."""
+        return {'requests': self._requests,
+                'allocations': self._allocations,
+                'reuses': self._requests - self._allocations,
+                'blobs': len(self._blobs),
+                'bytes': self._bytes}
+
+    def report(self):
+        stats = self.stats()
+        print 'blob pool: {:d} requests, {:d} allocations, {:d} reuses, {:d} blobs, {:.1f} MB' \
+              .format(stats['requests'], stats['allocations'], stats['reuses'], stats['blobs'], stats['bytes'] / 1048576.0)
@@ -0,0 +1,206 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Multi-process minibatch loader for training."""
+
+import multiprocessing
+import traceback
+import Queue
+import numpy as np
+import cv2
+from utils.timer import Timer, profiler
+
+# alignment of the blobs in a slot
+_ALIGN = 64
+
+def _pack(blobs, buf):
+    """copy the arrays of blobs into buf, return the layout to unpack them"""
+    layout = []
+    offset = 0
+    for key, value in blobs.iteritems():
+        if isinstance(value, np.ndarray) and value.nbytes > 0:
+            value = np.ascontiguousarray(value)
+            if offset + value.nbytes <= buf.size:
+                buf[offset:offset + value.nbytes] = value.view(np.uint8).reshape(-1)
+                layout.append((key, offset, value.shape, value.dtype.str, None))
+                offset += value.nbytes + (_ALIGN - value.nbytes % _ALIGN) % _ALIGN
+                continue
+        # small, empty or oversized values go through the queue
+        layout.append((key, None, None, None, value))
+    return layout
+
+
+def _unpack(layout, buf):
+    """copies of the arrays of a slot, the slot can be reused once they are made"""
+    blobs = {}
+    for key, offset, shape, dtype, value in layout:
+        if offset is None:
+            blobs[key] = value
+        else:
+            dtype = np.dtype(dtype)
+            count = int(np.prod(shape))
+            # the feed of the network queue does not copy aligned buffers
+            blobs[key] = buf[offset:offset + count * dtype.itemsize].view(dtype).reshape(shape).copy()
+    return blobs
+
+
+def _loader_worker(data_layer, worker_init, worker_id, num_workers, start, seed, buffers, free_queue, result_queue):
+    # the thread pool of cv2 does not survive the fork
+    cv2.setNumThreads(0)
+    np.random.seed(seed)
+    if worker_init is not None:
+        worker_init(data_layer, worker_id)
+    # iterations interleaved across the workers
+    iter = start + worker_id
+    while True:
+        slot = free_queue.get()
+        if slot is None:
+            break
+        timer = Timer()
+        timer.tic()
+        try:
+            blobs = data_layer.forward(iter)
+            layout = _pack(blobs, buffers[slot])
+            error = None
+        except Exception:
+            layout = None
+            error = traceback.format_exc()
+        timer.toc()
+        # scopes profiled in this worker, merged by the loader
+        if profiler.enabled:
+            records = profiler.collect()
+        else:
+            records = None
+        result_queue.put((slot, worker_id, layout, timer.diff, records, error))
+        iter += num_workers
+
+
+class DataLoader(object):
+    """Builds minibatches with data_layer.forward() in worker processes.
+
+    The arrays of a minibatch are written into one of queue_size slots of
+    shared memory. next() returns copies of them and hands the slot back
+    to the workers, so the arrays stay valid after they are fed to the
+    queue of the network. The slots are sized from a first
+    minibatch built in the calling process, a larger minibatch is sent
+    through the result queue instead. Worker k seeds numpy with seed + k
+    and then calls worker_init(data_layer, k). next() raises a
+    RuntimeError if a worker failed or died. With num_workers = 0 the
+    minibatches are built in the calling process.
+    """
+
+    def __init__(self, data_layer, num_workers=4, queue_size=8, seed=0, worker_init=None):
+        self._data_layer = data_layer
+        self._num_workers = num_workers
+        self._iter = 0
+        self._workers = []
+
+        # statistics
+        self._count = 0
+        self._ready = 0
+        self._build_time = np.zeros((max(num_workers, 1),), dtype=np.float64)
+        self._build_count = np.zeros((max(num_workers, 1),), dtype=np.int64)
+        self._t = {'wait' : Timer()}
+
+        if num_workers == 0:
+            self._first = None
+            return
+
+        # size the slots with the first minibatch
+        self._first = data_layer.forward(self._iter)
+        self._iter += 1
+        nbytes = sum(value.nbytes for value in self._first.itervalues() if isinstance(value, np.ndarray))
+        slot_bytes = int(1.25 * nbytes) + _ALIGN * len(self._first)
+        queue_size = max(queue_size, num_workers)
+        self._buffers = [np.frombuffer(multiprocessing.RawArray('b', slot_bytes), dtype=np.uint8) for i in xrange(queue_size)]
+        print 'data loader: {:d} workers, {:d} slots of {:.1f} MB'.format(num_workers, queue_size, slot_bytes / 1048576.0)
+
+        self._free_queue = multiprocessing.Queue()
+        self._result_queue = multiprocessing.Queue()
+        for slot in xrange(queue_size):
+            self._free_queue.put(slot)
+        for i in xrange(num_workers):
+            worker = multiprocessing.Process(target=_loader_worker, \
+                args=(data_layer, worker_init, i, num_workers, self._iter, seed + i, self._buffers, self._free_queue, self._result_queue))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def next(self):
+        """Return the blobs of the next minibatch."""
+        self._count += 1
+        if self._first is not None:
+            blobs = self._first
+            self._first = None
+            return blobs
+
+        if self._num_workers == 0:
+            self._t['wait'].tic()
+            blobs = self._data_layer.forward(self._iter)
+            self._iter += 1
+            self._build_time[0] += self._t['wait'].toc(average=False)
+            self._build_count[0] += 1
+            return blobs
+
+        self._ready += self._result_queue.qsize()
+        self._t['wait'].tic()
+        self._check_workers()
+        while True:
+            try:
+                slot, worker_id, layout, build_time, records, error = self._result_queue.get(timeout=1.0)
+                break
+            except Queue.Empty:
+                self._check_workers()
+        self._t['wait'].toc()
+        if error is not None:
+            self.close()
+            raise RuntimeError('data loader worker {} failed:\n{}'.format(worker_id, error))
+        self._build_time[worker_id] += build_time
+        self._build_count[worker_id] += 1
+        if records is not None:
+            profiler.merge(records)
+
+        blobs = _unpack(layout, self._buffers[slot])
+        self._free_queue.put(slot)
+        return blobs
+
+    def _check_workers(self):
+        # a worker killed by a crash or out of memory does not report, and its iterations are never built
+        for worker_id, worker in enumerate(self._workers):
+            if not worker.is_alive():
+                exitcode = worker.exitcode
+                self.close()
+                raise RuntimeError('data loader worker {} died with exit code {}'.format(worker_id, exitcode))
+
+    def close(self):
+        """Stop the worker processes."""
+        if not self._workers:
+            return
+        for worker in self._workers:
+            self._free_queue.put(None)
+        for worker in self._workers:
+            worker.join(1.0)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = []
+
+    def stats(self):
+        """Return the loading statistics of the minibatches so far."""
+        num = max(self._count, 1)
+        return {'minibatches': self._count,
+                'workers': self._num_workers,
+                'ready': float(self._ready) / num,
+                'wait': self._t['wait'].total_time / num,
+                'build': self._build_time / np.maximum(self._build_count, 1),
+                'built': self._build_count.copy()}
+
+    def report(self):
+        stats = self.stats()
+        print 'data loader: {:d} minibatches, {:d} workers, {:.2f} ready on average, feeder wait {:.3f}s/minibatch' \
+              .format(stats['minibatches'], stats['workers'], stats['ready'], stats['wait'])
+        for i in xrange(len(stats['build'])):
+            print '  worker {:d}: {:d} minibatches, {:.3f}s/minibatch'.format(i, stats['built'][i], stats['build'][i])
@@ -0,0 +1,57 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Files cached on disk and shared by processes.
+
+A cache file derived from a source file is named by a hash of the source
+path and is stale once the source is newer. Cache files are written to a
+temporary file and renamed, so the processes reading or building the same
+file concurrently (data loader workers, parallel tests) only ever see a
+complete file.
+"""
+
+import os
+import hashlib
+import numpy as np
+
+def makedirs(directory):
+    """create directory unless it exists, possibly created by another process meanwhile"""
+    if not os.path.exists(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+
+
+def cache_file(cache_dir, source_file, suffix='.npy'):
+    """path of the cache file of source_file in cache_dir"""
+    key = hashlib.md5(os.path.abspath(source_file)).hexdigest()
+    return os.path.join(cache_dir, key + suffix)
+
+
+def is_fresh(cache_file, source_file):
+    """whether cache_file exists and is not older than source_file"""
+    return os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(source_file)
+
+
+def write_atomic(filename, write):
+    """call write(path) on a temporary file next to filename and rename it to filename
+
+    The temporary file keeps the extension of filename, since np.save and
+    np.savez append theirs otherwise.
+    """
+    makedirs(os.path.dirname(filename))
+    base, ext = os.path.splitext(filename)
+    tmp_file = '{}.{}.tmp{}'.format(base, os.getpid(), ext)
+    write(tmp_file)
+    os.rename(tmp_file, filename)
+
+
+def save_npy(filename, data):
+    """np.save(filename, data) through write_atomic"""
+    write_atomic(filename, lambda path: np.save(path, data))
@@ -0,0 +1,149 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Prefetching frame reader for the test loops."""
+
+import multiprocessing
+import traceback
+import Queue
+import numpy as np
+import cv2
+from utils.timer import Timer
+
+def _reader_worker(read_frame, task_queue, result_queue, seed):
+    # the thread pool of cv2 does not survive the fork
+    cv2.setNumThreads(0)
+    np.random.seed(seed)
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        k, index = task
+        timer = Timer()
+        timer.tic()
+        try:
+            frame = read_frame(index)
+            error = None
+        except Exception:
+            frame = None
+            error = traceback.format_exc()
+        timer.toc()
+        result_queue.put((k, frame, timer.diff, error))
+
+
+class FrameReader(object):
+    """Reads frames ahead of the network with a pool of worker processes.
+
+    read_frame(index) is called in the workers for every index in indexes,
+    and the frames are returned by next() in the order of indexes. At most
+    queue_size frames are read ahead. next() raises a RuntimeError if a
+    frame cannot be read or a worker died. With num_workers = 0 the frames
+    are read in the calling process.
+    """
+
+    def __init__(self, read_frame, indexes, num_workers=2, queue_size=8, seed=0):
+        self._read_frame = read_frame
+        self._indexes = list(indexes)
+        self._num_workers = num_workers
+        self._queue_size = max(queue_size, num_workers, 1)
+        self._next_task = 0
+        self._next_frame = 0
+        self._buffer = {}
+        self._workers = []
+
+        # timers
+        self._t = {'read' : Timer(), 'wait' : Timer()}
+        self._read_time = 0.
+
+        if num_workers > 0:
+            self._task_queue = multiprocessing.Queue()
+            self._result_queue = multiprocessing.Queue()
+            for i in xrange(num_workers):
+                worker = multiprocessing.Process(target=_reader_worker, \
+                    args=(read_frame, self._task_queue, self._result_queue, seed + i))
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+            self._dispatch()
+
+    def __len__(self):
+        return len(self._indexes)
+
+    def __iter__(self):
+        return self
+
+    def _dispatch(self):
+        while self._next_task < len(self._indexes) and self._next_task - self._next_frame < self._queue_size:
+            self._task_queue.put((self._next_task, self._indexes[self._next_task]))
+            self._next_task += 1
+
+    def next(self):
+        """Return the next (index, frame) pair."""
+        if self._next_frame >= len(self._indexes):
+            self.close()
+            raise StopIteration
+
+        k = self._next_frame
+        index = self._indexes[k]
+        self._t['wait'].tic()
+        if self._num_workers == 0:
+            self._t['read'].tic()
+            frame = self._read_frame(index)
+            self._read_time += self._t['read'].toc(average=False)
+        else:
+            while k not in self._buffer:
+                try:
+                    j, frame, read_time, error = self._result_queue.get(timeout=1.0)
+                except Queue.Empty:
+                    self._check_workers()
+                    continue
+                if error is not None:
+                    self.close()
+                    raise RuntimeError('failed to read frame {}:\n{}'.format(self._indexes[j], error))
+                self._buffer[j] = frame
+                self._read_time += read_time
+            frame = self._buffer.pop(k)
+        self._t['wait'].toc()
+
+        self._next_frame += 1
+        if self._num_workers > 0:
+            self._dispatch()
+        return index, frame
+
+    def _check_workers(self):
+        # a worker killed by a crash or out of memory does not report, and its frames are never read
+        for worker_id, worker in enumerate(self._workers):
+            if not worker.is_alive():
+                exitcode = worker.exitcode
+                self.close()
+                raise RuntimeError('frame reader worker {} died with exit code {}'.format(worker_id, exitcode))
+
+    def close(self):
+        """Stop the worker processes."""
+        if not self._workers:
+            return
+        for worker in self._workers:
+            self._task_queue.put(None)
+        for worker in self._workers:
+            worker.join(1.0)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = []
+
+    def stats(self):
+        """Return the per stage time of the frames read so far."""
+        num = max(self._next_frame, 1)
+        return {'frames': self._next_frame,
+                'workers': self._num_workers,
+                'read': self._read_time / num,
+                'wait': self._t['wait'].total_time / num,
+                'wait_total': self._t['wait'].total_time}
+
+    def report(self):
+        stats = self.stats()
+        print 'frame reader: {:d} frames, {:d} workers, read {:.3f}s/frame, wait {:.3f}s/frame ({:.3f}s total)' \
+              .format(stats['frames'], stats['workers'], stats['read'], stats['wait'], stats['wait_total'])
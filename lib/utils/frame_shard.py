@@ -0,0 +1,160 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Packed shards of the frames of an image set.
+
+A shard is one flat file holding the decoded color, depth and label images
+of a range of frames back to back, optionally zlib compressed. An index
+file maps the image path of every frame in the roidb to its shard, the
+offset, size, shape and dtype of each of its images, and the parsed meta
+data fields, so reading a frame is a slice of a memory-mapped shard
+instead of several PNG decodes and a loadmat.
+"""
+
+import os
+import zlib
+import cPickle
+import numpy as np
+import cv2
+import scipy.io
+
+# meta data fields kept in the index
+META_KEYS = ('poses', 'cls_indexes', 'center', 'box', 'intrinsic_matrix', 'factor_depth')
+
+# alignment of the images in a shard
+_ALIGN = 64
+
+def _read_roidb_frame(entry, with_vertmap=False):
+    """the images and meta data of a roidb entry as read by the data layers"""
+    arrays = {}
+    arrays['image'] = cv2.imread(entry['image'], cv2.IMREAD_UNCHANGED)
+    if os.path.exists(entry['depth']):
+        arrays['depth'] = cv2.imread(entry['depth'], cv2.IMREAD_UNCHANGED)
+    arrays['label'] = cv2.imread(entry['label'], cv2.IMREAD_UNCHANGED)
+
+    meta_data = scipy.io.loadmat(entry['meta_data'])
+    if with_vertmap and 'vertmap' in meta_data:
+        arrays['vertmap'] = meta_data['vertmap'].astype(np.float32)
+    meta = {}
+    for key in META_KEYS:
+        if key in meta_data:
+            meta[key] = meta_data[key]
+    return arrays, meta
+
+
+def write_shards(roidb, index_file, frames_per_shard=1000, compress=False, with_vertmap=False):
+    """Pack the frames of a roidb into shards next to index_file."""
+    prefix = os.path.splitext(index_file)[0]
+    shards = []
+    frames = {}
+    # flipped entries share the images of their frame
+    paths = []
+    entries = {}
+    for entry in roidb:
+        if entry['image'] not in entries:
+            paths.append(entry['image'])
+            entries[entry['image']] = entry
+
+    fid = None
+    offset = 0
+    for i, path in enumerate(paths):
+        if i % frames_per_shard == 0:
+            if fid is not None:
+                fid.close()
+            filename = '{}_{:04d}.bin'.format(prefix, len(shards))
+            shards.append(os.path.basename(filename))
+            fid = open(filename, 'wb')
+            offset = 0
+            print 'writing shard {}'.format(filename)
+
+        arrays, meta = _read_roidb_frame(entries[path], with_vertmap)
+        records, offset = write_frame(fid, offset, arrays, compress)
+        frames[path] = {'shard': len(shards) - 1, 'arrays': records, 'meta_data': meta}
+    if fid is not None:
+        fid.close()
+
+    write_index(index_file, shards, frames)
+
+
+def write_frame(fid, offset, arrays, compress=False):
+    """Append the images of a frame at offset of an open shard.
+
+    Return the records of the images for the index and the offset after
+    the frame.
+    """
+    records = {}
+    for name, array in arrays.iteritems():
+        array = np.ascontiguousarray(array)
+        data = array.tostring()
+        if compress:
+            data = zlib.compress(data, 1)
+        records[name] = (offset, len(data), array.shape, array.dtype.str, compress)
+        padding = (_ALIGN - len(data) % _ALIGN) % _ALIGN
+        fid.write(data)
+        fid.write('\0' * padding)
+        offset += len(data) + padding
+    return records, offset
+
+
+def write_index(index_file, shards, frames):
+    """Write the index of the shard file names and the frames in them."""
+    with open(index_file, 'wb') as fid:
+        cPickle.dump({'shards': shards, 'frames': frames}, fid, cPickle.HIGHEST_PROTOCOL)
+    print 'wrote {} frames in {} shards to {}'.format(len(frames), len(shards), index_file)
+
+
+class ShardReader(object):
+    """Random access to the frames of the shards listed in an index file.
+
+    The shards are memory-mapped on first use in each process, so a reader
+    created before forking can be used by the worker processes. The images
+    returned are read-only.
+    """
+
+    def __init__(self, index_file):
+        with open(index_file, 'rb') as fid:
+            index = cPickle.load(fid)
+        root = os.path.dirname(os.path.abspath(index_file))
+        self._shards = [os.path.join(root, name) for name in index['shards']]
+        self._frames = index['frames']
+        self._maps = {}
+        self._pid = None
+        print '{} frames in {} shards loaded from {}'.format(len(self._frames), len(self._shards), index_file)
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, path):
+        return path in self._frames
+
+    def _map(self, k):
+        # memory maps are not shared with forked processes
+        if self._pid != os.getpid():
+            self._maps = {}
+            self._pid = os.getpid()
+        if k not in self._maps:
+            self._maps[k] = np.memmap(self._shards[k], dtype=np.uint8, mode='r')
+        return self._maps[k]
+
+    def read(self, path, names=None):
+        """Return the images and the meta data of the frame of the image path.
+
+        The images are in a dict keyed by 'image', 'depth', 'label' (and
+        'vertmap' if packed), the meta data is a new dict on every call.
+        """
+        frame = self._frames[path]
+        mm = self._map(frame['shard'])
+        arrays = {}
+        for name, (offset, nbytes, shape, dtype, compressed) in frame['arrays'].iteritems():
+            if names is not None and name not in names:
+                continue
+            data = mm[offset:offset + nbytes]
+            if compressed:
+                data = np.frombuffer(zlib.decompress(data.tostring()), dtype=np.uint8)
+            arrays[name] = data.view(dtype).reshape(shape)
+        meta_data = dict((key, value.copy()) for key, value in frame['meta_data'].iteritems())
+        return arrays, meta_data
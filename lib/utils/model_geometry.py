@@ -0,0 +1,75 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Binary cache of the object model points.
+
+Parsing the points.xyz text file of every model with np.loadtxt dominates
+the construction of an imdb. Each model is converted once to a float32 npy
+file in the cache directory and memory-mapped afterwards, the text file is
+parsed again only if it is newer than its cache. The extent and the diameter
+of a model can be computed from the cached points, the diameter is cached as
+well.
+"""
+
+import numpy as np
+from scipy import spatial
+from utils.file_cache import cache_file, is_fresh, save_npy
+
+def _max_distance(pts, block_size=1024):
+    """maximum distance between two of the points"""
+    dmax = 0.0
+    for start in xrange(0, pts.shape[0], block_size):
+        block = pts[start:start + block_size]
+        d = np.sum(block * block, axis=1)[:, np.newaxis] + np.sum(pts * pts, axis=1)[np.newaxis, :] \
+            - 2 * np.dot(block, pts.T)
+        dmax = max(dmax, d.max())
+    return np.sqrt(max(dmax, 0.0))
+
+
+class ModelGeometry(object):
+    """Memory-mapped points of the object models and their extents and diameters."""
+
+    def __init__(self, cache_dir):
+        self._cache_dir = cache_dir
+        self._files = []
+
+    @property
+    def files(self):
+        """the point files loaded so far, in order"""
+        return self._files
+
+    def points(self, point_file):
+        """Return the n x 3 float32 points of the model, memory-mapped copy-on-write."""
+        filename = cache_file(self._cache_dir, point_file)
+        if not is_fresh(filename, point_file):
+            pts = np.loadtxt(point_file, dtype=np.float32)
+            save_npy(filename, np.ascontiguousarray(pts[:, :3]))
+            print 'converted model points {} to {}'.format(point_file, filename)
+        if point_file not in self._files:
+            self._files.append(point_file)
+        return np.load(filename, mmap_mode='c')
+
+    def extent(self, point_file):
+        """Return the size of the bounding box of the model along x, y and z."""
+        pts = self.points(point_file)
+        return pts.max(axis=0) - pts.min(axis=0)
+
+    def diameter(self, point_file):
+        """Return the largest distance between two points of the model."""
+        filename = cache_file(self._cache_dir, point_file, '_diameter.npy')
+        if is_fresh(filename, point_file):
+            return float(np.load(filename))
+
+        pts = np.array(self.points(point_file), dtype=np.float64)
+        # the farthest points are vertices of the convex hull
+        try:
+            pts = pts[spatial.ConvexHull(pts).vertices]
+        except Exception:
+            pass
+        diameter = _max_distance(pts)
+        save_npy(filename, np.array(diameter))
+        return diameter
@@ -0,0 +1,120 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Cached nearest neighbor indexes of the object models for the ADI metric."""
+
+import os
+import hashlib
+import cPickle
+import numpy as np
+from scipy import spatial
+
+def _digest(pts):
+    pts = np.ascontiguousarray(pts, dtype=np.float64)
+    return hashlib.md5(pts.tostring()).hexdigest()
+
+
+class ModelIndex(object):
+    """One kd-tree per object model, built in model space and reused.
+
+    adi() in pose_error builds a kd-tree on the estimated model points for
+    every pose. Since the nearest neighbor distance is invariant to a rigid
+    transformation, the GT points can instead be brought into the model
+    frame of the estimate, q = R_est^T (R_gt p + t_gt - t_est), and queried
+    against a tree built once on the model points p. R_est must be a
+    rotation matrix. With cache_file, the trees are loaded from and saved
+    to that file.
+    """
+
+    def __init__(self, cache_file=None):
+        self._trees = {}
+        self._stored = {}
+        self._cache_file = cache_file
+        self._dirty = False
+        self._hits = 0
+        self._misses = 0
+        self._queries = 0
+
+        if cache_file is not None and os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'rb') as fid:
+                    self._stored = cPickle.load(fid)
+                print 'model index loaded from {}'.format(cache_file)
+            except Exception as e:
+                print 'failed to load model index from {}: {}'.format(cache_file, e)
+                self._stored = {}
+
+    def tree(self, key, pts):
+        """Return the kd-tree of the model points pts stored under key."""
+        tree = self._trees.get(key)
+        if tree is not None and tree.n == pts.shape[0]:
+            self._hits += 1
+            return tree
+
+        digest = _digest(pts)
+        if key in self._stored and self._stored[key][0] == digest:
+            tree = self._stored[key][1]
+            self._hits += 1
+        else:
+            tree = spatial.cKDTree(pts)
+            self._stored[key] = (digest, tree)
+            self._dirty = True
+            self._misses += 1
+        self._trees[key] = tree
+        return tree
+
+    def adi(self, key, R_est, t_est, R_gt, t_gt, pts):
+        """ADI error of one pose, see pose_error.adi()."""
+        e = self.adi_batch(key, R_est[np.newaxis], np.reshape(t_est, (1, 3)), \
+                           R_gt[np.newaxis], np.reshape(t_gt, (1, 3)), pts)
+        return e[0]
+
+    def adi_batch(self, key, R_est, t_est, R_gt, t_gt, pts, batch_size=128):
+        """
+        ADI errors of a batch of poses of the same object.
+
+        :param key: key of the object model, e.g. the class index.
+        :param R_est, t_est: Estimated poses (mx3x3 rot. matrices and mx3 trans. vectors).
+        :param R_gt, t_gt: GT poses (mx3x3 rot. matrices and mx3 trans. vectors).
+        :param pts: nx3 ndarray with 3D model points.
+        :param batch_size: number of poses queried at a time, bounds the memory use.
+        :return: m errors.
+        """
+        tree = self.tree(key, pts)
+        m = R_est.shape[0]
+        n = pts.shape[0]
+        e = np.zeros((m,), dtype=np.float64)
+        for start in xrange(0, m, batch_size):
+            end = min(start + batch_size, m)
+            # GT points in the model frame of the estimates
+            x = np.einsum('mij,nj->mni', R_gt[start:end], pts) + (t_gt[start:end] - t_est[start:end])[:, np.newaxis, :]
+            q = np.einsum('mni,mij->mnj', x, R_est[start:end])
+            nn_dists, _ = tree.query(q.reshape((-1, 3)), k=1)
+            e[start:end] = nn_dists.reshape((end - start, n)).mean(axis=1)
+            self._queries += end - start
+        return e
+
+    def save(self):
+        """Write the trees to the cache file if any has been built."""
+        if self._cache_file is None or not self._dirty:
+            return
+        with open(self._cache_file, 'wb') as fid:
+            cPickle.dump(self._stored, fid, cPickle.HIGHEST_PROTOCOL)
+        self._dirty = False
+        print 'wrote model index to {}'.format(self._cache_file)
+
+    def stats(self):
+        """Return the lookup statistics of the index."""
+        return {'hits': self._hits,
+                'misses': self._misses,
+                'queries': self._queries,
+                'models': len(self._trees)}
+
+    def report(self):
+        stats = self.stats()
+        print 'model index: {:d} poses, {:d} hits, {:d} misses, {:d} models' \
+              .format(stats['queries'], stats['hits'], stats['misses'], stats['models'])
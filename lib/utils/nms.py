@@ -1,6 +1,23 @@
 import numpy as np
+from fcn.config import cfg
 
 def nms(dets, thresh):
+    """Class-aware NMS of rois (batch, cls, x1, y1, x2, y2, score).
+
+    The implementation is selected by cfg.TEST.ROI_NMS.
+    """
+    if cfg.TEST.ROI_NMS == 'python':
+        return py_nms(dets, thresh)
+    elif cfg.TEST.ROI_NMS == 'numpy':
+        return vectorized_nms(dets, thresh)
+    elif cfg.TEST.ROI_NMS == 'cython':
+        from nms.cpu_roi_nms import cpu_roi_nms
+        return cpu_roi_nms(np.ascontiguousarray(dets, dtype=np.float32), thresh)
+    else:
+        raise ValueError('unknown roi nms: {}'.format(cfg.TEST.ROI_NMS))
+
+def py_nms(dets, thresh):
+    batch = dets[:, 0]
     cls = dets[:, 1]
     x1 = dets[:, 2]
     y1 = dets[:, 3]
@@ -25,8 +42,62 @@ def nms(dets, thresh):
         inter = w * h
         ovr = inter / (areas[i] + areas[order[1:]] - inter)
 
-        inds = np.where(~((ovr > thresh) & (cls[order[1:]] == cls[i])))[0]
+        inds = np.where(~((ovr > thresh) & (cls[order[1:]] == cls[i]) & (batch[order[1:]] == batch[i])))[0]
         #inds = np.where(ovr <= thresh)[0]
         order = order[inds + 1]
 
     return keep
+
+def vectorized_nms(dets, thresh, block_size=256):
+    """NMS of py_nms() with the overlaps computed a block of rois at a time.
+
+    Rois only suppress rois of the same image and class, so each
+    (batch, cls) group is processed on its own, in the score order of
+    py_nms(). Returns the same indexes in the same order.
+    """
+    if dets.shape[0] == 0:
+        return []
+    x1 = dets[:, 2]
+    y1 = dets[:, 3]
+    x2 = dets[:, 4]
+    y2 = dets[:, 5]
+    scores = dets[:, 6]
+
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+    order = scores.argsort()[::-1]
+
+    # (batch, cls) group of each roi in score order
+    cls = dets[order, 1] - dets[:, 1].min()
+    key = dets[order, 0] * (cls.max() + 1) + cls
+    _, groups = np.unique(key, return_inverse=True)
+    suppressed = np.zeros((dets.shape[0],), dtype=bool)
+    for g in xrange(groups.max() + 1):
+        inds = order[groups == g]
+        n = len(inds)
+        gx1 = x1[inds]
+        gy1 = y1[inds]
+        gx2 = x2[inds]
+        gy2 = y2[inds]
+        gareas = areas[inds]
+        gsuppressed = np.zeros((n,), dtype=bool)
+        for start in xrange(0, n, block_size):
+            end = min(start + block_size, n)
+            # overlaps between the rois of the block and all the lower scoring rois
+            xx1 = np.maximum(gx1[start:end, np.newaxis], gx1[np.newaxis, start:])
+            yy1 = np.maximum(gy1[start:end, np.newaxis], gy1[np.newaxis, start:])
+            xx2 = np.minimum(gx2[start:end, np.newaxis], gx2[np.newaxis, start:])
+            yy2 = np.minimum(gy2[start:end, np.newaxis], gy2[np.newaxis, start:])
+            w = np.maximum(0.0, xx2 - xx1 + 1)
+            h = np.maximum(0.0, yy2 - yy1 + 1)
+            inter = w * h
+            ovr = inter / (gareas[start:end, np.newaxis] + gareas[np.newaxis, start:] - inter)
+            overlapped = ovr > thresh
+
+            for i in xrange(start, end):
+                if gsuppressed[i]:
+                    continue
+                gsuppressed[i+1:] |= overlapped[i - start, i - start + 1:]
+        suppressed[inds] = gsuppressed
+
+    keep = order[~suppressed[order]]
+    return list(keep)
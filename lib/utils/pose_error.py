@@ -115,3 +115,55 @@ def te(t_est, t_gt):
     assert(t_est.size == t_gt.size == 3)
     error = np.linalg.norm(t_gt - t_est)
     return error
+
+def quat2mat_batch(q):
+    """
+    Rotation matrices of a batch of quaternions, as transforms3d.quaternions.quat2mat.
+
+    :param q: mx4 ndarray with quaternions (w, x, y, z).
+    :return: mx3x3 ndarray with rotation matrices.
+    """
+    q = np.asarray(q).reshape((-1, 4))
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    Nq = w*w + x*x + y*y + z*z
+    valid = Nq >= np.finfo(np.float64).eps
+    s = 2.0 / np.where(valid, Nq, 1.0)
+    X = x*s
+    Y = y*s
+    Z = z*s
+    wX = w*X; wY = w*Y; wZ = w*Z
+    xX = x*X; xY = x*Y; xZ = x*Z
+    yY = y*Y; yZ = y*Z; zZ = z*Z
+    R = np.empty((q.shape[0], 3, 3), dtype=q.dtype)
+    R[:, 0, 0] = 1.0 - (yY + zZ)
+    R[:, 0, 1] = xY - wZ
+    R[:, 0, 2] = xZ + wY
+    R[:, 1, 0] = xY + wZ
+    R[:, 1, 1] = 1.0 - (xX + zZ)
+    R[:, 1, 2] = yZ - wX
+    R[:, 2, 0] = xZ - wY
+    R[:, 2, 1] = yZ + wX
+    R[:, 2, 2] = 1.0 - (xX + yY)
+    R[~valid] = np.eye(3)
+    return R
+
+def add_batch(R_est, t_est, R_gt, t_gt, pts, batch_size=128):
+    """
+    ADD of a batch of poses of the same object, see add().
+
+    :param R_est, t_est: Estimated poses (mx3x3 rot. matrices and mx3 trans. vectors).
+    :param R_gt, t_gt: GT poses (mx3x3 rot. matrices and mx3 trans. vectors).
+    :param pts: nx3 ndarray with 3D model points.
+    :param batch_size: number of poses transformed at a time, bounds the memory use.
+    :return: m errors.
+    """
+    m = R_est.shape[0]
+    e = np.zeros((m,), dtype=np.float64)
+    for start in xrange(0, m, batch_size):
+        end = min(start + batch_size, m)
+        # R_est p + t_est - (R_gt p + t_gt) for all the points
+        dR = R_est[start:end] - R_gt[start:end]
+        dt = t_est[start:end] - t_gt[start:end]
+        d = np.einsum('mij,nj->mni', dR, pts) + dt[:, np.newaxis, :]
+        e[start:end] = np.sqrt((d * d).sum(axis=2)).mean(axis=1)
+    return e
@@ -0,0 +1,228 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Rois and poses of the objects of a video tracked across its frames.
+
+PoseTracker keeps the rois, poses and segmentation of the last frame of a
+video. The objects of a new frame are tracked if the same classes are
+segmented, the mask of every object overlaps its mask in the last frame by
+min_overlap and its model in the last pose fits the depth image within
+max_residual. Then the Hough voting of the frame is skipped, the rois are
+moved with the masks and the poses of the last frame start the ICP, objects
+fitting the depth within icp_residual keep their pose without ICP. Otherwise
+the objects are detected again.
+
+The depth residual of an object is the median absolute difference of the
+observed depth and the depth of its model rendered as a point z-buffer, over
+the pixels of the object with a depth.
+
+TrackingStats collects the cost of the pose estimation and the pose errors of
+the tracked and the detected frames.
+"""
+
+import numpy as np
+from transforms3d.quaternions import quat2mat
+from utils.pose_error import re, te
+
+def mask_overlap(mask, mask_prev):
+    """intersection over union of two boolean masks"""
+    union = np.count_nonzero(mask | mask_prev)
+    if union == 0:
+        return 0.0
+    return float(np.count_nonzero(mask & mask_prev)) / union
+
+
+def depth_residual(mask, depth, pose, points, intrinsic_matrix):
+    """median |observed depth - model depth| in meters over the pixels of mask, inf without enough pixels
+
+    depth is in meters with 0 for missing depth, pose is (quaternion, translation).
+    """
+    height, width = mask.shape
+    x3d = np.dot(points, quat2mat(pose[:4]).T) + pose[4:7]
+    z = x3d[:, 2]
+    front = z > 0
+    x2d = np.dot(x3d[front], intrinsic_matrix.T)
+    z = z[front]
+    u = np.round(x2d[:, 0] / x2d[:, 2]).astype(np.int64)
+    v = np.round(x2d[:, 1] / x2d[:, 2]).astype(np.int64)
+    inside = (u >= 0) & (u < width) & (v >= 0) & (v < height)
+    u = u[inside]
+    v = v[inside]
+    z = z[inside]
+
+    # nearest model point of each pixel
+    index = v * width + u
+    zbuffer = np.empty(height * width, dtype=np.float64)
+    zbuffer.fill(np.inf)
+    np.minimum.at(zbuffer, index, z)
+    index = np.unique(index)
+    observed = depth.ravel()[index]
+    valid = mask.ravel()[index] & (observed > 0)
+    if np.count_nonzero(valid) < 10:
+        return np.inf
+    return float(np.median(np.abs(observed[valid] - zbuffer[index[valid]])))
+
+
+def pose_errors(rois, poses, meta_data):
+    """mean rotation error in degrees and translation error in meters of the poses to the ground truth
+
+    Returns None if the meta data has no ground truth poses or no object is found.
+    """
+    if 'poses' not in meta_data or 'cls_indexes' not in meta_data:
+        return None
+    poses_gt = meta_data['poses']
+    if len(poses_gt.shape) == 2:
+        poses_gt = np.reshape(poses_gt, (3, 4, 1))
+    cls_indexes = meta_data['cls_indexes'].flatten()
+
+    errors = []
+    for j in xrange(len(cls_indexes)):
+        index = np.where(rois[:, 1] == cls_indexes[j])[0]
+        if len(index) == 0:
+            continue
+        pose = poses[index[0]]
+        errors.append((re(quat2mat(pose[:4]), poses_gt[:3, :3, j]), te(pose[4:7], poses_gt[:3, 3, j])))
+    if len(errors) == 0:
+        return None
+    return np.mean(errors, axis=0)
+
+
+class PoseTracker(object):
+    """The objects of the last frame of a video.
+
+    points are the model points of the classes (num_classes x num_points x 3),
+    num_points of them are used for the depth residuals.
+    """
+
+    def __init__(self, points, min_overlap, max_residual, icp_residual, min_pixels=100, num_points=500):
+        step = max(points.shape[1] // num_points, 1)
+        self.points = np.asarray(points[:, ::step, :], dtype=np.float64)
+        self.min_overlap = min_overlap
+        self.max_residual = max_residual
+        self.icp_residual = icp_residual
+        self.min_pixels = min_pixels
+        self.video_id = None
+        self.frame = None
+        self.reset()
+
+    def reset(self):
+        """forget the objects, the next frame is detected"""
+        self.labels = None
+        self.rois = None
+        self.poses = None
+
+    def start(self, video_id, frame):
+        """start a frame of video_id, the objects are forgotten unless it follows the last frame of the video"""
+        if video_id != self.video_id or self.frame is None or frame != self.frame + 1:
+            self.reset()
+        self.video_id = video_id
+        self.frame = frame
+
+    def track(self, labels, depth, intrinsic_matrix):
+        """rois, poses and depth residuals of the objects of the last frame in a frame
+
+        labels and depth (in meters) are the frame at the scale of the rois,
+        intrinsic_matrix is scaled too. Returns None if the objects are lost
+        and the frame has to be detected.
+        """
+        if self.rois is None or labels.shape != self.labels.shape:
+            return None
+
+        # the same objects are segmented
+        classes = set(int(c) for c in self.rois[:, 1])
+        cls_index, count = np.unique(labels, return_counts=True)
+        present = set(int(c) for c in cls_index[(count >= self.min_pixels) & (cls_index > 0)])
+        if present != classes:
+            return None
+
+        rois = self.rois.copy()
+        residuals = np.zeros((rois.shape[0],), dtype=np.float32)
+        for j in xrange(rois.shape[0]):
+            cls = int(rois[j, 1])
+            mask = labels == cls
+            mask_prev = self.labels == cls
+            if mask_overlap(mask, mask_prev) < self.min_overlap:
+                return None
+            residuals[j] = depth_residual(mask, depth, self.poses[j], self.points[cls], intrinsic_matrix)
+            if residuals[j] > self.max_residual:
+                return None
+
+            # move the roi with the center of the mask
+            y, x = np.nonzero(mask)
+            y_prev, x_prev = np.nonzero(mask_prev)
+            dx = x.mean() - x_prev.mean()
+            dy = y.mean() - y_prev.mean()
+            rois[j, 2:6] += [dx, dy, dx, dy]
+
+        return rois, self.poses.copy(), residuals
+
+    def update(self, labels, rois, poses):
+        """keep the labels, rois and final poses of a frame for the next frame"""
+        keep = np.where(rois[:, 1] > 0)[0]
+        if len(keep) == 0:
+            self.reset()
+            return
+        self.labels = labels.copy()
+        self.rois = rois[keep, :].copy()
+        self.poses = poses[keep, :].copy()
+
+
+class TrackingStats(object):
+    """Cost and accuracy of the pose estimation of the tracked and the detected frames.
+
+    The cost of a frame is the time spent after the segmentation: the Hough
+    voting, the tracking test and the ICP.
+    """
+
+    def __init__(self):
+        self.frames = []
+
+    def add(self, frame, tracked, seconds, icp_skipped=0, errors=None, errors_detected=None):
+        """record a frame, errors are the (rotation, translation) errors of its poses
+
+        errors_detected are the errors of the poses of a tracked frame when it is
+        detected again to audit the tracking.
+        """
+        self.frames.append((frame, tracked, seconds, icp_skipped, errors, errors_detected))
+
+    def frame_summary(self):
+        """one line of the last frame"""
+        frame, tracked, seconds, icp_skipped, errors, errors_detected = self.frames[-1]
+        line = 'frame {}: {} in {:.3f}s'.format(frame, 'tracked' if tracked else 'detected', seconds)
+        if tracked:
+            line += ', {} objects without icp'.format(icp_skipped)
+        if errors is not None:
+            line += ', error {:.2f}deg {:.4f}m'.format(errors[0], errors[1])
+        if errors_detected is not None:
+            line += ', detected {:.2f}deg {:.4f}m'.format(errors_detected[0], errors_detected[1])
+        return line
+
+    def report(self):
+        if len(self.frames) == 0:
+            return
+        tracked = [f for f in self.frames if f[1]]
+        detected = [f for f in self.frames if not f[1]]
+        print 'tracking: {} frames, {} tracked, {} detected'.format(len(self.frames), len(tracked), len(detected))
+        for name, frames in [('tracked', tracked), ('detected', detected)]:
+            if len(frames) == 0:
+                continue
+            line = '{:>9s}: {:.3f}s per frame'.format(name, np.mean([f[2] for f in frames]))
+            errors = [f[4] for f in frames if f[4] is not None]
+            if len(errors) > 0:
+                errors = np.mean(errors, axis=0)
+                line += ', error {:.2f}deg {:.4f}m'.format(errors[0], errors[1])
+            print line
+        if len(tracked) > 0 and len(detected) > 0:
+            saved = np.mean([f[2] for f in detected]) - np.mean([f[2] for f in tracked])
+            print 'saved {:.3f}s per tracked frame, {:.1f}s in total, {} objects without icp' \
+                .format(saved, saved * len(tracked), sum(f[3] for f in tracked))
+
+        # the tracked poses against the detected poses of the same frames
+        audited = [f for f in tracked if f[4] is not None and f[5] is not None]
+        if len(audited) > 0:
+            delta = np.mean([f[4] for f in audited], axis=0) - np.mean([f[5] for f in audited], axis=0)
+            print 'tracked - detected error on {} audited frames: {:+.2f}deg {:+.4f}m'.format(len(audited), delta[0], delta[1])
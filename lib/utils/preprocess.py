@@ -0,0 +1,140 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Blob images of the color, depth and normal images fed to the networks.
+
+Single frame testing, the ros node and the training minibatches build their
+blob images here. A blob image is the float32 image minus cfg.PIXEL_MEANS,
+resized by the scale of the path. A depth image is first scaled to 0-255
+and repeated over the 3 channels. The scaling uses a fixed maximum depth at
+test time and the maximum of the image in training.
+
+Each path selects a method in cfg.PREPROCESS:
+- 'reference' runs the separate numpy steps the paths used before.
+- 'fused' converts from uint8 and subtracts the means in one pass into one
+  new array. A depth image is resized before it is repeated over the
+  channels, and flipping is a view read by the conversion. The result equals
+  'reference' up to float rounding.
+- 'uint8' is 'fused' but resizes a color image before its conversion. This
+  rounds the resized pixels to integers.
+tools/test_preprocess.py compares the methods and times them per frame.
+"""
+
+import numpy as np
+import cv2
+from fcn.config import cfg
+
+METHODS = ('reference', 'fused', 'uint8')
+
+def _pixel_means():
+    return np.asarray(cfg.PIXEL_MEANS, dtype=np.float32).reshape((3,))
+
+
+def _resize(im, im_scale):
+    if im_scale == 1.0:
+        return im
+    return cv2.resize(im, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
+
+
+def color_blobs(im, im_scales, flip=False, method='fused'):
+    """blob images of a BGR image (or a normal image) at each scale of im_scales
+
+    The image is converted once and resized from the full resolution to
+    every scale.
+    """
+    if flip:
+        im = im[:, ::-1, :]
+
+    if method == 'reference':
+        im_orig = im.astype(np.float32, copy=True)
+        im_orig -= cfg.PIXEL_MEANS
+        return [_resize(im_orig, im_scale) for im_scale in im_scales]
+
+    means = _pixel_means()
+    if method == 'uint8':
+        im = np.ascontiguousarray(im)
+        return [np.subtract(_resize(im, im_scale), means, dtype=np.float32) for im_scale in im_scales]
+
+    im_orig = np.subtract(im, means, dtype=np.float32)
+    return [_resize(im_orig, im_scale) for im_scale in im_scales]
+
+
+def color_blob(im, im_scale=1.0, flip=False, method='fused'):
+    """blob image of a BGR image (or a normal image)"""
+    return color_blobs(im, [im_scale], flip, method)[0]
+
+
+def depth_blobs(im_depth, im_scales, flip=False, depth_max=2000.0, method='fused'):
+    """blob images of a depth image at each scale of im_scales
+
+    The depth is scaled from 0-depth_max to 0-255, values above depth_max
+    are clipped. If depth_max is None, the maximum of the image is used.
+    An empty depth image (depth_max <= 0) gives the blob of zero depth.
+    """
+    if depth_max is None:
+        depth_max = float(im_depth.max())
+    if depth_max <= 0:
+        depth = np.zeros(im_depth.shape[:2], dtype=np.float32)
+        means = _pixel_means()
+        return [np.subtract(_resize(depth, im_scale)[:, :, np.newaxis], means) for im_scale in im_scales]
+    if flip:
+        im_depth = im_depth[:, ::-1]
+
+    if method == 'reference':
+        depth = im_depth.astype(np.float32)
+        depth /= depth_max
+        np.clip(depth, 0, 1, out=depth)
+        depth *= 255
+        im_orig = np.empty((depth.shape[0], depth.shape[1], 3), dtype=np.float32)
+        im_orig[:] = depth[:, :, np.newaxis]
+        im_orig -= cfg.PIXEL_MEANS
+        return [_resize(im_orig, im_scale) for im_scale in im_scales]
+
+    # one channel until the means are subtracted
+    depth = np.multiply(im_depth, np.float32(255.0 / depth_max), dtype=np.float32)
+    np.minimum(depth, 255, out=depth)
+    means = _pixel_means()
+    return [np.subtract(_resize(depth, im_scale)[:, :, np.newaxis], means) for im_scale in im_scales]
+
+
+def depth_blob(im_depth, im_scale=1.0, flip=False, depth_max=2000.0, method='fused'):
+    """blob image of a depth image"""
+    return depth_blobs(im_depth, [im_scale], flip, depth_max, method)[0]
+
+
+def frame_blobs(im, im_depth, meta_data, im_scale, method, depth_max=2000.0):
+    """color, depth and normal blobs (1 x height x width x 3) of a test frame
+
+    The color blob is always built since the callers take the blob size
+    from it. The depth and normal blobs are only built if cfg.INPUT feeds
+    them to the network, otherwise they are []. The normal image needs the
+    intrinsic matrix and the depth factor of meta_data.
+    """
+    from normals.normal_image import normal_image
+
+    # mask the color image according to depth
+    if cfg.EXP_DIR == 'rgbd_scene':
+        im = im.copy()
+        im[im_depth == 0] = 0
+    blob = color_blob(im, im_scale, method=method)[np.newaxis, :, :, :]
+
+    blob_depth = []
+    if cfg.INPUT == 'DEPTH' or cfg.INPUT == 'RGBD':
+        blob_depth = depth_blob(im_depth, im_scale, depth_max=depth_max, method=method)[np.newaxis, :, :, :]
+
+    blob_normal = []
+    if cfg.INPUT == 'NORMAL':
+        K = meta_data['intrinsic_matrix']
+        fx = np.float32(K[0, 0])
+        fy = np.float32(K[1, 1])
+        cx = np.float32(K[0, 2])
+        cy = np.float32(K[1, 2])
+        depth = np.divide(im_depth, float(meta_data['factor_depth']), dtype=np.float32)
+        im_normal = normal_image(depth, fx, fy, cx, cy)
+        blob_normal = color_blob(im_normal, im_scale, method=method)[np.newaxis, :, :, :]
+
+    return blob, blob_depth, blob_normal
@@ -0,0 +1,105 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Per frame test results in an append-only SQLite database.
+
+A frame is one row holding its result arrays (labels, rois, poses, refined
+poses, ...) as a compressed npz blob. Each row is committed when it is
+added, so a test run that stops keeps the frames done so far and a rerun can
+skip them. A store opened with a key, the hash of the config the results
+depend on, drops the results written with another key, so a rerun with
+another config never mixes old and new frames. The store is indexed like
+the list of results it replaces,
+store[i] is the dict of frame i or [] if frame i has no result, and frames
+are read one at a time, so the evaluators never hold all the results in
+memory.
+"""
+
+import io
+import os
+import sqlite3
+import numpy as np
+
+class ResultsStore(object):
+    """Results of the test frames, keyed by frame index.
+
+    The database connection is opened on first use in each process, so a
+    store can be read by processes forked after it was created. If key is
+    given and the stored results were written with another key (or with
+    none), they are deleted and the store starts empty.
+    """
+
+    def __init__(self, filename, key=None):
+        self._filename = filename
+        self._conn = None
+        self._pid = None
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS results (frame INTEGER PRIMARY KEY, data BLOB)')
+        conn.execute('CREATE TABLE IF NOT EXISTS config (key TEXT)')
+        if key is not None:
+            row = conn.execute('SELECT key FROM config').fetchone()
+            stored = row[0] if row is not None else None
+            if stored != key:
+                if len(self) > 0:
+                    print 'results store {} was written with another config, starting over'.format(filename)
+                    conn.execute('DELETE FROM results')
+                conn.execute('DELETE FROM config')
+                conn.execute('INSERT INTO config (key) VALUES (?)', (key,))
+        conn.commit()
+        print '{} frames in results store {}'.format(len(self), filename)
+
+    def _connect(self):
+        # connections are not shared with forked processes
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self._filename, timeout=60)
+            self._pid = os.getpid()
+        return self._conn
+
+    def __len__(self):
+        """the number of frames with a result"""
+        return self._connect().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def __contains__(self, i):
+        return self._connect().execute('SELECT 1 FROM results WHERE frame = ?', (int(i),)).fetchone() is not None
+
+    def __getitem__(self, i):
+        row = self._connect().execute('SELECT data FROM results WHERE frame = ?', (int(i),)).fetchone()
+        if row is None:
+            return []
+        data = np.load(io.BytesIO(bytes(row[0])))
+        result = dict((key, data[key]) for key in data.files)
+        data.close()
+        return result
+
+    def __iter__(self):
+        """the results of frames 0 to the last frame stored, [] for the frames without one, like the list"""
+        frames = self.frames()
+        stored = set(frames)
+        for i in xrange(frames[-1] + 1 if frames else 0):
+            yield self[i] if i in stored else []
+
+    def frames(self):
+        """the indexes of the frames with a result, in order"""
+        return [row[0] for row in self._connect().execute('SELECT frame FROM results ORDER BY frame')]
+
+    def put(self, i, result):
+        """Store the result dict of frame i, replacing an earlier one."""
+        buf = io.BytesIO()
+        np.savez_compressed(buf, **dict((key, np.asarray(value)) for key, value in result.iteritems()))
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO results (frame, data) VALUES (?, ?)', (int(i), sqlite3.Binary(buf.getvalue())))
+        conn.commit()
+
+    def export_mat(self, mat_dir, pattern='%06d.mat'):
+        """Write the result of each frame to a .mat file in mat_dir, for the matlab evaluation."""
+        import scipy.io
+        if not os.path.exists(mat_dir):
+            os.makedirs(mat_dir)
+        frames = self.frames()
+        for i in frames:
+            scipy.io.savemat(os.path.join(mat_dir, pattern % i), self[i], do_compression=True)
+        print 'wrote {} results to {}'.format(len(frames), mat_dir)
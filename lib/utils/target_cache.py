@@ -0,0 +1,85 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Cache of the training targets of real frames.
+
+The label image, vertex targets, pose rows, boxes and camera parameters of a
+real frame only depend on its annotation, the image scale and the config,
+not on the augmentation of the color image. They are computed the first time
+a frame is used and stored as one compressed npz file per roidb index and
+scale, in a directory named by a hash of everything else they depend on.
+"""
+
+import os
+import hashlib
+import numpy as np
+from utils.file_cache import makedirs, write_atomic
+
+# bump when the layout of the records changes
+_VERSION = 1
+
+def config_key(*values):
+    """Return a short hash of values (numbers, strings, arrays or sequences of them)."""
+    md5 = hashlib.md5()
+    md5.update(str(_VERSION))
+    for value in values:
+        if isinstance(value, np.ndarray):
+            md5.update(str(value.dtype) + str(value.shape))
+            md5.update(np.ascontiguousarray(value).tostring())
+        else:
+            md5.update(repr(value))
+    return md5.hexdigest()[:12]
+
+
+def _source_mtimes(entry):
+    mtimes = []
+    for name in ('label', 'meta_data'):
+        try:
+            mtimes.append(os.path.getmtime(entry[name]))
+        except (KeyError, OSError):
+            mtimes.append(0.0)
+    return np.array(mtimes, dtype=np.float64)
+
+
+class TargetCache(object):
+    """Per frame training targets on disk, built lazily.
+
+    A record is a dict of arrays. It is dropped and rebuilt if the image path
+    stored with it differs from the roidb entry, or if the label image or the
+    meta data file changed since it was written. The records of another
+    config are in another directory and never read.
+    """
+
+    def __init__(self, root, key):
+        self._dir = os.path.join(root, key)
+        makedirs(self._dir)
+        print 'target cache in {}'.format(self._dir)
+
+    def _filename(self, index, scale):
+        return os.path.join(self._dir, '{:06d}_{:.4f}.npz'.format(index, scale))
+
+    def load(self, index, scale, entry):
+        """Return the record of roidb entry index at scale, None if not cached or stale."""
+        filename = self._filename(index, scale)
+        record = None
+        if os.path.exists(filename):
+            try:
+                data = np.load(filename)
+                record = dict((key, data[key]) for key in data.files)
+                data.close()
+            except Exception:
+                record = None
+        if record is not None and (str(record.pop('image')) != entry['image'] or \
+            not np.array_equal(record.pop('mtimes'), _source_mtimes(entry))):
+            record = None
+        return record
+
+    def save(self, index, scale, entry, record):
+        """Store the record of roidb entry index at scale."""
+        # the workers of the data loader may race on a frame
+        write_atomic(self._filename(index, scale), lambda path: \
+            np.savez_compressed(path, image=np.array(entry['image']), mtimes=_source_mtimes(entry), **record))
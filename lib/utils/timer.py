@@ -5,7 +5,11 @@
 # Written by Ross Girshick
 # --------------------------------------------------------
 
+import os
 import time
+import json
+import threading
+import numpy as np
 
 class Timer(object):
     """A simple timer."""
@@ -30,3 +34,156 @@ class Timer(object):
             return self.average_time
         else:
             return self.diff
+
+
+class _NullScope(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+_NULL_SCOPE = _NullScope()
+
+
+class _Scope(object):
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._profiler.tic(self._name)
+        return self
+
+    def __exit__(self, *args):
+        self._profiler.toc(self._name)
+        return False
+
+
+class Profiler(object):
+    """A hierarchical timer of named scopes.
+
+    Scopes opened with tic(name) / toc(name) or "with scope(name)" nest
+    within the scopes open in the same thread, and are recorded under
+    their path, e.g. 'frame/forward'. stats() gives the count, total,
+    mean, p50, p90, p99 and max time of every path, and the scopes can be
+    saved as JSON and as a Chrome trace (chrome://tracing). A disabled
+    profiler records nothing.
+    """
+
+    def __init__(self, enabled=False, max_events=1000000):
+        self.enabled = enabled
+        self._max_events = max_events
+        self._local = threading.local()
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self._samples = {}
+        self._events = []
+        self._start = time.time()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def tic(self, name):
+        if not self.enabled:
+            return
+        stack = self._stack()
+        if stack:
+            path = stack[-1][0] + '/' + name
+        else:
+            path = name
+        stack.append((path, time.time()))
+
+    def toc(self, name):
+        if not self.enabled:
+            return
+        end = time.time()
+        stack = self._stack()
+        # scopes opened before the profiler was enabled
+        if not stack or stack[-1][0].split('/')[-1] != name:
+            return
+        path, start = stack.pop()
+        self._samples.setdefault(path, []).append(end - start)
+        if len(self._events) < self._max_events:
+            self._events.append((path, start, end - start, os.getpid(), threading.current_thread().ident))
+
+    def scope(self, name):
+        """Return a context manager timing the scope name."""
+        if not self.enabled:
+            return _NULL_SCOPE
+        return _Scope(self, name)
+
+    def collect(self):
+        """Return and clear the records, to be merged into another profiler."""
+        records = (self._samples, self._events)
+        self._samples = {}
+        self._events = []
+        return records
+
+    def merge(self, records):
+        """Add the records collected by another profiler, e.g. of a worker process."""
+        samples, events = records
+        for path, times in samples.iteritems():
+            self._samples.setdefault(path, []).extend(times)
+        self._events.extend(events[:max(self._max_events - len(self._events), 0)])
+
+    def stats(self):
+        """Return the statistics of every scope path."""
+        stats = {}
+        for path, times in self._samples.iteritems():
+            times = np.array(times)
+            p50, p90, p99 = np.percentile(times, [50, 90, 99])
+            stats[path] = {'calls': len(times),
+                           'total': times.sum(),
+                           'mean': times.mean(),
+                           'p50': p50,
+                           'p90': p90,
+                           'p99': p99,
+                           'max': times.max()}
+        return stats
+
+    def report(self):
+        stats = self.stats()
+        if not stats:
+            return
+        print '{:40s} {:>8s} {:>10s} {:>8s} {:>8s} {:>8s} {:>8s} {:>8s}' \
+              .format('scope', 'calls', 'total(s)', 'mean', 'p50', 'p90', 'p99', 'max')
+        for path in sorted(stats.keys()):
+            s = stats[path]
+            name = '  ' * path.count('/') + path.split('/')[-1]
+            print '{:40s} {:8d} {:10.3f} {:8.4f} {:8.4f} {:8.4f} {:8.4f} {:8.4f}' \
+                  .format(name, s['calls'], s['total'], s['mean'], s['p50'], s['p90'], s['p99'], s['max'])
+
+    def save_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.stats(), f, indent=2, sort_keys=True)
+
+    def save_chrome_trace(self, filename):
+        events = []
+        for path, start, duration, pid, tid in self._events:
+            events.append({'name': path.split('/')[-1], 'cat': path, 'ph': 'X',
+                           'ts': (start - self._start) * 1e6, 'dur': duration * 1e6,
+                           'pid': pid, 'tid': tid})
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': events}, f)
+
+    def save(self, output_dir, prefix='profile'):
+        """Save the statistics and the trace of the scopes into output_dir."""
+        if not self._samples:
+            return
+        self.save_json(os.path.join(output_dir, prefix + '.json'))
+        self.save_chrome_trace(os.path.join(output_dir, prefix + '_trace.json'))
+        print 'wrote profile to {}'.format(os.path.join(output_dir, prefix + '.json'))
+
+# the profiler of the test and training loops, enabled with cfg.PROFILE
+profiler = Profiler()
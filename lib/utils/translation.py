@@ -0,0 +1,172 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Translations of detected objects from their 2D boxes and rotations.
+
+The object center is on the ray through the center of its box, the depth z
+along the ray is chosen so that the box of the projected model has the width
+and height of the detected box. translations_nelder_mead searches z with
+scipy's Nelder-Mead for each detection. translations_gauss_newton starts from
+the closed form weak perspective depth and refines the depths of all the
+detections together with Gauss-Newton steps. It projects only the vertices
+of the convex hull of each model, the box of the projected hull is the box
+of the projected model.
+"""
+
+import numpy as np
+from scipy import spatial
+from scipy.optimize import minimize
+from transforms3d.quaternions import quat2mat
+from utils.pose_error import quat2mat_batch
+
+def distance_objective(x, rx, ry, quaternion, cls, points, intrinsic_matrix, width, height):
+
+    x3d = np.ones((4, points.shape[1]), dtype=np.float32)
+    x3d[0, :] = points[cls,:,0]
+    x3d[1, :] = points[cls,:,1]
+    x3d[2, :] = points[cls,:,2]
+
+    # projection
+    RT = np.zeros((3, 4), dtype=np.float32)
+    RT[:3, :3] = quat2mat(quaternion)
+    RT[0, 3] = rx * x
+    RT[1, 3] = ry * x
+    RT[2, 3] = x
+    x2d = np.matmul(intrinsic_matrix, np.matmul(RT, x3d))
+    x2d[0, :] = np.divide(x2d[0, :], x2d[2, :])
+    x2d[1, :] = np.divide(x2d[1, :], x2d[2, :])
+
+    # bounding box
+    x1 = np.min(x2d[0, :])
+    x2 = np.max(x2d[0, :])
+    y1 = np.min(x2d[1, :])
+    y2 = np.max(x2d[1, :])
+    w = x2 - x1
+    h = y2 - y1
+
+    return (w - width) * (w - width) + (h - height) * (h - height)
+
+
+def translations_nelder_mead(dets, poses, points, intrinsic_matrix):
+    """Set the translations poses[:, 4:7] of the detections dets (cls, x1, y1, x2, y2, score)."""
+
+    fx = intrinsic_matrix[0, 0]
+    fy = intrinsic_matrix[1, 1]
+    cx = intrinsic_matrix[0, 2]
+    cy = intrinsic_matrix[1, 2]
+    num = dets.shape[0]
+    # for each object
+    for i in xrange(num):
+        cls = int(dets[i, 0])
+        # object center
+        x = (dets[i, 1] + dets[i, 3]) / 2
+        y = (dets[i, 2] + dets[i, 4]) / 2
+        width = dets[i, 3] - dets[i, 1]
+        height = dets[i, 4] - dets[i, 2]
+        # backprojection
+        rx = (x - cx) / fx;
+        ry = (y - cy) / fy;
+        x0 = 0.5
+        d = minimize(distance_objective, x0, method='nelder-mead', args=(rx, ry, poses[i,:4], cls, points, intrinsic_matrix, width, height))
+        poses[i, 4] = rx * d.x
+        poses[i, 5] = ry * d.x
+        poses[i, 6] = d.x
+
+    return poses
+
+
+# convex hull vertices of the models of a points array, keyed by its id.
+# The array is kept with its hulls so the id is not reused.
+_hulls = {}
+
+def _hull_points(points):
+    """num_classes x m x 3 array of the convex hull vertices of the models, padded with repeated vertices"""
+    key = id(points)
+    if key not in _hulls or _hulls[key][0] is not points:
+        vertices = []
+        for cls in xrange(points.shape[0]):
+            pts = np.asarray(points[cls], dtype=np.float64)
+            try:
+                pts = pts[spatial.ConvexHull(pts).vertices]
+            except Exception:
+                # flat or degenerate model
+                pass
+            vertices.append(pts)
+        m = max(pts.shape[0] for pts in vertices)
+        hulls = np.zeros((points.shape[0], m, 3), dtype=np.float64)
+        for cls, pts in enumerate(vertices):
+            # repeated points do not change the box
+            hulls[cls] = pts[np.arange(m) % pts.shape[0]]
+        _hulls[key] = (points, hulls)
+    return _hulls[key][1]
+
+
+def _projected_boxes(P, rx, ry, z, fx, fy):
+    """widths, heights and their derivatives in z of the boxes of the rotated points P at depths z"""
+    d = P[:, :, 2] + z[:, np.newaxis]
+    u = fx * (P[:, :, 0] + rx[:, np.newaxis] * z[:, np.newaxis]) / d
+    v = fy * (P[:, :, 1] + ry[:, np.newaxis] * z[:, np.newaxis]) / d
+    du = fx * (rx[:, np.newaxis] * P[:, :, 2] - P[:, :, 0]) / (d * d)
+    dv = fy * (ry[:, np.newaxis] * P[:, :, 2] - P[:, :, 1]) / (d * d)
+
+    rows = np.arange(P.shape[0])
+    umax = np.argmax(u, axis=1)
+    umin = np.argmin(u, axis=1)
+    vmax = np.argmax(v, axis=1)
+    vmin = np.argmin(v, axis=1)
+    w = u[rows, umax] - u[rows, umin]
+    h = v[rows, vmax] - v[rows, vmin]
+    dw = du[rows, umax] - du[rows, umin]
+    dh = dv[rows, vmax] - dv[rows, vmin]
+    return w, h, dw, dh
+
+
+def translations_gauss_newton(dets, poses, points, intrinsic_matrix, num_iterations=20, tolerance=1e-6):
+    """Set the translations poses[:, 4:7] of the detections dets (cls, x1, y1, x2, y2, score)."""
+
+    num = dets.shape[0]
+    if num == 0:
+        return poses
+
+    fx = intrinsic_matrix[0, 0]
+    fy = intrinsic_matrix[1, 1]
+    cx = intrinsic_matrix[0, 2]
+    cy = intrinsic_matrix[1, 2]
+    cls = dets[:, 0].astype(np.int64)
+    width = dets[:, 3] - dets[:, 1]
+    height = dets[:, 4] - dets[:, 2]
+    # backprojection of the box centers
+    rx = ((dets[:, 1] + dets[:, 3]) / 2 - cx) / fx
+    ry = ((dets[:, 2] + dets[:, 4]) / 2 - cy) / fy
+
+    # hull points in the camera orientation
+    R = quat2mat_batch(np.asarray(poses[:, :4], dtype=np.float64))
+    P = np.einsum('nij,nmj->nmi', R, _hull_points(points)[cls])
+
+    # weak perspective: the box size is f * model size / z
+    a = fx * (P[:, :, 0].max(axis=1) - P[:, :, 0].min(axis=1))
+    b = fy * (P[:, :, 1].max(axis=1) - P[:, :, 1].min(axis=1))
+    s = (a * width + b * height) / np.maximum(a * a + b * b, 1e-12)
+    z = np.where(s > 0, 1.0 / np.maximum(s, 1e-12), 0.5)
+
+    # the points stay in front of the camera
+    z_min = -P[:, :, 2].min(axis=1) + 1e-3
+    z = np.maximum(z, z_min)
+    for _ in xrange(num_iterations):
+        w, h, dw, dh = _projected_boxes(P, rx, ry, z, fx, fy)
+        jj = dw * dw + dh * dh
+        step = np.where(jj > 0, (dw * (w - width) + dh * (h - height)) / np.maximum(jj, 1e-12), 0)
+        z_new = np.maximum(z - step, 0.5 * (z + z_min))
+        converged = np.all(np.abs(z_new - z) <= tolerance * z)
+        z = z_new
+        if converged:
+            break
+
+    poses[:, 4] = rx * z
+    poses[:, 5] = ry * z
+    poses[:, 6] = z
+    return poses
@@ -0,0 +1,143 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Vertex regression targets computed for all object instances at once.
+
+Every labeled pixel is mapped to the instance it votes for through a lookup
+table indexed by the label (and the instance mask with multiple instances of
+a class), so the center directions, depths and scaled vertex coordinates of
+all instances are gathered and written through flat indices into the blobs
+in one pass instead of a pass over the image per class.
+"""
+
+import numpy as np
+
+def _pixel_instances(im_label, cls_indexes, num_classes, mask=None, mask_indexes=None):
+    """Return the pixels y, x voting for an instance and the instance index k.
+
+    Without a mask the pixels of class c vote for the instance of class c in
+    cls_indexes. With a mask the pixels of instance i are those of class
+    cls_indexes[i] with mask value mask_indexes[i] + 1, the last instance wins
+    if several have the same class and mask value.
+    """
+    cls_indexes = np.asarray(cls_indexes).flatten().astype(np.int64)
+    num_labels = max(int(im_label.max()) + 1, num_classes)
+    if mask is None or len(mask) == 0:
+        lut = -np.ones((num_labels,), dtype=np.int64)
+        for i in xrange(len(cls_indexes)):
+            if 0 < cls_indexes[i] < num_classes:
+                lut[cls_indexes[i]] = i
+        instances = lut[im_label]
+    else:
+        mask_indexes = np.asarray(mask_indexes).flatten().astype(np.int64)
+        num_masks = int(mask.max()) + 1
+        lut = -np.ones((num_masks * num_labels,), dtype=np.int64)
+        for i in xrange(len(cls_indexes)):
+            if 0 < cls_indexes[i] < num_classes and mask_indexes[i] + 1 < num_masks:
+                lut[(mask_indexes[i] + 1) * num_labels + cls_indexes[i]] = i
+        instances = lut[mask.astype(np.int64) * num_labels + im_label]
+
+    y, x = np.nonzero(instances >= 0)
+    return y, x, instances[y, x], cls_indexes
+
+
+def _center_directions(y, x, k, centers):
+    """unit vectors from the pixels to the centers of their instances"""
+    c = centers.astype(np.float32)[k]
+    dx = c[:, 0] - x
+    dy = c[:, 1] - y
+    N = np.sqrt(dx * dx + dy * dy) + 1e-10
+    return dx / N, dy / N
+
+
+def _scale_coefficients(extents, num_classes):
+    """per class a, b mapping the vertex coordinates into [0, 1] as a * v + b"""
+    extents = np.asarray(extents, dtype=np.float64)[:num_classes, :]
+    a = np.zeros(extents.shape, dtype=np.float64)
+    b = np.zeros(extents.shape, dtype=np.float64)
+    I = extents > 0
+    a[I] = 1.0 / extents[I]
+    b[I] = 0.5
+    return a.astype(np.float32), b.astype(np.float32)
+
+
+def generate_vertex_targets(im_label, cls_indexes, centers, poses, num_classes, vertmap=None, extents=None, \
+    mask=None, mask_indexes=None, vertex_targets=None, vertex_weights=None, \
+    reg_2d=True, reg_3d=False, weight_inside=1.0, log_depth=True):
+    """Compute the vertex targets and weights of a label image.
+
+    The targets have 3 channels per class: the unit direction to the object
+    center and the (log) depth of the object with reg_2d, and the vertex
+    coordinates of vertmap scaled by the extents to [0, 1] with reg_3d,
+    written back into vertmap. vertex_targets and vertex_weights are filled
+    in place if given and have to be contiguous.
+    """
+    height = im_label.shape[0]
+    width = im_label.shape[1]
+    if vertex_targets is None:
+        vertex_targets = np.zeros((height, width, 3 * num_classes), dtype=np.float32)
+    if vertex_weights is None:
+        vertex_weights = np.zeros((height, width, 3 * num_classes), dtype=np.float32)
+
+    y, x, k, cls_indexes = _pixel_instances(im_label, cls_indexes, num_classes, mask, mask_indexes)
+    if len(k) == 0:
+        return vertex_targets, vertex_weights
+    cls = cls_indexes[k]
+    # flat index of the first channel of the class of every pixel
+    index = (y * width + x) * (3 * num_classes) + 3 * cls
+    if not (vertex_targets.flags.c_contiguous and vertex_weights.flags.c_contiguous):
+        raise ValueError('vertex_targets and vertex_weights need to be contiguous')
+    targets = vertex_targets.reshape(-1)
+    weights = vertex_weights.reshape(-1)
+
+    if reg_2d:
+        dx, dy = _center_directions(y, x, k, centers)
+        z = poses[2, 3, :]
+        if log_depth:
+            z = np.log(z)
+        targets[index] = dx
+        targets[index + 1] = dy
+        targets[index + 2] = z[k]
+    if reg_3d:
+        a, b = _scale_coefficients(extents, num_classes)
+        v = a[cls] * vertmap[y, x, :] + b[cls]
+        vertmap[y, x, :] = v
+        for j in xrange(3):
+            targets[index + j] = v[:, j]
+
+    for j in xrange(3):
+        weights[index + j] = weight_inside
+    return vertex_targets, vertex_weights
+
+
+def vote_centers(im_label, cls_indexes, centers, poses, num_classes):
+    """Return the 3 channel map of the center direction and depth of every labeled pixel."""
+    vertex_targets = np.zeros((im_label.shape[0], im_label.shape[1], 3), dtype=np.float32)
+    y, x, k, cls_indexes = _pixel_instances(im_label, cls_indexes, num_classes)
+    if len(k) > 0:
+        dx, dy = _center_directions(y, x, k, centers)
+        vertex_targets[y, x, 0] = dx
+        vertex_targets[y, x, 1] = dy
+        vertex_targets[y, x, 2] = poses[2, 3, k]
+    return vertex_targets
+
+
+def scale_vertmap(im_label, vertmap, extents, num_classes):
+    """Scale the vertmap to [0, 1] by the extents of the class of every labeled pixel.
+
+    Returns the 3 channel map of the scaled coordinates, the labeled pixels of
+    vertmap are scaled in place as well.
+    """
+    vertex_targets = np.zeros((im_label.shape[0], im_label.shape[1], 3), dtype=np.float32)
+    y, x = np.nonzero((im_label > 0) & (im_label < num_classes))
+    if len(y) > 0:
+        cls = im_label[y, x]
+        a, b = _scale_coefficients(extents, num_classes)
+        v = a[cls] * vertmap[y, x, :] + b[cls]
+        vertmap[y, x, :] = v
+        vertex_targets[y, x, :] = v
+    return vertex_targets
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Benchmark the serving pipeline of the ros node without a camera or rosmaster.
+
+Recorded color and depth images are played into the pipeline at the camera
+rate, and the latency histograms of the stages are printed. With --sync the
+frames are processed one after the other in the playing thread like the
+old callback of the node, for comparison.
+"""
+
+import _init_paths
+from fcn.config import cfg, cfg_from_file
+from datasets.factory import get_imdb
+import argparse
+import pprint
+import time, sys
+import tensorflow as tf
+import numpy as np
+from inference import FrameSegmenter
+from serving import ServingPipeline, Frame, FrameSource, LatencyHistograms
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the serving pipeline of the ros node')
+    parser.add_argument('--gpu', dest='gpu_id', help='GPU id to use',
+                        default=0, type=int)
+    parser.add_argument('--model', dest='model',
+                        help='model to test, a checkpoint or a frozen graph (.pb)',
+                        default=None, type=str)
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional config file', default=None, type=str)
+    parser.add_argument('--imdb', dest='imdb_name',
+                        help='dataset to test',
+                        default='lov_keyframe', type=str)
+    parser.add_argument('--network', dest='network_name',
+                        help='name of the network',
+                        default=None, type=str)
+    parser.add_argument('--images', dest='image_dir',
+                        help='directory of the <index>-color.png and <index>-depth.png images to play',
+                        default='images', type=str)
+    parser.add_argument('--rate', dest='rate',
+                        help='frames per second of the stand-in camera',
+                        default=30.0, type=float)
+    parser.add_argument('--frames', dest='num_frames',
+                        help='number of frames to play',
+                        default=300, type=int)
+    parser.add_argument('--sync', dest='sync',
+                        help='process the frames synchronously in the playing thread',
+                        action='store_true')
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+
+    print('Using config:')
+    pprint.pprint(cfg)
+
+    imdb = get_imdb(args.imdb_name)
+
+    # construct meta data
+    K = np.array([[1066.778, 0, 312.9869], [0, 1067.487, 241.3109], [0, 0, 1]])
+    meta_data = dict({'intrinsic_matrix': K, 'factor_depth': 1000.0})
+
+    cfg.GPU_ID = args.gpu_id
+    cfg.TRAIN.NUM_STEPS = 1
+    cfg.TRAIN.GRID_SIZE = cfg.TEST.GRID_SIZE
+    cfg.TRAIN.TRAINABLE = False
+    cfg.IS_TRAIN = False
+
+    gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=0.6)
+    if args.model.endswith('.pb'):
+        # frozen graph written by tools/export_frozen_graph.py
+        from fcn.frozen_graph import FrozenNetwork
+        network = FrozenNetwork(args.model)
+        sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=True, gpu_options=gpu_options))
+    else:
+        from networks.factory import get_network
+        network = get_network(args.network_name)
+        saver = tf.train.Saver()
+        sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=True, gpu_options=gpu_options))
+        saver.restore(sess, args.model)
+        print ('Loading model weights from {:s}').format(args.model)
+
+    segmenter = FrameSegmenter(sess, network, imdb, meta_data, cfg)
+    source = FrameSource(args.image_dir)
+
+    def preprocess(data):
+        im, depth = data
+        feed_dict, im_scale = segmenter.get_feed_dict(im, depth)
+        return im, depth, feed_dict, im_scale
+
+    def infer(data):
+        im, depth, feed_dict, im_scale = data
+        labels, probs, vertex_pred, rois, poses = segmenter.run_network(feed_dict, depth, im_scale, 'benchmark')
+        return im, labels, rois, poses
+
+    def publish(frame):
+        # the work of the node besides the messages
+        im, labels, rois, poses = frame.data
+        imdb.labels_to_image(im, labels)
+
+    # warm up the network
+    publish(Frame(0, infer(preprocess(source.frames[0])), time.time()))
+
+    t = time.time()
+    if args.sync:
+        histograms = LatencyHistograms()
+        def receive(data):
+            frame = Frame(0, data, time.time())
+            for name, function in [('preprocess', preprocess), ('infer', infer)]:
+                start = time.time()
+                frame.data = function(frame.data)
+                histograms.add(name, time.time() - start)
+            start = time.time()
+            publish(frame)
+            histograms.add('publish', time.time() - start)
+            histograms.add('total', time.time() - frame.stamp)
+        source.play(receive, args.num_frames, args.rate)
+        print 'played {} frames at {:.1f} fps in {:.1f}s synchronously'.format(args.num_frames, args.rate, time.time() - t)
+        histograms.report()
+    else:
+        pipeline = ServingPipeline(preprocess, infer, publish, cfg.ROS.LATENCY_BUDGET)
+        source.play(pipeline.receive, args.num_frames, args.rate)
+        # let the last frame through
+        time.sleep(1.0)
+        pipeline.close()
+        print 'played {} frames at {:.1f} fps in {:.1f}s'.format(args.num_frames, args.rate, time.time() - t)
+        pipeline.report()
@@ -0,0 +1,219 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""The network of the ros node, independent of ROS.
+
+FrameSegmenter turns a color and depth image into the blobs of the network
+(get_feed_dict) and runs the network on them (run_network), so the two can
+run in different stages of the serving pipeline. With cfg.TEST.TRACKING the
+objects are tracked across the frames.
+"""
+
+import time
+import cv2
+import numpy as np
+from fcn.config import cfg
+from utils.blob_pool import BlobPool
+from fcn.frozen_graph import FrozenNetwork, feed_inputs
+from utils.pose_tracker import PoseTracker, TrackingStats
+from utils.preprocess import frame_blobs
+
+class FrameSegmenter(object):
+
+    def __init__(self, sess, network, imdb, meta_data, cfg):
+
+        self.sess = sess
+        self.net = network
+        self.imdb = imdb
+        self.meta_data = meta_data
+        self.cfg = cfg
+        self.blob_pool = BlobPool()
+        self.count = 0
+
+        # track the objects across the frames of the camera
+        self.tracker = None
+        if cfg.TEST.TRACKING and cfg.TEST.VERTEX_REG_2D:
+            if cfg.TEST.POSE_REG and isinstance(network, FrozenNetwork):
+                print 'tracking needs the features of the pose regression, it is disabled'
+            else:
+                self.tracker = PoseTracker(imdb._points_all, cfg.TEST.TRACK_MIN_OVERLAP, cfg.TEST.TRACK_MAX_RESIDUAL, cfg.TEST.TRACK_ICP_RESIDUAL)
+                self.tracking_stats = TrackingStats()
+
+    def get_image_blob(self, im, im_depth, meta_data):
+        """Converts an image into a network input.
+
+        Arguments:
+            im (ndarray): a color image in BGR order
+
+        Returns:
+            blob (ndarray): a data blob holding an image pyramid
+            im_scale_factors (list): list of image scales (relative to im) used
+               in the image pyramid
+        """
+
+        assert len(self.cfg.TEST.SCALES_BASE) == 1
+        im_scale = self.cfg.TEST.SCALES_BASE[0]
+
+        blob, blob_depth, blob_normal = frame_blobs(im, im_depth, meta_data, im_scale, self.cfg.PREPROCESS.ROS)
+        return blob, blob_depth, blob_normal, np.array([im_scale])
+
+
+    def get_feed_dict(self, im, im_depth):
+        """feed dict of the network for a color image and a depth image, and the scale of the blobs"""
+
+        meta_data = self.meta_data
+        num_classes = self.imdb.num_classes
+
+        # compute image blob
+        im_blob, im_depth_blob, im_normal_blob, im_scale_factors = self.get_image_blob(im, im_depth, meta_data)
+        im_scale = im_scale_factors[0]
+
+        # construct the meta data
+        K = np.matrix(meta_data['intrinsic_matrix']) * im_scale
+        K[2, 2] = 1
+        Kinv = np.linalg.pinv(K)
+        mdata = np.zeros(48, dtype=np.float32)
+        mdata[0:9] = K.flatten()
+        mdata[9:18] = Kinv.flatten()
+        # mdata[18:30] = pose_world2live.flatten()
+        # mdata[30:42] = pose_live2world.flatten()
+        meta_data_blob = np.zeros((1, 1, 1, 48), dtype=np.float32)
+        meta_data_blob[0,0,0,:] = mdata
+
+        # use a fake label blob of ones
+        height = int(im_depth.shape[0] * im_scale)
+        width = int(im_depth.shape[1] * im_scale)
+        label_blob = self.blob_pool.ones((1, height, width), np.int32)
+
+        pose_blob = self.blob_pool.zeros((1, 13))
+        vertex_target_blob = self.blob_pool.zeros((1, height, width, 3*num_classes), num_classes=num_classes)
+        vertex_weight_blob = vertex_target_blob
+
+        # forward pass
+        if self.cfg.INPUT == 'RGBD':
+            data_blob = im_blob
+            data_p_blob = im_depth_blob
+        elif self.cfg.INPUT == 'COLOR':
+            data_blob = im_blob
+        elif self.cfg.INPUT == 'DEPTH':
+            data_blob = im_depth_blob
+        elif self.cfg.INPUT == 'NORMAL':
+            data_blob = im_normal_blob
+
+        # feed the inputs of the network directly, net can be a frozen graph
+        inputs = {'data': data_blob, 'gt_label_2d': label_blob}
+        if self.cfg.INPUT == 'RGBD':
+            inputs['data_p'] = data_p_blob
+        if self.cfg.TEST.VERTEX_REG_2D or self.cfg.TEST.VERTEX_REG_3D:
+            inputs.update({'vertex_targets': vertex_target_blob, 'vertex_weights': vertex_weight_blob, \
+                           'meta_data': meta_data_blob, 'extents': self.imdb._extents, 'points': self.imdb._points_all, 'symmetry': self.imdb._symmetry, 'poses': pose_blob})
+        feed_dict = feed_inputs(self.net, inputs)
+        return feed_dict, im_scale
+
+    def run_network(self, feed_dict, im_depth, im_scale, camera_id=None):
+        """labels, probs, vertex_pred, rois and poses of the frame of feed_dict"""
+
+        sess = self.sess
+        net = self.net
+        self.count += 1
+        if self.count % 100 == 0:
+            self.blob_pool.report()
+            if self.tracker is not None:
+                self.tracking_stats.report()
+
+        if self.cfg.TEST.VERTEX_REG_2D and self.tracker is not None:
+            # the objects are forgotten when the camera changes
+            self.tracker.start(camera_id, self.count)
+            labels_2d, probs, vertex_pred, rois, poses = self.segment_and_track(sess, net, feed_dict, im_depth, self.meta_data, im_scale)
+            vertex_pred = vertex_pred[0, :, :, :]
+        elif self.cfg.TEST.VERTEX_REG_2D:
+            if self.cfg.TEST.POSE_REG:
+                labels_2d, probs, vertex_pred, rois, poses_init, poses_pred = \
+                    sess.run([net.get_output('label_2d'), net.get_output('prob_normalized'), net.get_output('vertex_pred'), \
+                              net.get_output('rois'), net.get_output('poses_init'), net.get_output('poses_tanh')], feed_dict=feed_dict)
+
+                # non-maximum suppression
+                # keep = nms(rois, 0.5)
+                # rois = rois[keep, :]
+                # poses_init = poses_init[keep, :]
+                # poses_pred = poses_pred[keep, :]
+
+                # combine poses
+                num = rois.shape[0]
+                poses = poses_init
+                for i in xrange(num):
+                    class_id = int(rois[i, 1])
+                    if class_id >= 0:
+                        poses[i, :4] = poses_pred[i, 4*class_id:4*class_id+4]
+            else:
+                labels_2d, probs, vertex_pred, rois, poses = \
+                    sess.run([net.get_output('label_2d'), net.get_output('prob_normalized'), net.get_output('vertex_pred'), net.get_output('rois'), net.get_output('poses_init')], feed_dict=feed_dict)
+                # non-maximum suppression
+                # keep = nms(rois[:, 2:], 0.5)
+                # rois = rois[keep, :]
+                # poses = poses[keep, :]
+
+                #labels_2d, probs = sess.run([net.get_output('label_2d'), net.get_output('prob_normalized')])
+                #vertex_pred = []
+                #rois = []
+                #poses = []
+            vertex_pred = vertex_pred[0, :, :, :]
+        else:
+            labels_2d, probs = sess.run([net.get_output('label_2d'), net.get_output('prob_normalized')], feed_dict=feed_dict)
+            vertex_pred = []
+            rois = []
+            poses = []
+
+        return labels_2d[0,:,:].astype(np.int32), probs[0,:,:,:], vertex_pred, rois, poses
+
+    def im_segment_single_frame(self, im, im_depth, camera_id=None):
+        """segment image
+        """
+        feed_dict, im_scale = self.get_feed_dict(im, im_depth)
+        return self.run_network(feed_dict, im_depth, im_scale, camera_id)
+
+    def segment_and_track(self, sess, net, feed_dict, im_depth, meta_data, im_scale):
+        """segment a frame and track its objects from the last frame
+
+        The Hough voting (and the pose regression) runs on the outputs of the
+        segmentation fed back to the network, only if the objects are lost.
+        """
+        names = ['label_2d', 'prob_normalized', 'vertex_pred']
+        if self.cfg.TEST.POSE_REG:
+            # the features pooled by the pose regression
+            names += ['conv4_3', 'conv5_3']
+        tensors = [net.get_output(name) for name in names]
+        if isinstance(net, FrozenNetwork):
+            # the outputs of a frozen graph are identities of the tensors to feed
+            tensors = [tensor.op.inputs[0] for tensor in tensors]
+        outputs = sess.run(tensors, feed_dict=feed_dict)
+        labels = outputs[0][0, :, :].astype(np.int32)
+
+        t = time.time()
+        depth = cv2.resize(im_depth, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
+        depth = depth.astype(np.float32) / float(meta_data['factor_depth'])
+        intrinsic_matrix = meta_data['intrinsic_matrix'] * im_scale
+        intrinsic_matrix[2, 2] = 1
+        tracked = self.tracker.track(labels, depth, intrinsic_matrix)
+        if tracked is None:
+            feed_dict = dict(feed_dict)
+            feed_dict.update(zip(tensors, outputs))
+            if self.cfg.TEST.POSE_REG:
+                rois, poses, poses_pred = sess.run([net.get_output('rois'), net.get_output('poses_init'), net.get_output('poses_tanh')], feed_dict=feed_dict)
+                # combine poses
+                for i in xrange(rois.shape[0]):
+                    class_id = int(rois[i, 1])
+                    if class_id >= 0:
+                        poses[i, :4] = poses_pred[i, 4*class_id:4*class_id+4]
+            else:
+                rois, poses = sess.run([net.get_output('rois'), net.get_output('poses_init')], feed_dict=feed_dict)
+        else:
+            rois, poses, _ = tracked
+        self.tracker.update(labels, rois, poses)
+        self.tracking_stats.add(self.count, tracked is not None, time.time() - t)
+
+        return outputs[0], outputs[1], outputs[2], rois, poses
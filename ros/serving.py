@@ -0,0 +1,323 @@
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Asynchronous serving pipeline of the ros node, independent of ROS.
+
+A frame goes through four stages: receive (the message callback), then
+preprocess, infer and publish, each in its own thread. Consecutive stages
+are connected by a LatestSlot holding a single frame. If a stage is still
+busy when a newer frame arrives, the older waiting frame is dropped. This
+keeps the latency bounded when the network is slower than the camera. A
+frame older than the latency budget when it reaches the network is dropped
+too.
+
+The time of every stage, the wait before it and the latency of the
+published frames are kept in LatencyHistograms with fixed buckets, so a
+node running for days uses constant memory. SampledRecorder writes every
+n-th frame to disk in the background, and FrameSource plays recorded
+images into a pipeline to benchmark it without a camera or rosmaster.
+"""
+
+import os
+import glob
+import json
+import time
+import threading
+import traceback
+import Queue
+import numpy as np
+import cv2
+
+class Frame(object):
+    """a frame in the pipeline, data is replaced by the output of each stage"""
+
+    def __init__(self, index, data, stamp):
+        self.index = index
+        self.data = data
+        # time the frame was received and the time it entered its current stage
+        self.stamp = stamp
+        self.ready = stamp
+
+
+class LatestSlot(object):
+    """a slot holding the latest frame put into it, the frame it replaces is dropped"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._frame = None
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, frame):
+        with self._condition:
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self._condition.notify()
+
+    def get(self):
+        """wait for a frame, None once the slot is closed"""
+        with self._condition:
+            while self._frame is None and not self._closed:
+                self._condition.wait()
+            frame = self._frame
+            self._frame = None
+            return frame
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class LatencyHistogram(object):
+    """counts of latencies in buckets spaced logarithmically from 1ms to 10s"""
+
+    EDGES = np.logspace(-3, 1, 41)
+
+    def __init__(self):
+        # one bucket below the first and one above the last edge
+        self.counts = np.zeros(len(self.EDGES) + 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[np.searchsorted(self.EDGES, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        """upper edge of the bucket of the q-th percentile"""
+        if self.count == 0:
+            return 0.0
+        index = np.searchsorted(np.cumsum(self.counts), q / 100.0 * self.count)
+        if index >= len(self.EDGES):
+            return self.max
+        return min(self.EDGES[index], self.max)
+
+    def summary(self):
+        if self.count == 0:
+            return {'count': 0}
+        return {'count': self.count,
+                'mean': self.total / self.count,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99),
+                'max': self.max,
+                'edges': self.EDGES.tolist(),
+                'counts': self.counts.tolist()}
+
+
+class LatencyHistograms(object):
+    """latency histograms by name, shared by the threads of the pipeline"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def add(self, name, seconds):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = LatencyHistogram()
+            self._histograms[name].add(seconds)
+
+    def summary(self):
+        with self._lock:
+            return dict((name, h.summary()) for name, h in self._histograms.iteritems())
+
+    def to_json(self):
+        return json.dumps(self.summary(), sort_keys=True)
+
+    def report(self):
+        summary = self.summary()
+        print '{:20s} {:>8s} {:>8s} {:>8s} {:>8s} {:>8s} {:>8s}' \
+              .format('latency', 'count', 'mean', 'p50', 'p90', 'p99', 'max')
+        for name in sorted(summary.keys()):
+            s = summary[name]
+            if s['count'] == 0:
+                continue
+            print '{:20s} {:8d} {:8.4f} {:8.4f} {:8.4f} {:8.4f} {:8.4f}' \
+                  .format(name, s['count'], s['mean'], s['p50'], s['p90'], s['p99'], s['max'])
+
+
+class SampledRecorder(object):
+    """write the images of every n-th recorded frame into a directory in a background thread
+
+    Frames are skipped rather than queued when the disk is slower than the
+    sampling rate.
+    """
+
+    def __init__(self, every, directory, max_queue=8):
+        self.every = every
+        self.directory = directory
+        self.skipped = 0
+        self._queue = Queue.Queue(max_queue)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._thread = threading.Thread(target=self._write)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def record(self, index, images):
+        """images is a dict {name: image}, written as <index>-<name>.png"""
+        if self.every <= 0 or index % self.every != 0:
+            return
+        try:
+            self._queue.put_nowait((index, images))
+        except Queue.Full:
+            self.skipped += 1
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            index, images = item
+            for name, image in images.iteritems():
+                cv2.imwrite(os.path.join(self.directory, '{:06d}-{}.png'.format(index, name)), image)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+class ServingPipeline(object):
+    """run preprocess, infer and publish on the received frames in three threads
+
+    preprocess(data) and infer(data) return the data of the next stage or
+    None to drop the frame, publish(frame) gets the frame with the output of
+    infer. Exceptions of a stage drop the frame too. Frames waiting
+    longer than latency_budget seconds (0 for no budget) from their receipt
+    to the start of infer are dropped. report(histograms) is called every
+    report_every published frames.
+    """
+
+    STAGES = ('preprocess', 'infer', 'publish')
+
+    def __init__(self, preprocess, infer, publish, latency_budget=0, report_every=0, report=None):
+        self.latency_budget = latency_budget
+        self.report_every = report_every
+        self._report = report
+        self._functions = dict(zip(self.STAGES, (preprocess, infer, publish)))
+        self._slots = dict((stage, LatestSlot()) for stage in self.STAGES)
+        self._lock = threading.Lock()
+        self.histograms = LatencyHistograms()
+        self.received = 0
+        self.published = 0
+        self.over_budget = 0
+        self.failed = 0
+
+        self._threads = []
+        for stage, next_stage in zip(self.STAGES, self.STAGES[1:] + (None,)):
+            thread = threading.Thread(target=self._run_stage, args=(stage, next_stage), name=stage)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def receive(self, data, stamp=None):
+        """put a received frame into the pipeline, it replaces a frame waiting for preprocessing"""
+        now = time.time()
+        with self._lock:
+            index = self.received
+            self.received += 1
+        self._slots['preprocess'].put(Frame(index, data, now if stamp is None else stamp))
+
+    def _run_stage(self, stage, next_stage):
+        slot = self._slots[stage]
+        function = self._functions[stage]
+        while True:
+            frame = slot.get()
+            if frame is None:
+                break
+            start = time.time()
+            self.histograms.add(stage + '_wait', start - frame.ready)
+            if stage == 'infer' and self.latency_budget > 0 and start - frame.stamp > self.latency_budget:
+                with self._lock:
+                    self.over_budget += 1
+                continue
+
+            try:
+                if next_stage is None:
+                    function(frame)
+                else:
+                    frame.data = function(frame.data)
+            except Exception:
+                # a bad frame does not stop the node
+                traceback.print_exc()
+                with self._lock:
+                    self.failed += 1
+                continue
+            end = time.time()
+            self.histograms.add(stage, end - start)
+
+            if next_stage is not None:
+                if frame.data is None:
+                    with self._lock:
+                        self.failed += 1
+                    continue
+                frame.ready = end
+                self._slots[next_stage].put(frame)
+                continue
+
+            self.histograms.add('total', end - frame.stamp)
+            with self._lock:
+                self.published += 1
+                published = self.published
+            if self.report_every > 0 and published % self.report_every == 0:
+                self.report()
+
+    def dropped(self):
+        """number of frames replaced by newer frames before each stage"""
+        return dict((stage, self._slots[stage].dropped) for stage in self.STAGES)
+
+    def report(self):
+        print 'frames: {} received, {} published, {} over the latency budget, {} failed, dropped before {}' \
+              .format(self.received, self.published, self.over_budget, self.failed, self.dropped())
+        self.histograms.report()
+        if self._report is not None:
+            self._report(self.histograms)
+
+    def close(self):
+        """stop the stages, the frames still in the pipeline are dropped"""
+        for stage in self.STAGES:
+            self._slots[stage].close()
+        for thread in self._threads:
+            thread.join()
+
+
+class FrameSource(object):
+    """a stand-in for the camera playing recorded frames into a pipeline
+
+    The frames are the <index>-color.png and <index>-depth.png images of a
+    directory, e.g. recorded by the node. They are read into memory before
+    playing so reading them does not count as latency.
+    """
+
+    def __init__(self, directory, max_frames=0):
+        self.frames = []
+        for filename in sorted(glob.glob(os.path.join(directory, '*-color.png'))):
+            depth = cv2.imread(filename.replace('-color.png', '-depth.png'), cv2.IMREAD_UNCHANGED)
+            if depth is None:
+                continue
+            self.frames.append((cv2.imread(filename, cv2.IMREAD_COLOR), depth))
+            if max_frames > 0 and len(self.frames) >= max_frames:
+                break
+        if len(self.frames) == 0:
+            raise ValueError('no color and depth images in {}'.format(directory))
+        print 'frame source with {} frames from {}'.format(len(self.frames), directory)
+
+    def play(self, receive, num_frames, rate):
+        """call receive((im, depth)) num_frames times at rate frames per second, looping over the frames"""
+        period = 1.0 / rate
+        start = time.time()
+        for k in xrange(num_frames):
+            wait = start + k * period - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            receive(self.frames[k % len(self.frames)])
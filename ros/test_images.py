@@ -32,7 +32,7 @@ def parse_args():
                         help='pretrained model',
                         default=None, type=str)
     parser.add_argument('--model', dest='model',
-                        help='model to test',
+                        help='model to test, a checkpoint or a frozen graph (.pb)',
                         default=None, type=str)
     parser.add_argument('--cfg', dest='cfg_file',
                         help='optional config file', default=None, type=str)
@@ -106,16 +106,22 @@ if __name__ == '__main__':
     cfg.BACKGROUND = args.background_name
     cfg.IS_TRAIN = False
 
-    from networks.factory import get_network
-    network = get_network(args.network_name)
-    print 'Use network `{:s}` in training'.format(args.network_name)
-
-    # start a session
-    saver = tf.train.Saver()
     gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=0.6)
-    sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=True, gpu_options=gpu_options))
-    saver.restore(sess, args.model)
-    print ('Loading model weights from {:s}').format(args.model)
+    if args.model.endswith('.pb'):
+        # frozen graph written by tools/export_frozen_graph.py
+        from fcn.frozen_graph import FrozenNetwork
+        network = FrozenNetwork(args.model)
+        sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=True, gpu_options=gpu_options))
+    else:
+        from networks.factory import get_network
+        network = get_network(args.network_name)
+        print 'Use network `{:s}` in training'.format(args.network_name)
+
+        # start a session
+        saver = tf.train.Saver()
+        sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=True, gpu_options=gpu_options))
+        saver.restore(sess, args.model)
+        print ('Loading model weights from {:s}').format(args.model)
 
     # image listener
     listener = ImageListener(sess, network, imdb, meta_data, cfg)
@@ -123,3 +129,4 @@ if __name__ == '__main__':
         rospy.spin()
     except KeyboardInterrupt:
         print "Shutting down"
+    listener.close()
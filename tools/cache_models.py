@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Convert the object models of an image database to the binary model cache."""
+
+import _init_paths
+import argparse
+import sys
+import time
+from fcn.config import cfg, cfg_from_file
+from datasets.factory import get_imdb
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='Cache the object models of an image database')
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional config file',
+                        default=None, type=str)
+    parser.add_argument('--imdb', dest='imdb_name',
+                        help='dataset of the models',
+                        default='lov_train', type=str)
+    parser.add_argument('--diameters', dest='diameters',
+                        help='compute and cache the model diameters',
+                        action='store_true')
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+
+    # constructing the imdb converts its models
+    t = time.time()
+    imdb = get_imdb(args.imdb_name)
+    print 'Loaded dataset `{:s}` in {:.3f}s'.format(imdb.name, time.time() - t)
+
+    geometry = imdb.model_geometry
+    for point_file in geometry.files:
+        pts = geometry.points(point_file)
+        extent = geometry.extent(point_file)
+        print '{}: {} points, extent {:.6f} {:.6f} {:.6f}'.format(point_file, pts.shape[0], extent[0], extent[1], extent[2])
+        if args.diameters:
+            print '  diameter {:.6f}'.format(geometry.diameter(point_file))
@@ -12,7 +12,7 @@
 import _init_paths
 from fcn.test import test_net_images
 from fcn.config import cfg, cfg_from_file
-from datasets.factory import get_imdb
+from datasets.factory import get_imdb, timing_report
 import argparse
 import pprint
 import time, os, sys
@@ -82,6 +82,7 @@ if __name__ == '__main__':
     weights_filename = os.path.splitext(os.path.basename(args.model))[0]
 
     imdb = get_imdb(args.imdb_name)
+    timing_report()
 
     # construct the filenames
     root = 'data/demo_images/'
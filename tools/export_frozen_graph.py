@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Export a trained network as a frozen inference graph."""
+
+import _init_paths
+from fcn.config import cfg, cfg_from_file
+from fcn.frozen_graph import output_names, freeze_network, write_frozen_graph
+import argparse
+import pprint
+import time, os, sys
+import tensorflow as tf
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='Export a frozen inference graph')
+    parser.add_argument('--model', dest='model',
+                        help='model to export',
+                        default=None, type=str)
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional config file', default=None, type=str)
+    parser.add_argument('--network', dest='network_name',
+                        help='name of the network',
+                        default=None, type=str)
+    parser.add_argument('--output', dest='output',
+                        help='frozen graph file, the model with extension .pb by default',
+                        default=None, type=str)
+    parser.add_argument('--no-fold', dest='fold_constants',
+                        help='do not fold constants',
+                        action='store_false')
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+
+    print('Using config:')
+    pprint.pprint(cfg)
+
+    # build the network as for testing
+    cfg.TRAIN.NUM_STEPS = 1
+    cfg.TRAIN.GRID_SIZE = cfg.TEST.GRID_SIZE
+    cfg.TRAIN.TRAINABLE = False
+    cfg.TRAIN.VOTING_THRESHOLD = cfg.TEST.VOTING_THRESHOLD
+    cfg.IS_TRAIN = False
+
+    from networks.factory import get_network
+    network = get_network(args.network_name)
+    print 'Use network `{:s}` in testing'.format(args.network_name)
+
+    saver = tf.train.Saver()
+    sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=True))
+    saver.restore(sess, args.model)
+    print ('Loading model weights from {:s}').format(args.model)
+
+    t = time.time()
+    outputs = output_names(cfg.TEST.VERTEX_REG_2D, cfg.TEST.VERTEX_REG_3D, cfg.TEST.POSE_REG)
+    graph_def = freeze_network(sess, network, outputs, args.fold_constants)
+    print 'froze outputs {} in {:.3f}s'.format(', '.join(outputs), time.time() - t)
+
+    if args.output is None:
+        args.output = os.path.splitext(args.model)[0] + '.pb'
+    write_frozen_graph(graph_def, args.output)
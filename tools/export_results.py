@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Write the test results in a results store to .mat files for the matlab evaluation."""
+
+import _init_paths
+import argparse
+import os
+import sys
+from utils.results_store import ResultsStore
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='Export test results to .mat files')
+    parser.add_argument('--results', dest='results',
+                        help='results store of a test run, segmentations.db or detections.db',
+                        default=None, type=str)
+    parser.add_argument('--output', dest='output',
+                        help='directory of the .mat files, mat next to the results store by default',
+                        default=None, type=str)
+    parser.add_argument('--pattern', dest='pattern',
+                        help='file name pattern of the frame index',
+                        default='%06d.mat', type=str)
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.output is None:
+        args.output = os.path.join(os.path.dirname(os.path.abspath(args.results)), 'mat')
+    ResultsStore(args.results).export_mat(args.output, args.pattern)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Generate a synthetic dataset offline in resumable shards rendered by worker processes.
+
+Running the same command again after a crash continues every shard from
+its last checkpoint.
+"""
+
+import _init_paths
+import argparse
+import os
+import sys
+import pprint
+import numpy as np
+import scipy.io
+from fcn.config import cfg, cfg_from_file
+from datasets.factory import get_imdb
+from synthesize.dataset_generator import DatasetGenerator
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='Generate a synthetic dataset')
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional config file',
+                        default=None, type=str)
+    parser.add_argument('--imdb', dest='imdb_name',
+                        help='dataset of the objects, for the model points, extents and camera',
+                        default='lov_train', type=str)
+    parser.add_argument('--cad', dest='cad_name',
+                        help='name of the CAD files',
+                        default=None, type=str)
+    parser.add_argument('--pose', dest='pose_name',
+                        help='name of the pose files',
+                        default=None, type=str)
+    parser.add_argument('--output', dest='root',
+                        help='directory of the images, TRAIN.SYNROOT by default',
+                        default=None, type=str)
+    parser.add_argument('--num', dest='num_images',
+                        help='number of images, TRAIN.SYNNUM by default',
+                        default=None, type=int)
+    parser.add_argument('--shards', dest='num_shards',
+                        help='number of shards of the images',
+                        default=64, type=int)
+    parser.add_argument('--workers', dest='num_workers',
+                        help='number of rendering processes',
+                        default=4, type=int)
+    parser.add_argument('--packed', dest='index_file',
+                        help='pack the frames into shards with this index file instead of writing files, set TRAIN.SHARDS to it',
+                        default=None, type=str)
+    parser.add_argument('--compress', dest='compress',
+                        help='zlib compress the packed images',
+                        action='store_true')
+    parser.add_argument('--checkpoint', dest='checkpoint_every',
+                        help='save the progress of a shard every n images',
+                        default=100, type=int)
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    cfg.CAD = args.cad_name
+    cfg.POSE = args.pose_name
+
+    print('Using config:')
+    pprint.pprint(cfg)
+
+    imdb = get_imdb(args.imdb_name)
+    print 'Loaded dataset `{:s}` for the objects'.format(imdb.name)
+
+    # camera of the dataset
+    meta_data = scipy.io.loadmat(imdb.roidb[0]['meta_data'])
+    intrinsic_matrix = meta_data['intrinsic_matrix'].astype(np.float32, copy=True)
+    if cfg.TRAIN.SYN_CLASS_INDEX >= 0:
+        extents = imdb._extents_all
+    else:
+        extents = None
+
+    root = args.root if args.root is not None else cfg.TRAIN.SYNROOT
+    num_images = args.num_images if args.num_images is not None else cfg.TRAIN.SYNNUM
+    index_file = args.index_file
+    if index_file is not None and not os.path.exists(os.path.dirname(os.path.abspath(index_file))):
+        os.makedirs(os.path.dirname(os.path.abspath(index_file)))
+
+    generator = DatasetGenerator(root, num_images, args.num_shards, intrinsic_matrix, extents, imdb._points_all, \
+                                 index_file, args.compress, args.checkpoint_every, cfg.RNG_SEED)
+    if not generator.run(args.num_workers):
+        print 'generation is not complete, run again to continue'
+        sys.exit(1)
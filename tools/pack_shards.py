@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Pack the frames of an image database into shards for training."""
+
+import _init_paths
+import argparse
+import os
+import sys
+from fcn.config import cfg, cfg_from_file
+from datasets.factory import get_imdb
+from utils.frame_shard import write_shards
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='Pack the frames of an image database into shards')
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional config file',
+                        default=None, type=str)
+    parser.add_argument('--imdb', dest='imdb_name',
+                        help='dataset to pack',
+                        default='lov_train', type=str)
+    parser.add_argument('--output', dest='index_file',
+                        help='index file of the shards, set TRAIN.SHARDS to it',
+                        default=None, type=str)
+    parser.add_argument('--frames', dest='frames_per_shard',
+                        help='number of frames in a shard',
+                        default=1000, type=int)
+    parser.add_argument('--compress', dest='compress',
+                        help='zlib compress the images',
+                        action='store_true')
+    parser.add_argument('--vertmap', dest='with_vertmap',
+                        help='pack the vertmap of the meta data, needed with TRAIN.VERTEX_REG_3D',
+                        action='store_true')
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+
+    imdb = get_imdb(args.imdb_name)
+    print 'Loaded dataset `{:s}` for packing'.format(imdb.name)
+
+    index_file = args.index_file
+    if index_file is None:
+        index_file = os.path.join(imdb.cache_path, imdb.name + '_shards', imdb.name + '.pkl')
+    if not os.path.exists(os.path.dirname(os.path.abspath(index_file))):
+        os.makedirs(os.path.dirname(os.path.abspath(index_file)))
+
+    write_shards(imdb.roidb, index_file, args.frames_per_shard, args.compress, args.with_vertmap)
@@ -13,7 +13,7 @@ import _init_paths
 from fcn.test import test_net
 from fcn.test import test_net_single_frame, test_net_detection
 from fcn.config import cfg, cfg_from_file
-from datasets.factory import get_imdb
+from datasets.factory import get_imdb, timing_report
 import argparse
 import pprint
 import time, os, sys
@@ -31,7 +31,7 @@ def parse_args():
                         help='pretrained model',
                         default=None, type=str)
     parser.add_argument('--model', dest='model',
-                        help='model to test',
+                        help='model to test, a checkpoint or a frozen graph (.pb)',
                         default=None, type=str)
     parser.add_argument('--cfg', dest='cfg_file',
                         help='optional config file', default=None, type=str)
@@ -82,6 +82,7 @@ if __name__ == '__main__':
     weights_filename = os.path.splitext(os.path.basename(args.model))[0]
 
     imdb = get_imdb(args.imdb_name)
+    timing_report()
 
     cfg.GPU_ID = args.gpu_id
     device_name = '/gpu:{:d}'.format(args.gpu_id)
@@ -101,16 +102,22 @@ if __name__ == '__main__':
     cfg.BACKGROUND = args.background_name
     cfg.IS_TRAIN = False
 
-    from networks.factory import get_network
-    network = get_network(args.network_name)
-    print 'Use network `{:s}` in training'.format(args.network_name)
-
-    # start a session
-    saver = tf.train.Saver()
     gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=0.6)
-    sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=True, gpu_options=gpu_options))
-    saver.restore(sess, args.model)
-    print ('Loading model weights from {:s}').format(args.model)
+    if args.model.endswith('.pb'):
+        # frozen graph written by tools/export_frozen_graph.py
+        from fcn.frozen_graph import FrozenNetwork
+        network = FrozenNetwork(args.model)
+        sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=True, gpu_options=gpu_options))
+    else:
+        from networks.factory import get_network
+        network = get_network(args.network_name)
+        print 'Use network `{:s}` in training'.format(args.network_name)
+
+        # start a session
+        saver = tf.train.Saver()
+        sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=True, gpu_options=gpu_options))
+        saver.restore(sess, args.model)
+        print ('Loading model weights from {:s}').format(args.model)
 
     if cfg.TEST.SINGLE_FRAME:
         if cfg.TEST.SEGMENTATION:
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Check the preprocessing methods against the reference steps and time them per frame."""
+
+import _init_paths
+import argparse
+import numpy as np
+from utils.preprocess import METHODS, color_blobs, depth_blobs
+from utils.timer import Timer
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='Test the preprocessing of the input images')
+    parser.add_argument('--height', dest='height',
+                        help='height of the images',
+                        default=480, type=int)
+    parser.add_argument('--width', dest='width',
+                        help='width of the images',
+                        default=640, type=int)
+    parser.add_argument('--repeats', dest='repeats',
+                        help='number of timed frames of each method',
+                        default=50, type=int)
+    args = parser.parse_args()
+    return args
+
+
+def random_frame(height, width):
+    """a color image with smooth content and noise, and a depth image in millimeters"""
+    y, x = np.mgrid[0:height, 0:width]
+    im = np.empty((height, width, 3), dtype=np.uint8)
+    for c in xrange(3):
+        smooth = 127 + 100 * np.sin(x / (20.0 + 10 * c)) * np.cos(y / 30.0)
+        im[:, :, c] = np.clip(smooth + np.random.randint(-20, 20, size=(height, width)), 0, 255)
+    depth = (800 + 1500 * np.random.rand(height, width)).astype(np.uint16)
+    depth[np.random.rand(height, width) < 0.05] = 0
+    return im, depth
+
+
+def frame_blobs(im, depth, im_scales, flip, depth_max, method):
+    return color_blobs(im, im_scales, flip, method) + depth_blobs(depth, im_scales, flip, depth_max, method)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    np.random.seed(0)
+    im, depth = random_frame(args.height, args.width)
+
+    # (path, scales, flip, maximum depth), training scales the depth by the maximum of the image
+    settings = [('test / ros', [1.0], False, 2000.0),
+                ('test / ros', [0.5], False, 2000.0),
+                ('train', [1.0], True, None),
+                ('train', [1.0, 0.5], True, None)]
+    for path, im_scales, flip, depth_max in settings:
+        reference = frame_blobs(im, depth, im_scales, flip, depth_max, 'reference')
+        times = []
+        for method in METHODS:
+            blobs = frame_blobs(im, depth, im_scales, flip, depth_max, method)
+            errors = [np.abs(a - b).max() for a, b in zip(blobs, reference)]
+            for a, b in zip(blobs, reference):
+                assert a.shape == b.shape and a.dtype == np.float32, '{} blob of {}'.format(method, a.shape)
+            # the uint8 method rounds the resized colors
+            tolerance = 1.0 if method == 'uint8' and im_scales != [1.0] else 1e-3
+            assert max(errors) <= tolerance, '{} differs from the reference by {}'.format(method, max(errors))
+
+            timer = Timer()
+            for i in xrange(args.repeats):
+                timer.tic()
+                frame_blobs(im, depth, im_scales, flip, depth_max, method)
+                timer.toc()
+            times.append('{} {:6.2f}ms (max difference {:.1e})'.format(method, timer.average_time * 1000, max(errors)))
+        print '{:10s} scales {:10s} flip {:d}: {}'.format(path, str(im_scales), flip, ', '.join(times))
+
+    # an empty depth image scaled by its maximum
+    empty = np.zeros_like(depth)
+    reference = depth_blobs(empty, [1.0, 0.5], True, None, 'reference')
+    for method in METHODS:
+        for a, b in zip(depth_blobs(empty, [1.0, 0.5], True, None, method), reference):
+            assert np.isfinite(a).all() and np.array_equal(a, b), '{} blob of an empty depth image'.format(method)
+    print 'empty depth image: {}'.format(', '.join(METHODS))
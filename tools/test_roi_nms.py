@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Compare and time the NMS implementations of the Hough voting rois."""
+
+import _init_paths
+import argparse
+import numpy as np
+from utils.nms import py_nms, vectorized_nms
+from nms.py_cpu_nms import py_cpu_nms
+from utils.timer import Timer
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the roi NMS')
+    parser.add_argument('--classes', dest='num_classes',
+                        help='number of object classes',
+                        default=22, type=int)
+    parser.add_argument('--thresh', dest='thresh',
+                        help='overlap threshold',
+                        default=0.5, type=float)
+    parser.add_argument('--repeats', dest='repeats',
+                        help='number of runs of each implementation',
+                        default=5, type=int)
+    args = parser.parse_args()
+    return args
+
+def random_rois(num, num_classes, width=640, height=480):
+    """rois (batch, cls, x1, y1, x2, y2, score) clustered around a few object centers"""
+    rois = np.zeros((num, 7), dtype=np.float32)
+    rois[:, 1] = np.random.randint(1, num_classes, size=num)
+    centers = np.random.rand(num_classes, 2) * [width, height]
+    c = centers[rois[:, 1].astype(np.int32)] + np.random.randn(num, 2) * 10
+    size = np.random.uniform(20, 150, size=(num, 2))
+    rois[:, 2] = c[:, 0] - size[:, 0] / 2
+    rois[:, 3] = c[:, 1] - size[:, 1] / 2
+    rois[:, 4] = c[:, 0] + size[:, 0] / 2
+    rois[:, 5] = c[:, 1] + size[:, 1] / 2
+    rois[:, 6] = np.random.rand(num)
+    return rois
+
+if __name__ == '__main__':
+    args = parse_args()
+    np.random.seed(0)
+
+    methods = [('python', py_nms), ('numpy', vectorized_nms)]
+    try:
+        from nms.cpu_roi_nms import cpu_roi_nms
+        methods.append(('cython', cpu_roi_nms))
+    except ImportError:
+        print 'nms.cpu_roi_nms is not built, run make in lib'
+    # class agnostic reference on the boxes only
+    methods.append(('py_cpu_nms', lambda rois, thresh: py_cpu_nms(rois[:, 2:], thresh)))
+
+    for num in [10, 100, 1000, 10000]:
+        rois = random_rois(num, args.num_classes)
+        keep_gt = py_nms(rois, args.thresh)
+        for name, method in methods:
+            timer = Timer()
+            for i in xrange(args.repeats):
+                timer.tic()
+                keep = method(rois, args.thresh)
+                timer.toc()
+            if name != 'py_cpu_nms':
+                assert list(keep) == list(keep_gt), '{} differs from the python nms with {} rois'.format(name, num)
+            print '{:6d} rois, {:10s}: {:8.3f}ms, {:d} kept'.format(num, name, timer.average_time * 1000, len(keep))
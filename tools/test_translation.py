@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Compare the translation solvers of the detections on an image database.
+
+The boxes and rotations are those of the ground truth poses, with optional
+box noise, or those of the detections in a results store written by
+test_net_detection. Each solver is timed and the error of its translations to
+the ground truth is reported.
+"""
+
+import _init_paths
+import argparse
+import sys
+import numpy as np
+import scipy.io
+from fcn.config import cfg, cfg_from_file
+from datasets.factory import get_imdb
+from utils.translation import translations_nelder_mead, translations_gauss_newton
+from utils.results_store import ResultsStore
+from utils.timer import Timer
+from transforms3d.quaternions import mat2quat
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='Compare the translation solvers')
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional config file', default=None, type=str)
+    parser.add_argument('--imdb', dest='imdb_name',
+                        help='dataset to test',
+                        default='linemod_ape_test', type=str)
+    parser.add_argument('--results', dest='results',
+                        help='detections.db of test_net_detection, the ground truth boxes are used if not given',
+                        default=None, type=str)
+    parser.add_argument('--num', dest='num_images',
+                        help='number of frames, all by default',
+                        default=0, type=int)
+    parser.add_argument('--noise', dest='noise',
+                        help='standard deviation in pixels of the noise added to the ground truth boxes',
+                        default=0.0, type=float)
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    args = parser.parse_args()
+    return args
+
+
+def _ground_truth(imdb, i):
+    """class indexes and 3 x 4 x n poses of the objects of frame i, and its intrinsic matrix"""
+    meta_data = scipy.io.loadmat(imdb.metadata_path_at(i))
+    cls_indexes = meta_data['cls_indexes'].flatten()
+    poses = meta_data['poses']
+    if len(poses.shape) == 2:
+        poses = np.reshape(poses, (3, 4, 1))
+    if imdb.num_classes == 2:
+        ind = np.where(cls_indexes == imdb._cls_index)[0]
+        cls_indexes = np.ones((len(ind),), dtype=np.int32)
+        poses = poses[:, :, ind]
+    return cls_indexes.astype(np.int32), poses, meta_data['intrinsic_matrix']
+
+
+def _ground_truth_detections(cls_indexes, poses_gt, points, intrinsic_matrix, noise):
+    """boxes of the projected models and rotations of the ground truth poses"""
+    num = len(cls_indexes)
+    dets = np.zeros((num, 6), dtype=np.float32)
+    poses = np.zeros((num, 7), dtype=np.float32)
+    for j in xrange(num):
+        RT = poses_gt[:, :, j]
+        x3d = np.dot(points[cls_indexes[j]], RT[:, :3].T) + RT[:, 3]
+        x2d = np.dot(intrinsic_matrix, x3d.T)
+        x2d = x2d[:2] / x2d[2]
+        dets[j, :5] = [cls_indexes[j], x2d[0].min(), x2d[1].min(), x2d[0].max(), x2d[1].max()]
+        poses[j, :4] = mat2quat(RT[:, :3])
+    if noise > 0:
+        dets[:, 1:5] += noise * np.random.randn(num, 4)
+    return dets, poses
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    np.random.seed(cfg.RNG_SEED)
+
+    imdb = get_imdb(args.imdb_name)
+    points = imdb._points_all
+    num_images = len(imdb.image_index)
+    if args.num_images > 0:
+        num_images = min(num_images, args.num_images)
+    detections = None
+    if args.results is not None:
+        detections = ResultsStore(args.results)
+
+    solvers = [('nelder-mead', translations_nelder_mead), ('gauss-newton', translations_gauss_newton)]
+    timers = dict((name, Timer()) for name, _ in solvers)
+    errors = dict((name, []) for name, _ in solvers)
+    differences = []
+    for i in xrange(num_images):
+        cls_indexes, poses_gt, intrinsic_matrix = _ground_truth(imdb, i)
+        if detections is None:
+            dets, poses = _ground_truth_detections(cls_indexes, poses_gt, points, intrinsic_matrix, args.noise)
+        elif i in detections:
+            det = detections[i]
+            dets = det['rois'].astype(np.float32)
+            poses = det['poses'].astype(np.float32)
+        else:
+            continue
+        if dets.shape[0] == 0:
+            continue
+
+        translations = {}
+        for name, solver in solvers:
+            timers[name].tic()
+            translations[name] = solver(dets, poses.copy(), points, intrinsic_matrix)[:, 4:7]
+            timers[name].toc()
+
+            # error to the ground truth pose of the class
+            for j in xrange(dets.shape[0]):
+                ind = np.where(cls_indexes == int(dets[j, 0]))[0]
+                if len(ind) > 0:
+                    errors[name].append(np.linalg.norm(translations[name][j] - poses_gt[:, 3, ind[0]]))
+        differences.append(np.abs(translations['nelder-mead'] - translations['gauss-newton']).max())
+
+    print '{} frames, {} detections'.format(len(differences), len(errors['gauss-newton']))
+    if len(errors['gauss-newton']) == 0:
+        sys.exit(0)
+    for name, _ in solvers:
+        e = np.array(errors[name])
+        print '{}: {:.2f}ms per frame, translation error mean {:.4f} median {:.4f} max {:.4f}'.format( \
+            name, 1000 * timers[name].average_time, e.mean(), np.median(e), e.max())
+    print 'largest difference between the solvers {:.6f}'.format(max(differences))
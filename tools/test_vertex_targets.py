@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# FCN
+# Copyright (c) 2016 RSE at UW
+# Licensed under The MIT License [see LICENSE for details]
+# Written by Yu Xiang
+# --------------------------------------------------------
+
+"""Check the vertex targets against the per class loops and time them."""
+
+import _init_paths
+import argparse
+import math
+import numpy as np
+from utils.vertex_targets import generate_vertex_targets, vote_centers, scale_vertmap
+from utils.timer import Timer
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='Test the vertex targets')
+    parser.add_argument('--height', dest='height',
+                        help='height of the label images',
+                        default=480, type=int)
+    parser.add_argument('--width', dest='width',
+                        help='width of the label images',
+                        default=640, type=int)
+    parser.add_argument('--trials', dest='trials',
+                        help='number of random scenes checked for each setting',
+                        default=20, type=int)
+    parser.add_argument('--repeats', dest='repeats',
+                        help='number of timed runs of each implementation',
+                        default=10, type=int)
+    args = parser.parse_args()
+    return args
+
+# reference implementations, the per class loops of the data layer and of test.py
+
+def _scale_vertmap_loop(vertmap, index, extents):
+    for i in range(3):
+        vmin = -extents[i] / 2
+        vmax = extents[i] / 2
+        if vmax - vmin > 0:
+            a = 1.0 / (vmax - vmin)
+            b = -1.0 * vmin / (vmax - vmin)
+        else:
+            a = 0
+            b = 0
+        vertmap[index[0], index[1], i] = a * vertmap[index[0], index[1], i] + b
+    return vertmap[index[0], index[1], :]
+
+
+def _generate_vertex_targets_loop(im_label, cls_indexes, center, poses, num_classes, vertmap, extents, \
+    mask, is_multi_instances, cls_indexes_old, vertex_targets, vertex_weights, reg_2d, reg_3d, w_inside):
+
+    if is_multi_instances:
+        c = np.zeros((2, 1), dtype=np.float32)
+        for i in xrange(len(cls_indexes)):
+            cls = int(cls_indexes[i])
+            y, x = np.where((mask == cls_indexes_old[i]+1) & (im_label == cls))
+            I = np.where((mask == cls_indexes_old[i]+1) & (im_label == cls))
+            if len(x) > 0:
+                if reg_2d:
+                    c[0] = center[i, 0]
+                    c[1] = center[i, 1]
+                    z = poses[2, 3, i]
+                    R = np.tile(c, (1, len(x))) - np.vstack((x, y))
+                    N = np.linalg.norm(R, axis=0) + 1e-10
+                    R = np.divide(R, np.tile(N, (2,1)))
+                    vertex_targets[y, x, 3*cls+0] = R[0,:]
+                    vertex_targets[y, x, 3*cls+1] = R[1,:]
+                    vertex_targets[y, x, 3*cls+2] = math.log(z)
+                if reg_3d:
+                    vertex_targets[y, x, 3*cls:3*cls+3] = _scale_vertmap_loop(vertmap, I, extents[cls, :])
+                vertex_weights[y, x, 3*cls:3*cls+3] = w_inside
+    else:
+        c = np.zeros((2, 1), dtype=np.float32)
+        for i in xrange(1, num_classes):
+            y, x = np.where(im_label == i)
+            I = np.where(im_label == i)
+            ind = np.where(cls_indexes == i)[0]
+            if len(x) > 0 and len(ind) > 0:
+                if reg_2d:
+                    c[0] = center[ind, 0]
+                    c[1] = center[ind, 1]
+                    z = poses[2, 3, ind[0]]
+                    R = np.tile(c, (1, len(x))) - np.vstack((x, y))
+                    N = np.linalg.norm(R, axis=0) + 1e-10
+                    R = np.divide(R, np.tile(N, (2,1)))
+                    vertex_targets[y, x, 3*i+0] = R[0,:]
+                    vertex_targets[y, x, 3*i+1] = R[1,:]
+                    vertex_targets[y, x, 3*i+2] = math.log(z)
+                if reg_3d:
+                    vertex_targets[y, x, 3*i:3*i+3] = _scale_vertmap_loop(vertmap, I, extents[i, :])
+                vertex_weights[y, x, 3*i:3*i+3] = w_inside
+
+    return vertex_targets, vertex_weights
+
+
+def _vote_centers_loop(im_label, cls_indexes, centers, poses, num_classes):
+    vertex_targets = np.zeros((im_label.shape[0], im_label.shape[1], 3), dtype=np.float32)
+    center = np.zeros((2, 1), dtype=np.float32)
+    for i in xrange(1, num_classes):
+        y, x = np.where(im_label == i)
+        ind = np.where(cls_indexes == i)[0]
+        if len(x) > 0 and len(ind) > 0:
+            center[0] = centers[ind, 0]
+            center[1] = centers[ind, 1]
+            z = poses[2, 3, ind]
+            R = np.tile(center, (1, len(x))) - np.vstack((x, y))
+            N = np.linalg.norm(R, axis=0) + 1e-10
+            R = np.divide(R, np.tile(N, (2,1)))
+            vertex_targets[y, x, 0] = R[0,:]
+            vertex_targets[y, x, 1] = R[1,:]
+            vertex_targets[y, x, 2] = z
+    return vertex_targets
+
+
+def _scale_vertmap_targets_loop(im_label, num_classes, vertmap, extents):
+    vertex_targets = np.zeros((im_label.shape[0], im_label.shape[1], 3), dtype=np.float32)
+    for i in xrange(1, num_classes):
+        y, x = np.where(im_label == i)
+        I = np.where(im_label == i)
+        if len(x) > 0:
+            vertex_targets[y, x, :] = _scale_vertmap_loop(vertmap, I, extents[i, :])
+    return vertex_targets
+
+
+def random_scene(height, width, num_classes, num_objects, multi_instances=False):
+    """label image, instance mask, classes, centers, poses, vertmap and extents of random boxes"""
+    im_label = np.zeros((height, width), dtype=np.uint8)
+    mask = np.zeros((height, width), dtype=np.uint8)
+    if multi_instances:
+        cls_indexes = np.ones((num_objects,), dtype=np.float32)
+    else:
+        cls_indexes = np.random.permutation(np.arange(1, num_classes))[:num_objects].astype(np.float32)
+    num_objects = len(cls_indexes)
+    centers = np.zeros((num_objects, 2), dtype=np.float32)
+    poses = np.zeros((3, 4, num_objects), dtype=np.float32)
+    for i in xrange(num_objects):
+        w = np.random.randint(20, width / 3)
+        h = np.random.randint(20, height / 3)
+        x1 = np.random.randint(0, width - w)
+        y1 = np.random.randint(0, height - h)
+        im_label[y1:y1+h, x1:x1+w] = cls_indexes[i]
+        mask[y1:y1+h, x1:x1+w] = i + 1
+        centers[i, :] = [x1 + w * np.random.rand(), y1 + h * np.random.rand()]
+        poses[:, :3, i] = np.eye(3)
+        poses[:, 3, i] = [0, 0, np.random.uniform(0.5, 2.0)]
+    # labels of objects without annotation and beyond the classes are ignored
+    im_label[:10, :10] = num_classes - 1 if multi_instances else 0
+    vertmap = np.random.uniform(-0.1, 0.1, size=(height, width, 3)).astype(np.float32)
+    extents = np.random.uniform(0.05, 0.3, size=(num_classes, 3))
+    extents[0, :] = 0
+    return im_label, mask, cls_indexes, centers, poses, vertmap, extents
+
+
+def check(name, a, b):
+    error = np.abs(a.astype(np.float64) - b.astype(np.float64)).max() if a.size > 0 else 0
+    assert a.shape == b.shape and np.allclose(a, b, rtol=1e-6, atol=1e-6), \
+        '{} differs from the loop by {}'.format(name, error)
+    return error
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    np.random.seed(0)
+    height = args.height
+    width = args.width
+
+    # (num_classes, number of objects, multiple instances of the class)
+    settings = [(22, 8, False), (2, 1, False), (2, 4, True)]
+    for num_classes, num_objects, multi in settings:
+        max_error = 0
+        for trial in xrange(args.trials + 1):
+            im_label, mask, cls_indexes, centers, poses, vertmap, extents = \
+                random_scene(height, width, num_classes, num_objects, multi)
+            mask_indexes = np.arange(len(cls_indexes)) if multi else []
+            for reg_2d, reg_3d in [(True, False), (False, True)]:
+                shape = (height, width, 3 * num_classes)
+                results = []
+                for method in ['loop', 'vectorized']:
+                    targets = np.zeros(shape, dtype=np.float32)
+                    weights = np.zeros(shape, dtype=np.float32)
+                    vmap = vertmap.copy()
+                    timer = Timer()
+                    repeats = args.repeats if trial == 0 else 1
+                    for i in xrange(repeats):
+                        vmap[:] = vertmap
+                        timer.tic()
+                        if method == 'loop':
+                            _generate_vertex_targets_loop(im_label, cls_indexes, centers, poses, num_classes, vmap, extents, \
+                                mask if multi else [], multi, mask_indexes, targets, weights, reg_2d, reg_3d, 1.0)
+                        else:
+                            generate_vertex_targets(im_label, cls_indexes, centers, poses, num_classes, vmap, extents, \
+                                mask if multi else None, mask_indexes, targets, weights, reg_2d, reg_3d, 1.0)
+                        timer.toc()
+                    results.append((targets, weights, vmap, timer.average_time))
+                max_error = max(max_error, check('targets', results[0][0], results[1][0]))
+                check('weights', results[0][1], results[1][1])
+                check('vertmap', results[0][2], results[1][2])
+                if trial == 0:
+                    print '{:2d} classes, {:d} objects{}, {}: loop {:7.2f}ms, vectorized {:7.2f}ms' \
+                        .format(num_classes, len(cls_indexes), ' (instances)' if multi else '', '2D' if reg_2d else '3D', \
+                                results[0][3] * 1000, results[1][3] * 1000)
+
+            if not multi:
+                check('vote_centers', _vote_centers_loop(im_label, cls_indexes, centers, poses, num_classes), \
+                      vote_centers(im_label, cls_indexes, centers, poses, num_classes))
+                vmap = vertmap.copy()
+                check('scale_vertmap', _scale_vertmap_targets_loop(im_label, num_classes, vertmap.copy(), extents), \
+                      scale_vertmap(im_label, vmap, extents, num_classes))
+        print '{:2d} classes: {:d} scenes match, max target difference {:.2e}'.format(num_classes, args.trials + 1, max_error)